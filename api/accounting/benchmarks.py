@@ -0,0 +1,370 @@
+"""
+Accounting Benchmark Fixtures
+=============================
+Synthetic ledger data and measurement helpers used by the benchmark
+management commands and the report performance tests.
+"""
+
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional
+
+from django.contrib.auth import get_user_model
+from django.db import connection, reset_queries
+from django.db.models import Q, Sum
+from django.test.utils import CaptureQueriesContext
+
+from .models import (
+    Account, AccountType, JournalEntry, JournalEntryLine, Report, ReportStatus,
+    ReportType, TransactionStatus
+)
+
+
+class LedgerBenchmarkFixture:
+    """
+    Build a synthetic tenant with a chart of accounts and posted entries.
+
+    Every entry debits one of the generated accounts and credits a shared
+    bank account, spread evenly over `days` days starting at `start_date`.
+    """
+
+    def __init__(self, accounts: int = 100, entries_per_account: int = 10,
+                 start_date: date = date(2024, 1, 1), days: int = 365,
+                 batch_size: int = 2000):
+        self.accounts = accounts
+        self.entries_per_account = entries_per_account
+        self.start_date = start_date
+        self.days = days
+        self.batch_size = batch_size
+        self.tenant = None
+
+    def build(self):
+        """Create the tenant, accounts, entries and lines. Returns the tenant."""
+        from core.tenants.models import Tenant
+
+        suffix = uuid.uuid4().hex[:8]
+        self.tenant = Tenant.objects.create(name=f'Benchmark {suffix}', slug=f'benchmark-{suffix}')
+        user = get_user_model().objects.create_user(
+            email=f'benchmark-{suffix}@example.com',
+            password=uuid.uuid4().hex
+        )
+
+        bank = Account.all_objects.create(
+            tenant=self.tenant, code='1100', name='Bank',
+            account_type=AccountType.ASSET.value
+        )
+        accounts = Account.all_objects.bulk_create([
+            Account(
+                tenant=self.tenant,
+                code=f'6{index:05d}',
+                name=f'Expense {index}',
+                account_type=AccountType.EXPENSE.value,
+            )
+            for index in range(self.accounts)
+        ], batch_size=self.batch_size)
+
+        entries, lines = [], []
+        total = self.accounts * self.entries_per_account
+        for index in range(total):
+            account = accounts[index % self.accounts]
+            amount = Decimal(index % 500 + 1)
+            entry = JournalEntry(
+                tenant=self.tenant,
+                entry_number=f'JE-{index:08d}',
+                date=self.start_date + timedelta(days=index * self.days // max(total, 1)),
+                description=f'Benchmark entry {index}',
+                status=TransactionStatus.POSTED.value,
+                created_by=user,
+                total_debit=amount,
+                total_credit=amount,
+            )
+            entries.append(entry)
+            lines.append(JournalEntryLine(journal_entry=entry, account=account, debit=amount))
+            lines.append(JournalEntryLine(journal_entry=entry, account=bank, credit=amount))
+
+        JournalEntry.all_objects.bulk_create(entries, batch_size=self.batch_size)
+        JournalEntryLine.objects.bulk_create(lines, batch_size=self.batch_size)
+        return self.tenant
+
+    def report(self) -> Report:
+        """
+        Unsaved, completed general ledger Report over the fixture's whole date
+        range, with its cached_data generated, for export benchmarks.
+        """
+        from .services import ReportGeneratorService
+
+        period_end = self.start_date + timedelta(days=self.days - 1)
+        data = ReportGeneratorService(tenant_id=self.tenant.id)._generate_general_ledger(
+            self.start_date, period_end, None, False, None, None
+        )
+        return Report(
+            tenant=self.tenant,
+            report_number='RPT-BENCH-0001',
+            name='Benchmark General Ledger',
+            report_type=ReportType.GENERAL_LEDGER.value,
+            period_start=self.start_date,
+            period_end=period_end,
+            status=ReportStatus.COMPLETED.value,
+            generation_completed_at=datetime(2025, 1, 1, 9, 0),
+            cached_data=data,
+        )
+
+    @staticmethod
+    def measure(func: Callable[[], Any]) -> Dict[str, Any]:
+        """Run `func` and record query count and wall time."""
+        # The query log is capped, and building a large fixture fills it
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        return {
+            'queries': len(ctx.captured_queries),
+            'seconds': elapsed,
+            'result': result,
+        }
+
+    @staticmethod
+    def measure_memory(func: Callable[[], Any]) -> Dict[str, Any]:
+        """Run `func` under tracemalloc and record peak Python allocations."""
+        tracemalloc.start()
+        try:
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'peak_bytes': peak,
+            'seconds': elapsed,
+            'result': result,
+        }
+
+
+class BankReconciliationFixture:
+    """
+    Build a bank account whose ledger lines and a matching bank statement CSV
+    exercise every reconciliation pass.
+
+    Of the `lines` bank transactions: most repeat their journal line's
+    amount and reference within a few days, some drop the reference, some
+    are a few cents off (fuzzy), some pay two journal lines at once (split)
+    and the rest have no ledger counterpart.
+    """
+
+    SHARES = {'reference': 0.6, 'exact': 0.2, 'fuzzy': 0.1, 'split': 0.05}
+
+    def __init__(self, lines: int = 100000, start_date: date = date(2024, 1, 1), days: int = 365,
+                 batch_size: int = 2000, seed: int = 0):
+        self.lines = lines
+        self.start_date = start_date
+        self.days = days
+        self.batch_size = batch_size
+        self.seed = seed
+        self.tenant = None
+        self.bank = None
+
+    def build(self) -> str:
+        """Create the tenant, bank account and journal entries. Returns the statement CSV."""
+        from core.tenants.models import Tenant
+
+        rng = random.Random(self.seed)
+        suffix = uuid.uuid4().hex[:8]
+        self.tenant = Tenant.objects.create(name=f'Bank Benchmark {suffix}', slug=f'bank-benchmark-{suffix}')
+        user = get_user_model().objects.create_user(
+            email=f'bank-benchmark-{suffix}@example.com',
+            password=uuid.uuid4().hex
+        )
+        self.bank = Account.all_objects.create(
+            tenant=self.tenant, code='1100', name='Bank', account_type=AccountType.ASSET.value
+        )
+        other = Account.all_objects.create(
+            tenant=self.tenant, code='4000', name='Sales', account_type=AccountType.REVENUE.value
+        )
+
+        entries, journal_lines, rows = [], [], ['Date,Description,Reference,Amount']
+
+        def ledger(amount, entry_date, reference):
+            entry = JournalEntry(
+                tenant=self.tenant,
+                entry_number=f'JE-{len(entries):08d}',
+                date=entry_date,
+                description=f'Bank benchmark {len(entries)}',
+                reference=reference,
+                status=TransactionStatus.POSTED.value,
+                created_by=user,
+                total_debit=abs(amount),
+                total_credit=abs(amount),
+            )
+            entries.append(entry)
+            # Money in debits the bank, money out credits it
+            journal_lines.append(JournalEntryLine(
+                journal_entry=entry, account=self.bank,
+                debit=max(amount, Decimal('0.00')), credit=max(-amount, Decimal('0.00')),
+            ))
+            journal_lines.append(JournalEntryLine(
+                journal_entry=entry, account=other,
+                debit=max(-amount, Decimal('0.00')), credit=max(amount, Decimal('0.00')),
+            ))
+
+        thresholds, total = [], 0.0
+        for kind, share in self.SHARES.items():
+            total += share
+            thresholds.append((total, kind))
+
+        for index in range(self.lines):
+            amount = Decimal(rng.randint(100, 500000)) / 100 * rng.choice((1, -1))
+            entry_date = self.start_date + timedelta(days=rng.randrange(self.days))
+            bank_date = entry_date + timedelta(days=rng.randint(-2, 2))
+            reference = f'INV-{index:07d}'
+            kind = next((kind for threshold, kind in thresholds if rng.random() < threshold), 'unmatched')
+
+            if kind == 'split':
+                part = (amount * Decimal(rng.randint(20, 80)) / 100).quantize(Decimal('0.01'))
+                ledger(part, entry_date, f'{reference}-A')
+                ledger(amount - part, entry_date, f'{reference}-B')
+                bank_reference = ''
+            elif kind == 'unmatched':
+                bank_reference = ''
+            else:
+                ledger(amount, entry_date, reference)
+                bank_reference = reference if kind == 'reference' else ''
+                if kind == 'fuzzy':
+                    amount += Decimal(rng.randint(1, 50)) / 100 * rng.choice((1, -1))
+                    bank_date = entry_date + timedelta(days=rng.randint(-6, 6))
+            rows.append(f'{bank_date.isoformat()},Bank line {index},{bank_reference},{amount}')
+
+        JournalEntry.all_objects.bulk_create(entries, batch_size=self.batch_size)
+        JournalEntryLine.objects.bulk_create(journal_lines, batch_size=self.batch_size)
+        return '\n'.join(rows) + '\n'
+
+
+def naive_bank_match(transactions, lines, date_window: int = 3):
+    """
+    Baseline: compare every transaction with every journal line (the ad-hoc
+    scripts the reconciliation engine replaces). Returns the match count.
+    """
+    used, matched = set(), 0
+    for txn in transactions:
+        amount = txn.credit - txn.debit
+        for line in lines:
+            if line.id in used or line.debit - line.credit != amount:
+                continue
+            if abs((line.journal_entry.date - txn.date).days) <= date_window:
+                used.add(line.id)
+                matched += 1
+                break
+    return matched
+
+
+def per_account_general_ledger(tenant_id, period_start: date, period_end: date,
+                               filters: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Baseline: ReportGeneratorService._generate_general_ledger as it was
+    before streaming, copied unchanged. Runs an opening-balance aggregate and
+    a fully loaded entries query per active account.
+    """
+    # Get accounts to include
+    accounts_filter = Q()
+    if tenant_id:
+        accounts_filter &= Q(tenant_id=tenant_id)
+    if filters and filters.get('account_ids'):
+        accounts_filter &= Q(id__in=filters['account_ids'])
+    if filters and filters.get('account_types'):
+        accounts_filter &= Q(account_type__in=filters['account_types'])
+
+    accounts = Account.objects.filter(accounts_filter, is_active=True).order_by('code')
+
+    ledger_accounts = []
+    total_debits = Decimal('0.00')
+    total_credits = Decimal('0.00')
+    entry_count = 0
+
+    for account in accounts:
+        # Get opening balance (sum of all entries before period start)
+        opening_filter = Q(
+            account=account,
+            journal_entry__date__lt=period_start,
+            journal_entry__status=TransactionStatus.POSTED.value
+        )
+
+        opening_totals = JournalEntryLine.objects.filter(opening_filter).aggregate(
+            total_debit=Sum('debit'),
+            total_credit=Sum('credit')
+        )
+
+        opening_debit = opening_totals['total_debit'] or Decimal('0.00')
+        opening_credit = opening_totals['total_credit'] or Decimal('0.00')
+
+        if account.account_type in [AccountType.ASSET.value, AccountType.EXPENSE.value]:
+            opening_balance = account.opening_balance + opening_debit - opening_credit
+        else:
+            opening_balance = account.opening_balance + opening_credit - opening_debit
+
+        # Get entries for the period
+        entries_filter = Q(
+            account=account,
+            journal_entry__date__gte=period_start,
+            journal_entry__date__lte=period_end,
+            journal_entry__status=TransactionStatus.POSTED.value
+        )
+
+        entries = JournalEntryLine.objects.filter(entries_filter).select_related(
+            'journal_entry'
+        ).order_by('journal_entry__date', 'journal_entry__entry_number')
+
+        account_entries = []
+        running_balance = opening_balance
+        account_total_debits = Decimal('0.00')
+        account_total_credits = Decimal('0.00')
+
+        for entry_line in entries:
+            debit = entry_line.debit or Decimal('0.00')
+            credit = entry_line.credit or Decimal('0.00')
+
+            if account.account_type in [AccountType.ASSET.value, AccountType.EXPENSE.value]:
+                running_balance += debit - credit
+            else:
+                running_balance += credit - debit
+
+            account_entries.append({
+                'date': entry_line.journal_entry.date.isoformat(),
+                'entry_number': entry_line.journal_entry.entry_number,
+                'description': entry_line.description or entry_line.journal_entry.description,
+                'reference': entry_line.journal_entry.reference,
+                'debit': float(debit),
+                'credit': float(credit),
+                'balance': float(running_balance)
+            })
+
+            account_total_debits += debit
+            account_total_credits += credit
+
+        if account_entries or opening_balance != Decimal('0.00'):
+            ledger_accounts.append({
+                'account_id': str(account.id),
+                'account_code': account.code,
+                'account_name': account.name,
+                'account_type': account.account_type,
+                'opening_balance': float(opening_balance),
+                'entries': account_entries,
+                'total_debits': float(account_total_debits),
+                'total_credits': float(account_total_credits),
+                'closing_balance': float(running_balance)
+            })
+
+            total_debits += account_total_debits
+            total_credits += account_total_credits
+            entry_count += len(account_entries)
+
+    return {
+        'accounts': ledger_accounts,
+        'total_debits': float(total_debits),
+        'total_credits': float(total_credits),
+        'entry_count': entry_count
+    }
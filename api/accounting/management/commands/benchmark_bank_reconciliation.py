@@ -0,0 +1,58 @@
+"""
+Benchmark bank statement import and reconciliation on a synthetic bank account
+Usage: python manage.py benchmark_bank_reconciliation --lines 100000 --naive-sample 50
+
+Compares BankReconciliationService with a nested-loop matcher timed on
+--naive-sample transactions and extrapolated to the whole statement.
+All benchmark data is created inside a transaction that is rolled back.
+"""
+import io
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounting.benchmarks import BankReconciliationFixture, LedgerBenchmarkFixture, naive_bank_match
+from accounting.models import BankTransaction, JournalEntryLine
+from accounting.services import BankReconciliationService, import_statement
+
+
+class Command(BaseCommand):
+    help = 'Measure queries and wall time of bank statement import and reconciliation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=100000)
+        parser.add_argument('--naive-sample', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixture = BankReconciliationFixture(lines=options['lines'])
+            self.stdout.write(f"Building {fixture.lines} bank lines...")
+            csv_text = fixture.build()
+
+            stats = LedgerBenchmarkFixture.measure(
+                lambda: import_statement(io.StringIO(csv_text), fixture.bank, fmt='csv')
+            )
+            statement = stats['result']
+            self.stdout.write(self.style.SUCCESS(
+                f"Import: {stats['queries']} queries, {stats['seconds']:.3f}s"
+            ))
+
+            sample = list(BankTransaction.all_objects.filter(statement=statement)[:options['naive_sample']])
+            lines = list(JournalEntryLine.objects.filter(account=fixture.bank).select_related('journal_entry'))
+            started = time.perf_counter()
+            naive_bank_match(sample, lines)
+            naive_seconds = (time.perf_counter() - started) / max(len(sample), 1) * fixture.lines
+
+            stats = LedgerBenchmarkFixture.measure(lambda: BankReconciliationService().reconcile(statement))
+            result = stats['result']
+            by_type = ', '.join(f"{key} {value}" for key, value in result['by_type'].items())
+            self.stdout.write(self.style.SUCCESS(
+                f"Reconcile: {stats['queries']} queries, {stats['seconds']:.3f}s, "
+                f"{result['matched']}/{result['transactions']} matched ({by_type})"
+            ))
+            self.stdout.write(
+                f"Nested loop: ~{naive_seconds:.1f}s extrapolated from {len(sample)} transactions "
+                f"({naive_seconds / stats['seconds']:.0f}x)"
+            )
+            transaction.set_rollback(True)
@@ -0,0 +1,58 @@
+"""
+Benchmark general ledger generation on a synthetic chart of accounts
+Usage: python manage.py benchmark_general_ledger --accounts 2000 --entries-per-account 20
+
+Compares ReportGeneratorService with the per-account baseline
+(per_account_general_ledger): queries and wall time, then peak Python
+allocations of each in a separate run under tracemalloc.
+All benchmark data is created inside a transaction that is rolled back.
+"""
+from datetime import date
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounting.benchmarks import LedgerBenchmarkFixture, per_account_general_ledger
+from accounting.services import ReportGeneratorService
+
+
+class Command(BaseCommand):
+    help = 'Measure queries, wall time and peak memory of general ledger generation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=500)
+        parser.add_argument('--entries-per-account', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixture = LedgerBenchmarkFixture(
+                accounts=options['accounts'],
+                entries_per_account=options['entries_per_account'],
+            )
+            self.stdout.write(
+                f"Building {fixture.accounts} accounts x {fixture.entries_per_account} entries..."
+            )
+            tenant = fixture.build()
+
+            service = ReportGeneratorService(tenant_id=tenant.id)
+            period_start, period_end = date(2024, 7, 1), date(2024, 12, 31)
+            runs = {
+                'Per-account baseline': lambda: per_account_general_ledger(tenant.id, period_start, period_end),
+                'General ledger': lambda: service._generate_general_ledger(
+                    period_start=period_start,
+                    period_end=period_end,
+                    filters=None,
+                    include_comparison=False,
+                    comparison_period_start=None,
+                    comparison_period_end=None,
+                ),
+            }
+
+            for label, func in runs.items():
+                stats = fixture.measure(func)
+                memory = fixture.measure_memory(func)
+                self.stdout.write(self.style.SUCCESS(
+                    f"{label}: {stats['queries']} queries, {stats['seconds']:.3f}s, "
+                    f"peak {memory['peak_bytes'] / 1e6:.1f} MB, "
+                    f"{stats['result']['entry_count']} lines in period"
+                ))
+            transaction.set_rollback(True)
@@ -0,0 +1,66 @@
+"""
+Benchmark peak memory of report exports on a synthetic general ledger
+Usage: python manage.py benchmark_report_export --accounts 200 --entries-per-account 100
+
+Builds the ledger in the database, then measures peak Python allocations of
+building the report's cached_data and of each Excel/CSV export path, which
+lay that cached_data out (Excel through a write-only workbook).
+All benchmark data is created inside a transaction that is rolled back.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounting.benchmarks import LedgerBenchmarkFixture
+from accounting.models import ExportFormat
+from accounting.services import ReportExporterService, ReportGeneratorService
+
+
+class Command(BaseCommand):
+    help = 'Measure peak memory of report exports against building the cached report data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=100)
+        parser.add_argument('--entries-per-account', type=int, default=100)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixture = LedgerBenchmarkFixture(
+                accounts=options['accounts'],
+                entries_per_account=options['entries_per_account'],
+            )
+            self.stdout.write(
+                f"Building {fixture.accounts} accounts x {fixture.entries_per_account} entries..."
+            )
+            fixture.build()
+            report = fixture.report()
+            exporter = ReportExporterService()
+
+            def cached_data():
+                data = ReportGeneratorService(tenant_id=report.tenant_id)._generate_general_ledger(
+                    report.period_start, report.period_end, None, False, None, None
+                )
+                return data['entry_count']
+
+            def stream(export_format):
+                chunks, _file_name, _mime_type = exporter.stream_export(report, export_format)
+                return sum(len(chunk) for chunk in chunks)
+
+            stats = LedgerBenchmarkFixture.measure_memory(cached_data)
+            self.stdout.write(
+                f"cached_data ({stats['result']} lines): peak {stats['peak_bytes'] / 1024 / 1024:.1f} MiB, "
+                f"{stats['seconds']:.2f}s"
+            )
+
+            cases = [
+                ('Excel (export_report)', lambda: exporter._generate_excel(report, {})[1]),
+                ('Excel (stream_export)', lambda: stream(ExportFormat.EXCEL.value)),
+                ('CSV (export_report)', lambda: exporter._generate_csv(report, {})[1]),
+                ('CSV (stream_export)', lambda: stream(ExportFormat.CSV.value)),
+            ]
+            for label, func in cases:
+                stats = LedgerBenchmarkFixture.measure_memory(func)
+                self.stdout.write(self.style.SUCCESS(
+                    f"{label}: peak {stats['peak_bytes'] / 1024 / 1024:.1f} MiB, "
+                    f"{stats['seconds']:.2f}s, {stats['result'] / 1024:.0f} KiB written"
+                ))
+            transaction.set_rollback(True)
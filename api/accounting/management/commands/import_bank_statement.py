@@ -0,0 +1,56 @@
+"""
+Import a CSV or OFX bank statement and optionally reconcile it
+Usage: python manage.py import_bank_statement statement.ofx --account 1100 [--tenant <tenant_id>]
+       [--date 2024-01-31] [--opening-balance 1000.00] [--format csv|ofx] [--reconcile]
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounting.models import Account
+from accounting.services import BankReconciliationService, StatementImportError, import_statement
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV/OFX bank statement into BankStatement/BankTransaction rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--account', required=True, help='Bank account code')
+        parser.add_argument('--tenant', dest='tenant_id', default=None)
+        parser.add_argument('--date', type=date.fromisoformat, default=None,
+                            help='Statement date (default: last transaction date)')
+        parser.add_argument('--opening-balance', type=Decimal, default=Decimal('0.00'))
+        parser.add_argument('--format', choices=['csv', 'ofx'], default=None)
+        parser.add_argument('--reconcile', action='store_true', help='Match transactions after importing')
+
+    def handle(self, *args, **options):
+        account = Account.all_objects.filter(code=options['account'], tenant_id=options['tenant_id']).first()
+        if account is None:
+            raise CommandError(f"Account {options['account']} not found")
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                statement = import_statement(
+                    stream, account,
+                    statement_date=options['date'],
+                    opening_balance=options['opening_balance'],
+                    fmt=options['format'],
+                    filename=options['path'],
+                )
+        except StatementImportError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {statement.transactions.count()} transactions into the "
+            f"{statement.statement_date} statement (closing balance {statement.closing_balance})"
+        ))
+
+        if options['reconcile']:
+            result = BankReconciliationService().reconcile(statement)
+            by_type = ', '.join(f"{name} {count}" for name, count in result['by_type'].items() if count)
+            self.stdout.write(self.style.SUCCESS(
+                f"Matched {result['matched']} of {result['transactions']} ({by_type or 'none'}), "
+                f"{result['unmatched']} unmatched, {result['seconds']:.2f}s"
+            ))
@@ -0,0 +1,28 @@
+"""
+Rebuild per-period account balance snapshots (AccountPeriodBalance)
+Usage: python manage.py rebuild_period_balances [--tenant <tenant_id>]
+"""
+from django.core.management.base import BaseCommand
+
+from accounting.services import PeriodBalanceService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild AccountPeriodBalance snapshots from posted journal entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            dest='tenant_id',
+            default=None,
+            help='Only rebuild snapshots for this tenant ID',
+        )
+
+    def handle(self, *args, **options):
+        tenant_id = options['tenant_id']
+        scope = f'tenant {tenant_id}' if tenant_id else 'all tenants'
+        self.stdout.write(f'Rebuilding period balances for {scope}...')
+
+        rows = PeriodBalanceService().rebuild(tenant_id=tenant_id)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {rows} period balance rows'))
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.4 on 2026-10-16 20:14
+
+import django.db.models.deletion
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_period_balances(apps, schema_editor):
+    """Snapshot existing posted entries into AccountPeriodBalance"""
+    AccountingPeriod = apps.get_model('accounting', 'AccountingPeriod')
+    AccountPeriodBalance = apps.get_model('accounting', 'AccountPeriodBalance')
+    JournalEntryLine = apps.get_model('accounting', 'JournalEntryLine')
+
+    for period in AccountingPeriod.objects.filter(tenant__isnull=False).iterator():
+        rows = (
+            JournalEntryLine.objects
+            .filter(
+                journal_entry__tenant_id=period.tenant_id,
+                journal_entry__status='POSTED',
+                journal_entry__date__gte=period.start_date,
+                journal_entry__date__lte=period.end_date,
+            )
+            .order_by()
+            .values('account_id')
+            .annotate(debit=Sum('debit'), credit=Sum('credit'))
+        )
+        AccountPeriodBalance.objects.bulk_create([
+            AccountPeriodBalance(
+                tenant_id=period.tenant_id,
+                account_id=row['account_id'],
+                period_id=period.id,
+                period_start=period.start_date,
+                period_end=period.end_date,
+                debit_total=row['debit'] or Decimal('0.00'),
+                credit_total=row['credit'] or Decimal('0.00'),
+            )
+            for row in rows
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0007_add_report_models'),
+        ('core', '0002_notification_notificationlog_notificationpreference_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountPeriodBalance',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('debit_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_balances', to='accounting.account')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='account_balances', to='accounting.accountingperiod')),
+                ('tenant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='account_period_balances', to='core.tenant')),
+            ],
+            options={
+                'ordering': ['period_start'],
+                'indexes': [models.Index(fields=['tenant', 'period_end'], name='accounting__tenant__be5a4e_idx')],
+                'unique_together': {('tenant', 'account', 'period')},
+            },
+        ),
+        migrations.RunPython(backfill_period_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-16 20:49
+
+from django.db import migrations, models
+
+
+def populate_normalized_names(apps, schema_editor):
+    from accounting.models import normalize_vendor_name
+
+    Contact = apps.get_model('accounting', 'Contact')
+    contacts = list(Contact.objects.only('id', 'company_name', 'contact_name'))
+    for contact in contacts:
+        contact.normalized_name = normalize_vendor_name(contact.company_name)
+        contact.normalized_contact_name = normalize_vendor_name(contact.contact_name)
+    Contact.objects.bulk_update(contacts, ['normalized_name', 'normalized_contact_name'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0008_account_period_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='normalized_contact_name',
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='normalized_name',
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.RunPython(populate_normalized_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0009_contact_normalized_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banktransaction',
+            name='match_type',
+            field=models.CharField(blank=True, choices=[('EXACT_REFERENCE', 'EXACT_REFERENCE'), ('EXACT', 'EXACT'), ('FUZZY', 'FUZZY'), ('SPLIT', 'SPLIT'), ('MANUAL', 'MANUAL')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='banktransaction',
+            name='split_lines',
+            field=models.ManyToManyField(blank=True, related_name='split_bank_transactions', to='accounting.journalentryline'),
+        ),
+        migrations.AddIndex(
+            model_name='banktransaction',
+            index=models.Index(fields=['statement', 'is_matched'], name='acc_banktxn_matched_idx'),
+        ),
+    ]
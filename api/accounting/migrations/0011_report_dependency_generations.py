@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0010_banktransaction_matching'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='dependency_generations',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:58
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('accounting', '0011_report_dependency_generations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntrySequence',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('prefix', models.CharField(max_length=40)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('tenant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='journal_entry_sequences', to='core.tenant')),
+            ],
+            options={
+                'ordering': ['prefix'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('tenant__isnull', True)), fields=('prefix',), name='unique_journal_entry_sequence_prefix_without_tenant')],
+                'unique_together': {('tenant', 'prefix')},
+            },
+        ),
+    ]
@@ -4,8 +4,10 @@ Accounting Module Models
 Complete double-entry bookkeeping system for ERP with multi-tenant support.
 """
 
+import re
 from enum import Enum
 from decimal import Decimal
+from functools import lru_cache
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils import timezone
@@ -112,6 +114,19 @@ class PaymentMethod(str, Enum):
         return [(tag.value, tag.value) for tag in cls]
 
 
+class BankMatchType(str, Enum):
+    """How a bank transaction was matched to the ledger"""
+    EXACT_REFERENCE = 'EXACT_REFERENCE'  # 金額與參考號相同
+    EXACT = 'EXACT'                      # 金額相同、日期相近
+    FUZZY = 'FUZZY'                      # 金額與日期在容許範圍內
+    SPLIT = 'SPLIT'                      # 多筆分錄合計相符
+    MANUAL = 'MANUAL'                    # 人工對帳
+    
+    @classmethod
+    def choices(cls):
+        return [(tag.value, tag.value) for tag in cls]
+
+
 # =================================================================
 # Core Accounting Models
 # =================================================================
@@ -314,6 +329,41 @@ class JournalEntry(BaseModel):
         return self.total_debit == self.total_credit
 
 
+class JournalEntrySequence(BaseModel):
+    """
+    分錄編號序列
+    Last entry number handed out per tenant and prefix (JE-YYYYMMDD). The row
+    is locked with select_for_update while a block of numbers is allocated.
+    """
+    tenant = models.ForeignKey(
+        'core.Tenant',
+        on_delete=models.CASCADE,
+        related_name='journal_entry_sequences',
+        null=True,
+        blank=True
+    )
+    prefix = models.CharField(max_length=40)
+    last_number = models.PositiveIntegerField(default=0)
+    
+    objects = TenantAwareManager()
+    all_objects = UnscopedManager()
+    
+    class Meta:
+        ordering = ['prefix']
+        unique_together = ['tenant', 'prefix']
+        constraints = [
+            # NULLs are distinct in unique_together; keep one tenant-less row per prefix
+            models.UniqueConstraint(
+                fields=['prefix'],
+                condition=models.Q(tenant__isnull=True),
+                name='unique_journal_entry_sequence_prefix_without_tenant',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.prefix}: {self.last_number}"
+
+
 class JournalEntryLine(BaseModel):
     """日記帳分錄明細"""
     journal_entry = models.ForeignKey(JournalEntry, on_delete=models.CASCADE, related_name='lines')
@@ -336,10 +386,75 @@ class JournalEntryLine(BaseModel):
         return f"{self.account.code}: Dr {self.debit} / Cr {self.credit}"
 
 
+class AccountPeriodBalance(BaseModel):
+    """
+    科目期間餘額快照
+    Materialized debit/credit movements of posted entries per account and
+    accounting period. Maintained incrementally by BalancePostingService and
+    rebuilt with `manage.py rebuild_period_balances`.
+    """
+    tenant = models.ForeignKey(
+        'core.Tenant',
+        on_delete=models.CASCADE,
+        related_name='account_period_balances',
+        null=True,
+        blank=True
+    )
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='period_balances')
+    period = models.ForeignKey(AccountingPeriod, on_delete=models.CASCADE, related_name='account_balances')
+    
+    # Denormalized period bounds for date-range lookups
+    period_start = models.DateField()
+    period_end = models.DateField()
+    
+    debit_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    credit_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    
+    objects = TenantAwareManager()
+    all_objects = UnscopedManager()
+    
+    class Meta:
+        ordering = ['period_start']
+        unique_together = ['tenant', 'account', 'period']
+        indexes = [
+            models.Index(fields=['tenant', 'period_end']),
+        ]
+    
+    def __str__(self):
+        return f"{self.account.code} @ {self.period_start}: Dr {self.debit_total} / Cr {self.credit_total}"
+
+
 # =================================================================
 # Customer & Vendor Models
 # =================================================================
 
+# Company suffixes dropped when matching vendor names, stripped in this order
+VENDOR_NAME_SUFFIXES = (
+    '有限公司', '股份有限公司', '公司', '企業', '商行', '店',
+    'limited', 'ltd', 'inc', 'corp', 'co.', 'company',
+    '分店', '門市', '專櫃'
+)
+_VENDOR_NAME_PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+@lru_cache(maxsize=8192)
+def normalize_vendor_name(name: str) -> str:
+    """
+    Normalize a vendor/contact name for matching
+    標準化供應商名稱用於配對
+    """
+    if not name:
+        return ''
+    
+    normalized = name.lower().strip()
+    for suffix in VENDOR_NAME_SUFFIXES:
+        if normalized.endswith(suffix):
+            normalized = normalized[:-len(suffix)].strip()
+    
+    normalized = _VENDOR_NAME_PUNCTUATION.sub('', normalized)
+    return ' '.join(normalized.split())
+
+
 class Contact(BaseModel):
     """客戶/供應商聯絡人"""
     CONTACT_TYPE_CHOICES = [
@@ -382,11 +497,23 @@ class Contact(BaseModel):
     is_active = models.BooleanField(default=True)
     notes = models.TextField(blank=True)
     
+    # Matching keys maintained on save (see normalize_vendor_name)
+    normalized_name = models.CharField(max_length=200, blank=True, db_index=True)
+    normalized_contact_name = models.CharField(max_length=200, blank=True, db_index=True)
+    
     objects = TenantAwareManager()
     all_objects = UnscopedManager()
     
     def __str__(self):
         return self.company_name or self.contact_name
+    
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_vendor_name(self.company_name)
+        self.normalized_contact_name = normalize_vendor_name(self.contact_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'company_name', 'contact_name'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'normalized_name', 'normalized_contact_name'}
+        super().save(*args, **kwargs)
 
 
 # =================================================================
@@ -669,12 +796,18 @@ class BankTransaction(BaseModel):
     
     is_matched = models.BooleanField(default=False)
     matched_journal_line = models.ForeignKey(JournalEntryLine, on_delete=models.SET_NULL, null=True, blank=True)
+    # Set by accounting.services.bank_reconciliation; a SPLIT match lists every line it covers
+    match_type = models.CharField(max_length=20, choices=BankMatchType.choices(), blank=True)
+    split_lines = models.ManyToManyField(JournalEntryLine, related_name='split_bank_transactions', blank=True)
     
     objects = TenantAwareManager()
     all_objects = UnscopedManager()
     
     class Meta:
         ordering = ['date']
+        indexes = [
+            models.Index(fields=['statement', 'is_matched'], name='acc_banktxn_matched_idx'),
+        ]
 
 
 # =================================================================
@@ -1472,6 +1605,8 @@ class Report(BaseModel):
     generation_started_at = models.DateTimeField(null=True, blank=True)
     generation_completed_at = models.DateTimeField(null=True, blank=True)
     generation_error = models.TextField(blank=True)
+    # Ledger generation counters the data was read at (accounting.services.report_cache)
+    dependency_generations = models.JSONField(default=dict, blank=True)
     
     # Cached report data (JSON for quick access)
     cached_data = models.JSONField(null=True, blank=True)
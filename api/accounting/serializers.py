@@ -8,7 +8,7 @@ from .models import (
     ProjectStatus, Receipt, RecognitionStatus,
     ExtractedField, ExtractedFieldType, FieldCorrectionHistory, ReceiptCorrectionSummary,
     Report, ReportTemplate, ReportExport, ReportSchedule, ReportSection,
-    ReportType, ReportStatus, ExportFormat
+    ReportType, ReportStatus, ExportFormat, TransactionStatus
 )
 
 
@@ -71,6 +71,24 @@ class JournalEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = JournalEntry
         fields = '__all__'
+        # Status changes go through the post/void actions (BalancePostingService)
+        read_only_fields = ['status', 'posted_at', 'total_debit', 'total_credit']
+    
+    # Posted/voided entries are reflected in account balances and period snapshots
+    LOCKED_WHEN_POSTED = ('tenant', 'date', 'fiscal_year', 'period', 'project')
+    
+    def validate(self, attrs):
+        if self.instance is not None and self.instance.status != TransactionStatus.DRAFT.value:
+            changed = [
+                field for field in self.LOCKED_WHEN_POSTED
+                if field in attrs and attrs[field] != getattr(self.instance, field)
+            ]
+            if changed:
+                raise serializers.ValidationError({
+                    field: _("Only draft entries can be changed; void and re-enter instead.")
+                    for field in changed
+                })
+        return attrs
 
 
 class JournalEntryCreateSerializer(serializers.ModelSerializer):
@@ -709,6 +727,7 @@ class ReceiptProcessingResultSerializer(serializers.Serializer):
     recognition_status = serializers.CharField()
     confidence_score = serializers.DecimalField(max_digits=5, decimal_places=4, allow_null=True)
     vendor_name = serializers.CharField(allow_blank=True)
+    contact_id = serializers.UUIDField(allow_null=True, required=False)
     total_amount = serializers.DecimalField(max_digits=15, decimal_places=2, allow_null=True)
     receipt_date = serializers.DateField(allow_null=True)
     error = serializers.CharField(allow_blank=True, required=False)
@@ -1208,6 +1227,9 @@ class GenerateReportSerializer(serializers.Serializer):
     # Notes
     notes = serializers.CharField(required=False, allow_blank=True, default='')
     
+    # Generate in a background worker and return immediately
+    queued = serializers.BooleanField(default=False)
+    
     def validate(self, data):
         if data['period_start'] > data['period_end']:
             raise serializers.ValidationError({
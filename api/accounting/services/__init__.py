@@ -7,9 +7,18 @@ Business logic services for accounting module.
 from .report_generator import ReportGeneratorService
 from .report_exporter import ReportExporterService
 from .report_cache import ReportCacheService
+from .balance_posting import BalancePostingService
+from .period_balances import PeriodBalanceService
+from .bank_reconciliation import BankReconciliationService
+from .bank_statement_import import import_statement, StatementImportError
 
 __all__ = [
     'ReportGeneratorService',
     'ReportExporterService',
     'ReportCacheService',
+    'BalancePostingService',
+    'PeriodBalanceService',
+    'BankReconciliationService',
+    'import_statement',
+    'StatementImportError',
 ]
@@ -0,0 +1,184 @@
+"""
+Balance Posting Service
+=======================
+Set-based posting engine that applies journal entry lines to account balances.
+
+Line amounts are grouped per account with a single aggregate query and applied
+with one ``F()`` expression ``UPDATE`` while the affected account rows are locked
+in sorted order, so concurrent posting neither loses updates nor deadlocks.
+Per-period snapshots (AccountPeriodBalance) are kept in step in the same transaction;
+journal_entries_posted / journal_entries_voided are sent once it commits.
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, List, Sequence
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+
+from ..models import Account, AccountType, JournalEntry, JournalEntryLine, TransactionStatus
+from ..signals import journal_entries_posted, journal_entries_voided
+from .period_balances import PeriodBalanceService
+
+
+# Assets and Expenses increase with debits; everything else with credits
+DEBIT_POSITIVE_TYPES = (AccountType.ASSET.value, AccountType.EXPENSE.value)
+
+BALANCE_FIELD = DecimalField(max_digits=15, decimal_places=2)
+
+
+class BalancePostingService:
+    """
+    Service for posting and voiding journal entries against account balances.
+    Used by JournalEntryViewSet and the AI assistants JournalEntryService.
+    """
+
+    # =================================================================
+    # Public API
+    # =================================================================
+
+    def post(self, entry: JournalEntry) -> bool:
+        """Post a single entry. Returns False if it was already posted or voided."""
+        return bool(self.post_many([entry]))
+
+    def void(self, entry: JournalEntry) -> bool:
+        """Reverse a single posted entry. Returns False if it was not posted."""
+        return bool(self.void_many([entry]))
+
+    @transaction.atomic
+    def post_many(self, entries: Iterable[JournalEntry]) -> List:
+        """
+        Post a batch of journal entries.
+
+        Entries are locked and re-checked so an entry posted (or voided)
+        concurrently by another request is not applied twice.
+        Returns the ids actually posted.
+        """
+        entries = list(entries)
+        entry_ids = self._lock_entries(
+            entries,
+            exclude_statuses=[TransactionStatus.POSTED.value, TransactionStatus.VOIDED.value],
+        )
+        if not entry_ids:
+            return []
+
+        self.apply_deltas(self.compute_deltas(entry_ids))
+        PeriodBalanceService().apply_entries(entry_ids)
+
+        now = timezone.now()
+        JournalEntry.all_objects.filter(id__in=entry_ids).update(
+            status=TransactionStatus.POSTED.value,
+            posted_at=now,
+            updated_at=now,
+        )
+        self._sync_instances(entries, entry_ids, status=TransactionStatus.POSTED.value, posted_at=now)
+        transaction.on_commit(
+            lambda: journal_entries_posted.send(sender=JournalEntry, entry_ids=entry_ids)
+        )
+        return entry_ids
+
+    @transaction.atomic
+    def void_many(self, entries: Iterable[JournalEntry]) -> List:
+        """
+        Void a batch of posted journal entries, reversing their balances.
+        Returns the ids actually voided.
+        """
+        entries = list(entries)
+        entry_ids = self._lock_entries(entries, status=TransactionStatus.POSTED.value)
+        if not entry_ids:
+            return []
+
+        self.apply_deltas(self.compute_deltas(entry_ids, sign=-1))
+        PeriodBalanceService().apply_entries(entry_ids, sign=-1)
+
+        JournalEntry.all_objects.filter(id__in=entry_ids).update(
+            status=TransactionStatus.VOIDED.value,
+            updated_at=timezone.now(),
+        )
+        self._sync_instances(entries, entry_ids, status=TransactionStatus.VOIDED.value)
+        transaction.on_commit(
+            lambda: journal_entries_voided.send(sender=JournalEntry, entry_ids=entry_ids)
+        )
+        return entry_ids
+
+    # =================================================================
+    # Delta Computation
+    # =================================================================
+
+    def compute_deltas(self, entry_ids: Sequence, sign: int = 1) -> Dict:
+        """
+        Group line amounts per account in one aggregate query.
+        Returns {account_id: signed balance delta}.
+        """
+        rows = (
+            JournalEntryLine.objects
+            .filter(journal_entry_id__in=entry_ids)
+            .order_by()
+            .values('account_id', 'account__account_type')
+            .annotate(debit=Sum('debit'), credit=Sum('credit'))
+        )
+
+        deltas = {}
+        for row in rows:
+            debit = row['debit'] or Decimal('0.00')
+            credit = row['credit'] or Decimal('0.00')
+            if row['account__account_type'] in DEBIT_POSITIVE_TYPES:
+                delta = debit - credit
+            else:
+                delta = credit - debit
+            if delta:
+                deltas[row['account_id']] = deltas.get(row['account_id'], Decimal('0.00')) + delta * sign
+        return deltas
+
+    @transaction.atomic
+    def apply_deltas(self, deltas: Dict) -> int:
+        """
+        Apply {account_id: delta} with a single UPDATE.
+        Account rows are locked in sorted id order first to avoid deadlocks
+        between concurrent batches touching overlapping accounts.
+        """
+        account_ids = sorted(account_id for account_id, delta in deltas.items() if delta)
+        if not account_ids:
+            return 0
+
+        list(
+            Account.all_objects.select_for_update()
+            .filter(id__in=account_ids)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+
+        increment = Case(
+            *[When(id=account_id, then=Value(deltas[account_id])) for account_id in account_ids],
+            default=Value(Decimal('0.00')),
+            output_field=BALANCE_FIELD,
+        )
+        return Account.all_objects.filter(id__in=account_ids).update(
+            current_balance=F('current_balance') + increment,
+            updated_at=timezone.now(),
+        )
+
+    # =================================================================
+    # Helpers
+    # =================================================================
+
+    def _lock_entries(self, entries: List[JournalEntry], status: str = None,
+                      exclude_statuses: Sequence[str] = ()) -> List:
+        """Lock entry rows (sorted) and return ids still in the expected status."""
+        queryset = JournalEntry.all_objects.select_for_update().filter(
+            id__in=[entry.pk for entry in entries]
+        )
+        if status is not None:
+            queryset = queryset.filter(status=status)
+        if exclude_statuses:
+            queryset = queryset.exclude(status__in=exclude_statuses)
+        return list(queryset.order_by('id').values_list('id', flat=True))
+
+    def _sync_instances(self, entries: List[JournalEntry], entry_ids: List, **fields):
+        """Keep in-memory instances in line with the bulk update."""
+        updated = set(entry_ids)
+        for entry in entries:
+            if entry.pk in updated:
+                for name, value in fields.items():
+                    setattr(entry, name, value)
@@ -0,0 +1,354 @@
+"""
+Bank Reconciliation Service
+===========================
+Matches the BankTransactions of a statement against the unmatched
+JournalEntryLines of its bank account.
+
+Amounts are compared in integer cents, signed from the bank account's side
+(money in positive): a deposit (transaction credit) matches a debit line on
+the bank account, a withdrawal a credit line. The candidate lines are loaded
+once into sorted numpy arrays and matched in passes:
+
+- exact: lines are sorted by ``amount * DAY_SPAN + day``, so every line with
+  the transaction's amount inside the date window is one searchsorted slice.
+  Candidates with the same reference rank first (EXACT_REFERENCE), the rest
+  by date distance (EXACT).
+- fuzzy: what is left, within an amount tolerance and a wider date window,
+  scored on amount and date distance and reference (FUZZY).
+- split: a remaining transaction equal to the sum of 2..max_split remaining
+  lines of the same sign inside the date window (SPLIT).
+
+Each pass assigns pairs greedily by score, one line per transaction; matches
+are written back with one bulk_update, plus one bulk insert of split lines.
+
+Only posted lines are candidates. A reconciliation runs in one transaction
+holding row locks on its statement and on the bank account's lines in the
+date window, so concurrent runs (same statement, or overlapping statements
+of one account) queue up and the later one sees the earlier one's matches.
+"""
+
+import re
+import time
+from datetime import date
+from decimal import Decimal
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import (
+    BankMatchType, BankStatement, BankTransaction, JournalEntryLine, TransactionStatus,
+)
+
+
+REFERENCE_CHARS = re.compile(r'[^0-9A-Z]')
+
+
+def normalize_reference(value: Optional[str]) -> str:
+    """Upper-case alphanumerics only, so 'inv-001 ' and 'INV001' compare equal"""
+    return REFERENCE_CHARS.sub('', (value or '').upper())
+
+
+def to_cents(value) -> int:
+    return int((Decimal(value or 0) * 100).to_integral_value())
+
+
+def expand_ranges(lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Flatten per-row [lo, hi) slices into (row, position) pairs
+    without a Python loop.
+    """
+    counts = hi - lo
+    rows = np.repeat(np.arange(len(lo)), counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return rows, starts + np.arange(counts.sum())
+
+
+class BankReconciliationService:
+    """
+    Service for matching bank statement transactions to journal entry lines.
+
+    Args:
+        date_window: days either side for exact-amount matches and splits
+        fuzzy_days: days either side for fuzzy matches
+        amount_tolerance: absolute fuzzy tolerance
+        tolerance_pct: fuzzy tolerance as a share of the amount (the larger wins)
+        max_split: most lines one transaction may be split across
+        max_candidates: fuzzy candidates kept per transaction (nearest amounts)
+    """
+
+    SPLIT_CANDIDATES = 20
+
+    def __init__(self, date_window: int = 3, fuzzy_days: int = 7,
+                 amount_tolerance: Decimal = Decimal('1.00'), tolerance_pct: float = 0.005,
+                 max_split: int = 3, max_candidates: int = 100, min_fuzzy_score: float = 0.4):
+        self.date_window = date_window
+        self.fuzzy_days = fuzzy_days
+        self.amount_tolerance = to_cents(amount_tolerance)
+        self.tolerance_pct = tolerance_pct
+        self.max_split = max_split
+        self.max_candidates = max_candidates
+        self.min_fuzzy_score = min_fuzzy_score
+
+    # =================================================================
+    # Public API
+    # =================================================================
+
+    @transaction.atomic
+    def reconcile(self, statement: BankStatement, user=None) -> Dict:
+        """
+        Match the statement's unmatched transactions and write the matches back.
+        Marks the statement reconciled once every transaction is matched.
+        """
+        started = time.perf_counter()
+        # Serializes runs on this statement; the transactions are read after the lock
+        statement.is_reconciled = BankStatement.all_objects.select_for_update().get(pk=statement.pk).is_reconciled
+        txns = self._load_transactions(statement)
+        by_type = {match_type.value: 0 for match_type in BankMatchType}
+        if txns['id'].size:
+            lines = self._load_lines(statement.bank_account_id, txns['day'].min(), txns['day'].max())
+            matches = self.match(txns, lines)
+            self._save(txns, lines, matches)
+            for _, _, match_type in matches:
+                by_type[match_type] += 1
+        else:
+            matches = []
+
+        unmatched = BankTransaction.all_objects.filter(statement=statement, is_matched=False).count()
+        if not unmatched and not statement.is_reconciled:
+            statement.is_reconciled = True
+            statement.reconciled_at = timezone.now()
+            statement.reconciled_by = user
+            statement.save(update_fields=['is_reconciled', 'reconciled_at', 'reconciled_by', 'updated_at'])
+
+        return {
+            'transactions': int(txns['id'].size),
+            'matched': len(matches),
+            'unmatched': unmatched,
+            'by_type': by_type,
+            'seconds': time.perf_counter() - started,
+        }
+
+    @transaction.atomic
+    def unmatch(self, transaction_ids: Iterable) -> int:
+        """Clear matches (and split lines) of the given transactions"""
+        transaction_ids = list(transaction_ids)
+        BankTransaction.split_lines.through.objects.filter(banktransaction_id__in=transaction_ids).delete()
+        updated = BankTransaction.all_objects.filter(id__in=transaction_ids).update(
+            is_matched=False, matched_journal_line=None, match_type='', updated_at=timezone.now(),
+        )
+        BankStatement.all_objects.filter(transactions__id__in=transaction_ids, is_reconciled=True).update(
+            is_reconciled=False, reconciled_at=None, reconciled_by=None,
+        )
+        return updated
+
+    def match(self, txns: Dict[str, np.ndarray], lines: Dict[str, np.ndarray]) -> List[Tuple[int, List[int], str]]:
+        """
+        Match transaction arrays to line arrays (see _arrays for the keys).
+        Returns [(transaction index, [line indexes], match type)].
+        """
+        txn_used = np.zeros(txns['id'].size, dtype=bool)
+        line_used = np.zeros(lines['id'].size, dtype=bool)
+        matches = []
+        if not lines['id'].size:
+            return matches
+        matches += self._exact_pass(txns, lines, txn_used, line_used)
+        matches += self._fuzzy_pass(txns, lines, txn_used, line_used)
+        matches += self._split_pass(txns, lines, txn_used, line_used)
+        return matches
+
+    # =================================================================
+    # Loading
+    # =================================================================
+
+    def _load_transactions(self, statement: BankStatement) -> Dict[str, np.ndarray]:
+        rows = BankTransaction.all_objects.filter(statement=statement, is_matched=False).values_list(
+            'id', 'date', 'reference', 'credit', 'debit',
+        )
+        return self._arrays(rows)
+
+    def _load_lines(self, account_id, first_day: int, last_day: int) -> Dict[str, np.ndarray]:
+        """Unmatched, posted lines of the bank account around the statement dates"""
+        window = max(self.date_window, self.fuzzy_days)
+        in_window = JournalEntryLine.objects.filter(
+            account_id=account_id,
+            journal_entry__date__gte=date.fromordinal(int(first_day) - window),
+            journal_entry__date__lte=date.fromordinal(int(last_day) + window),
+        )
+        # Lock first, then read: once a concurrent run commits, the read sees its matches
+        list(in_window.select_for_update(of=('self',)).order_by('pk').values_list('pk', flat=True))
+        rows = (
+            in_window
+            .filter(
+                journal_entry__status=TransactionStatus.POSTED.value,
+                banktransaction__isnull=True,
+                split_bank_transactions__isnull=True,
+            )
+            .order_by()
+            .values_list('id', 'journal_entry__date', 'journal_entry__reference', 'debit', 'credit')
+        )
+        return self._arrays(rows)
+
+    @staticmethod
+    def _arrays(rows) -> Dict[str, np.ndarray]:
+        """(id, date, reference, money in, money out) rows as column arrays"""
+        rows = list(rows)
+        return {
+            'id': np.array([row[0] for row in rows], dtype=object),
+            'day': np.array([row[1].toordinal() for row in rows], dtype=np.int64),
+            'reference': np.array([normalize_reference(row[2]) for row in rows], dtype=object),
+            'cents': np.array([to_cents(row[3]) - to_cents(row[4]) for row in rows], dtype=np.int64),
+        }
+
+    # =================================================================
+    # Matching passes
+    # =================================================================
+
+    def _exact_pass(self, txns, lines, txn_used, line_used):
+        window = self.date_window
+        base = min(txns['day'].min(), lines['day'].min()) - window
+        span = max(txns['day'].max(), lines['day'].max()) - base + window + 1
+
+        line_keys = lines['cents'] * span + (lines['day'] - base)
+        order = np.argsort(line_keys, kind='stable')
+        sorted_keys = line_keys[order]
+
+        txn_keys = txns['cents'] * span + (txns['day'] - base)
+        lo = np.searchsorted(sorted_keys, txn_keys - window, side='left')
+        hi = np.searchsorted(sorted_keys, txn_keys + window, side='right')
+        ti, positions = expand_ranges(lo, hi)
+        li = order[positions]
+
+        reference = txns['reference'][ti]
+        same_reference = (reference != '') & (reference == lines['reference'][li])
+        date_distance = np.abs(txns['day'][ti] - lines['day'][li])
+        score = same_reference * 2.0 + 1.0 - date_distance / (window + 1)
+
+        matches = []
+        for t, l, k in self._assign(ti, li, score, txn_used, line_used):
+            match_type = BankMatchType.EXACT_REFERENCE if same_reference[k] else BankMatchType.EXACT
+            matches.append((t, [l], match_type.value))
+        return matches
+
+    def _fuzzy_pass(self, txns, lines, txn_used, line_used):
+        open_txns = np.flatnonzero(~txn_used)
+        open_lines = np.flatnonzero(~line_used)
+        if not open_txns.size or not open_lines.size:
+            return []
+
+        order = open_lines[np.argsort(lines['cents'][open_lines], kind='stable')]
+        sorted_cents = lines['cents'][order]
+        cents = txns['cents'][open_txns]
+        tolerance = np.maximum(self.amount_tolerance, np.abs(cents) * self.tolerance_pct).astype(np.int64)
+
+        # Keep the max_candidates amounts nearest each transaction's own
+        lo = np.searchsorted(sorted_cents, cents - tolerance, side='left')
+        hi = np.searchsorted(sorted_cents, cents + tolerance, side='right')
+        middle = np.searchsorted(sorted_cents, cents)
+        half = self.max_candidates // 2
+        lo = np.maximum(lo, middle - half)
+        hi = np.maximum(lo, np.minimum(hi, middle + half))
+
+        rows, positions = expand_ranges(lo, hi)
+        ti = open_txns[rows]
+        li = order[positions]
+
+        date_distance = np.abs(txns['day'][ti] - lines['day'][li])
+        keep = (date_distance <= self.fuzzy_days) & (np.sign(txns['cents'][ti]) == np.sign(lines['cents'][li]))
+        ti, li, rows, date_distance = ti[keep], li[keep], rows[keep], date_distance[keep]
+
+        amount_distance = np.abs(txns['cents'][ti] - lines['cents'][li])
+        reference = txns['reference'][ti]
+        same_reference = (reference != '') & (reference == lines['reference'][li])
+        score = (
+            1.0
+            - 0.5 * amount_distance / (tolerance[rows] + 1)
+            - 0.3 * date_distance / (self.fuzzy_days + 1)
+            + 0.3 * same_reference
+        )
+
+        return [
+            (t, [l], BankMatchType.FUZZY.value)
+            for t, l, _ in self._assign(ti, li, score, txn_used, line_used, self.min_fuzzy_score)
+        ]
+
+    def _split_pass(self, txns, lines, txn_used, line_used):
+        if self.max_split < 2:
+            return []
+        order = np.argsort(lines['day'], kind='stable')
+        sorted_days = lines['day'][order]
+
+        matches = []
+        for t in np.flatnonzero(~txn_used):
+            cents, day = txns['cents'][t], txns['day'][t]
+            lo = np.searchsorted(sorted_days, day - self.date_window, side='left')
+            hi = np.searchsorted(sorted_days, day + self.date_window, side='right')
+            window = order[lo:hi]
+            window = window[
+                ~line_used[window]
+                & (np.sign(lines['cents'][window]) == np.sign(cents))
+                & (np.abs(lines['cents'][window]) < abs(cents))
+            ]
+            if window.size < 2:
+                continue
+            nearest = window[np.argsort(np.abs(lines['day'][window] - day), kind='stable')[:self.SPLIT_CANDIDATES]]
+            parts = self._find_split(nearest, lines['cents'][nearest], cents)
+            if parts:
+                txn_used[t] = True
+                line_used[parts] = True
+                matches.append((t, parts, BankMatchType.SPLIT.value))
+        return matches
+
+    def _find_split(self, indexes: np.ndarray, cents: np.ndarray, total: int) -> Optional[List[int]]:
+        """Fewest lines (2..max_split) whose amounts add up to total"""
+        positions = {}
+        for position, value in enumerate(cents.tolist()):
+            positions.setdefault(value, []).append(position)
+        for size in range(2, self.max_split + 1):
+            for combo in combinations(range(len(cents)), size - 1):
+                rest = total - int(cents[list(combo)].sum())
+                for position in positions.get(rest, ()):
+                    if position > combo[-1]:
+                        return [int(indexes[i]) for i in combo + (position,)]
+        return None
+
+    @staticmethod
+    def _assign(ti, li, score, txn_used, line_used, min_score=None):
+        """Greedy one-to-one assignment, best score first. Yields (txn, line, candidate)."""
+        for k in np.argsort(-score, kind='stable'):
+            if min_score is not None and score[k] < min_score:
+                break
+            t, l = ti[k], li[k]
+            if txn_used[t] or line_used[l]:
+                continue
+            txn_used[t] = line_used[l] = True
+            yield int(t), int(l), k
+
+    # =================================================================
+    # Write-back
+    # =================================================================
+
+    @transaction.atomic
+    def _save(self, txns, lines, matches) -> None:
+        now = timezone.now()
+        updated, split_rows = [], []
+        Through = BankTransaction.split_lines.through
+        for t, line_indexes, match_type in matches:
+            txn_id = txns['id'][t]
+            line_ids = [lines['id'][l] for l in line_indexes]
+            updated.append(BankTransaction(
+                id=txn_id,
+                is_matched=True,
+                matched_journal_line_id=line_ids[0],
+                match_type=match_type,
+                updated_at=now,
+            ))
+            if match_type == BankMatchType.SPLIT.value:
+                split_rows += [Through(banktransaction_id=txn_id, journalentryline_id=line_id) for line_id in line_ids]
+
+        BankTransaction.all_objects.bulk_update(
+            updated, ['is_matched', 'matched_journal_line', 'match_type', 'updated_at'], batch_size=1000,
+        )
+        Through.objects.bulk_create(split_rows, batch_size=1000, ignore_conflicts=True)
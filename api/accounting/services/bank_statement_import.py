@@ -0,0 +1,280 @@
+"""
+Bank Statement Import
+=====================
+Streaming CSV and OFX readers that turn a bank export into BankStatement /
+BankTransaction rows, inserted in batches so large statements are never
+held in memory.
+
+CSV column roles (date, description, reference, debit, credit or a signed
+amount) are resolved once from the header row. OFX (1.x SGML or 2.x XML)
+is tokenized tag by tag; each <STMTTRN> becomes one transaction and
+<LEDGERBAL><BALAMT> the statement's closing balance.
+"""
+
+import codecs
+import csv
+import io
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, Optional
+
+from django.db import transaction
+
+from ..models import BankStatement, BankTransaction
+
+
+class StatementImportError(Exception):
+    """Raised when a statement file cannot be read"""
+    pass
+
+
+CSV_COLUMN_ALIASES = {
+    'date': ('date', 'transaction date', 'posted date', 'posting date', 'value date', 'booking date',
+             '交易日期', '日期', '記帳日'),
+    'description': ('description', 'details', 'narrative', 'memo', 'payee', 'name', 'particulars',
+                    '摘要', '說明', '交易說明'),
+    'reference': ('reference', 'ref', 'reference number', 'check number', 'cheque number', 'transaction id',
+                  '參考號', '票據號碼'),
+    'debit': ('debit', 'withdrawal', 'withdrawals', 'paid out', 'money out', '支出', '提款'),
+    'credit': ('credit', 'deposit', 'deposits', 'paid in', 'money in', '存入', '存款'),
+    'amount': ('amount', 'transaction amount', '金額'),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y%m%d')
+
+AMOUNT_NOISE = re.compile(r'[^0-9.\-]')
+
+
+def parse_amount(value) -> Decimal:
+    """'1,234.50', '$-12', '(12.00)' -> Decimal; blank -> 0"""
+    text = str(value or '').strip()
+    negative = text.startswith('(') and text.endswith(')')
+    text = AMOUNT_NOISE.sub('', text)
+    if not text or text in ('-', '.'):
+        return Decimal('0.00')
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise StatementImportError(f"Invalid amount: {value!r}")
+    return -abs(amount) if negative else amount
+
+
+class DateParser:
+    """Parses dates in the first of DATE_FORMATS that fits, then keeps using it"""
+
+    def __init__(self):
+        self.formats = list(DATE_FORMATS)
+
+    def __call__(self, value) -> date:
+        text = str(value or '').strip()[:10]
+        for index, fmt in enumerate(self.formats):
+            try:
+                parsed = datetime.strptime(text, fmt).date()
+            except ValueError:
+                continue
+            if index:
+                self.formats.insert(0, self.formats.pop(index))
+            return parsed
+        raise StatementImportError(f"Invalid date: {value!r}")
+
+
+def text_stream(stream, encoding: str = 'utf-8-sig'):
+    """Text view of an uploaded (binary) file"""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return codecs.getreader(encoding)(stream, errors='replace')
+
+
+# =================================================================
+# Readers
+# =================================================================
+
+class CSVStatementReader:
+    """Iterate transactions of a CSV export as dicts of BankTransaction fields"""
+
+    closing_balance = None
+
+    def __init__(self, stream, encoding: str = 'utf-8-sig'):
+        self.stream = text_stream(stream, encoding)
+
+    def __iter__(self) -> Iterator[Dict]:
+        header_line = self.stream.readline()
+        if not header_line:
+            return
+        delimiter = max(',;\t', key=header_line.count)
+        header = next(csv.reader([header_line], delimiter=delimiter))
+        columns = self.resolve_columns(header)
+        parse_date = DateParser()
+
+        def cell(row, role):
+            index = columns.get(role)
+            return row[index].strip() if index is not None and index < len(row) else ''
+
+        for row in csv.reader(self.stream, delimiter=delimiter):
+            if not any(field.strip() for field in row):
+                continue
+            if 'amount' in columns:
+                amount = parse_amount(cell(row, 'amount'))
+                credit, debit = max(amount, Decimal('0.00')), max(-amount, Decimal('0.00'))
+            else:
+                credit, debit = abs(parse_amount(cell(row, 'credit'))), abs(parse_amount(cell(row, 'debit')))
+            yield {
+                'date': parse_date(cell(row, 'date')),
+                'description': cell(row, 'description')[:500],
+                'reference': cell(row, 'reference')[:100],
+                'debit': debit,
+                'credit': credit,
+            }
+
+    @staticmethod
+    def resolve_columns(header) -> Dict[str, int]:
+        """Map each role to its column index, exact names first"""
+        names = [name.strip().lower() for name in header]
+        columns = {}
+        for role, aliases in CSV_COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in names:
+                    columns[role] = names.index(alias)
+                    break
+        if 'date' not in columns or not ('amount' in columns or {'debit', 'credit'} & columns.keys()):
+            raise StatementImportError(
+                f"CSV header needs a date column and an amount or debit/credit columns: {header}"
+            )
+        if 'amount' in columns and {'debit', 'credit'} & columns.keys():
+            del columns['amount']
+        return columns
+
+
+class OFXStatementReader:
+    """Iterate transactions of an OFX/QFX export as dicts of BankTransaction fields"""
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, stream, encoding: str = 'utf-8-sig'):
+        self.stream = text_stream(stream, encoding)
+        self.closing_balance: Optional[Decimal] = None
+
+    def tags(self) -> Iterator:
+        """(TAG, text) per element start, ('/TAG', '') per end tag, read chunk by chunk"""
+        buffer = ''
+        while True:
+            chunk = self.stream.read(self.CHUNK_SIZE)
+            buffer += chunk
+            parts = buffer.split('<')
+            # The last part may be cut off mid-element
+            buffer = parts.pop() if chunk else ''
+            for part in parts:
+                tag, _, text = part.partition('>')
+                if tag:
+                    yield tag.strip().upper(), text.strip()
+            if not chunk:
+                if buffer:
+                    tag, _, text = buffer.partition('>')
+                    yield tag.strip().upper(), text.strip()
+                return
+
+    def __iter__(self) -> Iterator[Dict]:
+        fields, in_ledger_balance = None, False
+        for tag, text in self.tags():
+            if tag == 'STMTTRN':
+                fields = {}
+            elif tag == '/STMTTRN' and fields is not None:
+                yield self._transaction(fields)
+                fields = None
+            elif fields is not None and not tag.startswith('/'):
+                fields[tag] = text
+            elif tag == 'LEDGERBAL':
+                in_ledger_balance = True
+            elif tag == '/LEDGERBAL':
+                in_ledger_balance = False
+            elif tag == 'BALAMT' and in_ledger_balance:
+                self.closing_balance = parse_amount(text)
+
+    @staticmethod
+    def _transaction(fields: Dict[str, str]) -> Dict:
+        amount = parse_amount(fields.get('TRNAMT'))
+        posted = fields.get('DTPOSTED', '')[:8]
+        try:
+            posted = datetime.strptime(posted, '%Y%m%d').date()
+        except ValueError:
+            raise StatementImportError(f"Invalid DTPOSTED: {fields.get('DTPOSTED')!r}")
+        description = ' '.join(filter(None, [fields.get('NAME'), fields.get('MEMO')]))
+        return {
+            'date': posted,
+            'description': description[:500],
+            'reference': (fields.get('CHECKNUM') or fields.get('REFNUM') or fields.get('FITID') or '')[:100],
+            'debit': max(-amount, Decimal('0.00')),
+            'credit': max(amount, Decimal('0.00')),
+        }
+
+
+def detect_format(stream, filename: str = '') -> str:
+    """'ofx' or 'csv', from the file name or the first bytes"""
+    name = filename.lower()
+    if name.endswith(('.ofx', '.qfx')):
+        return 'ofx'
+    if name.endswith(('.csv', '.txt')):
+        return 'csv'
+    if hasattr(stream, 'peek'):
+        head = stream.peek(512)[:512]
+    elif stream.seekable():
+        head = stream.read(512)
+        stream.seek(0)
+    else:
+        return 'csv'
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', errors='ignore')
+    return 'ofx' if 'OFXHEADER' in head.upper() or '<OFX>' in head.upper() else 'csv'
+
+
+# =================================================================
+# Import
+# =================================================================
+
+@transaction.atomic
+def import_statement(stream, bank_account, statement_date: Optional[date] = None,
+                     opening_balance: Decimal = Decimal('0.00'), fmt: Optional[str] = None,
+                     filename: str = '', batch_size: int = 1000) -> BankStatement:
+    """
+    Stream a CSV/OFX file into a new BankStatement of bank_account.
+
+    statement_date defaults to the last transaction date; the closing balance
+    comes from OFX <LEDGERBAL>, otherwise opening balance plus net movement.
+    """
+    fmt = fmt or detect_format(stream, filename)
+    reader = OFXStatementReader(stream) if fmt == 'ofx' else CSVStatementReader(stream)
+
+    statement = BankStatement.all_objects.create(
+        tenant_id=bank_account.tenant_id,
+        bank_account=bank_account,
+        statement_date=statement_date or date.min,
+        opening_balance=opening_balance,
+        closing_balance=opening_balance,
+    )
+
+    batch, count, net, last_date = [], 0, Decimal('0.00'), None
+    for fields in reader:
+        batch.append(BankTransaction(tenant_id=bank_account.tenant_id, statement=statement, **fields))
+        net += fields['credit'] - fields['debit']
+        last_date = max(last_date or fields['date'], fields['date'])
+        if len(batch) >= batch_size:
+            BankTransaction.all_objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        BankTransaction.all_objects.bulk_create(batch)
+        count += len(batch)
+    if not count:
+        raise StatementImportError("Statement file contains no transactions")
+
+    if not statement_date and BankStatement.all_objects.filter(
+        tenant_id=bank_account.tenant_id, bank_account=bank_account, statement_date=last_date,
+    ).exists():
+        raise StatementImportError(f"A statement dated {last_date} already exists for this account")
+    statement.statement_date = statement_date or last_date
+    statement.closing_balance = (
+        reader.closing_balance if reader.closing_balance is not None else opening_balance + net
+    )
+    statement.save(update_fields=['statement_date', 'closing_balance', 'updated_at'])
+    return statement
@@ -0,0 +1,283 @@
+"""
+Period Balance Service
+======================
+Maintains the AccountPeriodBalance snapshot table and answers
+"movements before date X" queries from it.
+
+Opening balances become a grouped lookup over per-period snapshots plus a small
+delta scan of the lines outside the snapshotted range (typically the current,
+partial period) instead of aggregating the whole ledger history.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+
+from ..models import (
+    AccountingPeriod, AccountPeriodBalance, JournalEntryLine, TransactionStatus
+)
+
+
+ZERO = Decimal('0.00')
+AMOUNT_FIELD = DecimalField(max_digits=15, decimal_places=2)
+
+
+class PeriodBalanceService:
+    """
+    Service for incremental per-period account balance snapshots.
+    """
+
+    # =================================================================
+    # Incremental Maintenance
+    # =================================================================
+
+    @transaction.atomic
+    def apply_entries(self, entry_ids: Sequence, sign: int = 1) -> int:
+        """
+        Add (sign=1) or remove (sign=-1) the lines of the given entries
+        from their period snapshots. Entries without a tenant or outside any
+        accounting period are left to the delta scan.
+        Returns the number of snapshot rows touched.
+        """
+        rows = list(
+            JournalEntryLine.objects
+            .filter(journal_entry_id__in=entry_ids, journal_entry__tenant__isnull=False)
+            .order_by()
+            .values('account_id', 'journal_entry__tenant_id', 'journal_entry__date')
+            .annotate(debit=Sum('debit'), credit=Sum('credit'))
+        )
+        if not rows:
+            return 0
+
+        dates = [row['journal_entry__date'] for row in rows]
+        periods = self._periods_by_tenant(
+            {row['journal_entry__tenant_id'] for row in rows}, min(dates), max(dates)
+        )
+
+        totals = {}
+        for row in rows:
+            tenant_id = row['journal_entry__tenant_id']
+            period = self._resolve_period(periods.get(tenant_id, []), row['journal_entry__date'])
+            if period is None:
+                continue
+            key = (tenant_id, row['account_id'], period)
+            debit, credit = totals.get(key, (ZERO, ZERO))
+            totals[key] = (
+                debit + (row['debit'] or ZERO) * sign,
+                credit + (row['credit'] or ZERO) * sign,
+            )
+
+        return self._increment(totals)
+
+    def _increment(self, totals: Dict) -> int:
+        """Upsert {(tenant_id, account_id, period): (debit, credit)} increments."""
+        if not totals:
+            return 0
+
+        # Make sure every row exists, then add with a single UPDATE
+        AccountPeriodBalance.all_objects.bulk_create(
+            [
+                AccountPeriodBalance(
+                    tenant_id=tenant_id,
+                    account_id=account_id,
+                    period_id=period[0],
+                    period_start=period[1],
+                    period_end=period[2],
+                )
+                for tenant_id, account_id, period in totals
+            ],
+            ignore_conflicts=True,
+        )
+
+        wanted = {(tenant_id, account_id, period[0]): value for (tenant_id, account_id, period), value in totals.items()}
+        locked = (
+            AccountPeriodBalance.all_objects.select_for_update()
+            .filter(
+                tenant_id__in={key[0] for key in wanted},
+                account_id__in={key[1] for key in wanted},
+                period_id__in={key[2] for key in wanted},
+            )
+            .order_by('id')
+            .values_list('id', 'tenant_id', 'account_id', 'period_id')
+        )
+        row_values = {
+            row_id: wanted[(tenant_id, account_id, period_id)]
+            for row_id, tenant_id, account_id, period_id in locked
+            if (tenant_id, account_id, period_id) in wanted
+        }
+        if not row_values:
+            return 0
+
+        def increment(index):
+            return Case(
+                *[When(id=row_id, then=Value(value[index])) for row_id, value in row_values.items()],
+                default=Value(ZERO),
+                output_field=AMOUNT_FIELD,
+            )
+
+        return AccountPeriodBalance.all_objects.filter(id__in=list(row_values)).update(
+            debit_total=F('debit_total') + increment(0),
+            credit_total=F('credit_total') + increment(1),
+        )
+
+    # =================================================================
+    # Rebuild
+    # =================================================================
+
+    @transaction.atomic
+    def rebuild_period(self, period: AccountingPeriod) -> int:
+        """Recompute the snapshot rows of one period from posted lines."""
+        AccountPeriodBalance.all_objects.filter(period=period).delete()
+        if period.tenant_id is None:
+            return 0
+
+        rows = (
+            JournalEntryLine.objects
+            .filter(
+                journal_entry__tenant_id=period.tenant_id,
+                journal_entry__status=TransactionStatus.POSTED.value,
+                journal_entry__date__gte=period.start_date,
+                journal_entry__date__lte=period.end_date,
+            )
+            .order_by()
+            .values('account_id')
+            .annotate(debit=Sum('debit'), credit=Sum('credit'))
+        )
+        created = AccountPeriodBalance.all_objects.bulk_create([
+            AccountPeriodBalance(
+                tenant_id=period.tenant_id,
+                account_id=row['account_id'],
+                period=period,
+                period_start=period.start_date,
+                period_end=period.end_date,
+                debit_total=row['debit'] or ZERO,
+                credit_total=row['credit'] or ZERO,
+            )
+            for row in rows
+        ])
+        return len(created)
+
+    def rebuild(self, tenant_id=None) -> int:
+        """Rebuild snapshots for one tenant (or every tenant)."""
+        periods = AccountingPeriod.all_objects.filter(tenant__isnull=False)
+        if tenant_id is not None:
+            periods = periods.filter(tenant_id=tenant_id)
+        return sum(self.rebuild_period(period) for period in periods.order_by('start_date'))
+
+    # =================================================================
+    # Lookups
+    # =================================================================
+
+    def get_movements_before(
+        self,
+        tenant_id,
+        before: date,
+        account_ids: Optional[Iterable] = None,
+    ) -> Dict:
+        """
+        Total posted debits/credits per account for entries dated before `before`.
+        Returns {account_id: (debit_total, credit_total)}.
+        """
+        base_filter = Q(
+            journal_entry__date__lt=before,
+            journal_entry__status=TransactionStatus.POSTED.value,
+        )
+        if account_ids is not None:
+            account_ids = list(account_ids)
+            base_filter &= Q(account_id__in=account_ids)
+
+        if tenant_id is None:
+            return self._scan_lines(base_filter)
+        base_filter &= Q(journal_entry__tenant_id=tenant_id)
+
+        covered = self._covered_range(tenant_id, before)
+        if covered is None:
+            return self._scan_lines(base_filter)
+
+        covered_start, covered_end = covered
+        snapshot = AccountPeriodBalance.all_objects.filter(
+            tenant_id=tenant_id,
+            period_start__gte=covered_start,
+            period_end__lte=covered_end,
+        )
+        if account_ids is not None:
+            snapshot = snapshot.filter(account_id__in=account_ids)
+
+        movements = {}
+        for row in snapshot.order_by().values('account_id').annotate(
+            debit=Sum('debit_total'), credit=Sum('credit_total')
+        ):
+            movements[row['account_id']] = (row['debit'] or ZERO, row['credit'] or ZERO)
+
+        # Delta scan: lines before the first snapshotted period or after the last one
+        outside = Q(journal_entry__date__lt=covered_start) | Q(journal_entry__date__gt=covered_end)
+        for account_id, (debit, credit) in self._scan_lines(base_filter & outside).items():
+            prev_debit, prev_credit = movements.get(account_id, (ZERO, ZERO))
+            movements[account_id] = (prev_debit + debit, prev_credit + credit)
+
+        return {
+            account_id: value for account_id, value in movements.items()
+            if value[0] or value[1]
+        }
+
+    # =================================================================
+    # Helpers
+    # =================================================================
+
+    def _scan_lines(self, line_filter: Q) -> Dict:
+        """Grouped aggregate over journal lines (fallback / delta path)."""
+        return {
+            row['account_id']: (row['debit'] or ZERO, row['credit'] or ZERO)
+            for row in JournalEntryLine.objects.filter(line_filter)
+            .order_by()
+            .values('account_id')
+            .annotate(debit=Sum('debit'), credit=Sum('credit'))
+        }
+
+    def _covered_range(self, tenant_id, before: date) -> Optional[Tuple[date, date]]:
+        """
+        Date range of the most recent contiguous run of periods that end
+        before `before`. A gap ends the run (older history then falls into
+        the delta scan); overlapping periods disable the snapshot path.
+        Open periods count too: posted entries only change through
+        BalancePostingService, which keeps their snapshots current.
+        """
+        periods = list(
+            AccountingPeriod.all_objects
+            .filter(tenant_id=tenant_id, end_date__lt=before)
+            .order_by('-start_date')
+            .values_list('start_date', 'end_date')
+        )
+        if not periods:
+            return None
+
+        covered_start, covered_end = periods[0]
+        for start_date, end_date in periods[1:]:
+            if end_date >= covered_start:
+                return None
+            if end_date + timedelta(days=1) != covered_start:
+                break
+            covered_start = start_date
+        return covered_start, covered_end
+
+    def _periods_by_tenant(self, tenant_ids, start: date, end: date) -> Dict[object, List[tuple]]:
+        """Periods overlapping [start, end] as (id, start_date, end_date) per tenant."""
+        periods = {}
+        for period_id, tenant_id, start_date, end_date in (
+            AccountingPeriod.all_objects
+            .filter(tenant_id__in=tenant_ids, start_date__lte=end, end_date__gte=start)
+            .order_by('start_date')
+            .values_list('id', 'tenant_id', 'start_date', 'end_date')
+        ):
+            periods.setdefault(tenant_id, []).append((period_id, start_date, end_date))
+        return periods
+
+    def _resolve_period(self, periods: List[tuple], on: date) -> Optional[tuple]:
+        """First period (by start date) containing the given date."""
+        for period in periods:
+            if period[1] <= on <= period[2]:
+                return period
+        return None
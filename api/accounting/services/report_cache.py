@@ -3,17 +3,24 @@ Report Cache Service
 ====================
 Caching layer for large report data using Django cache framework.
 Supports Redis for production and local memory for development.
+
+Cached reports record what they depend on (tenant, period range, account set).
+Posting or voiding journal entries increments a per-tenant generation counter
+for each affected month/year bucket (and account). A report keeps the counters
+of its dependencies as read before generation; it is stale as soon as any of
+them differs, so no clocks are compared across hosts.
 """
 
 import hashlib
 import json
-from datetime import timedelta
-from typing import Dict, Optional, Any
+import secrets
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Any, Sequence
 from django.core.cache import cache
-from django.conf import settings
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
 
-from ..models import Report, ReportStatus
+from ..models import JournalEntryLine, Report, ReportType
 
 
 class ReportCacheService:
@@ -26,6 +33,9 @@ class ReportCacheService:
     PREFIX_REPORT_DATA = 'report:data:'
     PREFIX_REPORT_SUMMARY = 'report:summary:'
     PREFIX_REPORT_STATUS = 'report:status:'
+    PREFIX_GENERATION = 'report:gen:'
+    PREFIX_STATS = 'report:stats:'
+    PREFIX_INFLIGHT = 'report:inflight:'
     
     # Default cache TTL (24 hours)
     DEFAULT_TTL = 60 * 60 * 24
@@ -34,6 +44,26 @@ class ReportCacheService:
     LARGE_REPORT_THRESHOLD = 100000  # 100KB
     LARGE_REPORT_TTL = 60 * 60 * 48  # 48 hours
     
+    # Reports that include every movement up to period_end (opening balances)
+    CUMULATIVE_REPORT_TYPES = (
+        ReportType.BALANCE_SHEET.value,
+        ReportType.GENERAL_LEDGER.value,
+        ReportType.SUB_LEDGER.value,
+        ReportType.TRIAL_BALANCE.value,
+        ReportType.ACCOUNTS_RECEIVABLE.value,
+        ReportType.ACCOUNTS_PAYABLE.value,
+    )
+    
+    # In-flight generation claims outlive the Celery hard time limit
+    INFLIGHT_TTL = 60 * 30
+    
+    # Generation counters outlive every cached report (LARGE_REPORT_TTL) by a wide margin
+    GENERATION_TTL = 60 * 60 * 24 * 14
+    
+    # Months from this year on get their own generation; earlier dates share one bucket
+    FIRST_TRACKED_YEAR = 2000
+    EARLY_BUCKET = 'early'
+    
     def __init__(self):
         pass
     
@@ -65,38 +95,59 @@ class ReportCacheService:
     def get_cached_report_data(self, report: Report) -> Optional[Dict]:
         """
         Get cached report data if available and valid.
-        Returns None if not cached or expired.
+        Returns None if not cached, expired or invalidated by newer postings.
         """
         if not report.cache_key:
+            self._increment_stat(report.tenant_id, 'misses')
             return None
         
         # Check if cache is still valid
         if report.cache_expires_at and timezone.now() > report.cache_expires_at:
             self.invalidate_report_cache(report)
+            self._increment_stat(report.tenant_id, 'misses')
+            return None
+        
+        entry = cache.get(report.cache_key)
+        if entry is None:
+            self._increment_stat(report.tenant_id, 'misses')
             return None
         
-        cached = cache.get(report.cache_key)
-        if cached:
-            # Verify data hash if available
-            if report.data_hash:
-                cached_hash = self._calculate_hash(cached)
-                if cached_hash != report.data_hash:
-                    # Data mismatch, invalidate
-                    self.invalidate_report_cache(report)
-                    return None
-            return cached
+        if isinstance(entry, dict) and 'dependencies' in entry:
+            if self._is_stale(entry.get('generations')):
+                self.invalidate_report_cache(report)
+                self._increment_stat(report.tenant_id, 'invalidations')
+                self._increment_stat(report.tenant_id, 'misses')
+                return None
+            cached = entry['data']
+        else:
+            cached = entry
+        
+        # Verify data hash if available
+        if report.data_hash:
+            cached_hash = self._calculate_hash(cached)
+            if cached_hash != report.data_hash:
+                # Data mismatch, invalidate
+                self.invalidate_report_cache(report)
+                self._increment_stat(report.tenant_id, 'misses')
+                return None
         
-        return None
+        self._increment_stat(report.tenant_id, 'hits')
+        return cached
     
     def cache_report_data(
         self,
         report: Report,
         data: Dict,
-        ttl: Optional[int] = None
+        ttl: Optional[int] = None,
+        generations: Optional[Dict[str, int]] = None
     ) -> str:
         """
         Cache report data and return the cache key.
         Automatically adjusts TTL based on data size.
+        
+        generations are the dependency counters read before the data was
+        (defaults to report.dependency_generations, then the current ones);
+        any later posting or voiding makes the entry stale.
         """
         cache_key = self._get_report_data_key(str(report.id))
         
@@ -105,14 +156,24 @@ class ReportCacheService:
         if ttl is None:
             ttl = self.LARGE_REPORT_TTL if data_size > self.LARGE_REPORT_THRESHOLD else self.DEFAULT_TTL
         
-        # Store in cache
-        cache.set(cache_key, data, ttl)
+        update_fields = ['cache_key', 'cache_expires_at', 'data_hash']
+        generations = generations or report.dependency_generations
+        if not generations:
+            generations = report.dependency_generations = self.snapshot_generations(report)
+            update_fields.append('dependency_generations')
+        
+        # Store in cache together with what the data depends on
+        cache.set(cache_key, {
+            'data': data,
+            'dependencies': self.get_dependencies(report),
+            'generations': generations,
+        }, ttl)
         
         # Update report with cache info
         report.cache_key = cache_key
         report.cache_expires_at = timezone.now() + timedelta(seconds=ttl)
         report.data_hash = self._calculate_hash(data)
-        report.save(update_fields=['cache_key', 'cache_expires_at', 'data_hash'])
+        report.save(update_fields=update_fields)
         
         return cache_key
     
@@ -128,6 +189,149 @@ class ReportCacheService:
         report.cache_expires_at = None
         report.save(update_fields=['cache_key', 'cache_expires_at'])
     
+    def is_report_stale(self, report: Report) -> bool:
+        """Whether entries affecting the report were posted/voided after it was generated"""
+        return self._is_stale(report.dependency_generations)
+    
+    # =================================================================
+    # Dependency Tracking
+    # =================================================================
+    
+    def get_dependencies(self, report: Report) -> Dict:
+        """
+        (tenant, period range, account set) the report's data is built from.
+        Cumulative reports depend on all history up to period_end (period_start None).
+        """
+        period_start = report.period_start
+        period_end = report.period_end
+        if report.include_comparison:
+            for boundary in (report.comparison_period_start, report.comparison_period_end):
+                if boundary:
+                    period_start = min(period_start, boundary)
+                    period_end = max(period_end, boundary)
+        if report.report_type in self.CUMULATIVE_REPORT_TYPES:
+            period_start = None
+        
+        account_ids = (report.filters or {}).get('account_ids') or None
+        return {
+            'tenant_id': str(report.tenant_id) if report.tenant_id else None,
+            'period_start': period_start.isoformat() if period_start else None,
+            'period_end': period_end.isoformat(),
+            'account_ids': sorted(str(account_id) for account_id in account_ids) if account_ids else None,
+        }
+    
+    def snapshot_generations(self, report: Report) -> Dict[str, int]:
+        """
+        Current generation counters of the report's dependencies. Take it
+        before reading the ledger; counters missing from the cache are
+        created so the snapshot never records an absent key.
+        """
+        keys = self._dependency_keys(self.get_dependencies(report))
+        generations = cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                cache.add(key, self._new_generation(), timeout=self.GENERATION_TTL)
+        if len(generations) < len(keys):
+            generations = cache.get_many(keys)
+        return generations
+    
+    def bump_generations(self, tenant_id, changes: Iterable) -> int:
+        """
+        Increment the generation of every (month, account_id) changed in a tenant.
+        Returns the number of generation keys bumped.
+        """
+        keys = set()
+        for month, account_id in changes:
+            for bucket in self._buckets_for_date(month):
+                keys.add(self._get_generation_key(tenant_id, bucket))
+                keys.add(self._get_generation_key(tenant_id, bucket, account_id))
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Expired or never read: any new value differs from every snapshot
+                if not cache.add(key, self._new_generation(), timeout=self.GENERATION_TTL):
+                    cache.incr(key)
+            cache.touch(key, self.GENERATION_TTL)
+        return len(keys)
+    
+    def invalidate_for_entries(self, entry_ids: Sequence) -> int:
+        """
+        Bump generations for the tenants/months/accounts touched by the given
+        journal entries. Called after entries are posted or voided.
+        """
+        changes = {}
+        for tenant_id, month, account_id in (
+            JournalEntryLine.objects
+            .filter(journal_entry_id__in=entry_ids)
+            .annotate(month=TruncMonth('journal_entry__date'))
+            .order_by()
+            .values_list('journal_entry__tenant_id', 'month', 'account_id')
+            .distinct()
+        ):
+            changes.setdefault(tenant_id, set()).add((month, account_id))
+        
+        return sum(
+            self.bump_generations(tenant_id, tenant_changes)
+            for tenant_id, tenant_changes in changes.items()
+        )
+    
+    def _is_stale(self, generations: Optional[Dict[str, int]]) -> bool:
+        """True if any snapshotted generation changed (or expired) since it was read"""
+        if not generations:
+            return True
+        current = cache.get_many(list(generations))
+        return any(current.get(key) != generation for key, generation in generations.items())
+    
+    def _dependency_keys(self, dependencies: Dict) -> List[str]:
+        """Generation keys covering the dependencies' period range and accounts"""
+        start = date.fromisoformat(dependencies['period_start']) if dependencies['period_start'] else None
+        end = date.fromisoformat(dependencies['period_end'])
+        account_ids = dependencies.get('account_ids')
+        return [
+            self._get_generation_key(dependencies['tenant_id'], bucket, account_id)
+            for bucket in self._buckets_for_range(start, end)
+            for account_id in (account_ids or [None])
+        ]
+    
+    def _buckets_for_date(self, on: date) -> List[str]:
+        """Month and year buckets a change on this date belongs to"""
+        if on.year < self.FIRST_TRACKED_YEAR:
+            return [self.EARLY_BUCKET]
+        return [f"{on.year}-{on.month:02d}", str(on.year)]
+    
+    def _buckets_for_range(self, start: Optional[date], end: date) -> List[str]:
+        """
+        Smallest set of buckets covering [start, end]: months at the edges,
+        whole years in between. start=None means from the beginning.
+        """
+        first = date(self.FIRST_TRACKED_YEAR, 1, 1)
+        buckets = []
+        if start is None or start < first:
+            buckets.append(self.EARLY_BUCKET)
+            start = first
+        if end < start:
+            return buckets
+        
+        if start.year == end.year:
+            return buckets + [f"{start.year}-{month:02d}" for month in range(start.month, end.month + 1)]
+        
+        buckets += [f"{start.year}-{month:02d}" for month in range(start.month, 13)]
+        buckets += [str(year) for year in range(start.year + 1, end.year)]
+        buckets += [f"{end.year}-{month:02d}" for month in range(1, end.month + 1)]
+        return buckets
+    
+    def _get_generation_key(self, tenant_id, bucket: str, account_id=None) -> str:
+        """Cache key of a tenant (and optionally account) generation for a bucket"""
+        key = f"{self.PREFIX_GENERATION}{tenant_id or 'global'}:{bucket}"
+        if account_id:
+            key += f":{account_id}"
+        return key
+    
+    def _new_generation(self) -> int:
+        """Random starting value, so a recreated counter does not repeat an old one"""
+        return secrets.randbits(48)
+    
     # =================================================================
     # Report Summary Caching
     # =================================================================
@@ -175,6 +379,43 @@ class ReportCacheService:
         key = self._get_report_status_key(report_id)
         cache.delete(key)
     
+    # =================================================================
+    # In-flight Generation (request coalescing)
+    # =================================================================
+    
+    def get_request_hash(self, report: Report) -> str:
+        """Hash of everything that determines a report's data"""
+        return self._generate_filter_hash({
+            'tenant_id': report.tenant_id,
+            'report_type': report.report_type,
+            'period_start': report.period_start,
+            'period_end': report.period_end,
+            'filters': report.filters or {},
+            'include_comparison': report.include_comparison,
+            'comparison_period_start': report.comparison_period_start,
+            'comparison_period_end': report.comparison_period_end,
+        })
+    
+    def claim_generation(self, request_hash: str, report_id: str) -> Optional[str]:
+        """
+        Register report_id as the generation in flight for request_hash.
+        Returns None if claimed, otherwise the id of the report already in flight.
+        """
+        key = f"{self.PREFIX_INFLIGHT}{request_hash}"
+        if cache.add(key, str(report_id), timeout=self.INFLIGHT_TTL):
+            return None
+        return cache.get(key)
+    
+    def force_claim_generation(self, request_hash: str, report_id: str) -> None:
+        """Take over a claim whose report is no longer generating"""
+        cache.set(f"{self.PREFIX_INFLIGHT}{request_hash}", str(report_id), timeout=self.INFLIGHT_TTL)
+    
+    def release_generation(self, request_hash: str, report_id: str) -> None:
+        """Drop the in-flight claim if it still belongs to report_id"""
+        key = f"{self.PREFIX_INFLIGHT}{request_hash}"
+        if cache.get(key) == str(report_id):
+            cache.delete(key)
+    
     # =================================================================
     # Query Result Caching
     # =================================================================
@@ -256,6 +497,7 @@ class ReportCacheService:
     def get_cache_stats(self, tenant_id: Optional[str] = None) -> Dict:
         """
         Get cache statistics for monitoring.
+        Hit/miss/invalidation counters are per tenant (cache backed).
         """
         from ..models import Report
         
@@ -269,13 +511,36 @@ class ReportCacheService:
             cache_expires_at__lt=timezone.now()
         ).exclude(cache_key='').count()
         
+        counters = cache.get_many([
+            self._get_stats_key(tenant_id, name) for name in ('hits', 'misses', 'invalidations')
+        ])
+        hits = counters.get(self._get_stats_key(tenant_id, 'hits'), 0)
+        misses = counters.get(self._get_stats_key(tenant_id, 'misses'), 0)
+        
         return {
             'total_reports': total,
             'cached_reports': cached,
             'expired_cache': expired,
-            'cache_hit_rate': (cached - expired) / total if total > 0 else 0
+            'hits': hits,
+            'misses': misses,
+            'invalidations': counters.get(self._get_stats_key(tenant_id, 'invalidations'), 0),
+            'cache_hit_rate': hits / (hits + misses) if hits + misses > 0 else 0
         }
     
+    def _get_stats_key(self, tenant_id, name: str) -> str:
+        """Cache key of a per-tenant hit/miss/invalidation counter"""
+        return f"{self.PREFIX_STATS}{tenant_id or 'global'}:{name}"
+    
+    def _increment_stat(self, tenant_id, name: str) -> None:
+        """Atomically increment a statistics counter"""
+        key = self._get_stats_key(tenant_id, name)
+        if not cache.add(key, 1, timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Evicted between add and incr
+                cache.set(key, 1, timeout=None)
+    
     # =================================================================
     # Helper Methods
     # =================================================================
@@ -2,19 +2,72 @@
 Report Exporter Service
 =======================
 Exports reports to Word, Excel, PDF, and CSV formats.
+
+Excel is written with a write-only workbook, so rows go to disk as they
+are appended instead of accumulating as cell objects. Every format reads the
+report's cached_data, so all exports of a report show the figures it was
+generated with, whatever has been posted since.
+
+Excel and CSV exports can also be streamed to the client (stream_export):
+CSV is yielded in chunks as it is written, Excel is spooled to a temp file
+and read back in chunks.
 """
 
+import csv
 import io
-import uuid
+import tempfile
 from decimal import Decimal
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Any, Tuple
+from typing import Dict, Iterator, Optional, Any, Tuple
 from django.core.files.base import ContentFile
 from django.utils import timezone
 
 from ..models import Report, ReportExport, ReportStatus, ExportFormat, ReportType
 
 
+class _Echo:
+    """Pseudo-buffer for csv.writer: write() hands the formatted line back."""
+
+    def write(self, value):
+        return value
+
+
+class _RowWriter:
+    """
+    ws.cell(row=..., column=..., value=...) for a write-only worksheet.
+    Rows must be written in increasing order; a row is appended as soon as a
+    later one is started (or on flush), with empty rows for any gap.
+    """
+
+    def __init__(self, ws, cell_class):
+        self.ws = ws
+        self.cell_class = cell_class
+        self.rows_written = 0
+        self.pending_row = None
+        self.pending = {}
+
+    def cell(self, row, column, value=None):
+        if self.pending_row is not None and row != self.pending_row:
+            self.flush()
+        if row <= self.rows_written:
+            raise ValueError(f"Row {row} was already written")
+        self.pending_row = row
+        cell = self.cell_class(self.ws, value=value)
+        self.pending[column] = cell
+        return cell
+
+    def flush(self):
+        if self.pending_row is None:
+            return
+        while self.rows_written < self.pending_row - 1:
+            self.ws.append([])
+            self.rows_written += 1
+        self.ws.append([self.pending.get(column) for column in range(1, max(self.pending) + 1)])
+        self.rows_written = self.pending_row
+        self.pending_row = None
+        self.pending = {}
+
+
 class ReportExporterService:
     """
     Service for exporting reports to various formats.
@@ -38,6 +91,23 @@ class ReportExporterService:
         ExportFormat.JSON.value: '.json',
     }
     
+    # Formats stream_export can serve in chunks
+    STREAMING_FORMATS = (ExportFormat.EXCEL.value, ExportFormat.CSV.value)
+    
+    # Bytes per chunk yielded to StreamingHttpResponse
+    STREAM_CHUNK_SIZE = 64 * 1024
+    
+    # Columns used by each report type's Excel layout (all get the same width)
+    EXCEL_COLUMNS = {
+        ReportType.INCOME_STATEMENT.value: 3,
+        ReportType.BALANCE_SHEET.value: 3,
+        ReportType.GENERAL_LEDGER.value: 6,
+        ReportType.SUB_LEDGER.value: 7,
+        ReportType.TRIAL_BALANCE.value: 4,
+        ReportType.EXPENSE_REPORT.value: 6,
+    }
+    EXCEL_COLUMN_WIDTH = 15
+    
     def __init__(self):
         pass
     
@@ -93,6 +163,48 @@ class ReportExporterService:
         
         return export
     
+    def stream_export(
+        self,
+        report: Report,
+        export_format: str,
+        config: Optional[Dict] = None
+    ) -> Tuple[Iterator[bytes], str, str]:
+        """
+        Export a report without storing a ReportExport; same output as export_report.
+        Returns (chunks, file_name, mime_type); chunks is meant for StreamingHttpResponse.
+        """
+        if export_format not in self.STREAMING_FORMATS:
+            raise ValueError(f"Streaming is not supported for format: {export_format}")
+        
+        if export_format == ExportFormat.CSV.value:
+            chunks = self.stream_csv(report)
+        else:
+            tmp = tempfile.TemporaryFile()
+            try:
+                self._build_excel(report).save(tmp)
+            except Exception:
+                tmp.close()
+                raise
+            tmp.seek(0)
+            chunks = self._iter_file(tmp)
+        
+        return (
+            chunks,
+            self._generate_filename(report, export_format),
+            self.MIME_TYPES[export_format],
+        )
+    
+    def _iter_file(self, fileobj) -> Iterator[bytes]:
+        """Yield a file in chunks and close it when exhausted (or abandoned)"""
+        try:
+            while True:
+                chunk = fileobj.read(self.STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            fileobj.close()
+    
     def _generate_filename(self, report: Report, export_format: str) -> str:
         """Generate a filename for the export"""
         timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
@@ -127,16 +239,28 @@ class ReportExporterService:
     
     def _generate_excel(self, report: Report, config: Dict) -> Tuple[bytes, int]:
         """Generate Excel file from report data"""
+        output = io.BytesIO()
+        self._build_excel(report).save(output)
+        content = output.getvalue()
+        return content, len(content)
+    
+    def _build_excel(self, report: Report):
+        """Write-only workbook with the report laid out (shared by export and stream_export)"""
         try:
             from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+            from openpyxl.cell import WriteOnlyCell
+            from openpyxl.styles import Font, Border, Side, PatternFill
             from openpyxl.utils import get_column_letter
         except ImportError:
             raise ImportError("openpyxl is required for Excel export. Install with: pip install openpyxl")
         
-        wb = Workbook()
-        ws = wb.active
-        ws.title = report.report_type.replace('_', ' ').title()[:31]
+        wb = Workbook(write_only=True)
+        sheet = wb.create_sheet(title=report.report_type.replace('_', ' ').title()[:31])
+        
+        # Column widths must be set before the first row is appended
+        for col in range(1, self.EXCEL_COLUMNS.get(report.report_type, 1) + 1):
+            sheet.column_dimensions[get_column_letter(col)].width = self.EXCEL_COLUMN_WIDTH
+        ws = _RowWriter(sheet, WriteOnlyCell)
         
         # Styles
         header_font = Font(bold=True, size=14)
@@ -176,15 +300,8 @@ class ReportExporterService:
         elif report.report_type == ReportType.EXPENSE_REPORT.value:
             row = self._excel_expense_report(ws, data, row, subheader_font, money_format, thin_border, header_fill, Font)
         
-        # Auto-adjust column widths
-        for col in range(1, ws.max_column + 1):
-            ws.column_dimensions[get_column_letter(col)].width = 15
-        
-        # Save to bytes
-        output = io.BytesIO()
-        wb.save(output)
-        content = output.getvalue()
-        return content, len(content)
+        ws.flush()
+        return wb
     
     def _excel_income_statement(self, ws, data, row, subheader_font, money_format, border, header_fill, Font):
         """Write income statement to Excel worksheet"""
@@ -508,6 +625,159 @@ class ReportExporterService:
         
         return row + 2
     
+    # =================================================================
+    # CSV Rows
+    # =================================================================
+    
+    def _csv_rows(self, report: Report) -> Iterator[list]:
+        """Yield the values of every CSV row, one row at a time"""
+        yield [report.name]
+        yield [f"Period: {report.period_display}"]
+        yield []
+        
+        data = report.cached_data or {}
+        row_writers = {
+            ReportType.INCOME_STATEMENT.value: self._rows_income_statement,
+            ReportType.BALANCE_SHEET.value: self._rows_balance_sheet,
+            ReportType.GENERAL_LEDGER.value: self._rows_general_ledger,
+            ReportType.SUB_LEDGER.value: self._rows_sub_ledger,
+            ReportType.TRIAL_BALANCE.value: self._rows_trial_balance,
+            ReportType.EXPENSE_REPORT.value: self._rows_expense_report,
+        }
+        row_writer = row_writers.get(report.report_type)
+        if row_writer:
+            yield from row_writer(data)
+    
+    def _rows_section(self, title: str, items: list, amount_key: str,
+                      total_label: str, total: Any, with_code: bool = True):
+        """Rows for a titled list of accounts followed by its total"""
+        yield [title]
+        for item in items:
+            if with_code:
+                yield [item.get('account_code', ''), item.get('account_name', ''), item.get(amount_key, 0)]
+            else:
+                yield ['', item.get('account_name', ''), item.get(amount_key, 0)]
+        yield ['', total_label, total]
+    
+    def _rows_income_statement(self, data: Dict):
+        """Income statement rows"""
+        yield from self._rows_section('REVENUE', data.get('revenue', []), 'current_amount',
+                                      'Total Revenue', data.get('total_revenue', 0))
+        yield []
+        yield from self._rows_section('COST OF GOODS SOLD', data.get('cost_of_goods', []), 'current_amount',
+                                      'Total COGS', data.get('total_cost_of_goods', 0))
+        yield ['', 'GROSS PROFIT', data.get('gross_profit', 0)]
+        yield []
+        yield from self._rows_section('OPERATING EXPENSES', data.get('operating_expenses', []), 'current_amount',
+                                      'Total Operating Expenses', data.get('total_operating_expenses', 0))
+        yield []
+        yield ['', 'NET INCOME', data.get('net_income', 0)]
+    
+    def _rows_balance_sheet(self, data: Dict):
+        """Balance sheet rows"""
+        yield ['ASSETS']
+        yield from self._rows_section('Current Assets', data.get('current_assets', []), 'balance',
+                                      'Total Current Assets', data.get('total_current_assets', 0), with_code=False)
+        yield []
+        yield from self._rows_section('Fixed Assets', data.get('fixed_assets', []), 'balance',
+                                      'Total Fixed Assets', data.get('total_fixed_assets', 0), with_code=False)
+        yield []
+        yield ['', 'TOTAL ASSETS', data.get('total_assets', 0)]
+        yield []
+        yield from self._rows_section('LIABILITIES', data.get('current_liabilities', []), 'balance',
+                                      'Total Liabilities', data.get('total_liabilities', 0), with_code=False)
+        yield []
+        yield ['EQUITY']
+        for item in data.get('equity', []):
+            yield ['', item.get('account_name', ''), item.get('balance', 0)]
+        yield ['', 'Retained Earnings', data.get('retained_earnings', 0)]
+        yield ['', 'Total Equity', data.get('total_equity', 0)]
+        yield []
+        yield ['', 'TOTAL LIABILITIES & EQUITY', data.get('total_liabilities_and_equity', 0)]
+    
+    def _rows_general_ledger(self, data: Dict):
+        """General ledger rows, one block per account"""
+        for account in data.get('accounts', []):
+            yield [f"{account['account_code']} - {account['account_name']}"]
+            yield [f"Opening Balance: {account['opening_balance']:,.2f}"]
+            yield ['Date', 'Entry #', 'Description', 'Debit', 'Credit', 'Balance']
+            for entry in account.get('entries', []):
+                yield [
+                    entry.get('date', ''),
+                    entry.get('entry_number', ''),
+                    entry.get('description', ''),
+                    entry.get('debit', 0),
+                    entry.get('credit', 0),
+                    entry.get('balance', 0),
+                ]
+            yield [
+                '', '', 'Account Totals:',
+                account.get('total_debits', 0),
+                account.get('total_credits', 0),
+                account.get('closing_balance', 0),
+            ]
+            yield []
+        yield ['', '', 'GRAND TOTALS:', data.get('total_debits', 0), data.get('total_credits', 0)]
+    
+    def _rows_sub_ledger(self, data: Dict):
+        """Sub-ledger rows, one block per contact"""
+        yield [f"Ledger Type: {data.get('ledger_type', 'all').title()}"]
+        yield [f"Total Contacts: {data.get('contact_count', 0)}", '', f"Total Entries: {data.get('entry_count', 0)}"]
+        yield []
+        for contact in data.get('contacts', []):
+            contact_header = f"{contact['contact_name']} ({contact['contact_type']})"
+            if contact.get('linked_account_code'):
+                contact_header += f" - {contact['linked_account_code']}"
+            yield [contact_header]
+            yield [f"Opening Balance: {contact['opening_balance']:,.2f}"]
+            yield ['Date', 'Entry #', 'Description', 'Reference', 'Debit', 'Credit', 'Balance']
+            for entry in contact.get('entries', []):
+                yield [
+                    entry.get('date', ''),
+                    entry.get('entry_number', ''),
+                    entry.get('description', ''),
+                    entry.get('reference', ''),
+                    entry.get('debit', 0),
+                    entry.get('credit', 0),
+                    entry.get('balance', 0),
+                ]
+            yield [
+                '', '', 'Totals:', '',
+                contact.get('total_debits', 0),
+                contact.get('total_credits', 0),
+                contact.get('closing_balance', 0),
+            ]
+            yield []
+        yield ['', '', 'GRAND TOTALS:', '', data.get('total_debits', 0), data.get('total_credits', 0)]
+    
+    def _rows_trial_balance(self, data: Dict):
+        """Trial balance rows"""
+        yield ['Account Code', 'Account Name', 'Debit', 'Credit']
+        for line in data.get('lines', []):
+            yield [
+                line.get('account_code'),
+                line.get('account_name'),
+                line.get('debit'),
+                line.get('credit'),
+            ]
+        yield []
+        yield ['', 'TOTALS', data.get('total_debits'), data.get('total_credits')]
+    
+    def _rows_expense_report(self, data: Dict):
+        """Expense report rows"""
+        yield ['Date', 'Description', 'Vendor', 'Category', 'Project', 'Amount']
+        for expense in data.get('expenses', []):
+            yield [
+                expense.get('date'),
+                expense.get('description'),
+                expense.get('vendor'),
+                expense.get('category'),
+                expense.get('project'),
+                expense.get('amount'),
+            ]
+        yield []
+        yield ['', '', '', '', 'TOTAL', data.get('total_amount')]
+    
     # =================================================================
     # Word Export
     # =================================================================
@@ -720,47 +990,28 @@ class ReportExporterService:
     
     def _generate_csv(self, report: Report, config: Dict) -> Tuple[bytes, int]:
         """Generate CSV from report data"""
-        import csv
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Header info
-        writer.writerow([report.name])
-        writer.writerow([f"Period: {report.period_display}"])
-        writer.writerow([])
-        
-        data = report.cached_data or {}
-        
-        if report.report_type == ReportType.TRIAL_BALANCE.value:
-            writer.writerow(['Account Code', 'Account Name', 'Debit', 'Credit'])
-            for line in data.get('lines', []):
-                writer.writerow([
-                    line.get('account_code'),
-                    line.get('account_name'),
-                    line.get('debit'),
-                    line.get('credit')
-                ])
-            writer.writerow([])
-            writer.writerow(['', 'TOTALS', data.get('total_debits'), data.get('total_credits')])
-        
-        elif report.report_type == ReportType.EXPENSE_REPORT.value:
-            writer.writerow(['Date', 'Description', 'Vendor', 'Category', 'Project', 'Amount'])
-            for expense in data.get('expenses', []):
-                writer.writerow([
-                    expense.get('date'),
-                    expense.get('description'),
-                    expense.get('vendor'),
-                    expense.get('category'),
-                    expense.get('project'),
-                    expense.get('amount')
-                ])
-            writer.writerow([])
-            writer.writerow(['', '', '', '', 'TOTAL', data.get('total_amount')])
-        
-        content = output.getvalue().encode('utf-8')
+        content = b''.join(self.stream_csv(report))
         return content, len(content)
     
+    def stream_csv(self, report: Report) -> Iterator[bytes]:
+        """
+        Yield the CSV export as UTF-8 chunks of roughly STREAM_CHUNK_SIZE bytes.
+        Only the current chunk is held in memory.
+        """
+        writer = csv.writer(_Echo())
+        buffer, buffered = [], 0
+        
+        for values in self._csv_rows(report):
+            line = writer.writerow(values)
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= self.STREAM_CHUNK_SIZE:
+                yield ''.join(buffer).encode('utf-8')
+                buffer, buffered = [], 0
+        
+        if buffer:
+            yield ''.join(buffer).encode('utf-8')
+    
     # =================================================================
     # JSON Export
     # =================================================================
@@ -2,13 +2,17 @@
 Report Generator Service
 ========================
 Generates financial reports (Income Statement, Balance Sheet, General Ledger, etc.)
+
+Reports are generated inline (generate_report) or queued to a Celery worker
+(queue_report). Queued generation reports progress through the
+ReportCacheService status key, and identical requests in flight share one run.
 """
 
 import hashlib
 import uuid
 from decimal import Decimal
 from datetime import date, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 from django.db import transaction
 from django.db.models import Sum, Q, F
 from django.utils import timezone
@@ -18,6 +22,8 @@ from ..models import (
     Account, AccountType, AccountSubType, JournalEntry, JournalEntryLine,
     TransactionStatus, Contact, Expense, Project
 )
+from .period_balances import PeriodBalanceService
+from .report_cache import ReportCacheService
 
 
 class ReportGeneratorService:
@@ -26,6 +32,9 @@ class ReportGeneratorService:
     Handles data aggregation, calculations, and report structure creation.
     """
     
+    # Rows fetched per round trip when streaming general ledger lines
+    LEDGER_CHUNK_SIZE = 2000
+    
     def __init__(self, tenant_id: Optional[uuid.UUID] = None):
         self.tenant_id = tenant_id
     
@@ -71,37 +80,7 @@ class ReportGeneratorService:
             notes=notes
         )
         
-        try:
-            # Generate report data based on type
-            report_data = self._generate_report_data(
-                report_type=report_type,
-                period_start=period_start,
-                period_end=period_end,
-                filters=filters,
-                include_comparison=include_comparison,
-                comparison_period_start=comparison_period_start,
-                comparison_period_end=comparison_period_end
-            )
-            
-            # Store cached data and summary
-            report.cached_data = report_data
-            report.summary_totals = self._extract_summary_totals(report_type, report_data)
-            report.data_hash = self._calculate_data_hash(report_data)
-            report.status = ReportStatus.COMPLETED.value
-            report.generation_completed_at = timezone.now()
-            report.cache_expires_at = timezone.now() + timedelta(hours=24)
-            report.save()
-            
-            # Create report sections for structured reports
-            self._create_report_sections(report, report_data)
-            
-        except Exception as e:
-            report.status = ReportStatus.FAILED.value
-            report.generation_error = str(e)
-            report.generation_completed_at = timezone.now()
-            report.save()
-            raise
-        
+        self.run_generation(report)
         return report
     
     def regenerate_report(
@@ -143,35 +122,158 @@ class ReportGeneratorService:
         report.is_latest = False
         report.save(update_fields=['is_latest'])
         
+        self.run_generation(new_report)
+        return new_report
+    
+    def queue_report(
+        self,
+        report_type: str,
+        period_start: date,
+        period_end: date,
+        name: str,
+        user,
+        filters: Optional[Dict] = None,
+        display_config: Optional[Dict] = None,
+        include_comparison: bool = False,
+        comparison_period_start: Optional[date] = None,
+        comparison_period_end: Optional[date] = None,
+        template: Optional[ReportTemplate] = None,
+        notes: str = ''
+    ) -> Tuple[Report, bool]:
+        """
+        Create a PENDING report and generate it in a Celery worker.
+        Returns (report, queued); queued is False when an identical request
+        was already in flight and its report is returned instead.
+        """
+        report = Report(
+            tenant_id=self.tenant_id,
+            name=name,
+            report_type=report_type,
+            template=template,
+            period_start=period_start,
+            period_end=period_end,
+            filters=filters or {},
+            display_config=display_config or {},
+            include_comparison=include_comparison,
+            comparison_period_start=comparison_period_start,
+            comparison_period_end=comparison_period_end,
+            status=ReportStatus.PENDING.value,
+            generated_by=user,
+            notes=notes
+        )
+        
+        in_flight = self._claim(report)
+        if in_flight:
+            return in_flight, False
+        
+        report.report_number = self._generate_report_number()
+        report.save()
+        self._dispatch(report)
+        return report, True
+    
+    def enqueue_generation(self, report: Report) -> Tuple[Report, bool]:
+        """
+        Queue regeneration of an existing report (e.g. refresh).
+        Returns (report, queued) like queue_report.
+        """
+        in_flight = self._claim(report)
+        if in_flight:
+            return in_flight, False
+        
+        report.status = ReportStatus.PENDING.value
+        report.generation_error = ''
+        report.save(update_fields=['status', 'generation_error', 'updated_at'])
+        self._dispatch(report)
+        return report, True
+    
+    def run_generation(self, report: Report, request_hash: Optional[str] = None) -> Report:
+        """
+        Generate data for an existing report record and store it.
+        Progress is published through ReportCacheService.set_generation_status.
+        """
+        cache_service = ReportCacheService()
+        report_id = str(report.id)
+        
+        report.status = ReportStatus.GENERATING.value
+        report.generation_started_at = timezone.now()
+        # Read before the ledger, so postings made during generation leave it stale
+        report.dependency_generations = cache_service.snapshot_generations(report)
+        report.save(update_fields=['status', 'generation_started_at', 'dependency_generations', 'updated_at'])
+        cache_service.set_generation_status(report_id, report.status, 10, 'Aggregating ledger data')
+        
         try:
+            # Generate report data based on type
             report_data = self._generate_report_data(
-                report_type=new_report.report_type,
-                period_start=new_report.period_start,
-                period_end=new_report.period_end,
-                filters=new_report.filters,
-                include_comparison=new_report.include_comparison,
-                comparison_period_start=new_report.comparison_period_start,
-                comparison_period_end=new_report.comparison_period_end
+                report_type=report.report_type,
+                period_start=report.period_start,
+                period_end=report.period_end,
+                filters=report.filters,
+                include_comparison=report.include_comparison,
+                comparison_period_start=report.comparison_period_start,
+                comparison_period_end=report.comparison_period_end
             )
+            cache_service.set_generation_status(report_id, report.status, 80, 'Saving report')
             
-            new_report.cached_data = report_data
-            new_report.summary_totals = self._extract_summary_totals(new_report.report_type, report_data)
-            new_report.data_hash = self._calculate_data_hash(report_data)
-            new_report.status = ReportStatus.COMPLETED.value
-            new_report.generation_completed_at = timezone.now()
-            new_report.cache_expires_at = timezone.now() + timedelta(hours=24)
-            new_report.save()
+            # Store cached data and summary
+            report.cached_data = report_data
+            report.summary_totals = self._extract_summary_totals(report.report_type, report_data)
+            report.data_hash = self._calculate_data_hash(report_data)
+            report.status = ReportStatus.COMPLETED.value
+            report.generation_error = ''
+            report.generation_completed_at = timezone.now()
+            report.cache_expires_at = timezone.now() + timedelta(hours=24)
+            report.save()
             
-            self._create_report_sections(new_report, report_data)
+            # Create report sections for structured reports
+            self._create_report_sections(report, report_data)
+            cache_service.set_generation_status(report_id, report.status, 100, 'Report ready')
             
         except Exception as e:
-            new_report.status = ReportStatus.FAILED.value
-            new_report.generation_error = str(e)
-            new_report.generation_completed_at = timezone.now()
-            new_report.save()
+            report.status = ReportStatus.FAILED.value
+            report.generation_error = str(e)
+            report.generation_completed_at = timezone.now()
+            report.save()
+            cache_service.set_generation_status(report_id, report.status, 100, str(e))
             raise
         
-        return new_report
+        finally:
+            if request_hash:
+                cache_service.release_generation(request_hash, report_id)
+        
+        return report
+    
+    def _claim(self, report: Report) -> Optional[Report]:
+        """
+        Claim the in-flight slot for the report's request hash.
+        Returns the report already generating the same data, if any.
+        """
+        cache_service = ReportCacheService()
+        request_hash = cache_service.get_request_hash(report)
+        holder_id = cache_service.claim_generation(request_hash, report.id)
+        if holder_id is None:
+            return None
+        
+        holder = Report.all_objects.filter(
+            id=holder_id,
+            status__in=[ReportStatus.PENDING.value, ReportStatus.GENERATING.value]
+        ).first()
+        if holder is not None:
+            return holder
+        
+        # Previous holder finished or died without releasing
+        cache_service.force_claim_generation(request_hash, report.id)
+        return None
+    
+    def _dispatch(self, report: Report) -> None:
+        """Publish queued status and send the task once the report row is committed"""
+        from ..tasks import generate_financial_report
+        
+        cache_service = ReportCacheService()
+        request_hash = cache_service.get_request_hash(report)
+        cache_service.set_generation_status(str(report.id), ReportStatus.PENDING.value, 0, 'Queued')
+        transaction.on_commit(
+            lambda: generate_financial_report.delay(str(report.id), request_hash)
+        )
     
     # =================================================================
     # Report Type Dispatchers
@@ -389,29 +491,30 @@ class ReportGeneratorService:
         
         def get_balances(as_of_date: date) -> Dict:
             """Get account balances as of a date"""
-            # Get all journal entry lines up to the date
-            entries_filter = Q(
-                journal_entry__date__lte=as_of_date,
-                journal_entry__status=TransactionStatus.POSTED.value
-            )
-            
-            if self.tenant_id:
-                entries_filter &= Q(journal_entry__tenant_id=self.tenant_id)
-            
             if filters and filters.get('project_ids'):
-                entries_filter &= Q(journal_entry__project_id__in=filters['project_ids'])
-            
-            account_totals = JournalEntryLine.objects.filter(entries_filter).values(
-                'account__id',
-                'account__code',
-                'account__name',
-                'account__account_type',
-                'account__account_subtype',
-                'account__opening_balance'
-            ).annotate(
-                total_debit=Sum('debit'),
-                total_credit=Sum('credit')
-            )
+                # Project-scoped balances cannot use the period snapshots
+                entries_filter = Q(
+                    journal_entry__date__lte=as_of_date,
+                    journal_entry__status=TransactionStatus.POSTED.value,
+                    journal_entry__project_id__in=filters['project_ids']
+                )
+                
+                if self.tenant_id:
+                    entries_filter &= Q(journal_entry__tenant_id=self.tenant_id)
+                
+                account_totals = JournalEntryLine.objects.filter(entries_filter).values(
+                    'account__id',
+                    'account__code',
+                    'account__name',
+                    'account__account_type',
+                    'account__account_subtype',
+                    'account__opening_balance'
+                ).annotate(
+                    total_debit=Sum('debit'),
+                    total_credit=Sum('credit')
+                )
+            else:
+                account_totals = self._get_account_totals_as_of(as_of_date)
             
             result = {
                 'current_assets': [],
@@ -526,7 +629,52 @@ class ReportGeneratorService:
         comparison_period_end: Optional[date]
     ) -> Dict:
         """Generate General Ledger (總帳) data"""
+        ledger_accounts = []
+        total_debits = Decimal('0.00')
+        total_credits = Decimal('0.00')
+        entry_count = 0
+        
+        for account, entries in self.iter_general_ledger(period_start, period_end, filters):
+            account_entries = list(entries)
+            ledger_accounts.append({
+                'account_id': account['account_id'],
+                'account_code': account['account_code'],
+                'account_name': account['account_name'],
+                'account_type': account['account_type'],
+                'opening_balance': float(account['opening_balance']),
+                'entries': account_entries,
+                'total_debits': float(account['total_debits']),
+                'total_credits': float(account['total_credits']),
+                'closing_balance': float(account['closing_balance'])
+            })
+            
+            total_debits += account['total_debits']
+            total_credits += account['total_credits']
+            entry_count += len(account_entries)
         
+        return {
+            'accounts': ledger_accounts,
+            'total_debits': float(total_debits),
+            'total_credits': float(total_credits),
+            'entry_count': entry_count
+        }
+    
+    def iter_general_ledger(
+        self,
+        period_start: date,
+        period_end: date,
+        filters: Optional[Dict] = None
+    ) -> Iterator[Tuple[Dict, Iterator[Dict]]]:
+        """
+        Stream the general ledger one account at a time.
+        
+        Yields (account, entries) for every account with period lines or a
+        non-zero opening balance. `entries` yields the same entry dicts as
+        the cached report; `account` carries Decimal opening_balance and,
+        once `entries` is exhausted, total_debits, total_credits and
+        closing_balance. Entries not consumed before the next account are
+        skipped.
+        """
         # Get accounts to include
         accounts_filter = Q()
         if self.tenant_id:
@@ -536,96 +684,97 @@ class ReportGeneratorService:
         if filters and filters.get('account_types'):
             accounts_filter &= Q(account_type__in=filters['account_types'])
         
-        accounts = Account.objects.filter(accounts_filter, is_active=True).order_by('code')
+        accounts = list(
+            Account.objects.filter(accounts_filter, is_active=True).order_by('code', 'id')
+        )
         
-        ledger_accounts = []
-        total_debits = Decimal('0.00')
-        total_credits = Decimal('0.00')
-        entry_count = 0
+        # Opening movements (all entries before period start) from period snapshots
+        opening_movements = PeriodBalanceService().get_movements_before(self.tenant_id, period_start)
         
-        for account in accounts:
-            # Get opening balance (sum of all entries before period start)
-            opening_filter = Q(
-                account=account,
-                journal_entry__date__lt=period_start,
-                journal_entry__status=TransactionStatus.POSTED.value
-            )
-            
-            opening_totals = JournalEntryLine.objects.filter(opening_filter).aggregate(
-                total_debit=Sum('debit'),
-                total_credit=Sum('credit')
-            )
-            
-            opening_debit = opening_totals['total_debit'] or Decimal('0.00')
-            opening_credit = opening_totals['total_credit'] or Decimal('0.00')
-            
-            if account.account_type in [AccountType.ASSET.value, AccountType.EXPENSE.value]:
-                opening_balance = account.opening_balance + opening_debit - opening_credit
-            else:
-                opening_balance = account.opening_balance + opening_credit - opening_debit
-            
-            # Get entries for the period
-            entries_filter = Q(
-                account=account,
-                journal_entry__date__gte=period_start,
-                journal_entry__date__lte=period_end,
-                journal_entry__status=TransactionStatus.POSTED.value
-            )
-            
-            entries = JournalEntryLine.objects.filter(entries_filter).select_related(
-                'journal_entry'
-            ).order_by('journal_entry__date', 'journal_entry__entry_number')
-            
-            account_entries = []
-            running_balance = opening_balance
+        # All period lines in one ordered query, read as tuples in chunks so
+        # only one chunk of rows is held at a time
+        lines_filter = Q(
+            account__in=[account.id for account in accounts],
+            journal_entry__date__gte=period_start,
+            journal_entry__date__lte=period_end,
+            journal_entry__status=TransactionStatus.POSTED.value
+        )
+        lines = JournalEntryLine.objects.filter(lines_filter).order_by(
+            'account__code', 'account_id', 'journal_entry__date', 'journal_entry__entry_number'
+        ).values_list(
+            'account_id', 'description', 'debit', 'credit',
+            'journal_entry__date', 'journal_entry__entry_number',
+            'journal_entry__description', 'journal_entry__reference'
+        ).iterator(chunk_size=self.LEDGER_CHUNK_SIZE)
+        
+        next_line = next(lines, None)
+        
+        def account_entries(account_id, debit_positive, summary):
+            nonlocal next_line
+            running_balance = summary['opening_balance']
             account_total_debits = Decimal('0.00')
             account_total_credits = Decimal('0.00')
             
-            for entry_line in entries:
-                debit = entry_line.debit or Decimal('0.00')
-                credit = entry_line.credit or Decimal('0.00')
+            # Lines arrive in the same (code, id) order as accounts
+            while next_line is not None and next_line[0] == account_id:
+                _account_id, description, debit, credit, entry_date, entry_number, entry_description, reference = next_line
+                debit = debit or Decimal('0.00')
+                credit = credit or Decimal('0.00')
                 
-                if account.account_type in [AccountType.ASSET.value, AccountType.EXPENSE.value]:
+                if debit_positive:
                     running_balance += debit - credit
                 else:
                     running_balance += credit - debit
                 
-                account_entries.append({
-                    'date': entry_line.journal_entry.date.isoformat(),
-                    'entry_number': entry_line.journal_entry.entry_number,
-                    'description': entry_line.description or entry_line.journal_entry.description,
-                    'reference': entry_line.journal_entry.reference,
+                account_total_debits += debit
+                account_total_credits += credit
+                next_line = next(lines, None)
+                
+                yield {
+                    'date': entry_date.isoformat(),
+                    'entry_number': entry_number,
+                    'description': description or entry_description,
+                    'reference': reference,
                     'debit': float(debit),
                     'credit': float(credit),
                     'balance': float(running_balance)
-                })
-                
-                account_total_debits += debit
-                account_total_credits += credit
+                }
             
-            if account_entries or opening_balance != Decimal('0.00'):
-                ledger_accounts.append({
-                    'account_id': str(account.id),
-                    'account_code': account.code,
-                    'account_name': account.name,
-                    'account_type': account.account_type,
-                    'opening_balance': float(opening_balance),
-                    'entries': account_entries,
-                    'total_debits': float(account_total_debits),
-                    'total_credits': float(account_total_credits),
-                    'closing_balance': float(running_balance)
-                })
-                
-                total_debits += account_total_debits
-                total_credits += account_total_credits
-                entry_count += len(account_entries)
+            summary['total_debits'] = account_total_debits
+            summary['total_credits'] = account_total_credits
+            summary['closing_balance'] = running_balance
         
-        return {
-            'accounts': ledger_accounts,
-            'total_debits': float(total_debits),
-            'total_credits': float(total_credits),
-            'entry_count': entry_count
-        }
+        for account in accounts:
+            opening_debit, opening_credit = opening_movements.get(
+                account.id, (Decimal('0.00'), Decimal('0.00'))
+            )
+            
+            debit_positive = account.account_type in [AccountType.ASSET.value, AccountType.EXPENSE.value]
+            if debit_positive:
+                opening_balance = account.opening_balance + opening_debit - opening_credit
+            else:
+                opening_balance = account.opening_balance + opening_credit - opening_debit
+            
+            has_lines = next_line is not None and next_line[0] == account.id
+            if not has_lines and opening_balance == Decimal('0.00'):
+                continue
+            
+            summary = {
+                'account_id': str(account.id),
+                'account_code': account.code,
+                'account_name': account.name,
+                'account_type': account.account_type,
+                'opening_balance': opening_balance,
+                'total_debits': Decimal('0.00'),
+                'total_credits': Decimal('0.00'),
+                'closing_balance': opening_balance,
+            }
+            entries = account_entries(account.id, debit_positive, summary)
+            yield summary, entries
+            
+            # Skip whatever the caller left unread
+            for _entry in entries:
+                pass
     
     # =================================================================
     # Sub-Ledger Generator
@@ -834,20 +983,15 @@ class ReportGeneratorService:
         total_debits = Decimal('0.00')
         total_credits = Decimal('0.00')
         
+        # Movements up to and including period end, from period snapshots
+        movements = PeriodBalanceService().get_movements_before(
+            self.tenant_id, period_end + timedelta(days=1)
+        )
+        
         for account in accounts:
-            entries_filter = Q(
-                account=account,
-                journal_entry__date__lte=period_end,
-                journal_entry__status=TransactionStatus.POSTED.value
+            debit_total, credit_total = movements.get(
+                account.id, (Decimal('0.00'), Decimal('0.00'))
             )
-            
-            totals = JournalEntryLine.objects.filter(entries_filter).aggregate(
-                total_debit=Sum('debit'),
-                total_credit=Sum('credit')
-            )
-            
-            debit_total = totals['total_debit'] or Decimal('0.00')
-            credit_total = totals['total_credit'] or Decimal('0.00')
             opening = account.opening_balance or Decimal('0.00')
             
             # Calculate balance
@@ -989,6 +1133,31 @@ class ReportGeneratorService:
         
         return f"{prefix}{new_num:04d}"
     
+    def _get_account_totals_as_of(self, as_of_date: date) -> List[Dict]:
+        """
+        Posted debit/credit totals per account up to and including a date,
+        shaped like a JournalEntryLine values() aggregate over account fields.
+        """
+        movements = PeriodBalanceService().get_movements_before(
+            self.tenant_id, as_of_date + timedelta(days=1)
+        )
+        accounts = Account.all_objects.filter(id__in=list(movements)).values(
+            'id', 'code', 'name', 'account_type', 'account_subtype', 'opening_balance'
+        )
+        return [
+            {
+                'account__id': account['id'],
+                'account__code': account['code'],
+                'account__name': account['name'],
+                'account__account_type': account['account_type'],
+                'account__account_subtype': account['account_subtype'],
+                'account__opening_balance': account['opening_balance'],
+                'total_debit': movements[account['id']][0],
+                'total_credit': movements[account['id']][1],
+            }
+            for account in accounts
+        ]
+    
     def _calculate_data_hash(self, data: Dict) -> str:
         """Calculate hash of report data for cache invalidation"""
         import json
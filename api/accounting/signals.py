@@ -0,0 +1,63 @@
+"""
+Accounting Signals
+==================
+Keep derived accounting data in step with model changes.
+"""
+
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .models import AccountingPeriod
+
+
+# Sent by BalancePostingService once the posting/voiding transaction commits.
+# Arguments: entry_ids
+journal_entries_posted = Signal()
+journal_entries_voided = Signal()
+
+
+# Fields the period snapshot is computed from
+PERIOD_SNAPSHOT_FIELDS = ('tenant_id', 'start_date', 'end_date')
+
+
+@receiver(pre_save, sender=AccountingPeriod)
+def track_period_dates(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Remember whether a save changes what the period snapshot covers."""
+    instance._snapshot_changed = False
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not {
+        'tenant', 'tenant_id', 'start_date', 'end_date'
+    } & set(update_fields):
+        return
+
+    previous = (
+        sender._base_manager.filter(pk=instance.pk)
+        .values_list(*PERIOD_SNAPSHOT_FIELDS)
+        .first()
+    )
+    current = tuple(getattr(instance, field) for field in PERIOD_SNAPSHOT_FIELDS)
+    instance._snapshot_changed = previous != current
+
+
+@receiver(post_save, sender=AccountingPeriod)
+def rebuild_period_balances(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Snapshot a period when it is created or its dates change, so entries
+    posted before the period existed are included in its balances.
+    Status or is_active changes (e.g. closing it) leave the snapshot alone.
+    """
+    if raw:
+        return
+    if not created and not getattr(instance, '_snapshot_changed', False):
+        return
+
+    from .services.period_balances import PeriodBalanceService
+    PeriodBalanceService().rebuild_period(instance)
+
+
+@receiver([journal_entries_posted, journal_entries_voided])
+def invalidate_dependent_reports(sender, entry_ids, **kwargs):
+    """Mark cached reports covering the changed months/accounts as stale."""
+    from .services.report_cache import ReportCacheService
+    ReportCacheService().invalidate_for_entries(entry_ids)
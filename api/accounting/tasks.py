@@ -0,0 +1,39 @@
+"""
+Accounting Tasks
+================
+Celery tasks for long-running accounting work (report generation).
+"""
+
+import logging
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def generate_financial_report(self, report_id: str, request_hash: str = None):
+    """
+    Generate a queued financial report.
+    
+    Args:
+        report_id: ID of the PENDING Report created by ReportGeneratorService.queue_report
+        request_hash: In-flight claim to release when generation finishes
+    
+    Returns:
+        dict: Report id and final status
+    """
+    from accounting.models import Report
+    from accounting.services import ReportGeneratorService
+    
+    report = Report.all_objects.filter(id=report_id).first()
+    if report is None:
+        logger.warning(f"Queued report {report_id} no longer exists")
+        return {'report_id': report_id, 'status': 'MISSING'}
+    
+    try:
+        ReportGeneratorService(tenant_id=report.tenant_id).run_generation(report, request_hash=request_hash)
+    except Exception as exc:
+        # Failure is recorded on the report and in the status key
+        logger.error(f"Report generation failed for {report_id}: {exc}")
+    
+    return {'report_id': report_id, 'status': report.status}
@@ -0,0 +1,968 @@
+"""
+Tests for the Accounting module
+
+Tests cover:
+1. Balance posting - set-based posting/voiding of journal entries
+2. Period balances - incremental AccountPeriodBalance snapshots
+3. General ledger - single-pass generation with constant query count
+4. Report export - write-only Excel and streamed CSV from the report snapshot
+5. Report cache - dependency-tracked invalidation on posting/voiding
+6. Queued report generation - Celery pipeline with progress and coalescing
+7. Bank reconciliation - exact/fuzzy/split matching of statement lines
+8. Bank statement import - streaming CSV and OFX readers
+"""
+import csv
+import io
+import threading
+import unittest
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+
+from accounting.models import JournalEntry
+
+User = get_user_model()
+
+
+class PostingFixtureMixin:
+    """Shared tenant / chart of accounts setup for posting tests"""
+
+    def create_fixture(self):
+        from core.tenants.models import Tenant
+        from accounting.models import Account, AccountType
+
+        self.tenant = Tenant.objects.create(name='Posting Tenant', slug='posting-tenant')
+        self.user = User.objects.create_user(
+            email='poster@example.com',
+            password='testpass123'
+        )
+        self.cash = Account.all_objects.create(
+            tenant=self.tenant, code='1000', name='Cash',
+            account_type=AccountType.ASSET.value
+        )
+        self.revenue = Account.all_objects.create(
+            tenant=self.tenant, code='4000', name='Sales',
+            account_type=AccountType.REVENUE.value
+        )
+
+    def create_entry(self, amount, number, entry_date=date(2024, 1, 15)):
+        from accounting.models import JournalEntry, JournalEntryLine
+
+        amount = Decimal(amount)
+        entry = JournalEntry.all_objects.create(
+            tenant=self.tenant,
+            entry_number=number,
+            date=entry_date,
+            description='Cash sale',
+            created_by=self.user,
+            total_debit=amount,
+            total_credit=amount,
+        )
+        JournalEntryLine.objects.create(journal_entry=entry, account=self.cash, debit=amount)
+        JournalEntryLine.objects.create(journal_entry=entry, account=self.revenue, credit=amount)
+        return entry
+
+
+class BalancePostingServiceTests(PostingFixtureMixin, TestCase):
+    """Test set-based balance posting"""
+
+    def setUp(self):
+        self.create_fixture()
+
+    def test_post_updates_balances(self):
+        """Posting applies debit-positive and credit-positive deltas"""
+        from accounting.services import BalancePostingService
+
+        entry = self.create_entry('100.00', 'JE-0001')
+        self.assertTrue(BalancePostingService().post(entry))
+
+        self.cash.refresh_from_db()
+        self.revenue.refresh_from_db()
+        entry.refresh_from_db()
+        self.assertEqual(self.cash.current_balance, Decimal('100.00'))
+        self.assertEqual(self.revenue.current_balance, Decimal('100.00'))
+        self.assertEqual(entry.status, 'POSTED')
+        self.assertIsNotNone(entry.posted_at)
+
+    def test_post_is_idempotent(self):
+        """A posted entry is never applied twice"""
+        from accounting.services import BalancePostingService
+
+        entry = self.create_entry('100.00', 'JE-0001')
+        service = BalancePostingService()
+        self.assertTrue(service.post(entry))
+        self.assertFalse(service.post(entry))
+
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.current_balance, Decimal('100.00'))
+
+    def test_void_reverses_balances(self):
+        """Voiding restores the balances"""
+        from accounting.services import BalancePostingService
+
+        entry = self.create_entry('100.00', 'JE-0001')
+        service = BalancePostingService()
+        service.post(entry)
+        self.assertTrue(service.void(entry))
+        self.assertFalse(service.void(entry))
+
+        self.cash.refresh_from_db()
+        self.revenue.refresh_from_db()
+        self.assertEqual(self.cash.current_balance, Decimal('0.00'))
+        self.assertEqual(self.revenue.current_balance, Decimal('0.00'))
+        self.assertEqual(entry.status, 'VOIDED')
+
+    def test_post_many_uses_constant_queries(self):
+        """Batch posting cost does not grow with the number of entries"""
+        from accounting.services import BalancePostingService
+
+        single = [self.create_entry('10.00', 'JE-SINGLE')]
+        entries = [self.create_entry('10.00', f'JE-{i:04d}') for i in range(25)]
+
+        with CaptureQueriesContext(connection) as single_ctx:
+            BalancePostingService().post_many(single)
+        with CaptureQueriesContext(connection) as batch_ctx:
+            posted = BalancePostingService().post_many(entries)
+
+        self.assertEqual(len(posted), 25)
+        self.assertEqual(len(batch_ctx.captured_queries), len(single_ctx.captured_queries))
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.current_balance, Decimal('260.00'))
+
+
+class PeriodBalanceServiceTests(PostingFixtureMixin, TestCase):
+    """Test incremental per-period balance snapshots"""
+
+    def setUp(self):
+        self.create_fixture()
+        self.fiscal_year = self.create_fiscal_year()
+        self.january = self.create_period(1, date(2024, 1, 1), date(2024, 1, 31))
+        self.february = self.create_period(2, date(2024, 2, 1), date(2024, 2, 29))
+
+    def create_fiscal_year(self):
+        from accounting.models import FiscalYear
+
+        return FiscalYear.all_objects.create(
+            tenant=self.tenant, name='FY 2024',
+            start_date=date(2024, 1, 1), end_date=date(2024, 12, 31)
+        )
+
+    def create_period(self, number, start, end):
+        from accounting.models import AccountingPeriod
+
+        return AccountingPeriod.all_objects.create(
+            tenant=self.tenant, fiscal_year=self.fiscal_year,
+            name=start.strftime('%B %Y'), period_number=number,
+            start_date=start, end_date=end
+        )
+
+    def snapshot(self, account, period):
+        from accounting.models import AccountPeriodBalance
+
+        row = AccountPeriodBalance.all_objects.filter(account=account, period=period).first()
+        return (row.debit_total, row.credit_total) if row else None
+
+    def test_post_and_void_maintain_snapshot(self):
+        from accounting.services import BalancePostingService
+
+        service = BalancePostingService()
+        first = self.create_entry('100.00', 'JE-0001', date(2024, 1, 10))
+        second = self.create_entry('40.00', 'JE-0002', date(2024, 1, 20))
+        service.post_many([first, second])
+        self.assertEqual(self.snapshot(self.cash, self.january), (Decimal('140.00'), Decimal('0.00')))
+        self.assertEqual(self.snapshot(self.revenue, self.january), (Decimal('0.00'), Decimal('140.00')))
+
+        service.void(second)
+        self.assertEqual(self.snapshot(self.cash, self.january), (Decimal('100.00'), Decimal('0.00')))
+
+    def test_new_period_is_snapshotted(self):
+        """Entries posted before their period existed are picked up"""
+        from accounting.services import BalancePostingService
+
+        BalancePostingService().post(self.create_entry('25.00', 'JE-0001', date(2024, 3, 5)))
+        march = self.create_period(3, date(2024, 3, 1), date(2024, 3, 31))
+
+        self.assertEqual(self.snapshot(self.cash, march), (Decimal('25.00'), Decimal('0.00')))
+
+    def test_period_is_rebuilt_only_when_dates_change(self):
+        from accounting.services import BalancePostingService, PeriodBalanceService
+
+        with mock.patch.object(PeriodBalanceService, 'rebuild_period') as rebuild:
+            self.january.is_closed = True
+            self.january.save()
+            self.january.name = 'Jan 2024'
+            self.january.save(update_fields=['name'])
+            rebuild.assert_not_called()
+
+        BalancePostingService().post(self.create_entry('25.00', 'JE-0001', date(2024, 2, 5)))
+        self.january.end_date = date(2024, 2, 29)
+        self.january.save()
+        self.assertEqual(self.snapshot(self.cash, self.january), (Decimal('25.00'), Decimal('0.00')))
+
+    def test_movements_match_full_scan(self):
+        from accounting.services import BalancePostingService, PeriodBalanceService
+
+        service = BalancePostingService()
+        service.post(self.create_entry('100.00', 'JE-0001', date(2023, 12, 31)))  # before any period
+        service.post(self.create_entry('50.00', 'JE-0002', date(2024, 1, 31)))
+        service.post(self.create_entry('20.00', 'JE-0003', date(2024, 2, 10)))
+        service.post(self.create_entry('7.00', 'JE-0004', date(2024, 3, 3)))    # no period yet
+        service.post(self.create_entry('9.00', 'JE-0005', date(2024, 3, 20)))   # after cut-off
+
+        movements = PeriodBalanceService().get_movements_before(self.tenant.id, date(2024, 3, 10))
+
+        self.assertEqual(movements[self.cash.id], (Decimal('177.00'), Decimal('0.00')))
+        self.assertEqual(movements[self.revenue.id], (Decimal('0.00'), Decimal('177.00')))
+
+    def test_trial_balance_uses_snapshots(self):
+        from accounting.services import BalancePostingService, ReportGeneratorService
+
+        service = BalancePostingService()
+        service.post(self.create_entry('50.00', 'JE-0001', date(2024, 1, 31)))
+        service.post(self.create_entry('20.00', 'JE-0002', date(2024, 2, 10)))
+
+        data = ReportGeneratorService(tenant_id=self.tenant.id)._generate_trial_balance(
+            period_start=date(2024, 2, 1), period_end=date(2024, 2, 29), filters=None,
+            include_comparison=False, comparison_period_start=None, comparison_period_end=None
+        )
+
+        self.assertTrue(data['is_balanced'])
+        self.assertEqual(data['total_debits'], 70.0)
+
+    def test_rebuild_command_restores_snapshot(self):
+        from django.core.management import call_command
+        from accounting.models import AccountPeriodBalance
+        from accounting.services import BalancePostingService
+
+        BalancePostingService().post(self.create_entry('30.00', 'JE-0001', date(2024, 2, 1)))
+        AccountPeriodBalance.all_objects.all().delete()
+
+        call_command('rebuild_period_balances', tenant_id=str(self.tenant.id), stdout=io.StringIO())
+
+        self.assertEqual(self.snapshot(self.cash, self.february), (Decimal('30.00'), Decimal('0.00')))
+
+    def test_posted_entry_cannot_be_moved(self):
+        """Edits that would bypass the snapshots are rejected"""
+        from core.tenants.models import Tenant
+        from accounting.serializers import JournalEntrySerializer
+        from accounting.services import BalancePostingService
+
+        entry = self.create_entry('30.00', 'JE-0001', date(2024, 1, 10))
+        BalancePostingService().post(entry)
+
+        serializer = JournalEntrySerializer(entry, data={'date': '2024-02-10'}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('date', serializer.errors)
+
+        other = Tenant.objects.create(name='Other Tenant', slug='other-tenant')
+        serializer = JournalEntrySerializer(entry, data={'tenant': str(other.id)}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('tenant', serializer.errors)
+
+        serializer = JournalEntrySerializer(
+            entry, data={'status': 'DRAFT', 'description': 'Corrected'}, partial=True
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'POSTED')
+        self.assertEqual(entry.description, 'Corrected')
+        self.assertEqual(self.snapshot(self.cash, self.january), (Decimal('30.00'), Decimal('0.00')))
+
+
+class GeneralLedgerGenerationTests(TestCase):
+    """Test general ledger query count and running balances"""
+
+    def generate(self, tenant):
+        from accounting.services import ReportGeneratorService
+
+        service = ReportGeneratorService(tenant_id=tenant.id)
+        return service._generate_general_ledger(
+            period_start=date(2024, 7, 1), period_end=date(2024, 12, 31), filters=None,
+            include_comparison=False, comparison_period_start=None, comparison_period_end=None
+        )
+
+    def test_query_count_independent_of_chart_size(self):
+        from accounting.benchmarks import LedgerBenchmarkFixture
+
+        small = LedgerBenchmarkFixture(accounts=5, entries_per_account=4)
+        large = LedgerBenchmarkFixture(accounts=60, entries_per_account=4)
+        small_tenant, large_tenant = small.build(), large.build()
+        small_stats = small.measure(lambda: self.generate(small_tenant))
+        large_stats = large.measure(lambda: self.generate(large_tenant))
+
+        self.assertEqual(large_stats['queries'], small_stats['queries'])
+
+    def test_running_balances(self):
+        from accounting.benchmarks import LedgerBenchmarkFixture
+
+        fixture = LedgerBenchmarkFixture(accounts=3, entries_per_account=4)
+        data = self.generate(fixture.build())
+
+        for account in data['accounts']:
+            balance = account['opening_balance']
+            for line in account['entries']:
+                if account['account_type'] in ('ASSET', 'EXPENSE'):
+                    balance += line['debit'] - line['credit']
+                else:
+                    balance += line['credit'] - line['debit']
+                self.assertAlmostEqual(line['balance'], balance)
+            self.assertAlmostEqual(account['closing_balance'], balance)
+        self.assertEqual(data['total_debits'], data['total_credits'])
+        self.assertEqual(data['entry_count'], 12)
+
+    def test_matches_per_account_baseline(self):
+        from accounting.benchmarks import LedgerBenchmarkFixture, per_account_general_ledger
+
+        fixture = LedgerBenchmarkFixture(accounts=4, entries_per_account=6)
+        tenant = fixture.build()
+
+        self.assertEqual(
+            self.generate(tenant),
+            per_account_general_ledger(tenant.id, date(2024, 7, 1), date(2024, 12, 31)),
+        )
+
+
+class ReportExportStreamingTests(TestCase):
+    """Write-only Excel and streamed CSV export of a general ledger report"""
+
+    def build_report(self, accounts, entries_per_account):
+        from accounting.benchmarks import LedgerBenchmarkFixture
+
+        fixture = LedgerBenchmarkFixture(accounts=accounts, entries_per_account=entries_per_account)
+        fixture.build()
+        return fixture.report()
+
+    def test_stream_csv_contains_every_line(self):
+        from accounting.services import ReportExporterService
+
+        report = self.build_report(accounts=5, entries_per_account=200)
+        exporter = ReportExporterService()
+        chunks = list(exporter.stream_csv(report))
+
+        self.assertGreater(len(chunks), 1)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+        entry_rows = [row for row in rows if row and row[0].startswith('2024-')]
+        # Every entry debits an expense account and credits the bank
+        self.assertEqual(len(entry_rows), 2000)
+        self.assertEqual(rows[0], ['Benchmark General Ledger'])
+        self.assertEqual(rows[-1][2], 'GRAND TOTALS:')
+        self.assertEqual(rows[-1][3], rows[-1][4])
+
+    def test_exports_read_the_generated_snapshot(self):
+        """Entries posted after generation do not change any export of the report"""
+        from openpyxl import load_workbook
+        from accounting.models import Account, JournalEntry, JournalEntryLine, TransactionStatus
+        from accounting.services import ReportExporterService
+
+        report = self.build_report(accounts=2, entries_per_account=3)
+        totals = (report.cached_data['total_debits'], report.cached_data['total_credits'])
+
+        account = Account.all_objects.filter(tenant=report.tenant).order_by('code').first()
+        posted = JournalEntry.all_objects.filter(tenant=report.tenant).first()
+        entry = JournalEntry.all_objects.create(
+            tenant=report.tenant, entry_number='JE-LATE', date=report.period_start,
+            description='Posted after generation', status=TransactionStatus.POSTED.value,
+            created_by_id=posted.created_by_id,
+            total_debit=Decimal('999.00'), total_credit=Decimal('999.00'),
+        )
+        JournalEntryLine.objects.create(journal_entry=entry, account=account, debit=Decimal('999.00'))
+
+        exporter = ReportExporterService()
+        content, _size = exporter._generate_csv(report, {})
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8'))))
+        self.assertNotIn('JE-LATE', [row[1] for row in rows if len(row) > 1])
+        self.assertEqual((float(rows[-1][3]), float(rows[-1][4])), totals)
+
+        sheet = load_workbook(io.BytesIO(exporter._generate_excel(report, {})[0])).active
+        grand_totals = [row for row in sheet.iter_rows(values_only=True) if row[2] == 'GRAND TOTALS:'][0]
+        self.assertEqual((grand_totals[3], grand_totals[4]), totals)
+
+    def test_excel_uses_write_only_workbook(self):
+        from accounting.services import ReportExporterService
+
+        report = self.build_report(accounts=2, entries_per_account=3)
+        workbook = ReportExporterService()._build_excel(report)
+        self.assertTrue(workbook.write_only)
+        workbook.save(io.BytesIO())
+
+    def test_streamed_excel_matches_stored_export(self):
+        """stream_export and export_report lay the workbook out the same way"""
+        from openpyxl import load_workbook
+        from accounting.models import ExportFormat
+        from accounting.services import ReportExporterService
+
+        report = self.build_report(accounts=3, entries_per_account=100)
+        exporter = ReportExporterService()
+        chunks, _file_name, _mime_type = exporter.stream_export(report, ExportFormat.EXCEL.value)
+        streamed = load_workbook(io.BytesIO(b''.join(chunks))).active
+        stored = load_workbook(io.BytesIO(exporter._generate_excel(report, {})[0])).active
+
+        self.assertEqual(
+            [[(cell.value, cell.font.b, cell.number_format) for cell in row] for row in streamed.iter_rows()],
+            [[(cell.value, cell.font.b, cell.number_format) for cell in row] for row in stored.iter_rows()],
+        )
+        entry_rows = [row for row in streamed.iter_rows() if str(row[0].value).startswith('2024-')]
+        self.assertEqual(len(entry_rows), 600)
+        self.assertEqual(entry_rows[0][3].number_format, '#,##0.00')
+        self.assertTrue(streamed['A1'].font.b)
+        self.assertEqual(streamed.column_dimensions['F'].width, 15)
+
+    def test_trial_balance_csv_layout(self):
+        """CSV keeps its title, period and totals rows only"""
+        from accounting.models import Report, ReportType
+        from accounting.services import ReportExporterService
+
+        report = Report(
+            name='TB', report_type=ReportType.TRIAL_BALANCE.value,
+            period_start=date(2024, 1, 1), period_end=date(2024, 1, 31),
+            cached_data={
+                'lines': [{'account_code': '1000', 'account_name': 'Cash', 'debit': 10, 'credit': 0}],
+                'total_debits': 10, 'total_credits': 10, 'is_balanced': True,
+            },
+        )
+        content, _size = ReportExporterService()._generate_csv(report, {})
+
+        self.assertEqual(list(csv.reader(io.StringIO(content.decode('utf-8')))), [
+            ['TB'], [f'Period: {report.period_display}'], [],
+            ['Account Code', 'Account Name', 'Debit', 'Credit'],
+            ['1000', 'Cash', '10', '0'],
+            [],
+            ['', 'TOTALS', '10', '10'],
+        ])
+
+    def test_stream_export_rejects_unsupported_format(self):
+        from accounting.models import ExportFormat, Report, ReportType
+        from accounting.services import ReportExporterService
+
+        report = Report(
+            name='GL', report_type=ReportType.GENERAL_LEDGER.value,
+            period_start=date(2024, 1, 1), period_end=date(2024, 1, 31),
+        )
+        with self.assertRaises(ValueError):
+            ReportExporterService().stream_export(report, ExportFormat.WORD.value)
+
+
+class ReportCacheInvalidationTests(PostingFixtureMixin, TestCase):
+    """Posting/voiding only invalidates cached reports that depend on it"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.create_fixture()
+
+    def create_report(self, report_type, period_start, period_end, number, filters=None):
+        from django.utils import timezone
+        from accounting.models import Report, ReportStatus
+
+        report = Report.objects.create(
+            tenant=self.tenant,
+            report_number=number,
+            name=number,
+            report_type=report_type,
+            period_start=period_start,
+            period_end=period_end,
+            filters=filters or {},
+            status=ReportStatus.COMPLETED.value,
+            generation_started_at=timezone.now(),
+        )
+        report.cached_data = {'number': number}
+        return report
+
+    def post(self, entry):
+        from accounting.services import BalancePostingService
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BalancePostingService().post(entry)
+
+    def test_posting_invalidates_only_affected_periods(self):
+        from accounting.models import ReportType
+        from accounting.services import ReportCacheService
+
+        service = ReportCacheService()
+        january = self.create_report(
+            ReportType.INCOME_STATEMENT.value, date(2024, 1, 1), date(2024, 1, 31), 'RPT-JAN'
+        )
+        march = self.create_report(
+            ReportType.INCOME_STATEMENT.value, date(2024, 3, 1), date(2024, 3, 31), 'RPT-MAR'
+        )
+        balance_sheet = self.create_report(
+            ReportType.BALANCE_SHEET.value, date(2024, 3, 1), date(2024, 3, 31), 'RPT-BS'
+        )
+        for report in (january, march, balance_sheet):
+            service.cache_report_data(report, report.cached_data)
+
+        self.post(self.create_entry('100.00', 'JE-CACHE-1', entry_date=date(2024, 1, 15)))
+
+        self.assertIsNone(service.get_cached_report_data(january))
+        self.assertEqual(service.get_cached_report_data(march), {'number': 'RPT-MAR'})
+        # Balance sheet includes all history up to period end
+        self.assertIsNone(service.get_cached_report_data(balance_sheet))
+
+        stats = service.get_cache_stats(self.tenant.id)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['invalidations'], 2)
+
+    def test_account_filtered_report_ignores_other_accounts(self):
+        from accounting.models import Account, AccountType, ReportType
+        from accounting.services import ReportCacheService
+
+        service = ReportCacheService()
+        other = Account.all_objects.create(
+            tenant=self.tenant, code='6000', name='Rent',
+            account_type=AccountType.EXPENSE.value
+        )
+        filtered = self.create_report(
+            ReportType.INCOME_STATEMENT.value, date(2024, 1, 1), date(2024, 12, 31), 'RPT-RENT',
+            filters={'account_ids': [str(other.id)]}
+        )
+        service.cache_report_data(filtered, filtered.cached_data)
+
+        self.post(self.create_entry('100.00', 'JE-CACHE-2'))
+
+        self.assertEqual(service.get_cached_report_data(filtered), {'number': 'RPT-RENT'})
+
+    def test_voiding_invalidates_report(self):
+        from accounting.models import ReportType
+        from accounting.services import BalancePostingService, ReportCacheService
+
+        service = ReportCacheService()
+        entry = self.create_entry('100.00', 'JE-CACHE-3')
+        self.post(entry)
+
+        report = self.create_report(
+            ReportType.TRIAL_BALANCE.value, date(2024, 1, 1), date(2024, 1, 31), 'RPT-TB'
+        )
+        service.cache_report_data(report, report.cached_data)
+        self.assertFalse(service.is_report_stale(report))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BalancePostingService().void(entry)
+
+        self.assertTrue(service.is_report_stale(report))
+        self.assertIsNone(service.get_cached_report_data(report))
+
+    def test_posting_during_generation_leaves_report_stale(self):
+        from django.core.cache import cache
+        from accounting.models import ReportType
+        from accounting.services import ReportCacheService
+
+        service = ReportCacheService()
+        report = self.create_report(
+            ReportType.TRIAL_BALANCE.value, date(2024, 1, 1), date(2024, 1, 31), 'RPT-RACE'
+        )
+        # Counters are read before the ledger; a posting before the data is cached still counts
+        report.dependency_generations = service.snapshot_generations(report)
+        self.post(self.create_entry('100.00', 'JE-CACHE-4'))
+        service.cache_report_data(report, report.cached_data)
+
+        self.assertTrue(service.is_report_stale(report))
+        self.assertIsNone(service.get_cached_report_data(report))
+
+        # An expired counter is never mistaken for an unchanged one
+        fresh = self.create_report(
+            ReportType.TRIAL_BALANCE.value, date(2024, 1, 1), date(2024, 1, 31), 'RPT-EXPIRED'
+        )
+        service.cache_report_data(fresh, fresh.cached_data)
+        self.assertFalse(service.is_report_stale(fresh))
+        cache.delete_many(list(fresh.dependency_generations))
+        self.assertTrue(service.is_report_stale(fresh))
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class QueuedReportGenerationTests(PostingFixtureMixin, TestCase):
+    """Background report generation (Celery eager mode)"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.create_fixture()
+
+    def queue(self, service, **overrides):
+        from accounting.models import ReportType
+
+        params = dict(
+            report_type=ReportType.INCOME_STATEMENT.value,
+            period_start=date(2024, 1, 1),
+            period_end=date(2024, 1, 31),
+            name='January P&L',
+            user=self.user,
+        )
+        params.update(overrides)
+        return service.queue_report(**params)
+
+    def test_queued_report_runs_in_worker(self):
+        from accounting.models import Report, ReportStatus
+        from accounting.services import ReportCacheService, ReportGeneratorService
+
+        service = ReportGeneratorService(tenant_id=self.tenant.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            report, queued = self.queue(service)
+            self.assertTrue(queued)
+            self.assertEqual(report.status, ReportStatus.PENDING.value)
+
+        report = Report.all_objects.get(id=report.id)
+        self.assertEqual(report.status, ReportStatus.COMPLETED.value)
+        self.assertIsNotNone(report.cached_data)
+        progress = ReportCacheService().get_generation_status(str(report.id))
+        self.assertEqual(progress['progress'], 100)
+
+    def test_identical_requests_are_coalesced(self):
+        from accounting.models import Report
+        from accounting.services import ReportGeneratorService
+
+        service = ReportGeneratorService(tenant_id=self.tenant.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            first, first_queued = self.queue(service)
+            second, second_queued = self.queue(service, name='Same data, other name')
+            other, other_queued = self.queue(service, period_end=date(2024, 2, 29))
+
+        self.assertTrue(first_queued)
+        self.assertFalse(second_queued)
+        self.assertEqual(second.id, first.id)
+        self.assertTrue(other_queued)
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(Report.all_objects.filter(tenant=self.tenant).count(), 2)
+
+        # Once finished, the same request starts a new generation
+        with self.captureOnCommitCallbacks(execute=True):
+            again, again_queued = self.queue(service)
+        self.assertTrue(again_queued)
+        self.assertNotEqual(again.id, first.id)
+
+
+@unittest.skipUnless(
+    connection.features.has_select_for_update,
+    'Concurrent posting test requires row-level locks (PostgreSQL)'
+)
+class BalancePostingConcurrencyTests(PostingFixtureMixin, TransactionTestCase):
+    """Hammer a single account from many threads"""
+
+    THREADS = 8
+    ENTRIES_PER_THREAD = 10
+
+    def setUp(self):
+        self.create_fixture()
+
+    def test_concurrent_posting_loses_no_updates(self):
+        from accounting.services import BalancePostingService
+
+        batches = [
+            [self.create_entry('1.00', f'JE-{t:02d}-{i:04d}') for i in range(self.ENTRIES_PER_THREAD)]
+            for t in range(self.THREADS)
+        ]
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(batch):
+            try:
+                barrier.wait()
+                for entry in batch:
+                    BalancePostingService().post(entry)
+            except Exception as exc:  # pragma: no cover - surfaced below
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(batch,)) for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.cash.refresh_from_db()
+        expected = Decimal(self.THREADS * self.ENTRIES_PER_THREAD)
+        self.assertEqual(self.cash.current_balance, expected)
+
+    def test_concurrent_double_post_applies_once(self):
+        from accounting.services import BalancePostingService
+
+        entry = self.create_entry('5.00', 'JE-SHARED')
+        results = []
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            try:
+                # Each thread posts its own copy, as separate requests would
+                copy = JournalEntry.all_objects.get(pk=entry.pk)
+                barrier.wait()
+                results.append(BalancePostingService().post(copy))
+            except Exception as exc:  # pragma: no cover - surfaced below
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), [False] * (self.THREADS - 1) + [True])
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.current_balance, Decimal('5.00'))
+
+
+class BankReconciliationTests(PostingFixtureMixin, TestCase):
+    """Test matching bank transactions to journal entry lines"""
+
+    def setUp(self):
+        from accounting.models import BankStatement
+
+        self.create_fixture()
+        self.statement = BankStatement.all_objects.create(
+            tenant=self.tenant, bank_account=self.cash, statement_date=date(2024, 1, 31),
+            opening_balance=Decimal('0.00'), closing_balance=Decimal('0.00'),
+        )
+
+    def deposit(self, amount, txn_date=date(2024, 1, 15), reference=''):
+        from accounting.models import BankTransaction
+
+        return BankTransaction.all_objects.create(
+            tenant=self.tenant, statement=self.statement, date=txn_date,
+            description='Deposit', reference=reference, credit=Decimal(amount),
+        )
+
+    def posted_entry(self, amount, number, entry_date=date(2024, 1, 15)):
+        from accounting.services import BalancePostingService
+
+        entry = self.create_entry(amount, number, entry_date=entry_date)
+        BalancePostingService().post(entry)
+        return entry
+
+    def bank_line(self, entry):
+        return entry.lines.get(account=self.cash)
+
+    def reconcile(self):
+        from accounting.services import BankReconciliationService
+
+        return BankReconciliationService().reconcile(self.statement, user=self.user)
+
+    def test_reference_wins_over_closer_date(self):
+        """Equal amounts are told apart by reference before date distance"""
+        near = self.posted_entry('100.00', 'JE-0001', entry_date=date(2024, 1, 15))
+        referenced = self.posted_entry('100.00', 'JE-0002', entry_date=date(2024, 1, 17))
+        referenced.reference = 'INV-0042'
+        referenced.save(update_fields=['reference'])
+        txn = self.deposit('100.00', reference='inv 0042')
+
+        result = self.reconcile()
+
+        txn.refresh_from_db()
+        self.assertEqual(result['by_type']['EXACT_REFERENCE'], 1)
+        self.assertEqual(txn.match_type, 'EXACT_REFERENCE')
+        self.assertEqual(txn.matched_journal_line, self.bank_line(referenced))
+        self.assertNotEqual(txn.matched_journal_line, self.bank_line(near))
+
+    def test_exact_and_fuzzy_matches(self):
+        """Exact amounts inside the date window match first, near amounts fall to fuzzy"""
+        exact = self.posted_entry('250.00', 'JE-0001', entry_date=date(2024, 1, 10))
+        fuzzy = self.posted_entry('80.00', 'JE-0002', entry_date=date(2024, 1, 20))
+        exact_txn = self.deposit('250.00', txn_date=date(2024, 1, 12))
+        fuzzy_txn = self.deposit('79.60', txn_date=date(2024, 1, 24))
+        stranger = self.deposit('9999.00')
+
+        result = self.reconcile()
+
+        for txn in (exact_txn, fuzzy_txn, stranger):
+            txn.refresh_from_db()
+        self.assertEqual((exact_txn.match_type, exact_txn.matched_journal_line), ('EXACT', self.bank_line(exact)))
+        self.assertEqual((fuzzy_txn.match_type, fuzzy_txn.matched_journal_line), ('FUZZY', self.bank_line(fuzzy)))
+        self.assertFalse(stranger.is_matched)
+        self.assertEqual((result['matched'], result['unmatched']), (2, 1))
+        self.statement.refresh_from_db()
+        self.assertFalse(self.statement.is_reconciled)
+
+    def test_withdrawal_does_not_match_deposit_line(self):
+        """Amounts are signed from the bank account's side"""
+        from accounting.models import BankTransaction
+
+        self.posted_entry('60.00', 'JE-0001')
+        BankTransaction.all_objects.create(
+            tenant=self.tenant, statement=self.statement, date=date(2024, 1, 15),
+            description='Withdrawal', debit=Decimal('60.00'),
+        )
+
+        self.assertEqual(self.reconcile()['matched'], 0)
+
+    def test_split_match_and_statement_reconciled(self):
+        """One deposit covering several entries records every line"""
+        first = self.posted_entry('120.00', 'JE-0001', entry_date=date(2024, 1, 14))
+        second = self.posted_entry('30.50', 'JE-0002', entry_date=date(2024, 1, 15))
+        txn = self.deposit('150.50')
+
+        result = self.reconcile()
+
+        txn.refresh_from_db()
+        self.assertEqual(result['by_type']['SPLIT'], 1)
+        self.assertEqual(txn.match_type, 'SPLIT')
+        self.assertEqual(
+            set(txn.split_lines.all()), {self.bank_line(first), self.bank_line(second)}
+        )
+        self.statement.refresh_from_db()
+        self.assertTrue(self.statement.is_reconciled)
+        self.assertEqual(self.statement.reconciled_by, self.user)
+
+    def test_matched_lines_are_not_reused(self):
+        """A second statement cannot claim lines already matched"""
+        from accounting.models import BankStatement
+
+        self.posted_entry('100.00', 'JE-0001')
+        self.deposit('100.00')
+        self.reconcile()
+
+        self.statement = BankStatement.all_objects.create(
+            tenant=self.tenant, bank_account=self.cash, statement_date=date(2024, 2, 29),
+            opening_balance=Decimal('0.00'), closing_balance=Decimal('0.00'),
+        )
+        self.deposit('100.00', txn_date=date(2024, 1, 16))
+        self.assertEqual(self.reconcile()['matched'], 0)
+
+    def test_only_posted_lines_match(self):
+        """Draft and voided entries are not in the ledger yet (or any more)"""
+        from accounting.services import BalancePostingService
+
+        self.create_entry('100.00', 'JE-DRAFT')
+        voided = self.posted_entry('100.00', 'JE-VOID')
+        BalancePostingService().void(voided)
+        self.deposit('100.00')
+
+        self.assertEqual(self.reconcile()['matched'], 0)
+
+        posted = self.posted_entry('100.00', 'JE-0001')
+        self.reconcile()
+        self.assertEqual(self.statement.transactions.get().matched_journal_line, self.bank_line(posted))
+
+    def test_unmatch_releases_lines(self):
+        """Unmatching clears the match and reopens the statement"""
+        from accounting.services import BankReconciliationService
+
+        self.posted_entry('40.00', 'JE-0001', entry_date=date(2024, 1, 14))
+        self.posted_entry('60.00', 'JE-0002', entry_date=date(2024, 1, 15))
+        txn = self.deposit('100.00')
+        self.reconcile()
+
+        self.assertEqual(BankReconciliationService().unmatch([txn.id]), 1)
+
+        txn.refresh_from_db()
+        self.statement.refresh_from_db()
+        self.assertFalse(txn.is_matched)
+        self.assertEqual(txn.match_type, '')
+        self.assertFalse(txn.split_lines.exists())
+        self.assertFalse(self.statement.is_reconciled)
+        self.assertEqual(self.reconcile()['matched'], 1)
+
+
+@unittest.skipUnless(
+    connection.features.has_select_for_update,
+    'Concurrent reconciliation test requires row-level locks (PostgreSQL)'
+)
+class BankReconciliationConcurrencyTests(PostingFixtureMixin, TransactionTestCase):
+    """Overlapping statements reconciled at the same time"""
+
+    THREADS = 4
+
+    def setUp(self):
+        self.create_fixture()
+
+    def test_line_is_matched_once(self):
+        from accounting.models import BankStatement, BankTransaction
+        from accounting.services import BalancePostingService, BankReconciliationService
+
+        BalancePostingService().post(self.create_entry('100.00', 'JE-0001'))
+        statements = []
+        for i in range(self.THREADS):
+            statement = BankStatement.all_objects.create(
+                tenant=self.tenant, bank_account=self.cash, statement_date=date(2024, 1, 31),
+                opening_balance=Decimal('0.00'), closing_balance=Decimal('0.00'),
+            )
+            BankTransaction.all_objects.create(
+                tenant=self.tenant, statement=statement, date=date(2024, 1, 15),
+                description=f'Deposit {i}', credit=Decimal('100.00'),
+            )
+            statements.append(statement)
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(statement):
+            try:
+                barrier.wait()
+                BankReconciliationService().reconcile(statement)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(statement,)) for statement in statements]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(BankTransaction.all_objects.filter(is_matched=True).count(), 1)
+
+
+class BankStatementImportTests(PostingFixtureMixin, TestCase):
+    """Test streaming statement import"""
+
+    OFX = (
+        "OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>"
+        "<BANKTRANLIST>"
+        "<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240105120000<TRNAMT>1500.00<FITID>A1<NAME>Customer"
+        "</STMTTRN>"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240107<TRNAMT>-45.20<FITID>A2<CHECKNUM>1001<MEMO>Supplies"
+        "</STMTTRN>"
+        "</BANKTRANLIST><LEDGERBAL><BALAMT>2454.80<DTASOF>20240131</LEDGERBAL>"
+        "</STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>"
+    )
+
+    def setUp(self):
+        self.create_fixture()
+
+    def test_csv_with_signed_amounts(self):
+        """Header aliases are resolved once; closing balance follows the movement"""
+        from accounting.services import import_statement
+
+        data = io.BytesIO(
+            'Posted Date;Details;Ref;Amount\n'
+            '03/01/2024;Customer;INV-1;"1,200.00"\n'
+            '04/01/2024;Rent;;(300.00)\n'
+            '\n'.encode('utf-8-sig')
+        )
+        statement = import_statement(data, self.cash, opening_balance=Decimal('100.00'), filename='jan.csv')
+
+        transactions = list(statement.transactions.order_by('date'))
+        self.assertEqual(len(transactions), 2)
+        self.assertEqual(transactions[0].date, date(2024, 1, 3))
+        self.assertEqual((transactions[0].reference, transactions[0].credit), ('INV-1', Decimal('1200.00')))
+        self.assertEqual(transactions[1].debit, Decimal('300.00'))
+        self.assertEqual(statement.statement_date, date(2024, 1, 4))
+        self.assertEqual(statement.closing_balance, Decimal('1000.00'))
+
+    def test_ofx_uses_ledger_balance(self):
+        """OFX is detected from its header and reads <LEDGERBAL>"""
+        from accounting.services import import_statement
+
+        statement = import_statement(io.BytesIO(self.OFX.encode()), self.cash, opening_balance=Decimal('1000.00'))
+
+        transactions = list(statement.transactions.order_by('date'))
+        self.assertEqual([t.reference for t in transactions], ['A1', '1001'])
+        self.assertEqual(transactions[1].debit, Decimal('45.20'))
+        self.assertEqual(transactions[1].description, 'Supplies')
+        self.assertEqual(statement.closing_balance, Decimal('2454.80'))
+
+    def test_invalid_file_rolls_back(self):
+        """A bad row leaves no partial statement behind"""
+        from accounting.models import BankStatement
+        from accounting.services import StatementImportError, import_statement
+
+        data = io.StringIO('Date,Amount\n2024-01-03,10.00\nnot a date,5.00\n')
+        with self.assertRaises(StatementImportError):
+            import_statement(data, self.cash, batch_size=1)
+        self.assertFalse(BankStatement.all_objects.exists())
@@ -3,7 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.db import models, transaction
 from django.db.models import Sum, Q, Count, Min
 from django.utils import timezone
@@ -49,7 +49,7 @@ from .serializers import (
     ReportTemplateSerializer, ReportScheduleSerializer, ReportFilterSerializer,
     GenerateReportSerializer, ExportReportSerializer, UpdateReportSerializer, ReportDataSerializer
 )
-from .services import ReportGeneratorService, ReportExporterService, ReportCacheService
+from .services import ReportGeneratorService, ReportExporterService, ReportCacheService, BalancePostingService
 from core.schema_serializers import BalanceSheetResponseSerializer
 from .schema import (
     FiscalYearViewSetSchema, AccountingPeriodViewSetSchema, CurrencyViewSetSchema,
@@ -99,73 +99,26 @@ class TenantContextMixin:
         if getattr(request, 'tenant', None) and getattr(request, 'tenant_membership', None):
             return
         
-        from core.tenants.models import Tenant, TenantMembership
+        from core.tenants.context import get_request_context
         from core.tenants.managers import set_current_tenant
         
-        tenant_id = request.META.get('HTTP_X_TENANT_ID')
-        tenant_slug = request.META.get('HTTP_X_TENANT_SLUG')
-        
-        tenant = None
-        
-        if tenant_id:
-            try:
-                tenant = Tenant.objects.get(id=tenant_id, is_active=True)
-            except Tenant.DoesNotExist:
-                # Invalid tenant ID - try fallback
-                tenant = None
-            except Exception:
-                # Invalid format - try fallback
-                tenant = None
-        elif tenant_slug:
-            try:
-                tenant = Tenant.objects.get(slug=tenant_slug, is_active=True)
-            except Tenant.DoesNotExist:
-                tenant = None
-        
-        # Always try to get a default tenant if none found
-        if tenant is None and request.user and request.user.is_authenticated:
-            membership = TenantMembership.objects.filter(
-                user=request.user, is_active=True, tenant__is_active=True
-            ).select_related('tenant').first()
-            if membership:
-                tenant = membership.tenant
-                request.tenant = tenant
-                request.tenant_membership = membership
-                set_current_tenant(tenant)
-                return
-            else:
-                # No membership - create a default personal tenant for this user
-                # Or just set tenant/membership to None and let views handle it
-                request.tenant = None
-                request.tenant_membership = None
-                return
-        
-        if tenant is None:
-            # Still no tenant - just continue without tenant context
+        if not (request.user and request.user.is_authenticated):
             request.tenant = None
             request.tenant_membership = None
             return
         
-        # Verify membership
-        try:
-            membership = TenantMembership.objects.get(
-                user=request.user, tenant=tenant, is_active=True
-            )
-        except TenantMembership.DoesNotExist:
-            # No membership for this tenant - fall back to default
-            membership = TenantMembership.objects.filter(
-                user=request.user, is_active=True, tenant__is_active=True
-            ).select_related('tenant').first()
-            if membership:
-                tenant = membership.tenant
-            else:
-                request.tenant = None
-                request.tenant_membership = None
-                return
+        # Header tenant if the user is a member, otherwise their default tenant
+        context = get_request_context(request, user=request.user)
+        membership = context.membership or context.default_membership
+        if membership is None:
+            # No membership - let views handle the missing tenant
+            request.tenant = None
+            request.tenant_membership = None
+            return
         
-        request.tenant = tenant
+        request.tenant = membership.tenant
         request.tenant_membership = membership
-        set_current_tenant(tenant)
+        set_current_tenant(membership.tenant)
     
     def _check_viewer_write(self, request):
         """Check if viewer is trying to write"""
@@ -278,6 +231,14 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
     
+    def destroy(self, request, *args, **kwargs):
+        if self.get_object().status != 'DRAFT':
+            return Response(
+                {'error': 'Only draft entries can be deleted'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().destroy(request, *args, **kwargs)
+    
     @action(detail=True, methods=['post'])
     def post(self, request, pk=None):
         """Post a journal entry (make it final)"""
@@ -295,22 +256,34 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update account balances
-        for line in entry.lines.all():
-            account = line.account
-            if account.is_debit_positive:
-                account.current_balance += line.debit - line.credit
-            else:
-                account.current_balance += line.credit - line.debit
-            account.save()
-        
-        entry.status = 'POSTED'
-        from django.utils import timezone
-        entry.posted_at = timezone.now()
-        entry.save()
+        # Update account balances and mark the entry posted
+        if not BalancePostingService().post(entry):
+            return Response(
+                {'error': 'Only draft entries can be posted'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         return Response({'status': 'posted'})
     
+    @action(detail=False, methods=['post'])
+    def bulk_post(self, request):
+        """Post multiple balanced draft entries in one batch"""
+        entry_ids = request.data.get('entry_ids', [])
+        if not entry_ids:
+            return Response(
+                {'error': 'entry_ids is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        entries = list(self.get_queryset().filter(id__in=entry_ids, status='DRAFT'))
+        balanced = [entry for entry in entries if entry.is_balanced]
+        posted_ids = {str(pk) for pk in BalancePostingService().post_many(balanced)}
+        
+        return Response({
+            'posted': sorted(posted_ids),
+            'skipped': [str(pk) for pk in entry_ids if str(pk) not in posted_ids],
+        })
+    
     @action(detail=True, methods=['post'])
     def void(self, request, pk=None):
         """Void a posted journal entry"""
@@ -322,17 +295,12 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Reverse account balances
-        for line in entry.lines.all():
-            account = line.account
-            if account.is_debit_positive:
-                account.current_balance -= line.debit - line.credit
-            else:
-                account.current_balance -= line.credit - line.debit
-            account.save()
-        
-        entry.status = 'VOIDED'
-        entry.save()
+        # Reverse account balances and mark the entry voided
+        if not BalancePostingService().void(entry):
+            return Response(
+                {'error': 'Only posted entries can be voided'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         return Response({'status': 'voided'})
 
@@ -1239,6 +1207,7 @@ class ReceiptViewSet(viewsets.ModelViewSet):
         batch_id = uuid.uuid4()
         
         results = []
+        receipts = []
         recognized_count = 0
         unrecognized_count = 0
         failed_count = 0
@@ -1269,12 +1238,14 @@ class ReceiptViewSet(viewsets.ModelViewSet):
                 elif receipt.recognition_status == RecognitionStatus.UNRECOGNIZED.value:
                     unrecognized_count += 1
                 
+                receipts.append(receipt)
                 results.append({
                     'id': str(receipt.id),
                     'original_filename': receipt.original_filename,
                     'recognition_status': receipt.recognition_status,
                     'confidence_score': receipt.confidence_score,
                     'vendor_name': receipt.vendor_name or '',
+                    'contact_id': None,
                     'total_amount': receipt.total_amount,
                     'receipt_date': receipt.receipt_date,
                     'error': receipt.processing_error or ''
@@ -1288,11 +1259,24 @@ class ReceiptViewSet(viewsets.ModelViewSet):
                     'recognition_status': 'FAILED',
                     'confidence_score': None,
                     'vendor_name': '',
+                    'contact_id': None,
                     'total_amount': None,
                     'receipt_date': None,
                     'error': str(e)
                 })
         
+        # Match all vendors against one contact index instead of per receipt
+        if receipts:
+            from ai_assistants.services.vendor_recognition_service import VendorRecognitionService
+            contacts = VendorRecognitionService(user=request.user).match_many(receipts)
+            contact_ids = {
+                str(receipt.id): str(contact.id)
+                for receipt, contact in zip(receipts, contacts) if contact is not None
+            }
+            for result in results:
+                if result['id'] in contact_ids:
+                    result['contact_id'] = contact_ids[result['id']]
+        
         return Response({
             'batch_id': str(batch_id),
             'total_files': len(files),
@@ -1918,6 +1902,7 @@ class FinancialReportViewSet(viewsets.ModelViewSet):
     - POST /financial-reports/{id}/export/ - Export to Word/Excel/CSV
     - GET /financial-reports/{id}/exports/ - List exports for a report
     - POST /financial-reports/{id}/refresh/ - Force refresh cached data
+    - GET /financial-reports/{id}/progress/ - Progress of a queued generation
     - GET /financial-reports/types/ - Get available report types
     - GET /financial-reports/templates/ - List report templates
     - POST /financial-reports/templates/ - Create template
@@ -1979,75 +1964,91 @@ class FinancialReportViewSet(viewsets.ModelViewSet):
         {
             "report_type": "INCOME_STATEMENT",
             "name": "Q4 2024 Income Statement",
-            "description": "Income statement for Q4 2024",
+            "period_start": "2024-10-01",
+            "period_end": "2024-12-31",
             "filters": {
-                "date_from": "2024-10-01",
-                "date_to": "2024-12-31",
-                "project_id": "uuid",  // optional
-                "vendor_id": "uuid",   // optional
-                "category": "OPERATING",  // optional
+                "project_ids": ["uuid"],  // optional
+                "vendor_ids": ["uuid"],   // optional
                 "account_ids": ["uuid1", "uuid2"],  // optional
-                "include_zero_balances": false,
-                "comparison_period": "previous_year"  // optional
-            }
+                "include_zero_balances": false
+            },
+            "queued": true  // optional: generate in background, poll /progress/
         }
         """
         serializer = GenerateReportSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
         
-        # Create report record
-        report = Report.objects.create(
-            tenant=getattr(request, 'tenant', None),
-            report_type=serializer.validated_data['report_type'],
-            name=serializer.validated_data['name'],
-            description=serializer.validated_data.get('description', ''),
-            filter_config=serializer.validated_data.get('filters', {}),
-            generated_by=request.user,
-            status=ReportStatus.GENERATING.value
+        template = None
+        if data.get('template_id'):
+            template = ReportTemplate.objects.filter(id=data['template_id']).first()
+        
+        tenant = getattr(request, 'tenant', None)
+        generator = ReportGeneratorService(tenant_id=tenant.id if tenant else None)
+        params = dict(
+            report_type=data['report_type'],
+            period_start=data['period_start'],
+            period_end=data['period_end'],
+            name=data['name'],
+            user=request.user,
+            # JSON-safe representation (UUIDs as strings)
+            filters=serializer.data.get('filters') or {},
+            display_config=data.get('display_config', {}),
+            include_comparison=data.get('include_comparison', False),
+            comparison_period_start=data.get('comparison_period_start'),
+            comparison_period_end=data.get('comparison_period_end'),
+            template=template,
+            notes=data.get('notes', '')
         )
         
+        if data.get('queued'):
+            report, queued = generator.queue_report(**params)
+            return self._queued_response(report, queued)
+        
         try:
-            # Generate report data
-            generator = ReportGeneratorService()
-            report_data = generator.generate_report(report)
-            
-            # Store generated data
-            report.cached_data = report_data
-            report.status = ReportStatus.COMPLETED.value
-            report.generated_at = timezone.now()
-            report.save()
-            
+            report = generator.generate_report(**params)
             return Response(
                 ReportSerializer(report).data,
                 status=status.HTTP_201_CREATED
             )
             
         except Exception as e:
-            report.status = ReportStatus.FAILED.value
-            report.error_message = str(e)
-            report.save()
-            
             return Response(
-                {'error': str(e), 'report_id': str(report.id)},
+                {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _queued_response(self, report, queued):
+        """202 response for a report generating in the background."""
+        progress = ReportCacheService().get_generation_status(str(report.id))
+        return Response({
+            'report_id': str(report.id),
+            'report_number': report.report_number,
+            'status': report.status,
+            'coalesced': not queued,
+            'progress': progress
+        }, status=status.HTTP_202_ACCEPTED)
+    
     def retrieve(self, request, *args, **kwargs):
         """Get report with full data."""
         report = self.get_object()
         
         # Check if data needs refresh
         cache_service = ReportCacheService()
-        cached_data = cache_service.get(report)
+        cached_data = cache_service.get_cached_report_data(report)
+        is_stale = False
         
         if cached_data is None and report.cached_data:
-            # Re-cache from stored data
-            cache_service.set(report, report.cached_data)
+            # Re-cache from stored data unless newer postings affect it
+            is_stale = cache_service.is_report_stale(report)
+            if not is_stale:
+                cache_service.cache_report_data(report, report.cached_data)
             cached_data = report.cached_data
         
         serializer = ReportSerializer(report)
         data = serializer.data
         data['report_data'] = cached_data or report.cached_data
+        data['is_stale'] = is_stale
         
         return Response(data)
     
@@ -2150,9 +2151,19 @@ class FinancialReportViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
-        """Download an export file."""
+        """
+        Download an export file.
+        
+        Query params:
+        - export_id: stored export to serve (defaults to the latest)
+        - stream: EXCEL or CSV to stream a fresh export without storing it
+        """
         report = self.get_object()
         
+        stream_format = request.query_params.get('stream')
+        if stream_format:
+            return self._stream_export(report, stream_format.upper())
+        
         export_id = request.query_params.get('export_id')
         if not export_id:
             # Get latest export
@@ -2179,33 +2190,52 @@ class FinancialReportViewSet(viewsets.ModelViewSet):
         }
         content_type = content_types.get(export_record.export_format, 'application/octet-stream')
         
-        response = HttpResponse(export_record.file.read(), content_type=content_type)
-        response['Content-Disposition'] = f'attachment; filename="{export_record.file_name}"'
+        # Served in chunks straight from storage
+        return FileResponse(
+            export_record.file.open('rb'),
+            as_attachment=True,
+            filename=export_record.file_name,
+            content_type=content_type
+        )
+    
+    def _stream_export(self, report, export_format):
+        """Stream an Excel/CSV export of the report."""
+        if report.status != ReportStatus.COMPLETED.value:
+            return Response(
+                {'error': 'Report must be completed before export'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if export_format not in ReportExporterService.STREAMING_FORMATS:
+            return Response(
+                {'error': f'Streaming is only available for: {", ".join(ReportExporterService.STREAMING_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        chunks, file_name, content_type = ReportExporterService().stream_export(report, export_format)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
         return response
     
     @action(detail=True, methods=['post'])
     def refresh(self, request, pk=None):
         """
         Force refresh report data (clear cache and regenerate).
+        Pass {"queued": true} to regenerate in the background.
         """
         report = self.get_object()
         
         # Clear cache
         cache_service = ReportCacheService()
-        cache_service.delete(report)
+        cache_service.invalidate_report_cache(report)
         
-        # Regenerate
-        report.status = ReportStatus.GENERATING.value
-        report.save()
+        generator = ReportGeneratorService(tenant_id=report.tenant_id)
+        
+        if str(request.data.get('queued', '')).lower() in ('true', '1'):
+            report, queued = generator.enqueue_generation(report)
+            return self._queued_response(report, queued)
         
         try:
-            generator = ReportGeneratorService()
-            report_data = generator.generate_report(report, force_refresh=True)
-            
-            report.cached_data = report_data
-            report.status = ReportStatus.COMPLETED.value
-            report.generated_at = timezone.now()
-            report.save()
+            generator.run_generation(report)
             
             return Response({
                 'message': 'Report refreshed successfully',
@@ -2213,15 +2243,25 @@ class FinancialReportViewSet(viewsets.ModelViewSet):
             })
             
         except Exception as e:
-            report.status = ReportStatus.FAILED.value
-            report.error_message = str(e)
-            report.save()
-            
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """Generation status of a queued report."""
+        report = self.get_object()
+        progress = ReportCacheService().get_generation_status(str(report.id))
+        if progress is None:
+            # Status key expired; fall back to the report record
+            progress = {
+                'status': report.status,
+                'progress': 100 if report.status in (ReportStatus.COMPLETED.value, ReportStatus.FAILED.value) else 0,
+                'message': report.generation_error
+            }
+        return Response({'report_id': str(report.id), **progress})
+    
     @action(detail=False, methods=['get'])
     def types(self, request):
         """Get available report types with descriptions."""
@@ -2309,11 +2349,16 @@ class FinancialReportViewSet(viewsets.ModelViewSet):
         # Recent exports
         recent_exports = ReportExport.objects.order_by('-created_at')[:10]
         
+        # Cache effectiveness (hits, misses, dependency invalidations)
+        tenant = getattr(request, 'tenant', None)
+        cache_stats = ReportCacheService().get_cache_stats(tenant.id if tenant else None)
+        
         return Response({
             'total_reports': total,
             'by_type': {item['report_type']: item['count'] for item in by_type},
             'by_status': {item['status']: item['count'] for item in by_status},
-            'recent_exports': ReportExportListSerializer(recent_exports, many=True).data
+            'recent_exports': ReportExportListSerializer(recent_exports, many=True).data,
+            'cache': cache_stats
         })
     
     def _get_report_type_description(self, report_type):
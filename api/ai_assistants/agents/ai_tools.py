@@ -8,15 +8,22 @@ Each tool:
 2. Logs the action to AIActionLog
 3. Executes the operation
 4. Returns result with action_id for tracking
+
+execute_tool_calls runs one model turn's tool calls: consecutive read-only
+(category "query") calls run concurrently on a bounded thread pool, other
+calls run one at a time in the order the model gave them.
 """
 
 import json
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Callable, Type
 from dataclasses import dataclass, field
 from enum import Enum
-from django.db import models, transaction
+from django.conf import settings
+from django.db import connections, models, transaction
 from django.apps import apps
 from django.utils import timezone
 from django.core.serializers.json import DjangoJSONEncoder
@@ -43,6 +50,11 @@ class ToolDefinition:
     parameters: List[ToolParameter] = field(default_factory=list)
     requires_approval: bool = False
     
+    @property
+    def read_only(self) -> bool:
+        """Query tools only read business data, so they can run concurrently"""
+        return self.category == "query"
+    
     def to_openai_function(self) -> dict:
         """Convert to OpenAI function calling format"""
         properties = {}
@@ -120,6 +132,76 @@ class AIToolRegistry:
         return [{"type": "function", "function": t.to_openai_function()} for t in tools]
 
 
+# =================================================================
+# Tool Call Execution
+# =================================================================
+
+_tool_pool = None
+_tool_pool_lock = threading.Lock()
+
+
+def _get_tool_pool() -> ThreadPoolExecutor:
+    """Process-wide pool for read-only tools, bounded by AI_AGENT_TOOL_WORKERS"""
+    global _tool_pool
+    with _tool_pool_lock:
+        if _tool_pool is None:
+            _tool_pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AI_AGENT_TOOL_WORKERS', 4),
+                thread_name_prefix='ai-tool',
+            )
+        return _tool_pool
+
+
+def _run_in_worker(tenant, handler: Callable, executor, args: dict) -> dict:
+    from core.tenants.managers import clear_current_tenant, set_current_tenant
+
+    # Pool threads do not inherit the request's tenant or DB connection
+    set_current_tenant(tenant)
+    try:
+        return handler(executor, **args)
+    finally:
+        clear_current_tenant()
+        connections.close_all()
+
+
+def execute_tool_calls(executor, calls: List[tuple], concurrent: bool = True) -> List[Optional[dict]]:
+    """
+    Run (tool_name, arguments) pairs and return their results in the same
+    order (None for unknown tools). Two or more consecutive read-only tools
+    run together on the pool; every other tool runs in the calling thread
+    after the calls before it have finished.
+    """
+    from core.tenants.managers import get_current_tenant
+
+    # Split into runs: consecutive read-only calls, or a single other call
+    runs: List[List[tuple]] = []
+    for index, (name, args) in enumerate(calls):
+        handler = AIToolRegistry.get_handler(name)
+        if handler is None:
+            continue
+        read_only = concurrent and AIToolRegistry.get_tool(name).read_only
+        if read_only and runs and runs[-1][0][3]:
+            runs[-1].append((index, handler, args, read_only))
+        else:
+            runs.append([(index, handler, args, read_only)])
+
+    results: List[Optional[dict]] = [None] * len(calls)
+    tenant = get_current_tenant()
+    for run in runs:
+        if len(run) == 1:
+            index, handler, args, _ = run[0]
+            results[index] = handler(executor, **args)
+            continue
+        pool = _get_tool_pool()
+        futures = [
+            (index, pool.submit(_run_in_worker, tenant, handler, executor, args))
+            for index, handler, args, _ in run
+        ]
+        for index, future in futures:
+            results[index] = future.result()
+    return results
+
+
 class BusinessToolExecutor:
     """
     Executes business model CRUD operations with logging
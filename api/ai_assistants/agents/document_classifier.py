@@ -1,7 +1,4 @@
-from django.conf import settings
-from openai import OpenAI
-
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from core.libs.ai_service import cached_completion, get_llm_client
 
 
 def classify_document_query(query: str) -> str:
@@ -20,7 +17,8 @@ Respond with just one of the labels: TRANSLATE, SUMMARIZE_AGAIN, EXTRACT_INFO, T
 """
 
     try:
-        response = client.chat.completions.create(
+        response = cached_completion(
+            get_llm_client(),
             model="gpt-4o-mini",
             messages=[{"role": "system", "content": prompt}],
             max_tokens=10,
@@ -1,7 +1,4 @@
-from django.conf import settings
-from openai import OpenAI
-
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from core.libs.ai_service import cached_completion, get_llm_client
 
 
 def classify_analysis_query(query: str, data_columns: list[str]) -> str:
@@ -37,7 +34,8 @@ Return your classification as a single word: DATA_ANALYSIS, GRAPH, or INVALID.
 """
 
     try:
-        response = client.chat.completions.create(
+        response = cached_completion(
+            get_llm_client(),
             model="gpt-4o-mini",
             messages=[{"role": "system", "content": prompt}],
             max_tokens=10,
@@ -85,7 +83,8 @@ Return your classification as a single word: DATA_ANALYSIS, GRAPH, or INVALID.
 """
 
     try:
-        response = client.chat.completions.create(
+        response = cached_completion(
+            get_llm_client(),
             model="gpt-4o-mini",
             messages=[{"role": "system", "content": prompt}],
             max_tokens=10,
@@ -0,0 +1,197 @@
+"""
+Benchmark business agent chat turns against a local stub LLM server
+Usage: python manage.py benchmark_agent_chat --tools 4 --tool-latency 150 --turns 10
+
+Starts an OpenAI-compatible stub (/v1/chat/completions, streaming and not)
+that answers the first request of a turn with --tools read-only tool calls
+(plus --writes write calls) and the second with a --tokens token answer.
+Tool handlers sleep --tool-latency ms in place of their queries.
+
+Reports time-to-first-token and total latency per turn for:
+- blocking: tools one after another, final answer in one response
+- blocking + concurrent tools
+- streaming + concurrent tools (the agent/chat/stream/ path)
+No database access: the turns drive the clients and execute_tool_calls directly.
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from openai import AsyncOpenAI, OpenAI
+
+from ai_assistants.agents.ai_tools import AIToolRegistry, ToolDefinition, execute_tool_calls
+from ai_assistants.services.agent_chat import astream_completion, tool_call_dicts
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal chat.completions endpoint; timings come from server.config"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        config = self.server.config
+        wants_tools = body.get('tools') and body['messages'][-1]['role'] == 'user'
+
+        time.sleep(config['first_token'])
+        if body.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            if wants_tools:
+                for index, name in enumerate(config['tool_names']):
+                    self._chunk({"tool_calls": [{
+                        "index": index, "id": f"call_{index}", "type": "function",
+                        "function": {"name": name, "arguments": "{}"},
+                    }]})
+                self._chunk({}, finish_reason="tool_calls")
+            else:
+                for index in range(config['tokens']):
+                    if index:
+                        time.sleep(config['token_delay'])
+                    self._chunk({"content": "word "})
+                self._chunk({}, finish_reason="stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            return
+
+        if wants_tools:
+            message = {"role": "assistant", "content": None, "tool_calls": [
+                {"id": f"call_{index}", "type": "function", "function": {"name": name, "arguments": "{}"}}
+                for index, name in enumerate(config['tool_names'])
+            ]}
+        else:
+            time.sleep(config['token_delay'] * (config['tokens'] - 1))
+            message = {"role": "assistant", "content": "word " * config['tokens']}
+        payload = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body['model'],
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _chunk(self, delta, finish_reason=None):
+        chunk = {
+            "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.flush()
+
+
+class Command(BaseCommand):
+    help = 'Measure TTFT and total latency of multi-tool agent chat turns against a stub LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tools', type=int, default=4, help='read-only tool calls per turn')
+        parser.add_argument('--writes', type=int, default=1, help='write tool calls after them')
+        parser.add_argument('--tool-latency', type=float, default=150, help='ms per tool call')
+        parser.add_argument('--first-token', type=float, default=300, help='ms before the stub answers')
+        parser.add_argument('--tokens', type=int, default=60)
+        parser.add_argument('--token-delay', type=float, default=20, help='ms between streamed tokens')
+        parser.add_argument('--turns', type=int, default=10)
+
+    def handle(self, *args, **options):
+        tool_latency = options['tool_latency'] / 1000
+        names = [f'benchmark_query_{i}' for i in range(options['tools'])]
+        names += [f'benchmark_write_{i}' for i in range(options['writes'])]
+        for name in names:
+            AIToolRegistry.register(
+                ToolDefinition(
+                    name=name,
+                    description='Benchmark tool',
+                    category='query' if 'query' in name else 'crud',
+                    target_model='benchmark.Stub',
+                ),
+                lambda executor, **kwargs: time.sleep(tool_latency) or {"success": True},
+            )
+
+        self.tool_names = names
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        server.config = {
+            'tool_names': names,
+            'first_token': options['first_token'] / 1000,
+            'tokens': options['tokens'],
+            'token_delay': options['token_delay'] / 1000,
+        }
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+        try:
+            client = OpenAI(api_key='stub', base_url=base_url)
+            self._report('blocking, sequential tools',
+                         lambda: self._blocking_turn(client, concurrent=False), options)
+            self._report('blocking, concurrent tools',
+                         lambda: self._blocking_turn(client, concurrent=True), options)
+
+            self._report('streaming, concurrent tools',
+                         lambda: asyncio.run(self._streaming_turn(base_url)), options)
+        finally:
+            server.shutdown()
+            for name in names:
+                AIToolRegistry._tools.pop(name, None)
+                AIToolRegistry._handlers.pop(name, None)
+
+    def _request(self, messages, with_tools=True):
+        kwargs = {"model": "stub", "messages": messages}
+        if with_tools:
+            kwargs["tools"] = AIToolRegistry.to_openai_tools(self.tool_names)
+        return kwargs
+
+    def _tool_messages(self, messages, tool_calls, concurrent):
+        calls = [(tc["function"]["name"], json.loads(tc["function"]["arguments"])) for tc in tool_calls]
+        results = execute_tool_calls(None, calls, concurrent=concurrent)
+        messages.append({"role": "assistant", "content": None, "tool_calls": tool_calls})
+        for tool_call, result in zip(tool_calls, results):
+            messages.append({"role": "tool", "tool_call_id": tool_call["id"], "content": json.dumps(result)})
+
+    def _blocking_turn(self, client, concurrent):
+        """(ttft, total) of one turn the way AIAgentViewSet.chat runs it"""
+        started = time.perf_counter()
+        messages = [{"role": "user", "content": "Summarise my clients"}]
+        response = client.chat.completions.create(**self._request(messages))
+        self._tool_messages(messages, tool_call_dicts(response.choices[0].message.tool_calls), concurrent)
+        client.chat.completions.create(**self._request(messages, with_tools=False))
+        total = time.perf_counter() - started
+        return total, total
+
+    async def _streaming_turn(self, base_url):
+        """(ttft, total) of one turn the way agent_chat_stream runs it"""
+        from asgiref.sync import sync_to_async
+
+        # The async client is bound to the event loop, so one per turn
+        client = AsyncOpenAI(api_key='stub', base_url=base_url)
+        started = time.perf_counter()
+        ttft = None
+        messages = [{"role": "user", "content": "Summarise my clients"}]
+        tool_calls = []
+        async for kind, value in astream_completion(client, **self._request(messages)):
+            if kind == "tool_calls":
+                tool_calls = value
+        await sync_to_async(self._tool_messages)(messages, tool_calls, True)
+        async for kind, value in astream_completion(client, **self._request(messages, with_tools=False)):
+            if kind == "delta" and ttft is None:
+                ttft = time.perf_counter() - started
+        total = time.perf_counter() - started
+        await client.close()
+        return ttft, total
+
+    def _report(self, label, run, options):
+        ttfts, totals = [], []
+        for _ in range(options['turns']):
+            ttft, total = run()
+            ttfts.append(ttft * 1000)
+            totals.append(total * 1000)
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: TTFT p50 {np.percentile(ttfts, 50):.0f} ms, "
+            f"total p50 {np.percentile(totals, 50):.0f} ms, p99 {np.percentile(totals, 99):.0f} ms"
+        ))
@@ -0,0 +1,96 @@
+"""
+Benchmark Excel-vs-database receipt comparison
+Usage: python manage.py benchmark_excel_compare --rows 100000
+
+Creates --rows receipts for one user and a reconciliation sheet with the
+same receipt numbers (a few amounts changed, a few rows unknown to the
+database, a few receipts left out), then compares:
+- in-memory: full workbook load and every receipt of the user in a list
+  (compare_excel_with_database)
+- streaming: read-only sheet, chunked IN lookups (compare_excel_with_queryset)
+Reports wall time, queries and peak Python allocations.
+All benchmark data is created inside a transaction that is rolled back.
+"""
+import io
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+import openpyxl
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ai_assistants.models import Receipt
+from ai_assistants.services.accounting_service import (
+    compare_excel_with_database, compare_excel_with_queryset,
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure time, queries and peak memory of in-memory vs streaming Excel comparison'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                email=f'excel-benchmark-{uuid.uuid4().hex[:8]}@example.com', password=uuid.uuid4().hex
+            )
+            Receipt.objects.bulk_create([
+                Receipt(
+                    uploaded_by=user,
+                    receipt_number=f'R{i:07d}',
+                    receipt_date=date(2024, 1, 1) + timedelta(days=i % 365),
+                    vendor_name=f'Vendor {i % 500}',
+                    total_amount=Decimal(100 + i % 900),
+                )
+                for i in range(rows)
+            ], batch_size=2000)
+            excel = self._sheet(rows)
+            self.stdout.write(f"{rows:,} receipts, sheet of {len(excel) / 1e6:.1f} MB")
+
+            queryset = Receipt.objects.filter(uploaded_by=user)
+            self._run('in-memory', lambda: compare_excel_with_database(excel, list(queryset.values(
+                'receipt_number', 'vendor_name', 'receipt_date', 'total_amount', 'tax_amount', 'category'
+            ))))
+            self._run('streaming', lambda: compare_excel_with_queryset(
+                io.BytesIO(excel), queryset, chunk_size=options['chunk_size']
+            ))
+            transaction.set_rollback(True)
+
+    def _sheet(self, rows):
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(['Date', 'Receipt No', 'Vendor', 'Total'])
+        for i in range(rows):
+            if i % 100 == 1:
+                continue  # missing in Excel
+            number = f'X{i:07d}' if i % 100 == 2 else f'R{i:07d}'  # missing in DB
+            amount = 100 + i % 900 + (5 if i % 100 == 3 else 0)  # amount mismatch
+            ws.append([date(2024, 1, 1) + timedelta(days=i % 365), number, f'Vendor {i % 500}', amount])
+        output = io.BytesIO()
+        wb.save(output)
+        return output.getvalue()
+
+    def _run(self, label, func):
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                result = func()
+                elapsed = time.perf_counter() - started
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {elapsed:.2f}s, {len(ctx.captured_queries)} queries, peak {peak / 1e6:.1f} MB; "
+            f"{result['matched_count']:,} matched, {result['amount_mismatch_count']:,} amount mismatches, "
+            f"{result['missing_in_db_count']:,} missing in DB, {result['missing_in_excel_count']:,} missing in Excel"
+        ))
@@ -0,0 +1,118 @@
+"""
+Benchmark recurring-expense detection
+Usage: python manage.py benchmark_recurring_expenses --rows 1000000 --vendors 20000
+
+Builds a synthetic ledger in the receipt_frame format (weekly, bi-weekly,
+monthly, quarterly and irregular vendors with date and amount jitter) and
+times find_recurring over all of it, per vendor and per (user, vendor) as
+refresh_tenant runs it. The per-vendor _analyze_pattern loop is timed on
+the first --legacy-rows rows and checked to detect the same patterns.
+No database access.
+"""
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from ai_assistants.services.recurring_expense_service import (
+    RecurringExpenseService, find_recurring, pattern_records,
+)
+
+PERIODS = np.array([7, 14, 30, 90, 45])  # 45: no fixed pattern, wide jitter
+JITTER = np.array([1, 2, 3, 10, 30])
+CATEGORIES = np.array(['MEALS', 'TRAVEL', 'OFFICE', 'UTILITIES', 'OTHER'])
+
+
+class Command(BaseCommand):
+    help = 'Measure vectorized recurring-expense detection on a synthetic ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--vendors', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--legacy-rows', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        df = self._ledger(options['rows'], options['vendors'], options['users'])
+        self.stdout.write(f"Ledger: {len(df):,} rows, {df['vendor_key'].nunique():,} vendors "
+                          f"({time.perf_counter() - started:.1f}s to build)")
+
+        started = time.perf_counter()
+        patterns = find_recurring(df)
+        records = pattern_records(patterns)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"find_recurring by vendor: {elapsed:.2f}s, {len(records):,} recurring "
+            f"({len(df) / elapsed:,.0f} rows/s)"
+        ))
+
+        started = time.perf_counter()
+        by_user = find_recurring(df, keys=('uploaded_by_id', 'vendor_key'))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"find_recurring by user and vendor: {elapsed:.2f}s, {len(by_user):,} recurring"
+        ))
+
+        # Whole vendors, from the first --legacy-rows rows
+        vendors = df['vendor_key'].iloc[:options['legacy_rows']].unique()
+        subset = df[df['vendor_key'].isin(vendors)]
+        self._compare_legacy(subset)
+
+    def _ledger(self, rows, vendors, users):
+        rng = np.random.default_rng(0)
+        vendor = np.sort(rng.integers(0, vendors, rows))
+        kind = rng.integers(0, len(PERIODS), vendors)
+        start = rng.integers(0, 60, vendors)
+        base_amount = rng.uniform(20, 2000, vendors).round(2)
+        names = np.array([f'Vendor {v}' for v in range(vendors)], dtype=object)
+
+        # Position of each row within its vendor's receipts
+        first = np.searchsorted(vendor, vendor, side='left')
+        position = np.arange(rows) - first
+        offset = start[vendor] + position * PERIODS[kind[vendor]]
+        offset = offset + rng.integers(-1, 2, rows) * rng.integers(0, JITTER[kind[vendor]] + 1)
+        dates = np.datetime64('2020-01-01') + offset.astype('timedelta64[D]')
+
+        return pd.DataFrame({
+            'id': np.arange(rows),
+            'uploaded_by_id': vendor % users,
+            'vendor_name': names[vendor],
+            'receipt_date': pd.to_datetime(dates),
+            'category': CATEGORIES[kind[vendor]],
+            'amount': (base_amount[vendor] * rng.uniform(0.9, 1.1, rows)).round(2),
+            'vendor_key': np.char.lower(names[vendor].astype(str)).astype(object),
+        })
+
+    def _compare_legacy(self, df):
+        service = RecurringExpenseService()
+        receipts = defaultdict(list)
+        for row in df.itertuples(index=False):
+            receipts[row.vendor_key].append(SimpleNamespace(
+                id=row.id, vendor_name=row.vendor_name, receipt_date=row.receipt_date.date(),
+                total_amount=row.amount, category=row.category,
+            ))
+
+        started = time.perf_counter()
+        legacy = {}
+        for vendor_key, vendor_receipts in receipts.items():
+            if len(vendor_receipts) >= service.min_occurrences:
+                pattern = service._analyze_pattern(vendor_receipts)
+                if pattern:
+                    legacy[vendor_key] = pattern['pattern_type']
+        legacy_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        patterns = find_recurring(df)
+        elapsed = time.perf_counter() - started
+
+        vectorized = patterns['pattern_type'].to_dict()
+        mismatches = sum(1 for key in legacy.keys() | vectorized.keys() if legacy.get(key) != vectorized.get(key))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(df):,} rows: _analyze_pattern loop {legacy_elapsed:.2f}s, "
+            f"find_recurring {elapsed:.2f}s ({legacy_elapsed / elapsed:.0f}x), "
+            f"{len(vectorized):,} recurring, {mismatches} pattern mismatches"
+        ))
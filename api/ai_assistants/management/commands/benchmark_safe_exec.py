@@ -0,0 +1,91 @@
+"""
+Benchmark sandboxed execution of analyst queries
+Usage: python manage.py benchmark_safe_exec --rows 200000 --requests 200 --concurrency 4
+
+Compares the previous in-thread execution (one DataFrame copy per call)
+with the worker pool, then repeats the pool run while a runaway query
+keeps timing out, to show it no longer stalls other requests.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from ai_assistants.services.safe_exec import (
+    ExecutionTimeoutError, SafeCodeValidator, SandboxPool, _execute,
+)
+
+QUERIES = [
+    ('eval', "df.groupby('category')['amount'].sum()"),
+    ('eval', "df[df['amount'] > 500].shape[0]"),
+    ('eval', "df.nlargest(10, 'amount')"),
+    ('eval', "df['amount'].mean()"),
+    ('exec', "result = df.groupby('vendor')['amount'].agg(['sum', 'count']).head(20)"),
+]
+RUNAWAY = "sum(range(10**12))"
+
+
+class Command(BaseCommand):
+    help = 'Measure throughput and latency of safe_eval/safe_exec execution'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--workers', type=int, default=2)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        rows = options['rows']
+        df = pd.DataFrame({
+            'category': rng.choice(['Rent', 'Travel', 'Meals', 'Supplies', 'Utilities'], rows),
+            'vendor': rng.integers(0, 500, rows),
+            'amount': rng.uniform(1, 1000, rows).round(2),
+            'date': pd.date_range('2024-01-01', periods=rows, freq='min'),
+        })
+        for _mode, code in QUERIES + [('eval', RUNAWAY)]:
+            SafeCodeValidator().validate(code)
+
+        def inline(mode, code):
+            return _execute(mode, code, df.copy())
+
+        self._report('in-thread (copy per call)', inline, options)
+
+        pool = SandboxPool(size=options['workers'])
+        try:
+            pool.warm(df)
+            self._report('worker pool', lambda mode, code: pool.run(mode, code, df), options)
+
+            with ThreadPoolExecutor(max_workers=1) as runaway:
+                future = runaway.submit(self._runaway, pool, df)
+                self._report('worker pool + runaway query', lambda mode, code: pool.run(mode, code, df), options)
+                future.result()
+            self.stdout.write(f"Pool stats: {pool.stats}")
+        finally:
+            pool.shutdown()
+
+    def _runaway(self, pool, df):
+        try:
+            pool.run('eval', RUNAWAY, df, timeout=2)
+        except ExecutionTimeoutError:
+            pass
+
+    def _report(self, label, run, options):
+        def timed(index):
+            mode, code = QUERIES[index % len(QUERIES)]
+            started = time.perf_counter()
+            run(mode, code)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            latencies = list(executor.map(timed, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = np.array(latencies) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {len(latencies) / elapsed:.1f} req/s, "
+            f"p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms"
+        ))
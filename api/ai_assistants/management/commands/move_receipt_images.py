@@ -0,0 +1,71 @@
+"""
+Management command to move receipt images into the content-addressed blob store.
+Usage: python manage.py move_receipt_images [--batch-size 200] [--files] [--dry-run]
+
+Stores each Receipt.image_base64 in services.blob_store, points
+Receipt.image_blob at it and clears the base64 column. With --files,
+receipts that only have an uploaded image file are moved as well (the
+file itself is left in place). Safe to re-run: moved receipts are skipped.
+"""
+import binascii
+import mimetypes
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from ai_assistants.models import Receipt
+from ai_assistants.services.blob_store import get_blob_store
+
+
+class Command(BaseCommand):
+    help = 'Move receipt images from base64 columns and image files into the blob store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--files', action='store_true', help='Also move receipts with only an image file')
+        parser.add_argument('--dry-run', action='store_true', help='Count receipts to move without moving them')
+
+    def handle(self, *args, **options):
+        pending = Q(image_base64__isnull=False) & ~Q(image_base64='')
+        if options['files']:
+            pending |= ~Q(image='')
+        # Receipt.objects defers image_base64, and only() cannot undo that
+        queryset = Receipt._base_manager.filter(pending, image_blob__isnull=True)
+
+        if options['dry_run']:
+            self.stdout.write(f'{queryset.count()} receipts to move')
+            return
+
+        store = get_blob_store()
+        moved, failed, last_pk = 0, 0, None
+        while True:
+            # Keyset pagination: rows that fail stay behind last_pk
+            batch = queryset.order_by('pk').only('id', 'image', 'image_base64')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            batch = list(batch[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            updated = []
+            for receipt in batch:
+                try:
+                    if receipt.image_base64:
+                        receipt.image_blob = store.put_base64(receipt.image_base64)
+                    else:
+                        content_type = mimetypes.guess_type(receipt.image.name)[0] or 'image/jpeg'
+                        with receipt.image.open('rb') as f:
+                            receipt.image_blob = store.put_file(f, content_type)
+                except (binascii.Error, ValueError, OSError) as e:
+                    failed += 1
+                    self.stderr.write(f'Receipt {receipt.pk}: {e}')
+                    continue
+                receipt.image_base64 = None
+                updated.append(receipt)
+
+            Receipt.objects.bulk_update(updated, ['image_blob', 'image_base64'])
+            moved += len(updated)
+            self.stdout.write(f'Moved {moved} receipts')
+
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} receipts, {failed} failed'))
@@ -0,0 +1,31 @@
+"""
+Management command to rebuild the AI document retrieval index.
+Usage: python manage.py rebuild_document_index [--user <user_id>]
+"""
+from django.core.management.base import BaseCommand
+
+from ai_assistants.models import AIDocument
+from ai_assistants.services.document_index import DocumentIndexService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the chunk index used by RAG document retrieval'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            default=None,
+            help='Only reindex documents uploaded by this user (changed documents only)'
+        )
+
+    def handle(self, *args, **options):
+        service = DocumentIndexService()
+        self.stdout.write(f'Using {service.backend.__class__.__name__}')
+
+        queryset = None
+        if options['user']:
+            queryset = AIDocument.objects.filter(uploaded_by_id=options['user'], is_active=True)
+
+        chunks = service.rebuild(queryset)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {chunks} chunks'))
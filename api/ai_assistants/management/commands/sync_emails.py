@@ -5,6 +5,7 @@ Usage:
     python manage.py sync_emails
     python manage.py sync_emails --account-id=<uuid>
     python manage.py sync_emails --limit=100
+    python manage.py sync_emails --folder=INBOX --folder="Sent Items"
     
 Can be run as a scheduled task (cron job, Celery beat, etc.)
 """
@@ -31,6 +32,12 @@ class Command(BaseCommand):
             default=50,
             help='Maximum emails to fetch per account (default: 50)',
         )
+        parser.add_argument(
+            '--folder',
+            action='append',
+            dest='folders',
+            help='IMAP folder to sync (repeatable, default: INBOX)',
+        )
         parser.add_argument(
             '--skip-demo',
             action='store_true',
@@ -41,6 +48,7 @@ class Command(BaseCommand):
         account_id = options.get('account_id')
         limit = options.get('limit', 50)
         skip_demo = options.get('skip_demo', False)
+        folders = options.get('folders') or ['INBOX']
         
         # Get accounts to sync
         queryset = EmailAccount.objects.filter(is_active=True)
@@ -73,7 +81,7 @@ class Command(BaseCommand):
             self.stdout.write(f'  Syncing: {account.email_address}')
             
             try:
-                result = sync_emails_for_account(account, limit=limit)
+                result = sync_emails_for_account(account, limit=limit, folders=folders)
                 
                 total_stats['accounts'] += 1
                 total_stats['fetched'] += result.get('fetched', 0)
@@ -87,6 +95,8 @@ class Command(BaseCommand):
                     f'Updated: {result.get("updated", 0)}, '
                     f'Errors: {result.get("errors", 0)}'
                 )
+                if result.get('remaining'):
+                    self.stdout.write(f'    {result["remaining"]} more message(s) left for the next sync')
                 
             except Exception as e:
                 total_stats['errors'] += 1
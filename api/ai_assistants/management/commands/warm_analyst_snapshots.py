@@ -0,0 +1,72 @@
+"""
+Management command to write analyst / planner DataFrame snapshots.
+Usage: python manage.py warm_analyst_snapshots [--tenant <tenant_id>] [--timings]
+
+Run on deploy (or from cron) so new gunicorn / Celery workers map the
+snapshots instead of each querying the database on their first request.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_assistants.services.analyst_store import CSV_FALLBACK_PATH, AnalystDataStore
+from ai_assistants.services.frame_snapshots import FrameSnapshotStore
+from ai_assistants.services.tenant_cache import TenantCache
+from core.tenants.models import Tenant
+
+PLANNER_CSV_PATH = 'ai_assistants/data/planner_data.csv'
+
+
+class Command(BaseCommand):
+    help = 'Write memory-mapped analyst snapshots for each tenant and the demo CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            type=str,
+            default=None,
+            help='Only snapshot this tenant'
+        )
+        parser.add_argument(
+            '--timings',
+            action='store_true',
+            help='Compare a cold database load with mapping the snapshot'
+        )
+
+    def handle(self, *args, **options):
+        snapshots = FrameSnapshotStore()
+        tenants = Tenant.objects.filter(is_active=True)
+        if options['tenant']:
+            tenants = tenants.filter(pk=options['tenant'])
+            if not tenants.exists():
+                raise CommandError(f"Tenant {options['tenant']} not found")
+
+        for tenant in tenants:
+            store = AnalystDataStore(tenant=tenant, cache=TenantCache(), snapshots=snapshots)
+
+            started = time.perf_counter()
+            dataset = store.load()
+            load_ms = (time.perf_counter() - started) * 1000
+            generation = store.save_snapshot(dataset)
+            if not generation:
+                self.stdout.write(f'{tenant.slug}: no database data, skipped')
+                continue
+
+            self.stdout.write(
+                f'{tenant.slug}: generation {generation}, '
+                f'{dataset.memory_usage() / 1024 / 1024:.1f} MB'
+            )
+            if options['timings']:
+                started = time.perf_counter()
+                store.load_snapshot()
+                map_ms = (time.perf_counter() - started) * 1000
+                self.stdout.write(f'  cold start: database {load_ms:.0f} ms, snapshot {map_ms:.1f} ms')
+
+        for path in (CSV_FALLBACK_PATH, PLANNER_CSV_PATH):
+            try:
+                snapshots.read_csv(path)
+            except FileNotFoundError:
+                continue
+            self.stdout.write(f'{path}: snapshot ready')
+
+        self.stdout.write(self.style.SUCCESS('Snapshots written'))
@@ -0,0 +1,97 @@
+# Generated by Django 5.1.4 on 2026-10-16 20:44
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+GIN_INDEX = 'ai_assistants_docchunk_search_gin'
+
+
+def create_search_index(apps, schema_editor):
+    """GIN index over AIDocumentChunk.search_vector (PostgreSQL only)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('ai_assistants', 'AIDocumentChunk')._meta.db_table
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {GIN_INDEX} ON {table} USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {GIN_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistants', '0007_airequestlog_airesultlog_aiusagesummary_asynctask_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIDocumentIndexStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=64, unique=True)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('total_length', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AIDocumentChunk',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_public', models.BooleanField(default=False)),
+                ('position', models.PositiveIntegerField()),
+                ('start_offset', models.PositiveIntegerField(default=0)),
+                ('end_offset', models.PositiveIntegerField(default=0)),
+                ('content', models.TextField()),
+                ('length', models.FloatField(default=0, help_text='Weighted term count (BM25 document length)')),
+                ('source_hash', models.CharField(blank=True, max_length=64)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(blank=True, null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='index_chunks', to='ai_assistants.aidocument')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['document', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AIDocumentTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_public', models.BooleanField(default=False)),
+                ('term', models.CharField(max_length=64)),
+                ('tf', models.FloatField()),
+                ('first_offset', models.PositiveIntegerField(default=0, help_text='Excerpt anchor within chunk content')),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='ai_assistants.aidocumentchunk')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='aidocumentchunk',
+            index=models.Index(fields=['owner', 'is_public'], name='ai_assistan_owner_i_6fcbba_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='aidocumentchunk',
+            unique_together={('document', 'position')},
+        ),
+        migrations.AddIndex(
+            model_name='aidocumentterm',
+            index=models.Index(fields=['term', 'owner'], name='ai_assistan_term_a566a2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aidocumentterm',
+            index=models.Index(fields=['term', 'is_public'], name='ai_assistan_term_1cf952_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-16 21:40
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistants', '0008_document_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailFolderState',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('folder', models.CharField(default='INBOX', max_length=255)),
+                ('uid_validity', models.BigIntegerField(blank=True, null=True)),
+                ('last_uid', models.BigIntegerField(default=0, help_text='Highest UID stored (messages are synced in UID order)')),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='folder_states', to='ai_assistants.emailaccount')),
+            ],
+            options={
+                'verbose_name': 'Email Folder State',
+                'verbose_name_plural': 'Email Folder States',
+                'unique_together': {('account', 'folder')},
+            },
+        ),
+    ]
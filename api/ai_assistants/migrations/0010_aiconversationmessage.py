@@ -0,0 +1,101 @@
+# Generated by Django 5.1.4 on 2026-10-16 22:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def copy_messages(apps, schema_editor):
+    """Move AIConversation.messages JSON into AIConversationMessage rows"""
+    AIConversation = apps.get_model('ai_assistants', 'AIConversation')
+    AIConversationMessage = apps.get_model('ai_assistants', 'AIConversationMessage')
+
+    for conversation in AIConversation.objects.only('id', 'messages').iterator(chunk_size=200):
+        if not conversation.messages:
+            continue
+        rows = []
+        for seq, message in enumerate(conversation.messages, start=1):
+            rows.append(AIConversationMessage(
+                conversation_id=conversation.pk,
+                seq=seq,
+                role=message.get('role', 'user'),
+                content=message.get('content') or '',
+                actions=message.get('actions'),
+            ))
+        AIConversationMessage.objects.bulk_create(rows, batch_size=500)
+
+        # auto_now_add ignores the value given to bulk_create; restore the original times
+        for row, message in zip(rows, conversation.messages):
+            created_at = parse_datetime(message.get('timestamp') or '')
+            if created_at is not None:
+                if timezone.is_naive(created_at):
+                    created_at = timezone.make_aware(created_at)
+                row.created_at = created_at
+        AIConversationMessage.objects.bulk_update(rows, ['created_at'], batch_size=500)
+        AIConversation.objects.filter(pk=conversation.pk).update(message_count=len(rows))
+
+
+def restore_messages(apps, schema_editor):
+    AIConversation = apps.get_model('ai_assistants', 'AIConversation')
+    AIConversationMessage = apps.get_model('ai_assistants', 'AIConversationMessage')
+
+    for conversation in AIConversation.objects.filter(message_count__gt=0).iterator(chunk_size=200):
+        conversation.messages = [
+            {
+                'role': message.role,
+                'content': message.content,
+                'timestamp': message.created_at.isoformat(),
+                'actions': message.actions,
+            }
+            for message in AIConversationMessage.objects.filter(conversation_id=conversation.pk).order_by('seq')
+        ]
+        conversation.save(update_fields=['messages'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistants', '0009_emailfolderstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiconversation',
+            name='message_count',
+            field=models.IntegerField(default=0, help_text='Messages stored (also the last seq)'),
+        ),
+        migrations.AddField(
+            model_name='aiconversation',
+            name='summary',
+            field=models.TextField(blank=True, help_text='Rolling summary of messages up to summary_seq'),
+        ),
+        migrations.AddField(
+            model_name='aiconversation',
+            name='summary_seq',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AIConversationMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField()),
+                ('role', models.CharField(max_length=20)),
+                ('content', models.TextField(blank=True)),
+                ('actions', models.JSONField(blank=True, help_text='Tool calls executed for this turn', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='ai_assistants.aiconversation')),
+            ],
+            options={
+                'verbose_name': 'AI Conversation Message',
+                'verbose_name_plural': 'AI Conversation Messages',
+                'ordering': ['conversation', 'seq'],
+                'unique_together': {('conversation', 'seq')},
+            },
+        ),
+        migrations.RunPython(copy_messages, restore_messages),
+        migrations.RemoveField(
+            model_name='aiconversation',
+            name='messages',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistants', '0010_aiconversationmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveIntegerField()),
+                ('content_type', models.CharField(default='image/jpeg', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Receipt Blob / 收據圖檔',
+                'verbose_name_plural': 'Receipt Blobs / 收據圖檔',
+            },
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='image_blob',
+            field=models.ForeignKey(blank=True, help_text='Stored image (services.blob_store) / 圖檔', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='receipts', to='ai_assistants.receiptblob'),
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='receipts/%Y/%m/'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistants', '0011_receiptblob_receipt_image_blob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['uploaded_by', 'receipt_number'], name='ai_assistan_uploade_9a26c5_idx'),
+        ),
+    ]
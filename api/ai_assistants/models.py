@@ -164,6 +164,31 @@ class ExpenseCategory(models.TextChoices):
     OTHER = 'OTHER', 'Other / 其他'
 
 
+class ReceiptBlob(models.Model):
+    """
+    Content-addressed receipt image, stored once per SHA-256 digest
+    內容定址的收據圖片 - 相同內容只存一份
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveIntegerField()
+    content_type = models.CharField(max_length=100, default='image/jpeg')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Receipt Blob / 收據圖檔'
+        verbose_name_plural = 'Receipt Blobs / 收據圖檔'
+    
+    def __str__(self):
+        return f"{self.sha256} ({self.size} bytes)"
+
+
+class ReceiptManager(models.Manager):
+    """Never load the legacy base64 column unless asked for"""
+    
+    def get_queryset(self):
+        return super().get_queryset().defer('image_base64')
+
+
 class Receipt(BaseModel):
     """
     Receipt model for storing uploaded receipts and AI analysis results
@@ -187,8 +212,17 @@ class Receipt(BaseModel):
         on_delete=models.CASCADE,
         related_name='receipts'
     )
-    image = models.ImageField(upload_to='receipts/%Y/%m/')
-    image_base64 = models.TextField(blank=True, null=True)  # Cached base64
+    image = models.ImageField(upload_to='receipts/%Y/%m/', blank=True)
+    image_blob = models.ForeignKey(
+        ReceiptBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='receipts',
+        help_text='Stored image (services.blob_store) / 圖檔'
+    )
+    # Legacy: moved to image_blob by the move_receipt_images command
+    image_base64 = models.TextField(blank=True, null=True)
     original_filename = models.CharField(max_length=255, blank=True)
     
     # Status / 狀態
@@ -274,6 +308,8 @@ class Receipt(BaseModel):
     )
     reviewed_at = models.DateTimeField(null=True, blank=True)
     
+    objects = ReceiptManager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Receipt / 收據'
@@ -281,6 +317,7 @@ class Receipt(BaseModel):
         indexes = [
             models.Index(fields=['project', 'status']),
             models.Index(fields=['uploaded_by', 'status']),
+            models.Index(fields=['uploaded_by', 'receipt_number']),
             models.Index(fields=['receipt_date']),
         ]
     
@@ -461,6 +498,7 @@ from .models_extended import (
     EmailAccount,
     Email,
     EmailAttachment,
+    EmailFolderState,
     EmailTemplate,
     # Planner AI
     TaskPriority,
@@ -470,6 +508,9 @@ from .models_extended import (
     # Document Assistant
     DocumentType,
     AIDocument,
+    AIDocumentChunk,
+    AIDocumentTerm,
+    AIDocumentIndexStats,
     DocumentComparison,
     # Brainstorming Assistant
     BrainstormSession,
@@ -486,4 +527,5 @@ from .models_extended import (
     AIAgent,
     AIActionLog,
     AIConversation,
+    AIConversationMessage,
 )
\ No newline at end of file
@@ -9,6 +9,7 @@ from enum import Enum
 from decimal import Decimal
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from core.models import BaseModel
 
 
@@ -198,6 +199,28 @@ class EmailAttachment(BaseModel):
         ordering = ['filename']
 
 
+class EmailFolderState(BaseModel):
+    """
+    IMAP sync watermark per account folder.
+    last_uid only counts while the server's UIDVALIDITY is unchanged.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(EmailAccount, on_delete=models.CASCADE, related_name='folder_states')
+    folder = models.CharField(max_length=255, default='INBOX')
+    
+    uid_validity = models.BigIntegerField(null=True, blank=True)
+    last_uid = models.BigIntegerField(default=0, help_text='Highest UID stored (messages are synced in UID order)')
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ['account', 'folder']
+        verbose_name = 'Email Folder State'
+        verbose_name_plural = 'Email Folder States'
+    
+    def __str__(self):
+        return f"{self.account} / {self.folder} @ {self.last_uid}"
+
+
 class EmailTemplate(BaseModel):
     """Reusable email templates"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -478,6 +501,75 @@ class AIDocument(BaseModel):
         return f"{self.title} ({self.document_type})"
 
 
+class AIDocumentChunk(BaseModel):
+    """
+    Retrieval chunk of an AIDocument (see services/document_index.py).
+    Position 0 is the header (title, keywords, summary); the rest are
+    consecutive slices of extracted_text at [start_offset, end_offset).
+    """
+    document = models.ForeignKey(
+        AIDocument,
+        on_delete=models.CASCADE,
+        related_name='index_chunks'
+    )
+    # Index partition: an owner's private chunks, or the public pool
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    is_public = models.BooleanField(default=False)
+    
+    position = models.PositiveIntegerField()
+    start_offset = models.PositiveIntegerField(default=0)
+    end_offset = models.PositiveIntegerField(default=0)
+    content = models.TextField()
+    length = models.FloatField(default=0, help_text='Weighted term count (BM25 document length)')
+    source_hash = models.CharField(max_length=64, blank=True)
+    
+    # Filled on PostgreSQL only (GIN indexed by migration)
+    search_vector = SearchVectorField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['document', 'position']
+        unique_together = ['document', 'position']
+        indexes = [
+            models.Index(fields=['owner', 'is_public']),
+        ]
+    
+    def __str__(self):
+        return f"{self.document_id} #{self.position}"
+
+
+class AIDocumentTerm(models.Model):
+    """
+    Posting of the local document index: one row per (chunk, term).
+    Kept lean (no BaseModel columns) since there is a row per distinct term.
+    """
+    chunk = models.ForeignKey(AIDocumentChunk, on_delete=models.CASCADE, related_name='terms')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    is_public = models.BooleanField(default=False)
+    term = models.CharField(max_length=64)
+    tf = models.FloatField()
+    first_offset = models.PositiveIntegerField(default=0, help_text='Excerpt anchor within chunk content')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'owner']),
+            models.Index(fields=['term', 'is_public']),
+        ]
+
+
+class AIDocumentIndexStats(models.Model):
+    """Chunk count and total length per index partition, for BM25 normalisation"""
+    scope = models.CharField(max_length=64, unique=True)  # 'public' or 'user:<id>'
+    chunk_count = models.IntegerField(default=0)
+    total_length = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"{self.scope}: {self.chunk_count} chunks"
+
+
 class DocumentComparison(BaseModel):
     """Compare two document versions"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -1031,9 +1123,13 @@ class AIConversation(BaseModel):
     
     # Conversation state
     title = models.CharField(max_length=255, blank=True)
-    messages = models.JSONField(default=list, help_text='Chat history [{role, content, timestamp}]')
     context = models.JSONField(default=dict, help_text='Additional context for AI')
     
+    # Chat history lives in AIConversationMessage; older turns are folded into summary
+    message_count = models.IntegerField(default=0, help_text='Messages stored (also the last seq)')
+    summary = models.TextField(blank=True, help_text='Rolling summary of messages up to summary_seq')
+    summary_seq = models.IntegerField(default=0)
+    
     # Stats
     total_actions = models.IntegerField(default=0)
     successful_actions = models.IntegerField(default=0)
@@ -1046,3 +1142,38 @@ class AIConversation(BaseModel):
     
     def __str__(self):
         return f"Conversation {self.session_id[:8]}... - {self.user}"
+
+
+class AIConversationMessage(models.Model):
+    """
+    One chat message of an AIConversation (append-only, numbered by seq)
+    AI對話訊息
+    """
+    conversation = models.ForeignKey(
+        AIConversation,
+        on_delete=models.CASCADE,
+        related_name='chat_messages'
+    )
+    seq = models.PositiveIntegerField()
+    role = models.CharField(max_length=20)
+    content = models.TextField(blank=True)
+    actions = models.JSONField(null=True, blank=True, help_text='Tool calls executed for this turn')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['conversation', 'seq']
+        unique_together = ['conversation', 'seq']
+        verbose_name = 'AI Conversation Message'
+        verbose_name_plural = 'AI Conversation Messages'
+    
+    def __str__(self):
+        return f"{self.conversation_id} #{self.seq} ({self.role})"
+    
+    def to_dict(self) -> dict:
+        return {
+            "seq": self.seq,
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.created_at.isoformat(),
+            "actions": self.actions,
+        }
@@ -3,6 +3,7 @@ Accounting Assistant Serializers
 會計助手序列化器
 """
 
+from django.urls import reverse
 from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_field
 from ai_assistants.models import (
@@ -22,7 +23,28 @@ class ReceiptItemSerializer(serializers.Serializer):
     tax_included = serializers.BooleanField(default=True)
 
 
-class ReceiptSerializer(serializers.ModelSerializer):
+class ReceiptImageMixin(serializers.Serializer):
+    """
+    Image links of a receipt / 收據圖片連結
+    Built from image_blob_id, so listing receipts never loads the image.
+    """
+    image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    
+    @extend_schema_field(serializers.CharField(allow_null=True))
+    def get_image_url(self, obj):
+        if obj.image_blob_id:
+            return reverse('accounting-assistant-receipt-image', args=[obj.pk])
+        return obj.image.url if obj.image else None
+    
+    @extend_schema_field(serializers.CharField(allow_null=True))
+    def get_thumbnail_url(self, obj):
+        if obj.image_blob_id:
+            return reverse('accounting-assistant-receipt-image', args=[obj.pk]) + '?thumbnail=1'
+        return None
+
+
+class ReceiptSerializer(ReceiptImageMixin, serializers.ModelSerializer):
     """Serializer for Receipt model / 收據序列化器"""
     uploaded_by_name = serializers.CharField(source='uploaded_by.full_name', read_only=True)
     reviewed_by_name = serializers.CharField(source='reviewed_by.full_name', read_only=True)
@@ -34,7 +56,7 @@ class ReceiptSerializer(serializers.ModelSerializer):
         model = Receipt
         fields = [
             'id', 'project', 'project_name', 'status', 'uploaded_by', 'uploaded_by_name',
-            'image', 'original_filename', 'unrecognized_reason',
+            'image', 'image_url', 'thumbnail_url', 'original_filename', 'unrecognized_reason',
             'is_unrecognized', 'needs_review',
             'vendor_name', 'vendor_address', 'vendor_phone', 'vendor_tax_id',
             'receipt_number', 'receipt_date', 'receipt_time',
@@ -352,7 +374,7 @@ class BulkFieldCorrectionSerializer(serializers.Serializer):
 # Unrecognized Document Serializers / 無法識別文件序列化器
 # =================================================================
 
-class UnrecognizedReceiptSerializer(serializers.ModelSerializer):
+class UnrecognizedReceiptSerializer(ReceiptImageMixin, serializers.ModelSerializer):
     """Serializer for unrecognized receipts / 無法識別收據序列化器"""
     uploaded_by_name = serializers.CharField(source='uploaded_by.full_name', read_only=True)
     project_name = serializers.CharField(source='project.name', read_only=True)
@@ -362,7 +384,7 @@ class UnrecognizedReceiptSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'project', 'project_name',
             'uploaded_by', 'uploaded_by_name',
-            'image', 'original_filename',
+            'image', 'image_url', 'thumbnail_url', 'original_filename',
             'status', 'unrecognized_reason',
             'ai_confidence_score', 'ai_warnings',
             'created_at'
@@ -123,7 +123,6 @@ class AIConversationSerializer(serializers.ModelSerializer):
     
     agent_name = serializers.CharField(source='agent.display_name', read_only=True, allow_null=True)
     user_email = serializers.CharField(source='user.email', read_only=True)
-    message_count = serializers.SerializerMethodField()
     
     class Meta:
         model = AIConversation
@@ -135,8 +134,8 @@ class AIConversationSerializer(serializers.ModelSerializer):
             'agent',
             'agent_name',
             'title',
-            'messages',
             'context',
+            'summary',
             'message_count',
             'total_actions',
             'successful_actions',
@@ -146,18 +145,14 @@ class AIConversationSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [
             'id', 'created_at', 'updated_at', 'agent_name', 
-            'user_email', 'message_count'
+            'user_email', 'summary', 'message_count'
         ]
-    
-    def get_message_count(self, obj):
-        return len(obj.messages) if obj.messages else 0
 
 
 class AIConversationListSerializer(serializers.ModelSerializer):
     """Simplified serializer for listing conversations"""
     
     agent_name = serializers.CharField(source='agent.display_name', read_only=True, allow_null=True)
-    message_count = serializers.SerializerMethodField()
     
     class Meta:
         model = AIConversation
@@ -173,9 +168,6 @@ class AIConversationListSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
         ]
-    
-    def get_message_count(self, obj):
-        return len(obj.messages) if obj.messages else 0
 
 
 class ChatRequestSerializer(serializers.Serializer):
@@ -19,12 +19,8 @@ import uuid
 from datetime import datetime, date
 from decimal import Decimal
 from typing import Optional, List, Dict, Any
-from django.conf import settings
 from django.db import transaction
-from openai import OpenAI
-
-# Initialize OpenAI client
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from core.libs.ai_service import get_llm_client
 
 
 # =============================================================================
@@ -97,7 +93,7 @@ Important:
 5. Provide helpful suggestions for the accountant"""
 
     try:
-        response = client.chat.completions.create(
+        response = get_llm_client().chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
@@ -290,7 +286,7 @@ Please respond in JSON format:
 }}"""
 
     try:
-        response = client.chat.completions.create(
+        response = get_llm_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "system", "content": prompt}],
             max_tokens=1500,
@@ -557,6 +553,178 @@ def compare_excel_with_database(excel_file: bytes, db_records: List[Dict[str, An
     return summary
 
 
+EXCEL_HEADER_MARKERS = {
+    'date': ('date', '日期'),
+    'receipt_number': ('receipt', '收據', '編號'),
+    'amount': ('total', '總計', '金額'),
+}
+
+
+def normalize_receipt_number(value: Any) -> Optional[str]:
+    """
+    Key for joining Excel cells to Receipt.receipt_number
+    Excel 收據編號正規化（數字儲存格 12345.0 -> '12345'）
+    """
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def resolve_excel_columns(header: List[Any]) -> Dict[str, int]:
+    """
+    Map column roles to indexes, first matching header wins
+    從表頭解析欄位角色（每個角色取第一個符合的欄位）
+    """
+    columns = {}
+    for index, cell in enumerate(header):
+        if cell is None:
+            continue
+        text = str(cell)
+        lowered = text.lower()
+        for role, markers in EXCEL_HEADER_MARKERS.items():
+            if role not in columns and any(marker in lowered or marker in text for marker in markers):
+                columns[role] = index
+                break
+    return columns
+
+
+def iter_excel_rows(excel_file):
+    """
+    Stream (header, row) pairs of the active sheet in read-only mode
+    以唯讀模式逐列讀取工作表，表頭為第一個含日期欄的列
+    """
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("openpyxl is required")
+
+    if isinstance(excel_file, bytes):
+        excel_file = io.BytesIO(excel_file)
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        header = None
+        for cells in wb.active.iter_rows(values_only=True):
+            if header is None:
+                if any('date' in str(cell).lower() or '日期' in str(cell or '') for cell in cells):
+                    header = list(cells)
+                continue
+            if cells and cells[0] not in (None, ''):
+                yield header, cells
+    finally:
+        wb.close()
+
+
+def compare_excel_with_queryset(excel_file, queryset, chunk_size: int = 1000,
+                                max_details: int = 1000) -> Dict[str, Any]:
+    """
+    Streaming comparison of an Excel sheet with a Receipt queryset
+    串流比對 Excel 與收據查詢集
+
+    Rows are read in chunks of chunk_size; each chunk looks up only its own
+    receipt numbers with one IN query and is joined by normalized receipt
+    number, so memory is bounded by the chunk plus the set of numbers seen.
+    Counts are exact; each differences list keeps at most max_details items.
+
+    Returns the same structure as compare_excel_with_database.
+    """
+    differences = {
+        'missing_in_db': [],
+        'missing_in_excel': [],
+        'amount_mismatches': [],
+        'data_mismatches': [],
+        'matched': [],
+    }
+    counts = {key: 0 for key in differences}
+    seen = set()
+    state = {'excel_records': 0, 'found_in_db': 0}
+
+    def add(key, item):
+        counts[key] += 1
+        if len(differences[key]) < max_details:
+            differences[key].append(item)
+
+    def flush(chunk):
+        db_lookup = {}
+        for record in queryset.filter(receipt_number__in=list(chunk)).values('receipt_number', 'total_amount'):
+            db_lookup.setdefault(normalize_receipt_number(record['receipt_number']), record)
+        state['found_in_db'] += len(db_lookup)
+
+        for receipt_num, (excel_amount, excel_data) in chunk.items():
+            db_rec = db_lookup.get(receipt_num)
+            if db_rec is None:
+                add('missing_in_db', {'receipt_number': receipt_num, 'excel_data': excel_data()})
+                continue
+            db_amount = float(db_rec['total_amount'] or 0)
+            if excel_amount is not None and abs(db_amount - excel_amount) > 0.01:
+                add('amount_mismatches', {
+                    'receipt_number': receipt_num,
+                    'excel_amount': excel_amount,
+                    'db_amount': db_amount,
+                    'difference': excel_amount - db_amount,
+                })
+            else:
+                add('matched', receipt_num)
+
+    columns, chunk = None, {}
+    for header, cells in iter_excel_rows(excel_file):
+        if columns is None:
+            columns = resolve_excel_columns(header)
+        state['excel_records'] += 1
+        if 'receipt_number' not in columns:
+            continue
+
+        receipt_num = normalize_receipt_number(
+            cells[columns['receipt_number']] if columns['receipt_number'] < len(cells) else None
+        )
+        if not receipt_num or receipt_num in seen:
+            continue
+        seen.add(receipt_num)
+
+        excel_amount = None
+        if 'amount' in columns and columns['amount'] < len(cells) and cells[columns['amount']]:
+            try:
+                excel_amount = float(cells[columns['amount']])
+            except (ValueError, TypeError):
+                pass
+        # Full row is only materialized if it ends up in missing_in_db
+        chunk[receipt_num] = (excel_amount, lambda header=header, cells=cells: dict(zip(header, cells)))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = {}
+    if chunk:
+        flush(chunk)
+
+    total_db_records = queryset.count()
+    numbered = queryset.exclude(receipt_number__isnull=True).exclude(receipt_number='')
+    counts['missing_in_excel'] = (
+        numbered.order_by().values('receipt_number').distinct().count() - state['found_in_db']
+    )
+    if counts['missing_in_excel'] > 0:
+        # Stop scanning once max_details misses are collected
+        for record in numbered.values(
+            'receipt_number', 'vendor_name', 'receipt_date', 'total_amount', 'tax_amount', 'category'
+        ).order_by('receipt_date', 'id').iterator(chunk_size=chunk_size):
+            if len(differences['missing_in_excel']) >= max_details:
+                break
+            receipt_num = normalize_receipt_number(record['receipt_number'])
+            if receipt_num and receipt_num not in seen:
+                seen.add(receipt_num)
+                differences['missing_in_excel'].append({'receipt_number': receipt_num, 'db_data': record})
+
+    return {
+        'total_excel_records': state['excel_records'],
+        'total_db_records': total_db_records,
+        'matched_count': counts['matched'],
+        'missing_in_db_count': counts['missing_in_db'],
+        'missing_in_excel_count': counts['missing_in_excel'],
+        'amount_mismatch_count': counts['amount_mismatches'],
+        'differences': differences,
+    }
+
+
 def get_comparison_ai_analysis(comparison_result: Dict[str, Any]) -> Dict[str, Any]:
     """
     Get AI analysis of the comparison results
@@ -599,7 +767,7 @@ Please respond in JSON format with both English and Chinese:
 }}"""
 
     try:
-        response = client.chat.completions.create(
+        response = get_llm_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "system", "content": prompt}],
             max_tokens=1500,
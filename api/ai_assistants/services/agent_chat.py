@@ -0,0 +1,236 @@
+"""
+Agent Chat
+業務代理對話
+
+One chat turn of the business agent, shared by the blocking chat endpoint
+(AIAgentViewSet.chat) and the streaming one (agent_chat_stream):
+
+1. resolve the agent and conversation, build the model context
+2. first completion with the registered tools
+3. run the returned tool calls (execute_tool_calls: read-only tools
+   concurrently, writes in order) and add their results to the context
+4. final completion, then append the turn to the conversation
+
+The database steps are synchronous; the streaming view calls them through
+sync_to_async and only streams the completions itself.
+"""
+
+import json
+import logging
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from openai import AsyncOpenAI, OpenAI
+
+from core.libs.ai_service import get_async_llm_client, get_llm_client
+from ai_assistants.agents.ai_tools import AIToolRegistry, BusinessToolExecutor, execute_tool_calls
+from ai_assistants.models import AIAgent, AIConversation
+from ai_assistants.services.conversation_store import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+BUSINESS_AGENT_PROMPT = """You are an AI assistant for an ERP system that manages business operations including audit projects, tax returns, billable hours, and revenue.
+
+You have access to tools to create, read, update, and delete records in the database. When a user asks you to perform an action, use the appropriate tool.
+
+IMPORTANT RULES:
+1. Always confirm what action you're taking before executing
+2. For CREATE operations, extract all required information from the user's request
+3. For UPDATE operations, identify the record first then apply changes
+4. For DELETE operations, confirm the target before proceeding
+5. If information is missing, ask the user for it
+6. After executing an action, summarize what was done
+7. All actions are logged and can be rolled back if needed
+
+Available models and their purposes:
+- AuditProject: Audit engagements for clients (financial, internal, tax audits)
+- TaxReturnCase: Tax filing cases (profits tax, salaries tax, property tax)
+- BillableHour: Time tracking for employees working on projects
+- Revenue: Income records from clients
+- Company: Client companies
+
+When creating records:
+- client_id is a UUID reference to a Company
+- project_id is a UUID reference to an AuditProject (optional for some models)
+- Dates should be in YYYY-MM-DD format
+- Amounts/rates are decimal numbers
+
+Be helpful, accurate, and always explain what you're doing."""
+
+
+def get_openai_client() -> OpenAI:
+    return get_llm_client()
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Shared client of the running event loop; call from the streaming view"""
+    return get_async_llm_client()
+
+
+def tool_call_dicts(tool_calls) -> List[Dict]:
+    """SDK tool call objects as chat-completion message dicts"""
+    return [
+        {
+            "id": tc.id,
+            "type": "function",
+            "function": {"name": tc.function.name, "arguments": tc.function.arguments},
+        }
+        for tc in tool_calls or []
+    ]
+
+
+async def astream_completion(client: AsyncOpenAI, **kwargs) -> AsyncIterator[Tuple[str, object]]:
+    """
+    Stream a chat completion.
+    Yields ("delta", text) per content chunk, then ("tool_calls", [dicts])
+    once the stream ends (empty when the model answered directly).
+    """
+    stream = await client.chat.completions.create(stream=True, **kwargs)
+    calls: Dict[int, Dict] = {}
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            yield "delta", delta.content
+        # Tool calls arrive in fragments keyed by index
+        for fragment in delta.tool_calls or []:
+            call = calls.setdefault(fragment.index, {
+                "id": "", "type": "function", "function": {"name": "", "arguments": ""},
+            })
+            if fragment.id:
+                call["id"] = fragment.id
+            if fragment.function:
+                call["function"]["name"] += fragment.function.name or ""
+                call["function"]["arguments"] += fragment.function.arguments or ""
+    yield "tool_calls", [calls[index] for index in sorted(calls)]
+
+
+class AgentChatService:
+    """
+    Service for one business agent chat turn.
+    """
+
+    def __init__(self, user, message: str, session_id: Optional[str] = None, agent_id: Optional[str] = None):
+        self.user = user
+        self.message = message
+        self.session_id = session_id or str(uuid.uuid4())
+        self.agent = self._get_agent(agent_id)
+        self.conversation, _ = AIConversation.objects.get_or_create(
+            session_id=self.session_id,
+            defaults={
+                'user': user,
+                'agent': self.agent,
+                'title': message[:100],
+            }
+        )
+        self.store = ConversationStore(self.conversation)
+        self.actions_taken: List[Dict] = []
+
+    def _get_agent(self, agent_id) -> AIAgent:
+        if agent_id:
+            try:
+                return AIAgent.objects.get(pk=agent_id)
+            except AIAgent.DoesNotExist:
+                pass
+        # Use or create default business agent
+        agent, _ = AIAgent.objects.get_or_create(
+            name='business_agent',
+            defaults={
+                'display_name': 'Business CRUD Agent',
+                'description': 'Autonomous agent for managing business data (audits, tax returns, billing, revenue)',
+                'agent_type': 'BUSINESS',
+                'auto_execute': True,
+                'llm_model': 'gpt-4o-mini',
+                'system_prompt': BUSINESS_AGENT_PROMPT,
+            }
+        )
+        return agent
+
+    # =================================================================
+    # Model Requests
+    # =================================================================
+
+    def build_messages(self) -> List[Dict]:
+        """System prompt, rolling summary and recent history, then the new message"""
+        messages = [{"role": "system", "content": self.agent.system_prompt or BUSINESS_AGENT_PROMPT}]
+        messages.extend(self.store.context_messages())
+        messages.append({"role": "user", "content": self.message})
+        return messages
+
+    def completion_kwargs(self, messages: List[Dict], with_tools: bool = True) -> Dict:
+        kwargs = {
+            "model": self.agent.llm_model or 'gpt-4o-mini',
+            "messages": messages,
+            "temperature": self.agent.temperature or 0.7,
+        }
+        if with_tools:
+            kwargs["tools"] = AIToolRegistry.to_openai_tools(self.agent.allowed_tools or None)
+            kwargs["tool_choice"] = "auto"
+        return kwargs
+
+    # =================================================================
+    # Tool Calls
+    # =================================================================
+
+    def run_tools(self, messages: List[Dict], tool_calls: List[Dict]) -> List[Dict]:
+        """
+        Execute tool calls, record them in actions_taken and append the
+        assistant tool-call message and one tool message per call to messages.
+        """
+        executor = BusinessToolExecutor(user=self.user, session_id=self.session_id, agent=self.agent)
+        calls = [
+            (tc["function"]["name"], json.loads(tc["function"]["arguments"] or '{}'))
+            for tc in tool_calls
+        ]
+        results = execute_tool_calls(executor, calls, concurrent=settings.AI_AGENT_TOOL_WORKERS > 1)
+
+        messages.append({"role": "assistant", "content": None, "tool_calls": tool_calls})
+        actions = []
+        for tool_call, (name, args), result in zip(tool_calls, calls, results):
+            if result is not None:
+                actions.append({"tool": name, "arguments": args, "result": result})
+            else:
+                result = {"success": False, "error": f"Unknown tool: {name}"}
+            # The API expects an answer for every tool_call_id
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call["id"],
+                "content": json.dumps(result, cls=DjangoJSONEncoder),
+            })
+        self.actions_taken.extend(actions)
+        return actions
+
+    @staticmethod
+    def pending_actions_note(tool_calls: List[Dict]) -> str:
+        """Appended to the answer when tool calls wait for approval (auto_execute off)"""
+        pending_actions = [
+            {"tool": tc["function"]["name"], "arguments": json.loads(tc["function"]["arguments"] or '{}')}
+            for tc in tool_calls
+        ]
+        return f"\n\nI would like to execute the following actions (pending approval):\n{json.dumps(pending_actions, indent=2)}"
+
+    # =================================================================
+    # Finishing
+    # =================================================================
+
+    def finish(self, assistant_content: str) -> Dict:
+        """Append the turn to history and return the conversation stats"""
+        actions = self.actions_taken
+        self.store.append(
+            [
+                {"role": "user", "content": self.message},
+                {"role": "assistant", "content": assistant_content, "actions": actions or None},
+            ],
+            total_actions=len(actions),
+            successful_actions=sum(1 for a in actions if a["result"].get("success")),
+            failed_actions=sum(1 for a in actions if not a["result"].get("success")),
+        )
+        conversation = self.conversation
+        return {
+            "total_actions": conversation.total_actions,
+            "successful_actions": conversation.successful_actions,
+            "failed_actions": conversation.failed_actions,
+        }
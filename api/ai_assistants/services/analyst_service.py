@@ -11,10 +11,8 @@ import base64
 import numpy as np
 import pandas as pd
 import plotly.express as px
-from uuid import UUID
-from openai import OpenAI
+from core.libs.ai_service import cached_completion, get_llm_client
 from collections import Counter
-from django.conf import settings
 from ai_assistants.agents.query_classifier_agent import classify_analysis_query
 from ai_assistants.agents.prompts import (
     get_data_manipulation_prompt,
@@ -34,6 +32,7 @@ from ai_assistants.services.observability import (
     measure_time,
     token_tracker,
 )
+from ai_assistants.services.analyst_store import AnalystDataStore, SOURCE_CSV, SOURCE_DATABASE
 from ai_assistants.services.rag_service import (
     build_rag_context,
     get_relevant_documents,
@@ -41,163 +40,55 @@ from ai_assistants.services.rag_service import (
 import logging
 
 logger = logging.getLogger('analyst')
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
-dataframe_cache = {}
 
 
-def convert_uuid_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Convert UUID columns to strings to avoid aggregation errors / 將 UUID 欄位轉換為字串以避免聚合錯誤"""
-    for col in df.columns:
-        try:
-            # Check if column contains UUID objects
-            if df[col].dtype == 'object' and len(df[col]) > 0:
-                first_non_null = df[col].dropna().head(1)
-                if len(first_non_null) > 0 and isinstance(first_non_null.iloc[0], UUID):
-                    df[col] = df[col].astype(str)
-            # Also handle columns that might have UUID as string representation
-            elif col.endswith('_id') or col == 'id':
-                # Force ID columns to be strings
-                df[col] = df[col].astype(str)
-        except Exception:
-            # If conversion fails, try to convert to string anyway for ID-like columns
-            if col.endswith('_id') or col == 'id':
-                try:
-                    df[col] = df[col].astype(str)
-                except Exception:
-                    pass
-    return df
+def get_dataframes(load: bool = True) -> dict:
+    """Current tenant's analyst DataFrames (loaded on first use) / 當前租戶的分析數據"""
+    return AnalystDataStore().get_frames(load=load)
 
 
 @track_data_load
 def load_all_datasets():
-    """Load data from database into pandas DataFrames / 從資料庫載入數據"""
+    """Load (or incrementally refresh) the tenant's analyst data / 載入或增量更新租戶分析數據"""
     try:
-        from accounting.models import Invoice, InvoiceLine, Payment, Contact, Expense
-        
-        # Load Invoices (Sales Data) / 載入發票（銷售數據）
-        invoices = Invoice.objects.filter(invoice_type='SALES').values(
-            'id', 'invoice_number', 'contact__company_name', 'contact__contact_name',
-            'issue_date', 'due_date', 'status', 'subtotal', 'tax_amount', 
-            'discount_amount', 'total', 'amount_paid', 'amount_due',
-            'currency__code', 'contact__city', 'contact__country'
-        )
-        
-        if invoices.exists():
-            df_invoices = pd.DataFrame(list(invoices))
-            df_invoices.columns = [
-                'invoice_id', 'invoice_number', 'company_name', 'contact_name',
-                'issue_date', 'due_date', 'status', 'subtotal', 'tax_amount',
-                'discount_amount', 'total', 'amount_paid', 'amount_due', 'currency',
-                'city', 'country'
-            ]
-            # Convert to datetime and extract time components
-            df_invoices['issue_date'] = pd.to_datetime(df_invoices['issue_date'])
-            df_invoices['year'] = df_invoices['issue_date'].dt.year
-            df_invoices['month'] = df_invoices['issue_date'].dt.month
-            df_invoices['month_name'] = df_invoices['issue_date'].dt.strftime('%B')
-            df_invoices['quarter'] = df_invoices['issue_date'].dt.quarter
-            
-            # Convert Decimal to float for analysis
-            numeric_cols = ['subtotal', 'tax_amount', 'discount_amount', 'total', 'amount_paid', 'amount_due']
-            for col in numeric_cols:
-                df_invoices[col] = df_invoices[col].astype(float)
-        else:
-            df_invoices = pd.DataFrame()
-        
-        # Load Invoice Lines (Product/Service Details) / 載入發票明細
-        lines = InvoiceLine.objects.filter(invoice__invoice_type='SALES').values(
-            'id', 'invoice__invoice_number', 'description', 'quantity', 
-            'unit_price', 'tax_amount', 'discount_amount', 'line_total',
-            'account__name', 'invoice__issue_date', 'invoice__contact__company_name'
-        )
-        
-        if lines.exists():
-            df_lines = pd.DataFrame(list(lines))
-            df_lines.columns = [
-                'line_id', 'invoice_number', 'product', 'quantity',
-                'unit_price', 'tax_amount', 'discount_amount', 'line_total', 
-                'category', 'date', 'customer'
-            ]
-            # Convert UUID columns to strings
-            convert_uuid_columns(df_lines)
-            # Convert to proper types
-            df_lines['date'] = pd.to_datetime(df_lines['date'])
-            df_lines['year'] = df_lines['date'].dt.year
-            df_lines['month'] = df_lines['date'].dt.month
-            numeric_cols = ['quantity', 'unit_price', 'tax_amount', 'discount_amount', 'line_total']
-            for col in numeric_cols:
-                df_lines[col] = df_lines[col].astype(float)
-        else:
-            df_lines = pd.DataFrame()
-        
-        # Load Contacts (Customers) / 載入客戶資料
-        contacts = Contact.objects.filter(contact_type__in=['CUSTOMER', 'BOTH']).values(
-            'id', 'contact_type', 'company_name', 'contact_name', 'email',
-            'city', 'state', 'country', 'payment_terms', 'credit_limit'
-        )
-        
-        if contacts.exists():
-            df_contacts = pd.DataFrame(list(contacts))
-            df_contacts.columns = [
-                'customer_id', 'contact_type', 'company_name', 'contact_name', 
-                'email', 'city', 'state', 'country', 'payment_terms', 'credit_limit'
-            ]
-            # Convert UUID columns to strings
-            convert_uuid_columns(df_contacts)
-            df_contacts['credit_limit'] = df_contacts['credit_limit'].astype(float)
-        else:
-            df_contacts = pd.DataFrame()
-        
-        # Convert UUIDs in invoices as well
-        if not df_invoices.empty:
-            convert_uuid_columns(df_invoices)
-        
-        # Store in cache - use invoice lines as primary analysis data for more detail
-        if not df_lines.empty:
-            dataframe_cache["analysis_data"] = df_lines
-            dataframe_cache["invoices"] = df_invoices
-            dataframe_cache["customers"] = df_contacts
-            
+        dataset = AnalystDataStore().get_dataset(refresh=True)
+        frames = dataset.analysis_frames()
+        df_main = frames.get("analysis_data")
+
+        if dataset.source == SOURCE_DATABASE and "invoices" in frames:
             return {
                 "message": "Database data loaded successfully / 資料庫數據載入成功",
                 "rows": {
-                    "sales_data": len(df_lines),
-                    "invoices": len(df_invoices),
-                    "customers": len(df_contacts),
+                    "sales_data": len(df_main),
+                    "invoices": len(frames["invoices"]),
+                    "customers": len(frames["customers"]),
                 },
-                "columns": df_lines.columns.tolist()
+                "columns": df_main.columns.tolist()
             }
-        elif not df_invoices.empty:
+        elif dataset.source == SOURCE_DATABASE:
             # Fallback to invoices if no lines
-            dataframe_cache["analysis_data"] = df_invoices
-            dataframe_cache["customers"] = df_contacts
-            
             return {
                 "message": "Invoice data loaded (no line items) / 發票數據已載入（無明細）",
                 "rows": {
-                    "invoices": len(df_invoices),
-                    "customers": len(df_contacts),
+                    "invoices": len(df_main),
+                    "customers": len(frames["customers"]),
+                },
+                "columns": df_main.columns.tolist()
+            }
+        elif dataset.source == SOURCE_CSV:
+            return {
+                "message": "CSV fallback data loaded (no database data) / CSV 備用數據已載入",
+                "rows": {
+                    "analysis_data": len(df_main),
                 },
-                "columns": df_invoices.columns.tolist()
+                "columns": df_main.columns.tolist()
             }
         else:
-            # No data in database, try CSV fallback
-            try:
-                dataframe_cache["analysis_data"] = pd.read_csv("ai_assistants/data/analysis_data.csv")
-                return {
-                    "message": "CSV fallback data loaded (no database data) / CSV 備用數據已載入",
-                    "rows": {
-                        "analysis_data": len(dataframe_cache["analysis_data"]),
-                    },
-                    "columns": dataframe_cache["analysis_data"].columns.tolist()
-                }
-            except Exception:
-                dataframe_cache["analysis_data"] = pd.DataFrame()
-                return {
-                    "message": "No data available. Please generate sample data. / 沒有可用數據，請生成範例數據。",
-                    "rows": {},
-                    "empty": True
-                }
+            return {
+                "message": "No data available. Please generate sample data. / 沒有可用數據，請生成範例數據。",
+                "rows": {},
+                "empty": True
+            }
 
     except Exception as e:
         raise RuntimeError(f"Failed to load datasets: {e}")
@@ -205,7 +96,7 @@ def load_all_datasets():
 
 def handle_query_logic(query: str) -> dict:
     """Handle user query and generate response / 處理用戶查詢並生成回應"""
-    df = dataframe_cache.get("analysis_data")
+    df = get_dataframes().get("analysis_data")
     
     # Auto-load data if not available / 如果數據不可用則自動載入
     if df is None or df.empty:
@@ -216,7 +107,7 @@ def handle_query_logic(query: str) -> dict:
                     "type": "error", 
                     "message": "No analysis data found. Please call /start first or generate sample data. / 找不到分析數據，請先呼叫 /start 或生成範例數據。"
                 }
-            df = dataframe_cache.get("analysis_data")
+            df = get_dataframes().get("analysis_data")
             if df is None or df.empty:
                 return {
                     "type": "error", 
@@ -370,7 +261,7 @@ def generate_chat_response(query: str, data: pd.DataFrame, user_id: str = "anony
 - `代碼` 和代碼塊
 - 表格等"""
 
-        response = client.chat.completions.create(
+        response = get_llm_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -448,7 +339,8 @@ Total Rows: {len(data)}
     prompt += f"\n{data_info}\nQuery: \"{query}\"\nProvide only the correct response in JSON format."
     
     try:
-        response = client.chat.completions.create(
+        response = cached_completion(
+            get_llm_client(),
             model="gpt-4o-mini",
             messages=[{"role": "system", "content": prompt}],
             max_tokens=500,
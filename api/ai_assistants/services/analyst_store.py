@@ -0,0 +1,445 @@
+"""
+Analyst Data Store
+分析助手數據存儲
+
+Tenant-scoped DataFrames for the analyst assistant, kept in a TenantCache of
+their own (get_dataset_cache) whose size limits fit whole tenant ledgers.
+
+The first load pulls the sales invoices, invoice lines and customers of the
+current tenant; later refreshes only fetch rows whose own (or related)
+updated_at moved past the last watermark and patch them into the frames,
+dropping rows that were deleted or no longer qualify.
+
+Columns are stored compactly: repeated text (status, city, country, names)
+and UUIDs as categoricals, line-level amounts as float32, and only the
+money totals users aggregate as float64. Invoice numbers, products and line
+customers stay plain strings: analyst code joins and string-matches on them.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from core.tenants.managers import get_current_tenant
+from .frame_snapshots import FrameSnapshotStore, SnapshotError, get_snapshot_store
+from .tenant_cache import TenantCache
+
+logger = logging.getLogger('analyst.cache')
+
+SOURCE_DATABASE = 'database'
+SOURCE_CSV = 'csv'
+SOURCE_EMPTY = 'empty'
+
+CSV_FALLBACK_PATH = 'ai_assistants/data/analysis_data.csv'
+
+QUALIFIER_COLUMN = '_qualifies'
+
+
+@dataclass(frozen=True)
+class FrameSpec:
+    """How one analyst DataFrame is loaded from a model"""
+    name: str
+    model: str                                  # accounting model name
+    columns: Tuple[Tuple[str, str], ...]        # (ORM path, column)
+    qualify: Tuple[str, Tuple[str, ...]]        # rows kept: path value in values
+    tenant_path: str
+    watch: Tuple[str, ...]                      # updated_at paths that change a row
+    categorical: Tuple[str, ...] = ()
+    float32: Tuple[str, ...] = ()
+    float64: Tuple[str, ...] = ()
+    int32: Tuple[str, ...] = ()
+    dates: Tuple[str, ...] = ()
+    calendar: Optional[str] = None              # date column to derive year/month/... from
+    month_names: bool = False
+    quarters: bool = False
+
+    @property
+    def id_column(self) -> str:
+        return self.columns[0][1]
+
+
+INVOICES = FrameSpec(
+    name='invoices',
+    model='Invoice',
+    columns=(
+        ('id', 'invoice_id'), ('invoice_number', 'invoice_number'),
+        ('contact__company_name', 'company_name'), ('contact__contact_name', 'contact_name'),
+        ('issue_date', 'issue_date'), ('due_date', 'due_date'), ('status', 'status'),
+        ('subtotal', 'subtotal'), ('tax_amount', 'tax_amount'),
+        ('discount_amount', 'discount_amount'), ('total', 'total'),
+        ('amount_paid', 'amount_paid'), ('amount_due', 'amount_due'),
+        ('currency__code', 'currency'), ('contact__city', 'city'), ('contact__country', 'country'),
+    ),
+    qualify=('invoice_type', ('SALES',)),
+    tenant_path='tenant',
+    watch=('updated_at', 'contact__updated_at'),
+    categorical=('invoice_id', 'company_name', 'contact_name', 'status', 'currency', 'city', 'country'),
+    float64=('subtotal', 'tax_amount', 'discount_amount', 'total', 'amount_paid', 'amount_due'),
+    dates=('issue_date', 'due_date'),
+    calendar='issue_date',
+    month_names=True,
+    quarters=True,
+)
+
+INVOICE_LINES = FrameSpec(
+    name='lines',
+    model='InvoiceLine',
+    columns=(
+        ('id', 'line_id'), ('invoice__invoice_number', 'invoice_number'),
+        ('description', 'product'), ('quantity', 'quantity'), ('unit_price', 'unit_price'),
+        ('tax_amount', 'tax_amount'), ('discount_amount', 'discount_amount'),
+        ('line_total', 'line_total'), ('account__name', 'category'),
+        ('invoice__issue_date', 'date'), ('invoice__contact__company_name', 'customer'),
+    ),
+    qualify=('invoice__invoice_type', ('SALES',)),
+    tenant_path='invoice__tenant',
+    watch=('updated_at', 'invoice__updated_at', 'invoice__contact__updated_at', 'account__updated_at'),
+    categorical=('line_id', 'category'),
+    float32=('quantity', 'unit_price', 'tax_amount', 'discount_amount'),
+    float64=('line_total',),
+    dates=('date',),
+    calendar='date',
+)
+
+CUSTOMERS = FrameSpec(
+    name='customers',
+    model='Contact',
+    columns=(
+        ('id', 'customer_id'), ('contact_type', 'contact_type'),
+        ('company_name', 'company_name'), ('contact_name', 'contact_name'), ('email', 'email'),
+        ('city', 'city'), ('state', 'state'), ('country', 'country'),
+        ('payment_terms', 'payment_terms'), ('credit_limit', 'credit_limit'),
+    ),
+    qualify=('contact_type', ('CUSTOMER', 'BOTH')),
+    tenant_path='tenant',
+    watch=('updated_at',),
+    categorical=('customer_id', 'contact_type', 'city', 'state', 'country'),
+    float32=('credit_limit',),
+    int32=('payment_terms',),
+)
+
+FRAME_SPECS = (INVOICES, INVOICE_LINES, CUSTOMERS)
+
+
+@dataclass
+class AnalystDataset:
+    """A tenant's analyst frames plus the watermarks they are current to"""
+    source: str = SOURCE_EMPTY
+    frames: Dict[str, pd.DataFrame] = field(default_factory=dict)
+    watermarks: Dict[str, datetime] = field(default_factory=dict)
+    refreshed_at: float = 0.0
+    generation: int = 0         # snapshot generation the frames were last saved as / mapped from
+    snapshot_at: float = 0.0
+
+    def memory_usage(self) -> int:
+        return int(sum(df.memory_usage(deep=True).sum() for df in self.frames.values()))
+
+    def analysis_frames(self) -> Dict[str, pd.DataFrame]:
+        """Frames exposed to the analyst, keyed as the assistant expects"""
+        if self.source == SOURCE_CSV:
+            return {'analysis_data': self.frames['analysis_data']}
+        lines = self.frames.get('lines')
+        invoices = self.frames.get('invoices')
+        customers = self.frames.get('customers')
+        if lines is not None and not lines.empty:
+            return {'analysis_data': lines, 'invoices': invoices, 'customers': customers}
+        if invoices is not None and not invoices.empty:
+            return {'analysis_data': invoices, 'customers': customers}
+        return {}
+
+
+# Striped: a fixed set of locks shared by all tenants, so the set never grows
+_tenant_locks = tuple(threading.Lock() for _ in range(64))
+
+
+def _tenant_lock(key: str) -> threading.Lock:
+    return _tenant_locks[hash(key) % len(_tenant_locks)]
+
+
+_dataset_cache: Optional[TenantCache] = None
+
+
+def get_dataset_cache() -> TenantCache:
+    """Process-wide cache for analyst datasets, sized for whole tenant ledgers"""
+    global _dataset_cache
+    if _dataset_cache is None:
+        _dataset_cache = TenantCache(
+            max_size_per_tenant=settings.ANALYST_CACHE_MAX_SIZE,
+            global_max_size=settings.ANALYST_CACHE_GLOBAL_MAX_SIZE,
+        )
+    return _dataset_cache
+
+
+class AnalystDataStore:
+    """
+    Service for loading and incrementally refreshing a tenant's analyst frames.
+    """
+
+    CACHE_KEY = 'analyst_dataset'
+    REFRESH_INTERVAL = 30  # seconds between change checks on reads
+    # Re-read rows touched shortly before the last refresh, so writes that
+    # committed after it with an earlier updated_at are not missed
+    WATERMARK_OVERLAP = timedelta(minutes=2)
+    SNAPSHOT_INTERVAL = 300  # minimum seconds between snapshot rewrites after refreshes
+
+    def __init__(self, tenant=None, cache: Optional[TenantCache] = None,
+                 snapshots: Optional[FrameSnapshotStore] = None):
+        self.tenant = tenant if tenant is not None else get_current_tenant()
+        self.cache = cache or get_dataset_cache()
+        self.tenant_key = str(self.tenant.pk) if self.tenant is not None else 'global'
+        if snapshots is None and settings.ANALYST_SNAPSHOTS_ENABLED:
+            snapshots = get_snapshot_store()
+        self.snapshots = snapshots
+        self.snapshot_key = f'analyst-{self.tenant_key}'
+
+    # =================================================================
+    # Public API
+    # =================================================================
+
+    def get_dataset(self, refresh: bool = False, load: bool = True) -> Optional[AnalystDataset]:
+        """
+        Cached dataset for the tenant. Loaded on first use; checked for
+        changes when `refresh` is set or REFRESH_INTERVAL has passed.
+        """
+        dataset = self.cache.get(None, self.CACHE_KEY, tenant_id=self.tenant_key)
+        if dataset is None and not load:
+            return None
+
+        stale = dataset is not None and time.monotonic() - dataset.refreshed_at > self.REFRESH_INTERVAL
+        if dataset is not None and not refresh and not stale:
+            return dataset
+
+        with _tenant_lock(self.tenant_key):
+            # Another request may have loaded/refreshed it meanwhile
+            current = self.cache.get(None, self.CACHE_KEY, tenant_id=self.tenant_key)
+            if current is None:
+                # A new worker maps the last snapshot and catches up from its watermarks
+                dataset = self.load_snapshot()
+                if dataset is not None:
+                    self.refresh(dataset)
+                else:
+                    dataset = self.load()
+                    self.save_snapshot(dataset)
+            elif current is not dataset or (not refresh and not stale):
+                return current
+            else:
+                if self.refresh(current) and time.monotonic() - current.snapshot_at > self.SNAPSHOT_INTERVAL:
+                    self.save_snapshot(current)
+                dataset = current
+            if not self.cache.set(None, self.CACHE_KEY, dataset, tenant_id=self.tenant_key):
+                logger.warning(
+                    f"Analyst dataset for tenant {self.tenant_key} ({dataset.memory_usage()} bytes) "
+                    f"is over the cache limit; it is rebuilt on every request"
+                )
+        return dataset
+
+    def get_frames(self, load: bool = True) -> Dict[str, pd.DataFrame]:
+        dataset = self.get_dataset(load=load)
+        return dataset.analysis_frames() if dataset is not None else {}
+
+    def invalidate(self) -> None:
+        self.cache.delete(None, self.CACHE_KEY, tenant_id=self.tenant_key)
+
+    # =================================================================
+    # Snapshots
+    # =================================================================
+
+    def save_snapshot(self, dataset: AnalystDataset) -> int:
+        """Persist database-sourced frames for other workers. Returns the generation (0 = skipped)."""
+        if self.snapshots is None or dataset.source != SOURCE_DATABASE:
+            return 0
+        meta = {
+            'source': dataset.source,
+            'watermarks': {name: value.isoformat() for name, value in dataset.watermarks.items()},
+        }
+        try:
+            dataset.generation = self.snapshots.save(self.snapshot_key, dataset.frames, meta)
+        except (OSError, SnapshotError) as e:
+            logger.warning(f"Analyst snapshot for tenant {self.tenant_key} not written: {e}")
+            return 0
+        dataset.snapshot_at = time.monotonic()
+        return dataset.generation
+
+    def load_snapshot(self) -> Optional[AnalystDataset]:
+        """Map the tenant's latest snapshot; its frames still need a refresh() to catch up"""
+        if self.snapshots is None:
+            return None
+        snapshot = self.snapshots.load(self.snapshot_key)
+        if snapshot is None or set(snapshot.frames) != {spec.name for spec in FRAME_SPECS}:
+            return None
+        return AnalystDataset(
+            source=snapshot.meta['source'],
+            frames=snapshot.frames,
+            watermarks={
+                name: datetime.fromisoformat(value)
+                for name, value in snapshot.meta['watermarks'].items()
+            },
+            generation=snapshot.generation,
+            snapshot_at=time.monotonic(),
+        )
+
+    # =================================================================
+    # Loading
+    # =================================================================
+
+    def load(self) -> AnalystDataset:
+        """Full load of every frame"""
+        dataset = AnalystDataset(source=SOURCE_DATABASE)
+        started = timezone.now()
+        for spec in FRAME_SPECS:
+            rows = self._fetch(spec, self._queryset(spec).filter(self._qualify_q(spec)))
+            dataset.frames[spec.name] = self._build(spec, rows, None)
+            dataset.watermarks[spec.name] = started
+        dataset.refreshed_at = time.monotonic()
+
+        if not dataset.analysis_frames():
+            dataset = self._load_csv_fallback()
+        return dataset
+
+    def refresh(self, dataset: AnalystDataset) -> int:
+        """
+        Patch rows changed since the watermarks into the frames.
+        Returns the number of rows added, updated or removed.
+        """
+        if dataset.source != SOURCE_DATABASE:
+            # Database data may have appeared since the CSV fallback
+            fresh = self.load()
+            if fresh.source == SOURCE_DATABASE:
+                dataset.source, dataset.frames, dataset.watermarks = fresh.source, fresh.frames, fresh.watermarks
+            dataset.refreshed_at = time.monotonic()
+            return 0
+
+        changed = 0
+        for spec in FRAME_SPECS:
+            started = timezone.now()
+            since = dataset.watermarks[spec.name] - self.WATERMARK_OVERLAP
+            frame = dataset.frames[spec.name]
+
+            touched = Q()
+            for path in spec.watch:
+                touched |= Q(**{f'{path}__gte': since})
+            rows = self._fetch(spec, self._queryset(spec).filter(touched), with_qualifier=True)
+
+            qualifies = rows.pop(QUALIFIER_COLUMN).isin(spec.qualify[1])
+            keep = rows[qualifies]
+            drop_ids = set(rows[spec.id_column]) - set(keep[spec.id_column])
+
+            updated = self._upsert(spec, frame, keep, drop_ids)
+
+            # Deletions leave no updated_at behind; compare row counts instead
+            expected = self._queryset(spec).filter(self._qualify_q(spec)).count()
+            if expected != len(updated):
+                live = {str(pk) for pk in self._queryset(spec).filter(self._qualify_q(spec)).values_list('id', flat=True)}
+                gone = updated[~updated[spec.id_column].astype(str).isin(live)]
+                if len(gone):
+                    updated = self._upsert(spec, updated, keep.iloc[0:0], set(gone[spec.id_column].astype(str)))
+                    drop_ids |= set(gone[spec.id_column].astype(str))
+
+            if len(keep) or drop_ids:
+                dataset.frames[spec.name] = updated
+                changed += len(keep) + len(drop_ids)
+            dataset.watermarks[spec.name] = started
+
+        dataset.refreshed_at = time.monotonic()
+        if changed:
+            logger.info(f"Analyst data refreshed for tenant {self.tenant_key}: {changed} rows patched")
+        return changed
+
+    # =================================================================
+    # Helpers
+    # =================================================================
+
+    def _queryset(self, spec: FrameSpec):
+        from django.apps import apps
+        model = apps.get_model('accounting', spec.model)
+        # Scope explicitly to self.tenant rather than the thread-local tenant
+        queryset = getattr(model, 'all_objects', model._default_manager).all()
+        if self.tenant is not None:
+            queryset = queryset.filter(**{spec.tenant_path: self.tenant})
+        return queryset
+
+    def _qualify_q(self, spec: FrameSpec) -> Q:
+        path, allowed = spec.qualify
+        return Q(**{f'{path}__in': allowed})
+
+    def _fetch(self, spec: FrameSpec, queryset, with_qualifier: bool = False) -> pd.DataFrame:
+        paths = [path for path, _column in spec.columns]
+        if with_qualifier:
+            paths.append(spec.qualify[0])
+        rows = list(queryset.values_list(*paths))
+        columns = [column for _path, column in spec.columns]
+        if with_qualifier:
+            columns.append(QUALIFIER_COLUMN)
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        frame[spec.id_column] = frame[spec.id_column].astype(str)
+        return frame
+
+    def _build(self, spec: FrameSpec, rows: pd.DataFrame, like: Optional[pd.DataFrame]) -> pd.DataFrame:
+        """Convert fetched rows to the compact dtypes (categories extend `like`'s)"""
+        frame = rows.copy()
+        for column in spec.dates:
+            frame[column] = pd.to_datetime(frame[column])
+        if spec.calendar:
+            dates = frame[spec.calendar].dt
+            frame['year'] = dates.year.astype('Int16')
+            frame['month'] = dates.month.astype('Int8')
+            if spec.month_names:
+                frame['month_name'] = dates.strftime('%B').astype('category')
+            if spec.quarters:
+                frame['quarter'] = dates.quarter.astype('Int8')
+        for column in spec.float64:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('float64')
+        for column in spec.float32:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('float32')
+        for column in spec.int32:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('Int32')
+
+        categorical = list(spec.categorical) + (['month_name'] if spec.month_names else [])
+        for column in categorical:
+            values = frame[column].astype(object).where(frame[column].notna(), None)
+            existing = like[column].dtype.categories if like is not None else pd.Index([])
+            new = pd.Index(values.dropna().unique()).difference(existing)
+            frame[column] = values.astype(pd.CategoricalDtype(existing.append(new)))
+        return frame
+
+    def _upsert(self, spec: FrameSpec, frame: pd.DataFrame, rows: pd.DataFrame, drop_ids: set) -> pd.DataFrame:
+        """Replace rows by id, append new ones and drop `drop_ids`"""
+        if rows.empty and not drop_ids:
+            return frame
+
+        remove = set(rows[spec.id_column]) | drop_ids
+        remaining = frame[~frame[spec.id_column].isin(remove)]
+        if rows.empty:
+            remaining = remaining.reset_index(drop=True)
+            for column in remaining.columns:
+                if isinstance(remaining[column].dtype, pd.CategoricalDtype):
+                    remaining[column] = remaining[column].cat.remove_unused_categories()
+            return remaining
+
+        patch = self._build(spec, rows, frame)
+        remaining = remaining.copy()
+        for column in patch.columns:
+            if isinstance(patch[column].dtype, pd.CategoricalDtype):
+                remaining[column] = remaining[column].cat.set_categories(patch[column].cat.categories)
+        return pd.concat([remaining, patch[remaining.columns]], ignore_index=True)
+
+    def _load_csv_fallback(self) -> AnalystDataset:
+        dataset = AnalystDataset(refreshed_at=time.monotonic())
+        try:
+            if self.snapshots is not None:
+                dataset.frames['analysis_data'] = self.snapshots.read_csv(CSV_FALLBACK_PATH)
+            else:
+                dataset.frames['analysis_data'] = pd.read_csv(CSV_FALLBACK_PATH)
+            dataset.source = SOURCE_CSV
+        except Exception:
+            dataset.source = SOURCE_EMPTY
+            dataset.frames['analysis_data'] = pd.DataFrame()
+        return dataset
@@ -7,6 +7,11 @@ Features / 功能:
 - Detect duplicate receipts / 檢測重複收據
 - Detect unusual patterns / 檢測異常模式
 - AI-powered anomaly analysis / AI驅動的異常分析
+
+detect_many screens a batch of receipts with a fixed number of queries:
+category amount statistics, the (vendor, amount, date) duplicate index,
+receipt numbers and vendor category history are each loaded once for the
+whole batch. The single-receipt checks use the same loaders.
 """
 
 import json
@@ -15,8 +20,8 @@ from decimal import Decimal
 from typing import Optional, List, Dict, Any, Tuple
 from django.db import models
 from django.db.models import Avg, StdDev, Count, Sum, Q
+from django.db.models.functions import Lower
 from django.utils import timezone
-from django.conf import settings
 
 from ai_assistants.models import Receipt, ReceiptStatus, ExpenseCategory
 
@@ -41,6 +46,21 @@ class AnomalySeverity:
     CRITICAL = 'CRITICAL'
 
 
+# Receipts the amount and category history is built from
+HISTORY_STATUSES = [ReceiptStatus.APPROVED, ReceiptStatus.POSTED]
+# Receipts that do not count as duplicates
+IGNORED_STATUSES = [ReceiptStatus.REJECTED, ReceiptStatus.ERROR]
+
+
+def _vendor_key(vendor_name: Optional[str]) -> Optional[str]:
+    """Case-insensitive vendor key (None stays None, like vendor_name__iexact=None)"""
+    return vendor_name.lower() if vendor_name is not None else None
+
+
+def _duplicate_key(receipt) -> Tuple:
+    return (_vendor_key(receipt.vendor_name), receipt.total_amount, receipt.receipt_date)
+
+
 class AnomalyDetectionService:
     """
     Service for detecting anomalies in receipts and transactions
@@ -56,59 +76,43 @@ class AnomalyDetectionService:
         Run all anomaly detection checks on a receipt
         對收據執行所有異常檢測
         """
-        anomalies = []
-        
-        # Amount anomaly
-        amount_anomaly = self.detect_amount_anomaly(receipt)
-        if amount_anomaly:
-            anomalies.append(amount_anomaly)
-        
-        # Duplicate check
-        duplicates = self.detect_duplicate_receipt(receipt)
-        if duplicates:
-            anomalies.append(duplicates)
-        
-        # Missing info check
-        missing_info = self.detect_missing_info(receipt)
-        if missing_info:
-            anomalies.append(missing_info)
-        
-        # Tax anomaly
-        tax_anomaly = self.detect_tax_anomaly(receipt)
-        if tax_anomaly:
-            anomalies.append(tax_anomaly)
-        
-        # Weekend/Holiday check
-        time_anomaly = self.detect_unusual_time(receipt)
-        if time_anomaly:
-            anomalies.append(time_anomaly)
-        
-        # Category pattern check
-        category_anomaly = self.detect_unusual_category(receipt)
-        if category_anomaly:
-            anomalies.append(category_anomaly)
+        return self.detect_many([receipt])[receipt.pk]
+    
+    def detect_many(self, receipts) -> Dict[Any, List[Dict[str, Any]]]:
+        """
+        Run all anomaly checks on many receipts in four queries
+        批量執行異常檢測
+        Returns receipt pk -> anomalies.
+        """
+        receipts = list(receipts)
+        category_stats = self._category_stats({r.category for r in receipts})
+        duplicates = self._duplicate_index(receipts)
+        numbers = self._receipt_number_index(receipts)
+        vendor_categories = self._vendor_category_index(receipts)
         
-        return anomalies
+        results = {}
+        for receipt in receipts:
+            checks = [
+                self._check_amount(receipt, category_stats.get(receipt.category)),
+                self._check_duplicate(receipt, duplicates, numbers),
+                self.detect_missing_info(receipt),
+                self.detect_tax_anomaly(receipt),
+                self.detect_unusual_time(receipt),
+                self._check_category(receipt, vendor_categories.get(_vendor_key(receipt.vendor_name))),
+            ]
+            results[receipt.pk] = [anomaly for anomaly in checks if anomaly]
+        return results
     
     def detect_amount_anomaly(self, receipt: Receipt) -> Optional[Dict[str, Any]]:
         """
         Detect if the receipt amount is unusually high or low
         檢測金額是否異常
         """
-        # Get statistics for this category
-        stats = Receipt.objects.filter(
-            category=receipt.category,
-            status__in=[ReceiptStatus.APPROVED, ReceiptStatus.POSTED],
-            total_amount__gt=0
-        ).aggregate(
-            avg_amount=Avg('total_amount'),
-            std_amount=StdDev('total_amount'),
-            count=Count('id'),
-            max_amount=models.Max('total_amount'),
-            min_amount=models.Min('total_amount')
-        )
-        
-        if not stats['avg_amount'] or stats['count'] < 5:
+        stats = self._category_stats([receipt.category]).get(receipt.category)
+        return self._check_amount(receipt, stats)
+    
+    def _check_amount(self, receipt: Receipt, stats: Optional[Dict]) -> Optional[Dict[str, Any]]:
+        if not stats or not stats['avg_amount'] or stats['count'] < 5:
             return None
         
         avg = float(stats['avg_amount'])
@@ -157,24 +161,21 @@ class AnomalyDetectionService:
         Detect potential duplicate receipts
         檢測可能重複的收據
         """
-        # Look for receipts with same vendor, amount, date
-        duplicates = Receipt.objects.filter(
-            ~Q(id=receipt.id),
-            vendor_name__iexact=receipt.vendor_name,
-            total_amount=receipt.total_amount,
-            receipt_date=receipt.receipt_date
-        ).exclude(
-            status__in=[ReceiptStatus.REJECTED, ReceiptStatus.ERROR]
+        return self._check_duplicate(
+            receipt, self._duplicate_index([receipt]), self._receipt_number_index([receipt])
         )
-        
-        if duplicates.exists():
+    
+    def _check_duplicate(self, receipt: Receipt, duplicates: Dict, numbers: Dict) -> Optional[Dict[str, Any]]:
+        # Look for receipts with same vendor, amount, date
+        duplicate_ids = [pk for pk in duplicates.get(_duplicate_key(receipt), []) if pk != receipt.pk]
+        if duplicate_ids:
             return {
                 'type': AnomalyType.DUPLICATE_RECEIPT,
                 'severity': AnomalySeverity.HIGH,
                 'title': '可能重複收據 / Possible Duplicate Receipt',
-                'description': f'發現 {duplicates.count()} 筆相同供應商、金額、日期的收據',
+                'description': f'發現 {len(duplicate_ids)} 筆相同供應商、金額、日期的收據',
                 'details': {
-                    'duplicate_ids': list(duplicates.values_list('id', flat=True)),
+                    'duplicate_ids': duplicate_ids,
                     'vendor': receipt.vendor_name,
                     'amount': float(receipt.total_amount),
                     'date': str(receipt.receipt_date)
@@ -184,14 +185,8 @@ class AnomalyDetectionService:
         
         # Also check for same receipt number
         if receipt.receipt_number:
-            same_number = Receipt.objects.filter(
-                ~Q(id=receipt.id),
-                receipt_number=receipt.receipt_number
-            ).exclude(
-                status__in=[ReceiptStatus.REJECTED, ReceiptStatus.ERROR]
-            )
-            
-            if same_number.exists():
+            existing_ids = [pk for pk in numbers.get(receipt.receipt_number, []) if pk != receipt.pk]
+            if existing_ids:
                 return {
                     'type': AnomalyType.DUPLICATE_RECEIPT,
                     'severity': AnomalySeverity.CRITICAL,
@@ -199,7 +194,7 @@ class AnomalyDetectionService:
                     'description': f'收據編號 {receipt.receipt_number} 已存在於系統中',
                     'details': {
                         'receipt_number': receipt.receipt_number,
-                        'existing_ids': list(same_number.values_list('id', flat=True))
+                        'existing_ids': existing_ids
                     },
                     'recommendation': '請確認是否為同一張收據重複上傳'
                 }
@@ -307,30 +302,26 @@ class AnomalyDetectionService:
         """
         if not receipt.vendor_name:
             return None
-        
-        # Get most common category for this vendor
-        vendor_stats = Receipt.objects.filter(
-            vendor_name__iexact=receipt.vendor_name,
-            status__in=[ReceiptStatus.APPROVED, ReceiptStatus.POSTED]
-        ).values('category').annotate(
-            count=Count('id')
-        ).order_by('-count')
-        
-        if not vendor_stats:
+        history = self._vendor_category_index([receipt]).get(_vendor_key(receipt.vendor_name))
+        return self._check_category(receipt, history)
+    
+    def _check_category(self, receipt: Receipt, history: Optional[Dict]) -> Optional[Dict[str, Any]]:
+        if not receipt.vendor_name or not history:
             return None
         
-        most_common = vendor_stats[0]
+        # Most common category for this vendor
+        common_category, count = max(history.items(), key=lambda item: item[1])
         
-        if most_common['category'] != receipt.category and most_common['count'] >= 3:
+        if common_category != receipt.category and count >= 3:
             return {
                 'type': AnomalyType.UNUSUAL_CATEGORY,
                 'severity': AnomalySeverity.LOW,
                 'title': '分類與歷史不符 / Unusual Category',
-                'description': f'此供應商通常分類為 {most_common["category"]}，但此收據分類為 {receipt.category}',
+                'description': f'此供應商通常分類為 {common_category}，但此收據分類為 {receipt.category}',
                 'details': {
                     'current_category': receipt.category,
-                    'common_category': most_common['category'],
-                    'historical_count': most_common['count'],
+                    'common_category': common_category,
+                    'historical_count': count,
                     'vendor': receipt.vendor_name
                 },
                 'recommendation': '請確認分類是否正確'
@@ -338,6 +329,83 @@ class AnomalyDetectionService:
         
         return None
     
+    # =========================================================================
+    # Batch Lookups / 批量查詢
+    # =========================================================================
+    
+    def _category_stats(self, categories) -> Dict[str, Dict]:
+        """Amount statistics of approved receipts per category, one grouped query"""
+        rows = Receipt.objects.filter(
+            category__in=categories,
+            status__in=HISTORY_STATUSES,
+            total_amount__gt=0
+        ).values('category').annotate(
+            avg_amount=Avg('total_amount'),
+            std_amount=StdDev('total_amount'),
+            count=Count('id'),
+            max_amount=models.Max('total_amount'),
+            min_amount=models.Min('total_amount')
+        ).order_by()
+        return {row['category']: row for row in rows}
+    
+    def _duplicate_index(self, receipts: List[Receipt]) -> Dict[Tuple, List]:
+        """(vendor, amount, date) -> ids of receipts with that key, one query"""
+        keys = {_duplicate_key(r) for r in receipts}
+        if not keys:
+            return {}
+        vendors = {vendor for vendor, _, _ in keys}
+        dates = {receipt_date for _, _, receipt_date in keys}
+        
+        vendor_q = Q(vendor_key__in=[v for v in vendors if v is not None])
+        if None in vendors:
+            vendor_q |= Q(vendor_name__isnull=True)
+        date_q = Q(receipt_date__in=[d for d in dates if d is not None])
+        if None in dates:
+            date_q |= Q(receipt_date__isnull=True)
+        
+        rows = Receipt.objects.annotate(vendor_key=Lower('vendor_name')).filter(
+            vendor_q, date_q, total_amount__in={amount for _, amount, _ in keys}
+        ).exclude(
+            status__in=IGNORED_STATUSES
+        ).values_list('id', 'vendor_name', 'total_amount', 'receipt_date')
+        
+        index: Dict[Tuple, List] = {}
+        for pk, vendor_name, total_amount, receipt_date in rows:
+            key = (_vendor_key(vendor_name), total_amount, receipt_date)
+            # The prefilter crosses vendors, amounts and dates
+            if key in keys:
+                index.setdefault(key, []).append(pk)
+        return index
+    
+    def _receipt_number_index(self, receipts: List[Receipt]) -> Dict[str, List]:
+        """receipt_number -> ids of receipts with that number, one query"""
+        numbers = {r.receipt_number for r in receipts if r.receipt_number}
+        if not numbers:
+            return {}
+        index: Dict[str, List] = {}
+        rows = Receipt.objects.filter(receipt_number__in=numbers).exclude(
+            status__in=IGNORED_STATUSES
+        ).values_list('id', 'receipt_number')
+        for pk, receipt_number in rows:
+            index.setdefault(receipt_number, []).append(pk)
+        return index
+    
+    def _vendor_category_index(self, receipts: List[Receipt]) -> Dict[str, Dict[str, int]]:
+        """vendor key -> {category: approved receipt count}, one grouped query"""
+        vendors = {_vendor_key(r.vendor_name) for r in receipts if r.vendor_name}
+        if not vendors:
+            return {}
+        index: Dict[str, Dict[str, int]] = {}
+        rows = Receipt.objects.annotate(vendor_key=Lower('vendor_name')).filter(
+            vendor_key__in=vendors,
+            status__in=HISTORY_STATUSES
+        ).values('vendor_key', 'category').annotate(
+            count=Count('id')
+        ).order_by()
+        for row in rows:
+            index.setdefault(row['vendor_key'], {})[row['category']] = row['count']
+        return index
+    
     def _get_amount_severity(self, deviation: float) -> str:
         """
         Get severity level based on deviation
@@ -416,8 +484,8 @@ class AnomalyDetectionService:
             }
         
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
+            from core.libs.ai_service import get_llm_client
+            client = get_llm_client()
             
             prompt = f"""作為會計專家，分析以下收據異常情況並提供風險評估：
 
@@ -0,0 +1,130 @@
+"""
+Receipt Blob Store
+收據圖檔存儲
+
+Content-addressed storage for receipt images. Each image is stored once
+under its SHA-256 digest (core.file_security.calculate_file_hash) in the
+``receipt_blobs`` storage (local disk, or S3-compatible when
+RECEIPT_BLOB_STORAGE=s3), and receipts reference it through
+Receipt.image_blob, so identical uploads share one file and receipt rows
+carry no image payload.
+
+Layout::
+
+    <sha[:2]>/<sha[2:4]>/<sha>                 original image
+    thumbs/<size>/<sha[:2]>/<sha>.jpg          thumbnail, written on first request
+"""
+
+import base64
+from io import BytesIO
+from typing import Optional
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+
+from ai_assistants.models import ReceiptBlob
+from core.file_security import calculate_file_hash
+
+THUMBNAIL_SIZE = 320
+
+
+class BlobStoreError(Exception):
+    """Raised when a blob cannot be read or its thumbnail rendered"""
+    pass
+
+
+class BlobStore:
+    """
+    Service for storing and reading receipt images by content hash.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or storages['receipt_blobs']
+
+    @staticmethod
+    def blob_path(sha256: str) -> str:
+        return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+    @staticmethod
+    def thumbnail_path(sha256: str, size: int) -> str:
+        return f"thumbs/{size}/{sha256[:2]}/{sha256}.jpg"
+
+    # =================================================================
+    # Writing
+    # =================================================================
+
+    def put(self, content: bytes, content_type: str = 'image/jpeg') -> ReceiptBlob:
+        """Store content (once per digest) and return its blob row"""
+        sha256 = calculate_file_hash(content)
+        blob, _ = ReceiptBlob.objects.get_or_create(
+            sha256=sha256,
+            defaults={'size': len(content), 'content_type': content_type},
+        )
+        # Also rewrites a file lost after its row was created
+        self._write(self.blob_path(sha256), content)
+        return blob
+
+    def put_file(self, uploaded_file, content_type: Optional[str] = None) -> ReceiptBlob:
+        """Store an uploaded file, leaving its read position at the start"""
+        uploaded_file.seek(0)
+        content = uploaded_file.read()
+        uploaded_file.seek(0)
+        return self.put(content, content_type or getattr(uploaded_file, 'content_type', None) or 'image/jpeg')
+
+    def put_base64(self, image_base64: str, content_type: str = 'image/jpeg') -> ReceiptBlob:
+        if image_base64.startswith('data:'):
+            header, image_base64 = image_base64.split(',', 1)
+            content_type = header[5:].split(';', 1)[0] or content_type
+        return self.put(base64.b64decode(image_base64), content_type)
+
+    def _write(self, name: str, content: bytes) -> None:
+        if self.storage.exists(name):
+            return
+        saved = self.storage.save(name, ContentFile(content))
+        if saved != name:
+            # Lost a race with an identical upload: keep the first copy
+            self.storage.delete(saved)
+
+    # =================================================================
+    # Reading
+    # =================================================================
+
+    def read(self, sha256: str) -> bytes:
+        try:
+            with self.storage.open(self.blob_path(sha256), 'rb') as f:
+                return f.read()
+        except (FileNotFoundError, OSError) as e:
+            raise BlobStoreError(f"Receipt blob {sha256} is missing: {e}")
+
+    def read_base64(self, sha256: str) -> str:
+        return base64.b64encode(self.read(sha256)).decode('utf-8')
+
+    def open(self, sha256: str):
+        return self.storage.open(self.blob_path(sha256), 'rb')
+
+    def open_thumbnail(self, sha256: str, size: int = THUMBNAIL_SIZE):
+        """Open the JPEG thumbnail of a blob, rendering and storing it on first use"""
+        name = self.thumbnail_path(sha256, size)
+        if not self.storage.exists(name):
+            self._write(name, self._render_thumbnail(self.read(sha256), size))
+        return self.storage.open(name, 'rb')
+
+    @staticmethod
+    def _render_thumbnail(content: bytes, size: int) -> bytes:
+        from PIL import Image, ImageOps
+
+        try:
+            image = Image.open(BytesIO(content))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            output = BytesIO()
+            image.save(output, format='JPEG', quality=80, optimize=True)
+            return output.getvalue()
+        except Exception as e:
+            raise BlobStoreError(f"Cannot render thumbnail: {e}")
+
+
+def get_blob_store() -> BlobStore:
+    return BlobStore()
@@ -0,0 +1,180 @@
+"""
+Conversation Store
+對話記錄存儲
+
+Append-only chat history for AIConversation. Messages are rows of
+AIConversationMessage numbered by seq, so a turn inserts its messages and
+bumps AIConversation.message_count without reading or rewriting the history.
+
+Model context is a rolling summary plus the messages after it. Once
+SUMMARY_BATCH messages lie outside the last CONTEXT_MESSAGES,
+summarize_conversation (Celery) folds them into the summary, so a turn
+reads a bounded number of rows however long the session is.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ai_assistants.models import AIConversation, AIConversationMessage
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """
+    Service for appending to and reading an AIConversation's messages.
+    """
+
+    CONTEXT_MESSAGES = 10   # sent to the model verbatim
+    SUMMARY_BATCH = 20      # messages folded into the summary at a time
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+
+    def __init__(self, conversation: AIConversation):
+        self.conversation = conversation
+
+    # =================================================================
+    # Writing
+    # =================================================================
+
+    def append(self, messages: List[Dict], **counters) -> List[AIConversationMessage]:
+        """
+        Append messages ({role, content, actions?}) in order.
+        counters are added to AIConversation integer fields (e.g. total_actions=2).
+        """
+        conversation = self.conversation
+        with transaction.atomic():
+            # Lock the conversation row only to number the new messages
+            count = (
+                AIConversation.objects.select_for_update()
+                .filter(pk=conversation.pk)
+                .values_list('message_count', flat=True)
+                .get()
+            )
+            rows = [
+                AIConversationMessage(
+                    conversation=conversation,
+                    seq=count + offset,
+                    role=message['role'],
+                    content=message.get('content') or '',
+                    actions=message.get('actions'),
+                )
+                for offset, message in enumerate(messages, start=1)
+            ]
+            AIConversationMessage.objects.bulk_create(rows)
+
+            updates = {name: F(name) + value for name, value in counters.items() if value}
+            AIConversation.objects.filter(pk=conversation.pk).update(
+                message_count=count + len(rows),
+                updated_at=timezone.now(),
+                **updates,
+            )
+
+        conversation.message_count = count + len(rows)
+        for name, value in counters.items():
+            setattr(conversation, name, getattr(conversation, name) + value)
+
+        if self.needs_summary():
+            from ai_assistants.tasks import summarize_conversation
+            # robust: a missing broker must not fail the chat turn
+            transaction.on_commit(lambda: summarize_conversation.delay(str(conversation.pk)), robust=True)
+        return rows
+
+    # =================================================================
+    # Reading
+    # =================================================================
+
+    def recent(self, limit: int = None) -> List[AIConversationMessage]:
+        """Last limit messages, oldest first"""
+        limit = limit or self.CONTEXT_MESSAGES
+        rows = list(self.conversation.chat_messages.order_by('-seq')[:limit])
+        rows.reverse()
+        return rows
+
+    def context_messages(self) -> List[Dict]:
+        """
+        Chat-completion messages: the rolling summary, then every message
+        after it (at least CONTEXT_MESSAGES, at most one SUMMARY_BATCH more
+        while the summary catches up).
+        """
+        unsummarized = self.conversation.message_count - self.conversation.summary_seq
+        limit = min(max(unsummarized, self.CONTEXT_MESSAGES), self.CONTEXT_MESSAGES + self.SUMMARY_BATCH)
+        messages = []
+        if self.conversation.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.conversation.summary}",
+            })
+        for row in self.recent(limit):
+            messages.append({"role": row.role, "content": row.content})
+        return messages
+
+    def page(self, before: Optional[int] = None, limit: int = None) -> Tuple[List[AIConversationMessage], Optional[int]]:
+        """
+        Messages older than seq `before` (newest page when None), oldest first.
+        Returns (messages, cursor for the next older page or None).
+        """
+        limit = min(limit or self.PAGE_SIZE, self.MAX_PAGE_SIZE)
+        queryset = self.conversation.chat_messages.order_by('-seq')
+        if before is not None:
+            queryset = queryset.filter(seq__lt=before)
+        rows = list(queryset[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        return rows, (rows[0].seq if has_more and rows else None)
+
+    # =================================================================
+    # Summary
+    # =================================================================
+
+    def needs_summary(self) -> bool:
+        conversation = self.conversation
+        outside_window = conversation.message_count - self.CONTEXT_MESSAGES - conversation.summary_seq
+        return outside_window >= self.SUMMARY_BATCH
+
+    def summarize(self, client, model: str = 'gpt-4o-mini') -> bool:
+        """Fold messages that left the context window into the summary"""
+        conversation = self.conversation
+        previous_seq = conversation.summary_seq
+        upto = conversation.message_count - self.CONTEXT_MESSAGES
+        if upto <= previous_seq:
+            return False
+
+        rows = conversation.chat_messages.filter(seq__gt=previous_seq, seq__lte=upto).order_by('seq')
+        transcript = "\n".join(f"{row.role}: {row.content[:2000]}" for row in rows)
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "Maintain a concise running summary of a conversation between a user and a "
+                        "business assistant. Keep facts, decisions, record names/IDs and open requests. "
+                        "Reply with the updated summary only."
+                    ),
+                },
+                {
+                    "role": "user",
+                    "content": f"Current summary:\n{conversation.summary or '(none)'}\n\nNew messages:\n{transcript}",
+                },
+            ],
+            temperature=0.2,
+            max_tokens=600,
+        )
+        summary = (response.choices[0].message.content or '').strip()
+        if not summary:
+            return False
+
+        # Only advance from the summary we started from (a concurrent run may have won)
+        updated = AIConversation.objects.filter(pk=conversation.pk, summary_seq=previous_seq).update(
+            summary=summary, summary_seq=upto
+        )
+        if updated:
+            conversation.summary = summary
+            conversation.summary_seq = upto
+        return bool(updated)
@@ -0,0 +1,466 @@
+"""
+Document Index Service
+文件索引服務
+
+Persistent inverted index over AIDocument chunks for RAG retrieval.
+
+Each document is split into a header chunk (title, keywords, summary) and
+body chunks of extracted_text. The index is partitioned per owner, with
+public documents (tagged 'public') in a shared partition, and is updated
+incrementally when a document is saved or deleted.
+
+Two backends sit behind DocumentIndexService:
+- PostgresIndexBackend: tsvector column + GIN index, ranked with ts_rank
+- LocalIndexBackend: postings table with BM25 scoring (SQLite / others)
+
+Both only touch postings of the query terms, so search cost follows the
+number of matching chunks rather than the size of the document table.
+"""
+
+import abc
+import hashlib
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from core.libs.rag_service import iter_tokens
+
+PUBLIC_TAG = 'public'
+PUBLIC_SCOPE = 'public'
+
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 32
+
+
+@dataclass
+class DocumentHit:
+    """Best matching chunk of a document"""
+    document_id: str
+    chunk_id: str
+    score: float
+    excerpt: str
+
+
+def user_scope(user_id) -> str:
+    return f'user:{user_id}'
+
+
+def is_public_document(document) -> bool:
+    return PUBLIC_TAG in (document.tags or [])
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct index terms of a query, in order of appearance"""
+    terms = []
+    for token, _offset in iter_tokens(query):
+        if len(token) <= MAX_TERM_LENGTH and token not in terms:
+            terms.append(token)
+            if len(terms) >= MAX_QUERY_TERMS:
+                break
+    return terms
+
+
+def make_excerpt(text: str, offset: int = 0, max_length: int = 300) -> str:
+    """Excerpt of `text` starting shortly before `offset`, trimmed to word boundaries"""
+    if not text:
+        return ''
+    start = max(0, offset - 50)
+    excerpt = text[start:start + max_length]
+
+    if start > 0 and excerpt and excerpt[0] != ' ':
+        space_pos = excerpt.find(' ')
+        if 0 < space_pos < 20:
+            excerpt = excerpt[space_pos + 1:]
+
+    if len(text) > start + max_length:
+        last_space = excerpt.rfind(' ')
+        if last_space > max_length - 50:
+            excerpt = excerpt[:last_space] + '...'
+
+    return excerpt.strip()
+
+
+class BaseIndexBackend(abc.ABC):
+    """
+    Chunking and partition bookkeeping shared by the backends.
+    """
+
+    CHUNK_SIZE = 1200
+
+    # =================================================================
+    # Indexing
+    # =================================================================
+
+    @transaction.atomic
+    def index_document(self, document) -> int:
+        """
+        (Re)build the chunks of one document.
+        Skipped when its indexed content is unchanged. Returns chunks written.
+        """
+        from ai_assistants.models import AIDocumentChunk
+
+        if not document.is_active:
+            self.remove_document(document.pk)
+            return 0
+
+        source_hash = self.source_hash(document)
+        current = (
+            AIDocumentChunk.objects
+            .filter(document_id=document.pk, position=0)
+            .values_list('source_hash', flat=True)
+            .first()
+        )
+        if current == source_hash:
+            return 0
+
+        self.remove_document(document.pk)
+
+        is_public = is_public_document(document)
+        chunks = [
+            AIDocumentChunk(
+                document_id=document.pk,
+                owner_id=document.uploaded_by_id,
+                is_public=is_public,
+                position=position,
+                start_offset=start,
+                end_offset=end,
+                content=content,
+                source_hash=source_hash if position == 0 else '',
+            )
+            for position, (start, end, content) in enumerate(self.split_document(document))
+        ]
+        self.prepare_chunks(chunks)
+        AIDocumentChunk.objects.bulk_create(chunks)
+        self.after_create(chunks)
+
+        scope = PUBLIC_SCOPE if is_public else user_scope(document.uploaded_by_id)
+        self._update_stats(scope, len(chunks), sum(chunk.length for chunk in chunks))
+        return len(chunks)
+
+    @transaction.atomic
+    def remove_document(self, document_id) -> int:
+        """Drop a document's chunks and postings. Returns chunks removed."""
+        from ai_assistants.models import AIDocumentChunk
+
+        chunks = AIDocumentChunk.objects.filter(document_id=document_id)
+        totals = list(
+            chunks.order_by()
+            .values('owner_id', 'is_public')
+            .annotate(count=Count('id'), length=Sum('length'))
+        )
+        if not totals:
+            return 0
+
+        chunks.delete()
+        removed = 0
+        for row in totals:
+            scope = PUBLIC_SCOPE if row['is_public'] else user_scope(row['owner_id'])
+            self._update_stats(scope, -row['count'], -(row['length'] or 0))
+            removed += row['count']
+        return removed
+
+    def source_hash(self, document) -> str:
+        """Fingerprint of everything the index is built from"""
+        digest = hashlib.sha256()
+        for part in (
+            str(document.uploaded_by_id),
+            str(is_public_document(document)),
+            document.title or '',
+            ' '.join(str(k) for k in (document.ai_keywords or [])),
+            document.ai_summary or '',
+            document.extracted_text or '',
+        ):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+
+    def split_document(self, document) -> List[Tuple[int, int, str]]:
+        """
+        Header chunk followed by extracted_text slices as (start, end, content).
+        Slices end at whitespace where possible so words are not cut in half.
+        """
+        header = '\n'.join(part for part in (
+            document.title or '',
+            ', '.join(str(k) for k in (document.ai_keywords or [])),
+            document.ai_summary or '',
+        ) if part)
+        parts = [(0, 0, header)]
+
+        text = document.extracted_text or ''
+        start = 0
+        while start < len(text):
+            end = min(start + self.CHUNK_SIZE, len(text))
+            if end < len(text):
+                space = text.rfind(' ', start + self.CHUNK_SIZE // 2, end)
+                newline = text.rfind('\n', start + self.CHUNK_SIZE // 2, end)
+                cut = max(space, newline)
+                if cut > start:
+                    end = cut + 1
+            if text[start:end].strip():
+                parts.append((start, end, text[start:end]))
+            start = end
+        return parts
+
+    def prepare_chunks(self, chunks: List) -> None:
+        """Hook to fill backend specific fields before the chunks are saved"""
+
+    def after_create(self, chunks: List) -> None:
+        """Hook run after the chunks are saved"""
+
+    def _update_stats(self, scope: str, count: int, length: float) -> None:
+        from ai_assistants.models import AIDocumentIndexStats
+
+        if not count and not length:
+            return
+        AIDocumentIndexStats.objects.get_or_create(scope=scope)
+        AIDocumentIndexStats.objects.filter(scope=scope).update(
+            chunk_count=F('chunk_count') + count,
+            total_length=F('total_length') + length,
+        )
+
+    def _scope_filter(self, user_id) -> Q:
+        return Q(owner_id=user_id, is_public=False) | Q(is_public=True)
+
+    @abc.abstractmethod
+    def search(self, user_id, query: str, limit: int = 10) -> List[DocumentHit]:
+        """Ranked hits for `query` among the documents `user_id` can see"""
+
+
+class LocalIndexBackend(BaseIndexBackend):
+    """
+    BM25 over the AIDocumentTerm postings table.
+    Works on any database; header terms weigh HEADER_WEIGHT times body terms.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    HEADER_WEIGHT = 3
+
+    # =================================================================
+    # Indexing
+    # =================================================================
+
+    def prepare_chunks(self, chunks: List) -> None:
+        self._postings = {}
+        for chunk in chunks:
+            weight = self.HEADER_WEIGHT if chunk.position == 0 else 1
+            counts: Dict[str, int] = {}
+            first: Dict[str, int] = {}
+            for token, offset in iter_tokens(chunk.content):
+                if len(token) > MAX_TERM_LENGTH:
+                    continue
+                counts[token] = counts.get(token, 0) + 1
+                first.setdefault(token, offset)
+            chunk.length = float(sum(counts.values()) * weight)
+            self._postings[id(chunk)] = (weight, counts, first)
+
+    def after_create(self, chunks: List) -> None:
+        from ai_assistants.models import AIDocumentTerm
+
+        postings = getattr(self, '_postings', {})
+        terms = []
+        for chunk in chunks:
+            weight, counts, first = postings.pop(id(chunk), (1, {}, {}))
+            terms.extend(
+                AIDocumentTerm(
+                    chunk=chunk,
+                    owner_id=chunk.owner_id,
+                    is_public=chunk.is_public,
+                    term=term,
+                    tf=count * weight,
+                    first_offset=first[term],
+                )
+                for term, count in counts.items()
+            )
+        AIDocumentTerm.objects.bulk_create(terms, batch_size=2000)
+
+    # =================================================================
+    # Search
+    # =================================================================
+
+    def search(self, user_id, query: str, limit: int = 10) -> List[DocumentHit]:
+        from ai_assistants.models import AIDocumentChunk, AIDocumentIndexStats, AIDocumentTerm
+
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        postings = list(
+            AIDocumentTerm.objects
+            .filter(self._scope_filter(user_id), term__in=terms)
+            .values_list(
+                'chunk_id', 'chunk__document_id', 'chunk__position', 'chunk__length',
+                'term', 'tf', 'first_offset',
+            )
+        )
+        if not postings:
+            return []
+
+        stats = AIDocumentIndexStats.objects.filter(scope__in=[PUBLIC_SCOPE, user_scope(user_id)])
+        chunk_count, total_length = 0, 0.0
+        for row in stats:
+            chunk_count += row.chunk_count
+            total_length += row.total_length
+        chunk_count = max(chunk_count, 1)
+        avg_length = total_length / chunk_count or 1.0
+
+        doc_freq: Dict[str, int] = {}
+        for posting in postings:
+            doc_freq[posting[4]] = doc_freq.get(posting[4], 0) + 1
+        idf = {
+            term: math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+            for term, df in doc_freq.items()
+        }
+
+        # chunk_id -> [document_id, position, score, (idf, offset) of the anchor term]
+        chunk_scores: Dict = {}
+        for chunk_id, document_id, position, length, term, tf, offset in postings:
+            norm = self.K1 * (1 - self.B + self.B * (length or 0) / avg_length)
+            score = idf[term] * tf * (self.K1 + 1) / (tf + norm)
+            entry = chunk_scores.setdefault(chunk_id, [document_id, position, 0.0, (-1.0, 0)])
+            entry[2] += score
+            if idf[term] > entry[3][0]:
+                entry[3] = (idf[term], offset)
+
+        # A document scores as its best chunk; the excerpt comes from the best
+        # body chunk, falling back to the header when only it matched
+        best: Dict = {}
+        excerpt_from: Dict = {}
+        for chunk_id, (document_id, position, score, anchor) in chunk_scores.items():
+            if score > best.get(document_id, 0.0):
+                best[document_id] = score
+            current = excerpt_from.get(document_id)
+            key = (position > 0, score)
+            if current is None or key > current[0]:
+                excerpt_from[document_id] = (key, chunk_id, anchor[1])
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+        contents = dict(
+            AIDocumentChunk.objects
+            .filter(id__in=[excerpt_from[document_id][1] for document_id, _score in ranked])
+            .values_list('id', 'content')
+        )
+        hits = []
+        for document_id, score in ranked:
+            _key, chunk_id, offset = excerpt_from[document_id]
+            hits.append(DocumentHit(
+                document_id=str(document_id),
+                chunk_id=str(chunk_id),
+                score=score,
+                excerpt=make_excerpt(contents.get(chunk_id, ''), offset),
+            ))
+        return hits
+
+
+class PostgresIndexBackend(BaseIndexBackend):
+    """
+    PostgreSQL full text search over AIDocumentChunk.search_vector
+    (GIN indexed). The vector is built from the same tokens as the local
+    backend (iter_tokens: words plus CJK unigrams and bigrams), joined by
+    spaces and parsed with the 'simple' configuration, so CJK queries
+    match and mixed EN/ZH text is not stemmed with English rules.
+    """
+
+    CONFIG = 'simple'
+
+    def prepare_chunks(self, chunks: List) -> None:
+        self._terms = {}
+        for chunk in chunks:
+            tokens = [token for token, _offset in iter_tokens(chunk.content) if len(token) <= MAX_TERM_LENGTH]
+            chunk.length = float(len(tokens))
+            self._terms[id(chunk)] = ' '.join(tokens)
+
+    def after_create(self, chunks: List) -> None:
+        from django.contrib.postgres.search import SearchVector
+        from django.db.models import Value
+        from ai_assistants.models import AIDocumentChunk
+
+        terms = getattr(self, '_terms', {})
+        for chunk in chunks:
+            AIDocumentChunk.objects.filter(pk=chunk.pk).update(search_vector=SearchVector(
+                Value(terms.pop(id(chunk), '')), config=self.CONFIG,
+                weight='A' if chunk.position == 0 else 'D',
+            ))
+
+    def search(self, user_id, query: str, limit: int = 10) -> List[DocumentHit]:
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+        from ai_assistants.models import AIDocumentChunk
+
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        search_query = SearchQuery(terms[0], config=self.CONFIG)
+        for term in terms[1:]:
+            search_query |= SearchQuery(term, config=self.CONFIG)
+
+        rows = (
+            AIDocumentChunk.objects
+            .filter(self._scope_filter(user_id), search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank')
+            .values_list('id', 'document_id', 'rank')[:limit * 5]
+        )
+        best: Dict = {}
+        for chunk_id, document_id, rank in rows:
+            if document_id not in best:
+                best[document_id] = (chunk_id, float(rank))
+        ranked = list(best.items())[:limit]
+
+        headlines = dict(
+            AIDocumentChunk.objects
+            .filter(id__in=[chunk_id for _doc, (chunk_id, _rank) in ranked])
+            .annotate(headline=SearchHeadline(
+                'content', search_query, config=self.CONFIG,
+                start_sel='', stop_sel='', max_words=50, min_words=20,
+            ))
+            .values_list('id', 'headline')
+        )
+        return [
+            DocumentHit(
+                document_id=str(document_id),
+                chunk_id=str(chunk_id),
+                score=rank,
+                excerpt=headlines.get(chunk_id, ''),
+            )
+            for document_id, (chunk_id, rank) in ranked
+        ]
+
+
+class DocumentIndexService:
+    """
+    Service for indexing and searching AIDocuments.
+    Picks the PostgreSQL backend when available, else the local BM25 one.
+    """
+
+    def __init__(self, backend: Optional[BaseIndexBackend] = None):
+        if backend is None:
+            backend = PostgresIndexBackend() if connection.vendor == 'postgresql' else LocalIndexBackend()
+        self.backend = backend
+
+    def index_document(self, document) -> int:
+        return self.backend.index_document(document)
+
+    def remove_document(self, document_id) -> int:
+        return self.backend.remove_document(document_id)
+
+    def search(self, user_id, query: str, limit: int = 10) -> List[DocumentHit]:
+        return self.backend.search(user_id, query, limit)
+
+    def rebuild(self, queryset=None) -> int:
+        """Reindex every document (or the given queryset). Returns chunks written."""
+        from ai_assistants.models import AIDocument, AIDocumentChunk, AIDocumentIndexStats
+
+        if queryset is None:
+            with transaction.atomic():
+                AIDocumentChunk.objects.all().delete()
+                AIDocumentIndexStats.objects.all().delete()
+            queryset = AIDocument.objects.filter(is_active=True)
+
+        written = 0
+        for document in queryset.iterator(chunk_size=200):
+            written += self.backend.index_document(document)
+        return written
@@ -22,11 +22,21 @@ from typing import Dict, List, Tuple, Optional
 from datetime import datetime
 
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from django.core.files.base import ContentFile
 from openai import OpenAI
 
-from ai_assistants.models import Email, EmailAccount, EmailAttachment
+from core.libs.ai_service import get_llm_client
+from core.libs.llm_gateway import GatewayError, LLMRequest, QuotaExceeded, get_llm_gateway
+from ai_assistants.models import Email, EmailAccount
+from ai_assistants.services.imap_sync import (
+    MESSAGE_ITEMS,
+    ImapSyncError,
+    ImapSyncService,
+    existing_message_keys,
+    fetch_uids,
+    store_emails,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -35,11 +45,14 @@ def _get_client() -> OpenAI:
 	api_key = getattr(settings, "OPENAI_API_KEY", None)
 	if not api_key:
 		raise RuntimeError("OPENAI_API_KEY is not configured")
-	return OpenAI(api_key=api_key)
+	return get_llm_client(api_key=api_key)
 
 
-def summarize_email(email: Email) -> Dict[str, object]:
-	"""Generate AI summary, action items, and sentiment for an email."""
+def summarize_email(email: Email, user_id: Optional[str] = None) -> Dict[str, object]:
+	"""
+	Generate AI summary, action items, and sentiment for an email.
+	The request counts against user_id's daily AI quota (QuotaExceeded when spent).
+	"""
 	prompt = (
 		"You are an email analysis assistant for an accounting and audit firm. "
 		"Summarize the email in 2 sentences, extract up to 3 actionable next steps "
@@ -56,20 +69,26 @@ def summarize_email(email: Email) -> Dict[str, object]:
 	)
 
 	try:
-		client = _get_client()
-		completion = client.chat.completions.create(
-			model="gpt-4o-mini",
+		# Through the shared gateway: OpenAI first, then DeepSeek/Gemini if it is throttled or down
+		response = get_llm_gateway().complete_sync(LLMRequest(
 			messages=[
 				{"role": "system", "content": prompt},
 				{"role": "user", "content": email_context},
 			],
-			response_format={"type": "json_object"},
+			models={"openai": "gpt-4o-mini"},
+			extra={"response_format": {"type": "json_object"}},
 			temperature=0.2,
 			max_tokens=500,
-		)
-		raw_content = completion.choices[0].message.content or "{}"
-		data = json.loads(raw_content)
-	except RuntimeError as exc:
+			user_id=user_id,
+			action="email_summary",
+		))
+		data = json.loads(response.content or "{}")
+	except QuotaExceeded:
+		raise
+	except GatewayError as exc:
+		if exc.errors:
+			logger.error("Email summary failed: %s", exc, exc_info=True)
+			raise
 		logger.warning("Email summary skipped: %s", exc)
 		return {
 			"summary": "AI summarization unavailable (missing API key).",
@@ -286,31 +305,25 @@ def fetch_emails_imap(
         if not search_criteria:
             search_criteria = ["ALL"]
         
-        # Search emails
-        status, messages = mail.search(None, *search_criteria)
+        # Search emails (UIDs, so the bodies come back in one batched FETCH)
+        status, messages = mail.uid("SEARCH", None, *search_criteria)
         if status != "OK":
             logger.error("IMAP search failed")
             return []
         
-        email_ids = messages[0].split()
+        email_uids = [int(uid) for uid in messages[0].split()]
         # Get latest emails first
-        email_ids = email_ids[-limit:] if len(email_ids) > limit else email_ids
-        email_ids.reverse()
+        email_uids = email_uids[-limit:] if len(email_uids) > limit else email_uids
+        raw_emails = fetch_uids(mail, email_uids, MESSAGE_ITEMS)
         
         emails = []
-        for email_id in email_ids:
-            try:
-                status, msg_data = mail.fetch(email_id, "(RFC822)")
-                if status != "OK":
-                    continue
-                
-                raw_email = msg_data[0][1]
-                parsed_email = _parse_email(raw_email)
-                if parsed_email:
-                    emails.append(parsed_email)
-            except Exception as e:
-                logger.error(f"Failed to fetch email {email_id}: {e}")
+        for uid in reversed(email_uids):
+            if uid not in raw_emails:
+                logger.error(f"Failed to fetch email {uid}")
                 continue
+            parsed_email = _parse_email(raw_emails[uid])
+            if parsed_email:
+                emails.append(parsed_email)
         
         mail.logout()
         return emails
@@ -399,77 +412,50 @@ def _parse_email(raw_email: bytes) -> Optional[Dict]:
         return None
 
 
-def sync_emails_for_account(account: EmailAccount, limit: int = 100) -> Dict:
+def sync_emails_for_account(account: EmailAccount, limit: int = 100, folders: List[str] = None) -> Dict:
     """
     Synchronize emails from IMAP server to database.
     
+    New UIDs above each folder's watermark are fetched in batches (headers
+    first, bodies only for unseen Message-IDs) and stored with bulk_create;
+    an interrupted sync resumes from the last stored batch.
+    
     Args:
         account: EmailAccount to sync
-        limit: Maximum emails to fetch
+        limit: Maximum emails to fetch per folder
+        folders: IMAP folders to sync (default INBOX)
     
     Returns:
         Dict with sync statistics
     """
-    fetched_emails = fetch_emails_imap(account, limit=limit)
-    
-    created = 0
-    updated = 0
-    errors = 0
+    if account.is_demo:
+        fetched_emails = _get_demo_emails()
+        messages = {data["message_id"]: data for data in fetched_emails}
+        with transaction.atomic():
+            for key in existing_message_keys(account, messages):
+                del messages[key]
+            created = store_emails(account, messages)
+        return {
+            "fetched": len(fetched_emails),
+            "created": created,
+            "updated": len(fetched_emails) - created,
+            "errors": 0,
+        }
     
-    for email_data in fetched_emails:
-        try:
-            # Check if email already exists by message_id
-            message_id = email_data.get("message_id", "")
-            existing = None
-            if message_id:
-                existing = Email.objects.filter(
-                    account=account,
-                    thread_id=message_id
-                ).first()
-            
-            if existing:
-                # Update existing email
-                updated += 1
-            else:
-                # Create new email
-                email_obj = Email.objects.create(
-                    account=account,
-                    from_address=email_data["from_address"],
-                    from_name=email_data.get("from_name", ""),
-                    to_addresses=email_data.get("to_addresses", []),
-                    cc_addresses=email_data.get("cc_addresses", []),
-                    subject=email_data.get("subject", ""),
-                    body_text=email_data.get("body_text", ""),
-                    body_html=email_data.get("body_html", ""),
-                    thread_id=message_id,
-                    received_at=email_data.get("received_at") or timezone.now(),
-                    status="RECEIVED",
-                    is_read=False,
-                    has_attachments=bool(email_data.get("attachments")),
-                )
-                
-                # Save attachments
-                for att_data in email_data.get("attachments", []):
-                    EmailAttachment.objects.create(
-                        email=email_obj,
-                        filename=att_data.get("filename", "attachment"),
-                        content_type=att_data.get("content_type", "application/octet-stream"),
-                        file=ContentFile(att_data.get("content", b""), name=att_data.get("filename", "attachment")),
-                        size=len(att_data.get("content", b"")),
-                    )
-                
-                created += 1
-                
-        except Exception as e:
-            logger.error(f"Failed to sync email: {e}")
-            errors += 1
+    if not account.imap_host:
+        logger.warning("IMAP host not configured for account %s", account.email_address)
+        return {"fetched": 0, "created": 0, "updated": 0, "errors": 0}
     
-    return {
-        "fetched": len(fetched_emails),
-        "created": created,
-        "updated": updated,
-        "errors": errors,
-    }
+    service = ImapSyncService(account)
+    try:
+        return service.sync(folders=folders or ["INBOX"], limit=limit)
+    except (imaplib.IMAP4.error, ImapSyncError, OSError) as e:
+        # Batches stored before the failure are kept; the next sync resumes after them
+        logger.error(f"IMAP sync failed for {account.email_address}: {e}")
+        stats = dict(service.stats or {"fetched": 0, "created": 0, "updated": 0, "errors": 0})
+        stats["errors"] += 1
+        stats["error"] = str(e)
+        return stats
 
 
 def _get_demo_emails() -> List[Dict]:
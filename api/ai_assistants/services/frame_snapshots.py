@@ -0,0 +1,294 @@
+"""
+DataFrame Snapshots
+數據快照
+
+Columnar on-disk snapshots of analyst / planner DataFrames, so a fresh
+gunicorn or Celery worker maps the data in instead of re-querying the
+database or re-parsing CSV files.
+
+Each column is written as its own .npy file and loaded with
+``np.load(mmap_mode='c')``: numeric, datetime, nullable-integer and
+categorical columns come back backed by the page cache (shared by every
+worker on the host, copied privately only if written to). Text columns are
+stored dictionary-encoded and materialized on load.
+
+Layout::
+
+    <ANALYST_SNAPSHOT_DIR>/<key>/CURRENT          generation number
+    <ANALYST_SNAPSHOT_DIR>/<key>/gen-<n>/manifest.json
+    <ANALYST_SNAPSHOT_DIR>/<key>/gen-<n>/<frame>.<i>.npy
+
+A snapshot is written to a temporary directory and published by renaming
+it to the next generation and then replacing CURRENT, so readers never see
+a partial snapshot.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+logger = logging.getLogger('analyst.cache')
+
+FORMAT_VERSION = 1
+KEEP_GENERATIONS = 2  # older generations may still be mapped by running workers
+
+
+class SnapshotError(Exception):
+    """Raised when a frame cannot be written to or read from a snapshot"""
+    pass
+
+
+@dataclass
+class Snapshot:
+    """A loaded snapshot generation"""
+    key: str
+    generation: int
+    frames: Dict[str, pd.DataFrame] = field(default_factory=dict)
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+# =================================================================
+# Column Encoding
+# =================================================================
+
+MASKED_ARRAYS = {
+    'integer': pd.arrays.IntegerArray,
+    'floating': pd.arrays.FloatingArray,
+    'boolean': pd.arrays.BooleanArray,
+}
+
+
+def _json_categories(categories: pd.Index) -> list:
+    values = categories.tolist()
+    if not all(isinstance(value, (str, int, float)) for value in values):
+        raise SnapshotError(f'Unsupported category values ({categories.dtype})')
+    return values
+
+
+def _encode_column(series: pd.Series) -> tuple:
+    """Return (column spec, {suffix: ndarray}) for one column"""
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        return (
+            {'kind': 'categorical', 'categories': _json_categories(dtype.categories), 'ordered': bool(dtype.ordered)},
+            {'codes': series.array.codes},
+        )
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and hasattr(series.array, '_mask'):
+        kind = 'boolean' if dtype.name == 'boolean' else ('floating' if dtype.kind == 'f' else 'integer')
+        return (
+            {'kind': 'masked', 'array': kind, 'dtype': dtype.name},
+            {'values': series.array._data, 'mask': series.array._mask},
+        )
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        return {'kind': 'numeric'}, {'values': series.to_numpy()}
+    if isinstance(dtype, np.dtype) and dtype.kind == 'M':
+        return {'kind': 'datetime', 'dtype': dtype.str}, {'values': series.to_numpy().view('i8')}
+    if dtype == object or pd.api.types.is_string_dtype(dtype):
+        # Dictionary-encode text; restored as its original dtype
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        return (
+            {'kind': 'text', 'dtype': str(dtype), 'categories': _json_categories(pd.Index(uniques))},
+            {'codes': codes.astype(np.int32, copy=False)},
+        )
+    raise SnapshotError(f'Unsupported column dtype {dtype} for {series.name!r}')
+
+
+def _decode_column(spec: dict, arrays: Dict[str, np.ndarray]):
+    kind = spec['kind']
+    # Plain ndarray views of the memmaps: still file-backed, but pandas treats them like any array
+    arrays = {name: np.asarray(array) for name, array in arrays.items()}
+    if kind == 'categorical':
+        dtype = pd.CategoricalDtype(spec['categories'], ordered=spec['ordered'])
+        return pd.Categorical.from_codes(arrays['codes'], dtype=dtype, validate=False)
+    if kind == 'masked':
+        return MASKED_ARRAYS[spec['array']](arrays['values'], arrays['mask'])
+    if kind == 'numeric':
+        return arrays['values']
+    if kind == 'datetime':
+        return arrays['values'].view(spec['dtype'])
+    if kind == 'text':
+        values = np.asarray(spec['categories'] + [None], dtype=object).take(arrays['codes'])  # -1 -> None
+        return values if spec['dtype'] == 'object' else pd.array(values, dtype=spec['dtype'])
+    raise SnapshotError(f'Unknown column kind {kind!r}')
+
+
+# =================================================================
+# Snapshot Store
+# =================================================================
+
+class FrameSnapshotStore:
+    """
+    Service for writing and memory-mapping generation-numbered snapshots.
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+
+    @property
+    def root(self) -> Path:
+        return Path(self._root or settings.ANALYST_SNAPSHOT_DIR)
+
+    # =================================================================
+    # Public API
+    # =================================================================
+
+    def generation(self, key: str) -> int:
+        """Current published generation for key (0 = none)"""
+        try:
+            return int((self._key_dir(key) / 'CURRENT').read_text().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def save(self, key: str, frames: Dict[str, pd.DataFrame], meta: Optional[dict] = None) -> int:
+        """
+        Write frames as the next generation and publish it.
+        Returns the new generation number.
+        """
+        key_dir = self._key_dir(key)
+        key_dir.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix='.staging-', dir=key_dir))
+        try:
+            manifest = {'format': FORMAT_VERSION, 'meta': meta or {}, 'frames': {}}
+            for name, df in frames.items():
+                manifest['frames'][name] = self._write_frame(staging, name, df)
+            (staging / 'manifest.json').write_text(json.dumps(manifest, default=str))
+
+            # Another worker may publish concurrently; take the next free generation
+            generation = self.generation(key)
+            while True:
+                generation += 1
+                try:
+                    os.rename(staging, key_dir / f'gen-{generation}')
+                    break
+                except OSError:
+                    if not (key_dir / f'gen-{generation}').exists():
+                        raise
+            self._publish(key_dir, generation)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self._prune(key_dir, generation)
+        logger.info(f"Snapshot {key} generation {generation} written")
+        return generation
+
+    def load(self, key: str) -> Optional[Snapshot]:
+        """Memory-map the current generation, or None if there is none"""
+        generation = self.generation(key)
+        if not generation:
+            return None
+        gen_dir = self._key_dir(key) / f'gen-{generation}'
+        try:
+            manifest = json.loads((gen_dir / 'manifest.json').read_text())
+            if manifest.get('format') != FORMAT_VERSION:
+                return None
+            frames = {
+                name: self._read_frame(gen_dir, name, frame_spec)
+                for name, frame_spec in manifest['frames'].items()
+            }
+        except (OSError, ValueError, KeyError, SnapshotError) as e:
+            logger.warning(f"Snapshot {key} generation {generation} unreadable: {e}")
+            return None
+        return Snapshot(key=key, generation=generation, frames=frames, meta=manifest['meta'])
+
+    def delete(self, key: str) -> None:
+        shutil.rmtree(self._key_dir(key), ignore_errors=True)
+
+    def read_csv(self, path, **kwargs) -> pd.DataFrame:
+        """
+        pd.read_csv through a snapshot keyed by the file's path, size and
+        mtime, so each CSV is parsed once per change rather than per worker.
+        """
+        path = Path(path)
+        stat = path.stat()
+        signature = f'{stat.st_size}:{stat.st_mtime_ns}'
+        key = 'csv-' + re.sub(r'[^A-Za-z0-9]+', '_', str(path.resolve())).strip('_')
+
+        snapshot = self.load(key)
+        if snapshot is not None and snapshot.meta.get('signature') == signature:
+            return snapshot.frames['data']
+
+        df = pd.read_csv(path, **kwargs)
+        try:
+            self.save(key, {'data': df}, {'signature': signature, 'path': str(path)})
+        except (OSError, SnapshotError) as e:
+            logger.warning(f"Could not snapshot {path}: {e}")
+        return df
+
+    # =================================================================
+    # Helpers
+    # =================================================================
+
+    def _key_dir(self, key: str) -> Path:
+        if not re.fullmatch(r'[A-Za-z0-9_.-]+', key) or key.startswith('.'):
+            raise ValueError(f'Invalid snapshot key {key!r}')
+        return self.root / key
+
+    def _write_frame(self, directory: Path, name: str, df: pd.DataFrame) -> dict:
+        if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+            raise SnapshotError(f'Frame {name!r} must have a default RangeIndex')
+        columns = []
+        for position, column in enumerate(df.columns):
+            spec, arrays = _encode_column(df.iloc[:, position])
+            spec['name'] = column
+            spec['files'] = {}
+            for suffix, array in arrays.items():
+                filename = f'{name}.{position}.{suffix}.npy'
+                np.save(directory / filename, np.ascontiguousarray(array), allow_pickle=False)
+                spec['files'][suffix] = filename
+            columns.append(spec)
+        return {'rows': len(df), 'columns': columns}
+
+    def _read_frame(self, directory: Path, name: str, frame_spec: dict) -> pd.DataFrame:
+        data = {}
+        for spec in frame_spec['columns']:
+            arrays = {
+                suffix: np.load(directory / filename, mmap_mode='c', allow_pickle=False)
+                for suffix, filename in spec['files'].items()
+            }
+            data[spec['name']] = _decode_column(spec, arrays)
+        if not data:
+            return pd.DataFrame(index=pd.RangeIndex(frame_spec['rows']))
+        # copy=False keeps each column backed by its mapped file
+        return pd.DataFrame(data, copy=False)
+
+    def _publish(self, key_dir: Path, generation: int) -> None:
+        fd, tmp = tempfile.mkstemp(prefix='.CURRENT-', dir=key_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(generation))
+        # Never move CURRENT backwards if a newer generation won the race
+        if self.generation(key_dir.name) > generation:
+            os.unlink(tmp)
+            return
+        os.replace(tmp, key_dir / 'CURRENT')
+
+    def _prune(self, key_dir: Path, current: int) -> None:
+        for path in key_dir.glob('gen-*'):
+            try:
+                generation = int(path.name[4:])
+            except ValueError:
+                continue
+            if generation <= current - KEEP_GENERATIONS:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+_store_instance: Optional[FrameSnapshotStore] = None
+
+
+def get_snapshot_store() -> FrameSnapshotStore:
+    """Get or create the global snapshot store"""
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = FrameSnapshotStore()
+    return _store_instance
@@ -0,0 +1,304 @@
+"""
+IMAP Sync
+=========
+Batched, resumable IMAP to Email synchronisation.
+
+Each account folder keeps a watermark in EmailFolderState: the folder's
+UIDVALIDITY and the highest UID stored. A sync searches for UIDs above the
+watermark and processes them in ascending batches:
+
+1. one UID FETCH of the headers for the whole batch
+2. one query for the Message-IDs already stored
+3. one UID FETCH of the full message, for new UIDs only
+4. bulk_create of emails and attachments and the watermark advanced in one
+   transaction
+
+An interrupted sync resumes after the last committed batch. A UIDVALIDITY
+change (mailbox rebuilt on the server) resets the watermark; Message-ID
+dedupe keeps the re-scan from creating duplicates.
+"""
+
+import imaplib
+import logging
+import re
+from email.parser import BytesHeaderParser
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from ai_assistants.models import Email, EmailAccount, EmailAttachment, EmailFolderState
+
+logger = logging.getLogger(__name__)
+
+UID_PATTERN = re.compile(rb'UID (\d+)')
+
+HEADER_ITEMS = '(UID BODY.PEEK[HEADER])'
+MESSAGE_ITEMS = '(UID BODY.PEEK[])'
+
+
+class ImapSyncError(Exception):
+    """Raised when the IMAP server rejects a sync command"""
+    pass
+
+
+# =================================================================
+# IMAP Helpers
+# =================================================================
+
+def uid_set(uids: Iterable[int]) -> str:
+    """Compact UID set for a command, e.g. [1, 2, 3, 7] -> '1:3,7'"""
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(a) if a == b else f'{a}:{b}' for a, b in ranges)
+
+
+def parse_fetch_response(data) -> Dict[int, bytes]:
+    """Map UID -> literal from an imaplib UID FETCH response"""
+    results = {}
+    pending = None  # literal whose UID item came after it
+    for item in data or []:
+        if isinstance(item, tuple):
+            match = UID_PATTERN.search(item[0])
+            if match:
+                results[int(match.group(1))] = item[1]
+                pending = None
+            else:
+                pending = item[1]
+        elif isinstance(item, bytes) and pending is not None:
+            match = UID_PATTERN.search(item)
+            if match:
+                results[int(match.group(1))] = pending
+            pending = None
+    return results
+
+
+def fetch_uids(mail, uids: Sequence[int], items: str, batch_size: int = 200) -> Dict[int, bytes]:
+    """UID FETCH items for uids, one command per batch"""
+    results = {}
+    uids = list(uids)
+    for start in range(0, len(uids), batch_size):
+        status, data = mail.uid('FETCH', uid_set(uids[start:start + batch_size]), items)
+        if status != 'OK':
+            raise ImapSyncError(f'UID FETCH failed: {data}')
+        results.update(parse_fetch_response(data))
+    return results
+
+
+def search_uids(mail, *criteria: str) -> List[int]:
+    """UID SEARCH, ascending"""
+    status, data = mail.uid('SEARCH', None, *criteria)
+    if status != 'OK':
+        raise ImapSyncError(f'UID SEARCH failed: {data}')
+    return sorted(int(uid) for uid in (data[0] or b'').split())
+
+
+def quote_folder(folder: str) -> str:
+    if folder.startswith('"') or not re.search(r'[\s"()]', folder):
+        return folder
+    return '"' + folder.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+# =================================================================
+# Storing Messages
+# =================================================================
+
+def build_email(account: EmailAccount, data: Dict, message_key: str) -> Tuple[Email, List[EmailAttachment]]:
+    """Unsaved Email and EmailAttachment rows for a parsed message"""
+    email_obj = Email(
+        account=account,
+        from_address=data["from_address"],
+        from_name=data.get("from_name", ""),
+        to_addresses=data.get("to_addresses", []),
+        cc_addresses=data.get("cc_addresses", []),
+        subject=(data.get("subject") or "")[:500],
+        body_text=data.get("body_text", ""),
+        body_html=data.get("body_html", ""),
+        thread_id=message_key,
+        received_at=data.get("received_at") or timezone.now(),
+        status="RECEIVED",
+        is_read=False,
+        has_attachments=bool(data.get("attachments")),
+    )
+    attachments = []
+    for att_data in data.get("attachments", []):
+        content = att_data.get("content") or b""
+        filename = att_data.get("filename", "attachment")
+        attachments.append(EmailAttachment(
+            email=email_obj,
+            filename=filename,
+            content_type=att_data.get("content_type", "application/octet-stream"),
+            file=ContentFile(content, name=filename),
+            size=len(content),
+        ))
+    return email_obj, attachments
+
+
+def existing_message_keys(account: EmailAccount, keys: Iterable[str]) -> Set[str]:
+    """Message keys (stored in Email.thread_id) the account already has"""
+    keys = set(keys)
+    if not keys:
+        return set()
+    return set(
+        Email.objects.filter(account=account, thread_id__in=keys).values_list('thread_id', flat=True)
+    )
+
+
+def store_emails(account: EmailAccount, messages: Dict[str, Dict]) -> int:
+    """bulk_create messages (message key -> parsed email). Returns the number created."""
+    emails, attachments = [], []
+    for key, data in messages.items():
+        email_obj, email_attachments = build_email(account, data, key)
+        emails.append(email_obj)
+        attachments.extend(email_attachments)
+    Email.objects.bulk_create(emails)
+    EmailAttachment.objects.bulk_create(attachments)
+    return len(emails)
+
+
+# =================================================================
+# Sync Service
+# =================================================================
+
+class ImapSyncService:
+    """
+    Service for syncing IMAP folders into Email rows.
+    connect() returns an imaplib.IMAP4-compatible client (not yet logged in),
+    so tests can point the service at a fake server.
+    """
+
+    BATCH_SIZE = 200
+    TIMEOUT = 30
+
+    def __init__(self, account: EmailAccount, connect: Optional[Callable] = None, batch_size: int = None):
+        self.account = account
+        self.connect = connect or self._connect_ssl
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.stats: Dict = {}
+
+    def _connect_ssl(self):
+        return imaplib.IMAP4_SSL(self.account.imap_host, self.account.imap_port, timeout=self.TIMEOUT)
+
+    # =================================================================
+    # Public API
+    # =================================================================
+
+    def sync(self, folders: Sequence[str] = ('INBOX',), limit: Optional[int] = None) -> Dict:
+        """
+        Sync new messages of each folder over one connection.
+        limit caps messages per folder per call; the rest are reported as remaining.
+        """
+        # Kept on the service so callers can report progress if the sync fails
+        self.stats = stats = {'fetched': 0, 'created': 0, 'updated': 0, 'errors': 0, 'remaining': 0}
+        mail = self.connect()
+        try:
+            mail.login(self.account.smtp_user or self.account.email_address, self.account.smtp_password)
+            for folder in folders:
+                self.sync_folder(mail, folder, limit, stats)
+        finally:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+        return stats
+
+    def sync_folder(self, mail, folder: str, limit: Optional[int], stats: Dict) -> None:
+        status, data = mail.select(quote_folder(folder), readonly=True)
+        if status != 'OK':
+            raise ImapSyncError(f'Cannot select folder {folder}: {data}')
+        uid_validity = self._uid_validity(mail)
+
+        state, _ = EmailFolderState.objects.get_or_create(account=self.account, folder=folder)
+        if state.uid_validity != uid_validity:
+            if state.uid_validity is not None:
+                logger.info(f"UIDVALIDITY of {self.account.email_address}/{folder} changed, rescanning")
+            state.uid_validity = uid_validity
+            state.last_uid = 0
+            state.save(update_fields=['uid_validity', 'last_uid', 'updated_at'])
+
+        # "n:*" always matches the highest UID, even when it is below n
+        uids = [uid for uid in search_uids(mail, f'UID {state.last_uid + 1}:*') if uid > state.last_uid]
+        if limit and len(uids) > limit:
+            if state.last_uid == 0:
+                # First sync: start from the most recent messages
+                uids = uids[-limit:]
+            else:
+                stats['remaining'] += len(uids) - limit
+                uids = uids[:limit]
+
+        # After a failed message the watermark stays below it, so it is retried next sync
+        failed = False
+        for start in range(0, len(uids), self.batch_size):
+            batch = uids[start:start + self.batch_size]
+            failed = self._sync_batch(mail, folder, state, batch, stats, advance=not failed) or failed
+
+        state.last_synced_at = timezone.now()
+        state.save(update_fields=['last_synced_at', 'updated_at'])
+
+    # =================================================================
+    # Helpers
+    # =================================================================
+
+    def _uid_validity(self, mail) -> int:
+        _, data = mail.response('UIDVALIDITY')
+        try:
+            return int(data[-1])
+        except (TypeError, ValueError, IndexError):
+            return 0
+
+    def _sync_batch(self, mail, folder: str, state: EmailFolderState, uids: List[int], stats: Dict,
+                    advance: bool = True) -> bool:
+        """
+        Store the new messages among uids. With advance, the watermark moves
+        to the last uid, or to just below the first one that failed.
+        Returns whether any message failed.
+        """
+        from ai_assistants.services.email_service import _parse_email
+
+        # Headers first, so bodies are only pulled for messages not stored yet
+        keys = {}
+        for uid, raw in fetch_uids(mail, uids, HEADER_ITEMS, self.batch_size).items():
+            message_id = (BytesHeaderParser().parsebytes(raw).get('Message-ID') or '').strip()
+            keys[uid] = message_id or f'imap:{folder}:{state.uid_validity}:{uid}'
+        stats['fetched'] += len(keys)
+        stats['errors'] += len(uids) - len(keys)
+        failed = [uid for uid in uids if uid not in keys]
+
+        known = existing_message_keys(self.account, keys.values())
+        new = {}
+        for uid, key in keys.items():
+            if key not in known:
+                new[uid] = key
+                known.add(key)  # same message twice in one folder
+        bodies = fetch_uids(mail, list(new), MESSAGE_ITEMS, self.batch_size) if new else {}
+
+        messages = {}
+        for uid, key in new.items():
+            parsed = _parse_email(bodies[uid]) if uid in bodies else None
+            if parsed is None:
+                stats['errors'] += 1
+                failed.append(uid)
+                continue
+            messages[key] = parsed
+
+        with transaction.atomic():
+            locked = EmailFolderState.objects.select_for_update().get(pk=state.pk)
+            # A concurrent sync of the same folder may have stored some meanwhile
+            stored_meanwhile = existing_message_keys(self.account, messages)
+            for key in stored_meanwhile:
+                del messages[key]
+            created = store_emails(self.account, messages)
+            if advance:
+                watermark = min(failed) - 1 if failed else uids[-1]
+                locked.last_uid = max(locked.last_uid, watermark)
+                locked.save(update_fields=['last_uid', 'updated_at'])
+        state.last_uid = locked.last_uid
+
+        stats['created'] += created
+        stats['updated'] += len(keys) - len(new) + len(stored_meanwhile)
+        return bool(failed)
@@ -6,6 +6,7 @@ Features / 功能:
 - Auto-create JournalEntry from Receipt / 從收據自動建立分錄
 - Smart account mapping / 智能科目對應
 - Batch processing / 批量處理
+- Set-based bulk approval / 批量核准 (bulk_approve_receipts)
 - Approval workflow / 審批流程
 """
 
@@ -14,6 +15,7 @@ from datetime import datetime, date
 from decimal import Decimal
 from typing import Optional, List, Dict, Any, Tuple
 from django.db import transaction
+from django.db.models.functions import Length
 from django.utils import timezone
 from django.conf import settings
 
@@ -21,6 +23,7 @@ from accounting.models import (
     Account, 
     JournalEntry, 
     JournalEntryLine,
+    JournalEntrySequence,
     FiscalYear,
     AccountingPeriod,
     TransactionStatus,
@@ -29,6 +32,8 @@ from accounting.models import (
     Contact,
     Expense,
 )
+from accounting.services.balance_posting import BalancePostingService
+from core.tenants.managers import get_current_tenant
 from ai_assistants.models import Receipt, ReceiptStatus, ExpenseCategory
 
 
@@ -246,15 +251,7 @@ class JournalEntryService:
         Generate unique journal entry number
         生成唯一分錄編號
         """
-        today = datetime.now()
-        prefix = f"JE-{today.strftime('%Y%m%d')}"
-        
-        # Get today's count
-        count = JournalEntry.objects.filter(
-            entry_number__startswith=prefix
-        ).count()
-        
-        return f"{prefix}-{(count + 1):04d}"
+        return self.allocate_entry_numbers(1)[0]
     
     @transaction.atomic
     def create_journal_entry_from_receipt(
@@ -370,17 +367,12 @@ class JournalEntryService:
             }
             receipt.save()
             
-            # Auto-post if requested
+            # Auto-post if requested (updates status and account balances)
             if auto_post:
-                journal_entry.status = TransactionStatus.POSTED.value
-                journal_entry.posted_at = timezone.now()
-                journal_entry.save()
+                self._update_account_balances(journal_entry)
                 
                 receipt.status = ReceiptStatus.POSTED
                 receipt.save()
-                
-                # Update account balances
-                self._update_account_balances(journal_entry)
             
             return journal_entry, None
             
@@ -389,20 +381,13 @@ class JournalEntryService:
     
     def _update_account_balances(self, journal_entry: JournalEntry):
         """
-        Update account current balances after posting
-        過帳後更新科目餘額
+        Post the entry and update account current balances
+        過帳並更新科目餘額
+        
+        Delegates to BalancePostingService which applies per-account deltas
+        in a single locked UPDATE. Returns False if already posted.
         """
-        for line in journal_entry.lines.all():
-            account = line.account
-            
-            # Assets and Expenses increase with debits
-            if account.is_debit_positive:
-                account.current_balance += line.debit - line.credit
-            else:
-                # Liabilities, Equity, Revenue increase with credits
-                account.current_balance += line.credit - line.debit
-            
-            account.save()
+        return BalancePostingService().post(journal_entry)
     
     @transaction.atomic
     def approve_and_create_journal(
@@ -469,6 +454,227 @@ class JournalEntryService:
         
         return results
     
+    # -------------------------------------------------------------------------
+    # Bulk approval / 批量核准
+    # -------------------------------------------------------------------------
+    
+    @transaction.atomic
+    def allocate_entry_numbers(self, count: int) -> List[str]:
+        """
+        Reserve a block of consecutive entry numbers for today
+        一次配發今日的連續分錄編號
+        
+        Takes the current tenant's JournalEntrySequence row for the day with
+        select_for_update; the lock is held until the caller's transaction
+        commits, so concurrent allocations of the same tenant queue up and a
+        rolled back chunk hands its numbers back. Other tenants number
+        independently. Call it inside the transaction that creates the entries.
+        """
+        tenant = get_current_tenant()
+        prefix = f"JE-{datetime.now().strftime('%Y%m%d')}"
+        sequence, _ = JournalEntrySequence.all_objects.get_or_create(
+            tenant=tenant, prefix=prefix,
+            defaults={'last_number': self._last_entry_number(prefix)},
+        )
+        sequence = JournalEntrySequence.all_objects.select_for_update().get(pk=sequence.pk)
+        start = sequence.last_number + 1
+        sequence.last_number += count
+        sequence.save(update_fields=['last_number', 'updated_at'])
+        return [f"{prefix}-{number:04d}" for number in range(start, start + count)]
+    
+    def _last_entry_number(self, prefix: str) -> int:
+        """Highest numeric suffix the current tenant already used with prefix (seeds a new sequence)"""
+        last = (
+            JournalEntry.objects
+            .filter(entry_number__regex=rf'^{prefix}-[0-9]+$')
+            .order_by(Length('entry_number').desc(), '-entry_number')
+            .values_list('entry_number', flat=True)
+            .first()
+        )
+        return int(last.rsplit('-', 1)[1]) if last else 0
+    
+    def resolve_accounts(self, receipts: List[Receipt]) -> Dict[str, Dict[str, Optional[Account]]]:
+        """
+        Resolve expense/payment/tax accounts once per distinct key
+        每個分類、付款方式只查詢一次科目
+        """
+        accounts = {'expense': {}, 'payment': {}, 'tax': None}
+        for receipt in receipts:
+            if receipt.category not in accounts['expense']:
+                accounts['expense'][receipt.category] = self.get_expense_account(receipt.category)
+            if receipt.payment_method not in accounts['payment']:
+                accounts['payment'][receipt.payment_method] = self.get_payment_account(receipt.payment_method)
+        if any(receipt.tax_amount and receipt.tax_amount > 0 for receipt in receipts):
+            accounts['tax'] = self.get_tax_account()
+        return accounts
+    
+    def bulk_approve_receipts(
+        self,
+        receipts: List[Receipt],
+        user,
+        notes: str = '',
+        auto_post: bool = False,
+        chunk_size: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Approve receipts and create their journal entries set-based
+        批量核准收據並建立分錄
+        
+        Accounts, fiscal year and periods are resolved once; each chunk
+        allocates its block of entry numbers inside its own transaction,
+        bulk-creates its entries and lines, updates its receipts and
+        (auto_post) posts through BalancePostingService.post_many, one UPDATE
+        for all touched accounts. Chunks commit separately; a failing chunk is
+        retried one receipt at a time through approve_and_create_journal so
+        errors are per receipt.
+        
+        Returns the same shape as batch_create_journal_entries.
+        """
+        self.user = user
+        chunk_size = chunk_size or settings.JOURNAL_BULK_CHUNK_SIZE
+        results = {
+            'success': [],
+            'failed': [],
+            'total': len(receipts),
+        }
+        
+        accounts = self.resolve_accounts(receipts)
+        fiscal_year = self.get_current_fiscal_year()
+        periods = {}
+        
+        valid = []
+        for receipt in receipts:
+            if not receipt.total_amount or receipt.total_amount <= 0:
+                error = "Receipt total amount is invalid"
+            elif not accounts['expense'][receipt.category]:
+                error = f"Could not find/create expense account for category: {receipt.category}"
+            elif not accounts['payment'][receipt.payment_method]:
+                error = f"Could not find/create payment account for method: {receipt.payment_method}"
+            else:
+                entry_date = receipt.receipt_date or timezone.now().date()
+                month = (entry_date.year, entry_date.month)
+                if month not in periods:
+                    periods[month] = self.get_accounting_period(entry_date)
+                valid.append(receipt)
+                continue
+            results['failed'].append({'receipt_id': str(receipt.id), 'error': error})
+        
+        for start in range(0, len(valid), chunk_size):
+            chunk_receipts = valid[start:start + chunk_size]
+            try:
+                with transaction.atomic():
+                    chunk = list(zip(chunk_receipts, self.allocate_entry_numbers(len(chunk_receipts))))
+                    entries = self._bulk_create_chunk(chunk, accounts, fiscal_year, periods, notes, auto_post)
+            except Exception:
+                # Isolate the failing receipt(s); the others still go through.
+                # The rolled back chunk already changed these objects, so start from the rows
+                fresh = Receipt.objects.in_bulk([receipt.pk for receipt in chunk_receipts])
+                for receipt in chunk_receipts:
+                    receipt = fresh.get(receipt.pk, receipt)
+                    journal_entry, error = self.approve_and_create_journal(receipt, user, notes, auto_post)
+                    if error:
+                        results['failed'].append({'receipt_id': str(receipt.id), 'error': error})
+                    else:
+                        results['success'].append({
+                            'receipt_id': str(receipt.id),
+                            'journal_entry_id': str(journal_entry.id),
+                            'entry_number': journal_entry.entry_number,
+                        })
+                continue
+            
+            for receipt, journal_entry in zip(chunk_receipts, entries):
+                results['success'].append({
+                    'receipt_id': str(receipt.id),
+                    'journal_entry_id': str(journal_entry.id),
+                    'entry_number': journal_entry.entry_number,
+                })
+        
+        results['success_count'] = len(results['success'])
+        results['failed_count'] = len(results['failed'])
+        
+        return results
+    
+    def _bulk_create_chunk(self, chunk, accounts, fiscal_year, periods, notes, auto_post) -> List[JournalEntry]:
+        """Create, link and optionally post the entries of one chunk"""
+        now = timezone.now()
+        entries, lines = [], []
+        for receipt, entry_number in chunk:
+            vendor = receipt.vendor_name or 'Unknown'
+            entry_date = receipt.receipt_date or now.date()
+            total_amount = Decimal(str(receipt.total_amount))
+            tax_amount = Decimal(str(receipt.tax_amount or 0))
+            
+            journal_entry = JournalEntry(
+                entry_number=entry_number,
+                date=entry_date,
+                description=f"費用 - {vendor} / Expense - {vendor}",
+                reference=receipt.receipt_number or str(receipt.id),
+                fiscal_year=fiscal_year,
+                period=periods[(entry_date.year, entry_date.month)],
+                status=TransactionStatus.DRAFT.value,
+                created_by=self.user or receipt.uploaded_by,
+                total_debit=total_amount,
+                total_credit=total_amount,
+            )
+            entry_lines = [JournalEntryLine(
+                journal_entry=journal_entry,
+                account=accounts['expense'][receipt.category],
+                description=f"{vendor} - {receipt.category}",
+                debit=total_amount - tax_amount,
+                credit=Decimal('0.00'),
+            )]
+            if tax_amount > 0 and accounts['tax']:
+                entry_lines.append(JournalEntryLine(
+                    journal_entry=journal_entry,
+                    account=accounts['tax'],
+                    description=f"VAT on {vendor}",
+                    debit=tax_amount,
+                    credit=Decimal('0.00'),
+                ))
+            entry_lines.append(JournalEntryLine(
+                journal_entry=journal_entry,
+                account=accounts['payment'][receipt.payment_method],
+                description=f"Payment to {vendor}",
+                debit=Decimal('0.00'),
+                credit=total_amount,
+            ))
+            
+            entries.append(journal_entry)
+            lines.extend(entry_lines)
+            receipt.journal_entry = journal_entry
+            receipt.journal_entry_data = {
+                'journal_entry_id': str(journal_entry.id),
+                'entry_number': entry_number,
+                'date': str(entry_date),
+                'total_debit': float(total_amount),
+                'total_credit': float(total_amount),
+                'status': journal_entry.status,
+                'lines': [
+                    {
+                        'account_code': line.account.code,
+                        'account_name': line.account.name,
+                        'debit': float(line.debit),
+                        'credit': float(line.credit),
+                    }
+                    for line in entry_lines
+                ]
+            }
+            receipt.status = ReceiptStatus.POSTED if auto_post else ReceiptStatus.APPROVED
+            receipt.reviewed_by = self.user
+            receipt.reviewed_at = now
+            receipt.notes = notes
+            receipt.updated_at = now
+        
+        JournalEntry.objects.bulk_create(entries)
+        JournalEntryLine.objects.bulk_create(lines)
+        Receipt.objects.bulk_update(
+            [receipt for receipt, _ in chunk],
+            ['journal_entry', 'journal_entry_data', 'status', 'reviewed_by', 'reviewed_at', 'notes', 'updated_at'],
+        )
+        if auto_post:
+            BalancePostingService().post_many(entries)
+        return entries
+    
     @transaction.atomic
     def post_journal_entry(self, journal_entry: JournalEntry, user) -> Tuple[bool, Optional[str]]:
         """
@@ -484,15 +690,14 @@ class JournalEntryService:
             if journal_entry.status == TransactionStatus.POSTED.value:
                 return False, "Journal entry is already posted"
             
-            # Update status
-            journal_entry.status = TransactionStatus.POSTED.value
+            # Record approval
             journal_entry.approved_by = user
             journal_entry.approved_at = timezone.now()
-            journal_entry.posted_at = timezone.now()
-            journal_entry.save()
+            journal_entry.save(update_fields=['approved_by', 'approved_at', 'updated_at'])
             
-            # Update account balances
-            self._update_account_balances(journal_entry)
+            # Update status and account balances
+            if not self._update_account_balances(journal_entry):
+                return False, "Journal entry is already posted or voided"
             
             # Update linked receipt if exists
             linked_receipts = Receipt.objects.filter(journal_entry=journal_entry)
@@ -510,22 +715,10 @@ class JournalEntryService:
         作廢分錄
         """
         try:
-            # If posted, reverse the account balances
-            if journal_entry.status == TransactionStatus.POSTED.value:
-                for line in journal_entry.lines.all():
-                    account = line.account
-                    
-                    # Reverse the balance update
-                    if account.is_debit_positive:
-                        account.current_balance -= line.debit - line.credit
-                    else:
-                        account.current_balance -= line.credit - line.debit
-                    
-                    account.save()
-            
-            # Update status
-            journal_entry.status = TransactionStatus.VOIDED.value
-            journal_entry.save()
+            # If posted, reverse the account balances (also marks it voided)
+            if not BalancePostingService().void(journal_entry):
+                journal_entry.status = TransactionStatus.VOIDED.value
+                journal_entry.save()
             
             # Update linked receipt
             linked_receipts = Receipt.objects.filter(journal_entry=journal_entry)
@@ -554,6 +747,14 @@ def approve_receipt_with_journal(receipt: Receipt, user, notes: str = '', auto_p
     return service.approve_and_create_journal(receipt, user, notes, auto_post)
 
 
+def bulk_approve_receipts(receipts: List[Receipt], user, notes: str = '', auto_post: bool = False) -> Dict[str, Any]:
+    """
+    Convenience function for set-based bulk approval with journal creation
+    """
+    service = JournalEntryService(user=user)
+    return service.bulk_approve_receipts(receipts, user, notes, auto_post)
+
+
 def batch_create_journals(receipts: List[Receipt], user=None, auto_post: bool = False) -> Dict[str, Any]:
     """
     Convenience function for batch journal creation
@@ -6,11 +6,12 @@ import pandas as pd
 import plotly.express as px
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
-from openai import OpenAI
+from core.libs.ai_service import cached_completion, get_llm_client
 from collections import Counter
 from django.conf import settings
 from django.utils import timezone
 from ai_assistants.agents.query_classifier_agent import classify_planner_query
+from ai_assistants.services.frame_snapshots import get_snapshot_store
 from ai_assistants.agents.prompts import (
     get_data_manipulation_prompt,
     get_data_visualization_prompt,
@@ -18,7 +19,6 @@ from ai_assistants.agents.prompts import (
 )
 
 logger = logging.getLogger(__name__)
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
 dataframe_cache = {}
 
 
@@ -91,7 +91,7 @@ Additional context: {json.dumps(context or {}, ensure_ascii=False)}
 
 Extract all tasks and provide the JSON response."""
 
-        response = client.chat.completions.create(
+        response = get_llm_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -248,7 +248,7 @@ Today's date: {today}
 
 Provide new priority scores (0-100) and reasoning for each task."""
 
-        response = client.chat.completions.create(
+        response = get_llm_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -332,7 +332,7 @@ Planning horizon: 14 days
 
 Create an optimal schedule."""
 
-        response = client.chat.completions.create(
+        response = get_llm_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -352,7 +352,12 @@ Create an optimal schedule."""
 
 def load_all_datasets():
     try:
-        dataframe_cache["planner_data"] = pd.read_csv("ai_assistants/data/planner_data.csv")
+        path = "ai_assistants/data/planner_data.csv"
+        if settings.ANALYST_SNAPSHOTS_ENABLED:
+            # Parsed once per CSV change and memory-mapped by every other worker
+            dataframe_cache["planner_data"] = get_snapshot_store().read_csv(path)
+        else:
+            dataframe_cache["planner_data"] = pd.read_csv(path)
 
         return {
             "message": "Planner dataset loaded successfully",
@@ -512,7 +517,8 @@ def generate_response(query, data: pd.DataFrame, query_type: str):
     prompt += f"\nDataset Columns: {columns}\nQuery: \"{query}\"\nProvide only the correct response in JSON format."
 
     try:
-        response = client.chat.completions.create(
+        response = cached_completion(
+            get_llm_client(),
             model="gpt-4o-mini",
             messages=[{"role": "system", "content": prompt}],
             max_tokens=500,
@@ -6,8 +6,7 @@ Provides document retrieval and context injection for AI responses.
 """
 
 import logging
-from typing import List, Dict, Optional, Any
-from django.db.models import Q
+from typing import List, Dict, Any
 
 logger = logging.getLogger('analyst.rag')
 
@@ -22,53 +21,48 @@ def get_relevant_documents(
     Retrieve relevant documents for a query.
     檢索與查詢相關的文件。
     
-    Uses keyword matching and document metadata to find relevant context.
+    Searches the document chunk index (see document_index.py): the user's
+    own documents plus public ones, ranked by BM25 / ts_rank, with the
+    excerpt taken from the best matching chunk.
     
     Args:
         user_id: The user's ID for filtering documents
         query: The search query
         max_docs: Maximum number of documents to return
-        min_relevance: Minimum relevance score (0-1)
+        min_relevance: Minimum relevance score (0-1), relative to the best hit
     
     Returns:
         List of relevant document summaries with context
     """
     try:
         from ai_assistants.models import AIDocument
+        from ai_assistants.services.document_index import DocumentIndexService
         
-        # Tokenize query into keywords
-        query_lower = query.lower()
-        keywords = [w for w in query_lower.split() if len(w) > 2]
-        
-        # Build query filter
-        # Filter by user or public documents
-        base_query = Q(uploaded_by_id=user_id) | Q(tags__contains=['public'])
-        
-        # Text search filter
-        text_filter = Q()
-        for keyword in keywords[:10]:  # Limit keywords
-            text_filter |= (
-                Q(title__icontains=keyword) |
-                Q(extracted_text__icontains=keyword) |
-                Q(ai_summary__icontains=keyword) |
-                Q(ai_keywords__contains=[keyword])
-            )
-        
-        if not text_filter:
+        hits = DocumentIndexService().search(user_id, query, limit=max_docs * 2)
+        if not hits:
             return []
         
-        # Query documents
-        documents = AIDocument.objects.filter(
-            base_query & text_filter,
-            is_active=True,
-            extracted_text__isnull=False,
-        ).order_by('-created_at')[:max_docs * 2]  # Get more, then score
+        # Only the metadata of the hits is loaded, never the full text
+        documents = {
+            str(doc.id): doc
+            for doc in AIDocument.objects.filter(
+                id__in=[hit.document_id for hit in hits],
+                is_active=True,
+            ).defer('extracted_text', 'search_vector')
+        }
+        
+        # BM25 and ts_rank live on different scales (a single body match
+        # ranks ~0.006 under ts_rank), so scores are taken relative to the
+        # best hit before the threshold is applied
+        top_score = max(hit.score for hit in hits)
         
-        # Score and filter documents
         results = []
-        for doc in documents:
-            score = calculate_relevance_score(doc, keywords)
+        for hit in hits:
+            doc = documents.get(hit.document_id)
+            if doc is None:
+                continue
             
+            score = hit.score / top_score if top_score > 0 else 0.0
             if score >= min_relevance:
                 results.append({
                     'id': str(doc.id),
@@ -76,13 +70,11 @@ def get_relevant_documents(
                     'document_type': doc.document_type,
                     'summary': doc.ai_summary[:500] if doc.ai_summary else '',
                     'keywords': doc.ai_keywords[:10] if doc.ai_keywords else [],
-                    'excerpt': get_relevant_excerpt(doc.extracted_text, keywords),
+                    'excerpt': hit.excerpt,
                     'relevance_score': score,
                     'created_at': doc.created_at.isoformat(),
                 })
         
-        # Sort by relevance and limit
-        results.sort(key=lambda x: x['relevance_score'], reverse=True)
         return results[:max_docs]
         
     except Exception as e:
@@ -90,82 +82,6 @@ def get_relevant_documents(
         return []
 
 
-def calculate_relevance_score(doc, keywords: List[str]) -> float:
-    """
-    Calculate relevance score for a document.
-    計算文件的相關性分數。
-    """
-    score = 0.0
-    
-    title_lower = doc.title.lower()
-    text_lower = (doc.extracted_text or '').lower()
-    summary_lower = (doc.ai_summary or '').lower()
-    doc_keywords = [k.lower() for k in (doc.ai_keywords or [])]
-    
-    for keyword in keywords:
-        # Title match (highest weight)
-        if keyword in title_lower:
-            score += 0.3
-        
-        # Keyword match
-        if keyword in doc_keywords:
-            score += 0.25
-        
-        # Summary match
-        if keyword in summary_lower:
-            score += 0.2
-        
-        # Text match (lower weight due to noise)
-        if keyword in text_lower:
-            score += 0.1
-    
-    # Normalize by keyword count
-    if keywords:
-        score = score / len(keywords)
-    
-    return min(score, 1.0)  # Cap at 1.0
-
-
-def get_relevant_excerpt(text: str, keywords: List[str], max_length: int = 300) -> str:
-    """
-    Extract a relevant excerpt from text.
-    從文本中提取相關摘要。
-    """
-    if not text:
-        return ''
-    
-    text_lower = text.lower()
-    
-    # Find the best starting position
-    best_pos = 0
-    best_score = 0
-    
-    for i, keyword in enumerate(keywords):
-        pos = text_lower.find(keyword)
-        if pos != -1:
-            # Score based on keyword importance (earlier keywords more important)
-            score = 1 / (i + 1)
-            if score > best_score:
-                best_score = score
-                best_pos = max(0, pos - 50)  # Start slightly before keyword
-    
-    # Extract excerpt
-    excerpt = text[best_pos:best_pos + max_length]
-    
-    # Clean up - don't cut in the middle of words
-    if best_pos > 0 and excerpt and excerpt[0] != ' ':
-        space_pos = excerpt.find(' ')
-        if space_pos > 0 and space_pos < 20:
-            excerpt = excerpt[space_pos + 1:]
-    
-    if len(text) > best_pos + max_length:
-        last_space = excerpt.rfind(' ')
-        if last_space > max_length - 50:
-            excerpt = excerpt[:last_space] + '...'
-    
-    return excerpt.strip()
-
-
 def build_rag_context(
     user_id: str,
     query: str,
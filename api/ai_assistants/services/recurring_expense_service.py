@@ -7,15 +7,32 @@ Features / 功能:
 - Predict future expenses / 預測未來費用
 - Auto-categorize recurring items / 自動分類重複項目
 - Generate recurring expense reports / 生成重複費用報表
+
+Detection is vectorized: the (vendor, date, amount, category) columns of
+the receipts are read into one DataFrame via values_list and every
+vendor's intervals, variance and periodicity are computed at once with
+diff/bincount over integer group ids (find_recurring). The resulting
+patterns frame feeds both detect_recurring_expenses and
+predict_future_expenses and is cached per user under a fingerprint of the
+receipts it was computed from, so it is only recomputed after receipts
+change. refresh_tenant warms the cache for
+every member of a tenant from a single ledger query (scheduled daily by
+the refresh_recurring_expenses task).
+
+_analyze_pattern is the per-vendor reference implementation.
 """
 
 import json
-from datetime import datetime, timedelta, date
+from datetime import timedelta, date
 from decimal import Decimal
 from collections import defaultdict
 from typing import Optional, List, Dict, Any, Tuple
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
 from django.db import models
-from django.db.models import Avg, Count, Sum, Q, F
+from django.db.models import Avg, Count, Max, Sum, Q, F
 from django.db.models.functions import TruncMonth, TruncWeek
 from django.utils import timezone
 from django.conf import settings
@@ -32,6 +49,194 @@ class RecurringPattern:
     ANNUAL = 'ANNUAL'
 
 
+# (pattern, expected interval days, tolerance days)
+PATTERN_INTERVALS = [
+    (RecurringPattern.WEEKLY, 7, 2),        # 5-9 days
+    (RecurringPattern.BI_WEEKLY, 14, 3),    # 11-17 days
+    (RecurringPattern.MONTHLY, 30, 5),      # 25-35 days
+    (RecurringPattern.QUARTERLY, 90, 15),   # 75-105 days
+    (RecurringPattern.ANNUAL, 365, 30),     # 335-395 days
+]
+
+# Monthly cost per occurrence amount; other patterns use 30 / interval
+MONTHLY_FACTORS = {
+    RecurringPattern.WEEKLY: 4.33,
+    RecurringPattern.BI_WEEKLY: 2.17,
+    RecurringPattern.MONTHLY: 1,
+    RecurringPattern.QUARTERLY: 1 / 3,
+    RecurringPattern.ANNUAL: 1 / 12,
+}
+
+FRAME_FIELDS = ['id', 'uploaded_by_id', 'vendor_name', 'receipt_date', 'total_amount', 'category']
+
+CACHE_KEY = 'recurring:{user}:{start}:{count}:{updated}'
+
+
+# =================================================================
+# Vectorized Detection
+# =================================================================
+
+def receipt_frame(queryset) -> pd.DataFrame:
+    """Receipt columns needed for detection, read without model instances"""
+    rows = queryset.values_list(*FRAME_FIELDS).iterator(chunk_size=20000)
+    df = pd.DataFrame.from_records(rows, columns=FRAME_FIELDS)
+    df['receipt_date'] = pd.to_datetime(df['receipt_date'])
+    df['amount'] = df.pop('total_amount').astype(float)
+    df['vendor_key'] = df['vendor_name'].str.lower()
+    return df
+
+
+def find_recurring(df: pd.DataFrame, keys=('vendor_key',), min_occurrences: int = 3) -> pd.DataFrame:
+    """
+    Recurring patterns of receipt_frame rows, one row per group of keys
+    (a vendor, or a user and vendor), sorted by confidence.
+    Same rules as RecurringExpenseService._analyze_pattern.
+    """
+    keys = list(keys)
+    columns = [
+        'vendor_name', 'pattern_type', 'average_interval_days', 'average_amount', 'amount_variance',
+        'total_occurrences', 'first_occurrence', 'last_occurrence', 'most_common_category',
+        'confidence', 'estimated_monthly_cost', 'estimated_annual_cost', 'next_expected_date', 'receipt_ids',
+    ]
+    if len(keys) > 1:
+        index = pd.MultiIndex.from_arrays([[]] * len(keys), names=keys)
+    else:
+        index = pd.Index([], name=keys[0])
+    empty = pd.DataFrame(columns=columns, index=index)
+    if df.empty:
+        return empty
+
+    df = df.sort_values(keys + ['receipt_date', 'vendor_name'], kind='mergesort')
+
+    # Integer group ids: rows are sorted by the keys, so a group starts where
+    # any key changes. Every per-group step below is a bincount over these
+    # ids instead of a groupby that factorizes the string keys again.
+    starts = np.zeros(len(df), dtype=bool)
+    starts[0] = True
+    for key in keys:
+        values = df[key].to_numpy()
+        starts[1:] |= values[1:] != values[:-1]
+    group = np.cumsum(starts) - 1
+    keep = (np.bincount(group) >= min_occurrences)[group]
+    df, starts = df[keep], starts[keep]
+    if df.empty:
+        return empty
+    group = np.cumsum(starts) - 1
+    first_row = np.flatnonzero(starts)
+    last_row = np.r_[first_row[1:], len(df)] - 1
+    n_groups = len(first_row)
+
+    def group_mean(ids, values, counts):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.bincount(ids, values, minlength=n_groups) / counts
+
+    # Days between consecutive receipts; same-day repeats do not count
+    dates = df['receipt_date'].to_numpy()
+    days = np.diff(dates).astype('timedelta64[D]').astype(np.int64)
+    valid = (group[1:] == group[:-1]) & (days > 0)
+    interval_group, interval = group[1:][valid], days[valid].astype(float)
+    interval_count = np.bincount(interval_group, minlength=n_groups)
+    mean = group_mean(interval_group, interval, interval_count)
+    variance = group_mean(interval_group, (interval - mean[interval_group]) ** 2, interval_count)
+
+    # Pattern whose range contains the mean interval (the ranges do not overlap)
+    expected = np.full(n_groups, np.nan)
+    tolerance = np.full(n_groups, np.nan)
+    pattern = np.full(n_groups, None, dtype=object)
+    for pattern_type, days_expected, days_tolerance in PATTERN_INTERVALS:
+        hit = np.abs(mean - days_expected) <= days_tolerance
+        expected[hit], tolerance[hit], pattern[hit] = days_expected, days_tolerance, pattern_type
+
+    matched = np.abs(interval - expected[interval_group]) <= tolerance[interval_group]
+    match_ratio = group_mean(interval_group, matched, interval_count)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        consistency = 1 - np.minimum(variance / (expected * 0.3), 1)
+    confidence = np.nan_to_num(consistency * 0.5 + match_ratio * 0.5, nan=0.0)
+    has_pattern = (pattern != None) & (confidence > 0)  # noqa: E711 (elementwise)
+    # Irregular but consistent intervals
+    irregular = ~has_pattern & (variance < mean * 0.2)
+    pattern = np.where(has_pattern, pattern, np.where(irregular, 'IRREGULAR', None))
+    confidence = np.where(has_pattern, confidence, np.where(irregular, 0.6, 0.0))
+    kept = np.flatnonzero(confidence >= 0.5)
+    if not kept.size:
+        return empty
+
+    # Amount consistency over non-zero amounts
+    amount = df['amount'].to_numpy(dtype=float)
+    nonzero = amount != 0
+    amount_group, amount = group[nonzero], amount[nonzero]
+    amount_count = np.bincount(amount_group, minlength=n_groups)
+    average_amount = group_mean(amount_group, amount, amount_count)
+    amount_variance = group_mean(amount_group, (amount - average_amount[amount_group]) ** 2, amount_count)
+
+    # Most frequent category; ties go to the one seen first
+    category_codes, categories = pd.factorize(df['category'], use_na_sentinel=False)
+    cell = group * len(categories) + category_codes
+    counts = np.bincount(cell, minlength=n_groups * len(categories)).reshape(n_groups, len(categories))
+    first_seen = np.full(counts.size, len(df))
+    np.minimum.at(first_seen, cell, np.arange(len(df)))
+    rank = counts * (len(df) + 1) - first_seen.reshape(counts.shape)
+    most_common = np.asarray(categories, dtype=object)[rank.argmax(axis=1)]
+
+    # Last 5 receipt ids of each group, in date order
+    last5 = (np.arange(len(df)) > last_row[group] - 5)
+    ids = df['id'].to_numpy()[last5].tolist()
+    bounds = np.r_[0, np.cumsum(np.bincount(group[last5], minlength=n_groups))]
+    receipt_ids = [ids[bounds[g]:bounds[g + 1]] for g in kept]
+
+    key_values = [df[key].to_numpy()[first_row[kept]] for key in keys]
+    if len(keys) > 1:
+        index = pd.MultiIndex.from_arrays(key_values, names=keys)
+    else:
+        index = pd.Index(key_values[0], name=keys[0])
+    stats = pd.DataFrame({
+        'vendor_name': df['vendor_name'].to_numpy()[first_row[kept]],
+        'pattern_type': pattern[kept],
+        'average_interval_days': mean[kept],
+        'average_amount': np.nan_to_num(average_amount[kept], nan=0.0),
+        'amount_variance': np.nan_to_num(amount_variance[kept], nan=0.0),
+        'total_occurrences': (last_row - first_row + 1)[kept],
+        'first_occurrence': dates[first_row[kept]],
+        'last_occurrence': dates[last_row[kept]],
+        'most_common_category': most_common[kept],
+        'confidence': confidence[kept],
+        'receipt_ids': receipt_ids,
+    }, index=index)
+
+    factor = stats['pattern_type'].map(MONTHLY_FACTORS).fillna(30 / stats['average_interval_days'])
+    stats['estimated_monthly_cost'] = stats['average_amount'] * factor
+    stats['estimated_annual_cost'] = (stats['estimated_monthly_cost'] * 12).round(2)
+    stats['next_expected_date'] = stats['last_occurrence'] + pd.to_timedelta(
+        np.floor(stats['average_interval_days']), unit='D'
+    )
+    stats['confidence'] = stats['confidence'].round(2)
+    return stats.sort_values('confidence', ascending=False, kind='mergesort')[columns]
+
+
+def pattern_records(patterns: pd.DataFrame) -> List[Dict[str, Any]]:
+    """find_recurring rows in the detect_recurring_expenses format"""
+    return [
+        {
+            'vendor_name': row.vendor_name,
+            'pattern_type': row.pattern_type,
+            'average_interval_days': float(row.average_interval_days),
+            'average_amount': round(float(row.average_amount), 2),
+            'amount_variance': round(float(row.amount_variance), 2),
+            'total_occurrences': int(row.total_occurrences),
+            'first_occurrence': str(row.first_occurrence.date()),
+            'last_occurrence': str(row.last_occurrence.date()),
+            'most_common_category': row.most_common_category,
+            'confidence': float(row.confidence),
+            'estimated_monthly_cost': float(row.estimated_monthly_cost),
+            'estimated_annual_cost': float(row.estimated_annual_cost),
+            'next_expected_date': str(row.next_expected_date.date()),
+            'receipt_ids': [str(pk) for pk in row.receipt_ids],
+        }
+        for row in patterns.itertuples(index=False)
+    ]
+
+
 class RecurringExpenseService:
     """
     Service for detecting and managing recurring expenses
@@ -47,34 +252,71 @@ class RecurringExpenseService:
         Detect recurring expenses for a user
         檢測用戶的重複費用
         """
-        start_date = timezone.now().date() - timedelta(days=months * 30)
+        return pattern_records(self.recurring_frame(user, months))
+    
+    def recurring_frame(self, user, months: int = 12) -> pd.DataFrame:
+        """
+        find_recurring patterns of a user's receipts, cached until they change
+        用戶的重複模式（快取）
+        """
+        start_date = self._start_date(months)
+        receipts = self._receipts(start_date).filter(uploaded_by=user)
+        key = self._cache_key(user.pk, start_date, **receipts.aggregate(count=Count('id'), updated=Max('updated_at')))
+        patterns = cache.get(key)
+        if patterns is None:
+            patterns = find_recurring(receipt_frame(receipts), min_occurrences=self.min_occurrences)
+            cache.set(key, patterns, settings.RECURRING_EXPENSE_CACHE_TTL)
+        return patterns
+    
+    def refresh_tenant(self, tenant, months: int = 12) -> int:
+        """
+        Compute and cache the patterns of every member of a tenant from one
+        ledger query. Returns the number of users cached.
+        為租戶所有成員預先計算重複費用
+        """
+        from core.tenants.models import TenantMembership
+        
+        start_date = self._start_date(months)
+        members = TenantMembership.objects.filter(tenant=tenant, is_active=True).values('user_id')
+        receipts = self._receipts(start_date).filter(uploaded_by__in=members)
+        
+        # Fingerprints first: receipts changed after this are recomputed on read
+        fingerprints = receipts.values('uploaded_by').annotate(
+            count=Count('id'), updated=Max('updated_at')
+        ).order_by()
+        fingerprints = {row['uploaded_by']: row for row in fingerprints}
+        
+        patterns = find_recurring(
+            receipt_frame(receipts), keys=('uploaded_by_id', 'vendor_key'), min_occurrences=self.min_occurrences
+        )
+        by_user = {
+            user_id: user_patterns.droplevel('uploaded_by_id')
+            for user_id, user_patterns in patterns.groupby(level='uploaded_by_id', sort=False)
+        }
+        no_patterns = patterns.iloc[0:0].droplevel('uploaded_by_id')
         
-        receipts = Receipt.objects.filter(
-            uploaded_by=user,
+        cache.set_many({
+            self._cache_key(user_id, start_date, row['count'], row['updated']): by_user.get(user_id, no_patterns)
+            for user_id, row in fingerprints.items()
+        }, settings.RECURRING_EXPENSE_CACHE_TTL)
+        return len(fingerprints)
+    
+    def _start_date(self, months: int) -> date:
+        return timezone.now().date() - timedelta(days=months * 30)
+    
+    def _receipts(self, start_date: date):
+        return Receipt.objects.filter(
             status__in=[ReceiptStatus.APPROVED, ReceiptStatus.POSTED],
             receipt_date__gte=start_date,
             vendor_name__isnull=False
         ).exclude(
             vendor_name=''
-        ).order_by('vendor_name', 'receipt_date')
-        
-        # Group by vendor
-        vendor_receipts = defaultdict(list)
-        for receipt in receipts:
-            vendor_receipts[receipt.vendor_name.lower()].append(receipt)
-        
-        recurring_expenses = []
-        
-        for vendor_name, vendor_list in vendor_receipts.items():
-            if len(vendor_list) >= self.min_occurrences:
-                pattern = self._analyze_pattern(vendor_list)
-                if pattern:
-                    recurring_expenses.append(pattern)
-        
-        # Sort by confidence
-        recurring_expenses.sort(key=lambda x: x['confidence'], reverse=True)
-        
-        return recurring_expenses
+        )
+    
+    def _cache_key(self, user_id, start_date: date, count: int, updated) -> str:
+        return CACHE_KEY.format(
+            user=user_id, start=start_date, count=count, updated=updated.isoformat() if updated else ''
+        )
     
     def _analyze_pattern(self, receipts: List[Receipt]) -> Optional[Dict[str, Any]]:
         """
@@ -218,57 +460,53 @@ class RecurringExpenseService:
         Predict future expenses based on recurring patterns
         根據重複模式預測未來費用
         """
-        recurring = self.detect_recurring_expenses(user)
-        
-        predictions = []
-        total_predicted = 0
+        patterns = self.recurring_frame(user)
+        patterns = patterns[patterns['confidence'] >= 0.6]
         
         today = timezone.now().date()
         end_date = today + timedelta(days=months_ahead * 30)
         
-        for expense in recurring:
-            if expense['confidence'] < 0.6:
-                continue
-            
-            # Calculate expected occurrences
-            interval = expense['average_interval_days']
-            last_date = datetime.strptime(expense['last_occurrence'], '%Y-%m-%d').date()
-            
-            expected_dates = []
-            current_date = last_date
-            
-            while current_date < end_date:
-                current_date += timedelta(days=int(interval))
-                if today <= current_date <= end_date:
-                    expected_dates.append(str(current_date))
-            
-            if expected_dates:
-                expected_total = len(expected_dates) * expense['average_amount']
-                total_predicted += expected_total
-                
-                predictions.append({
-                    'vendor_name': expense['vendor_name'],
-                    'category': expense['most_common_category'],
-                    'pattern_type': expense['pattern_type'],
-                    'expected_amount': expense['average_amount'],
-                    'expected_dates': expected_dates,
-                    'expected_count': len(expected_dates),
-                    'expected_total': round(expected_total, 2),
-                    'confidence': expense['confidence']
-                })
+        # Occurrences last + k * interval (k >= 1) that fall in [today, end_date]
+        interval = np.floor(patterns['average_interval_days'].to_numpy(dtype=float)).astype(np.int64)
+        last = patterns['last_occurrence'].to_numpy(dtype='datetime64[D]')
+        since_last = (np.datetime64(today) - last).astype(np.int64)
+        until_end = (np.datetime64(end_date) - last).astype(np.int64)
+        first_k = np.maximum(1, -(-since_last // interval))  # ceil
+        counts = np.maximum(until_end // interval - first_k + 1, 0)
+        
+        rows = np.repeat(np.arange(len(patterns)), counts)
+        k = first_k[rows] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        dates = (last[rows] + k * interval[rows]).astype(str)
+        amounts = patterns['average_amount'].round(2).to_numpy(dtype=float)
         
-        # Group by month
-        monthly_breakdown = defaultdict(float)
-        for pred in predictions:
-            for date_str in pred['expected_dates']:
-                month_key = date_str[:7]  # YYYY-MM
-                monthly_breakdown[month_key] += pred['expected_amount']
+        predictions = []
+        total_predicted = 0
+        for index, (row, expected_dates) in enumerate(
+            zip(patterns.itertuples(index=False), np.split(dates, np.cumsum(counts)[:-1]))
+        ):
+            if not counts[index]:
+                continue
+            expected_total = counts[index] * amounts[index]
+            total_predicted += expected_total
+            predictions.append({
+                'vendor_name': row.vendor_name,
+                'category': row.most_common_category,
+                'pattern_type': row.pattern_type,
+                'expected_amount': float(amounts[index]),
+                'expected_dates': expected_dates.tolist(),
+                'expected_count': int(counts[index]),
+                'expected_total': round(float(expected_total), 2),
+                'confidence': float(row.confidence)
+            })
+        
+        # Group by month (YYYY-MM)
+        monthly_breakdown = pd.Series(amounts[rows]).groupby(pd.Series(dates).str[:7], sort=False).sum()
         
         return {
             'prediction_period': f'{today} to {end_date}',
-            'total_predicted': round(total_predicted, 2),
+            'total_predicted': round(float(total_predicted), 2),
             'predictions': predictions,
-            'monthly_breakdown': dict(monthly_breakdown),
+            'monthly_breakdown': {month: float(amount) for month, amount in monthly_breakdown.items()},
             'recurring_vendors_count': len(predictions)
         }
     
@@ -322,8 +560,8 @@ class RecurringExpenseService:
             }
         
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
+            from core.libs.ai_service import get_llm_client
+            client = get_llm_client()
             
             prompt = f"""作為財務顧問，分析以下重複費用資料並提供建議：
 
@@ -4,9 +4,28 @@ Safe Code Execution Module
 
 This module provides a secure way to execute pandas/plotly code
 generated by LLM, using AST validation and sandboxing.
+
+Validated code runs in a pool of pre-started worker processes (see
+SandboxPool) with a hard wall-clock timeout and an address-space limit;
+workers that time out or die are killed and replaced. DataFrames are
+published once into shared memory and mapped by the workers without
+copying, so a call only ships the code and a small frame handle. With the
+pool disabled, code runs on a watchdog thread under the same timeout.
 """
 
 import ast
+import atexit
+import ctypes
+import os
+import pickle
+import queue
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
 import pandas as pd
 import plotly.express as px
 import signal
@@ -18,7 +37,7 @@ if sys.platform != 'win32':
 else:
     resource = None  # type: ignore
     
-from typing import Any, Dict, Set, Optional
+from typing import Any, Dict, List, Set, Optional, Tuple
 from functools import wraps
 import logging
 
@@ -78,6 +97,34 @@ MAX_EXECUTION_TIME = 10
 # Maximum memory (bytes) - 256MB
 MAX_MEMORY = 256 * 1024 * 1024
 
+# Sandbox pool defaults (overridable via SAFE_EXEC_* settings)
+DEFAULT_POOL_SIZE = 2
+MAX_TASKS_PER_WORKER = 500  # recycle workers to bound leaks
+MAX_FRAMES_PER_WORKER = 4   # shared frames kept mapped in each worker
+MAX_SHARED_FRAMES = 16      # frames kept published by the parent
+
+SAFE_BUILTINS = {
+    'True': True,
+    'False': False,
+    'None': None,
+    'len': len,
+    'str': str,
+    'int': int,
+    'float': float,
+    'list': list,
+    'dict': dict,
+    'tuple': tuple,
+    'range': range,
+    'enumerate': enumerate,
+    'zip': zip,
+    'sorted': sorted,
+    'sum': sum,
+    'min': min,
+    'max': max,
+    'abs': abs,
+    'round': round,
+}
+
 
 class UnsafeCodeError(Exception):
     """Raised when code contains unsafe operations"""
@@ -89,6 +136,16 @@ class ExecutionTimeoutError(Exception):
     pass
 
 
+class ExecutionMemoryError(Exception):
+    """Raised when code exceeds the sandbox memory limit"""
+    pass
+
+
+class SandboxError(Exception):
+    """Raised when a sandbox worker dies or cannot return its result"""
+    pass
+
+
 class SafeCodeValidator(ast.NodeVisitor):
     """
     AST visitor that validates code safety.
@@ -166,9 +223,99 @@ class SafeCodeValidator(ast.NodeVisitor):
         return True
 
 
-def timeout_handler(signum, frame):
-    """Signal handler for execution timeout"""
-    raise ExecutionTimeoutError("Code execution timed out")
+# =================================================================
+# Execution
+# =================================================================
+
+def _execute(mode: str, code: str, df: pd.DataFrame, mark_input: bool = False) -> Any:
+    """
+    Run validated code against `df` in a restricted namespace.
+    The code works on a copy, so its writes never reach the caller's (or
+    the shared) data: a shallow one in pool workers, which run with
+    copy-on-write on, a deep one otherwise. With `mark_input`, an exec
+    namespace whose 'df' is still the untouched input gets a marker
+    instead, so the frame is not shipped back to the caller.
+    """
+    frame = df.copy(deep=not _copy_on_write())
+    namespace = {
+        'df': frame,
+        'pd': pd,
+        '__builtins__': dict(SAFE_BUILTINS),
+    }
+    if mode == 'eval':
+        return eval(code, namespace)
+
+    namespace['px'] = px
+    before = _frame_arrays(frame) if mark_input else None
+    exec(code, namespace)
+    # Return only safe variables
+    result = {
+        k: v for k, v in namespace.items()
+        if not k.startswith('_') and k not in {'pd', 'px'}
+    }
+    if before is not None and result.get('df') is frame and _frame_arrays(frame) == before:
+        result['df'] = _INPUT_FRAME
+    return result
+
+
+def _copy_on_write() -> bool:
+    """Whether pandas copy-on-write is on in this process"""
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except (KeyError, pd.errors.OptionError):
+        return False
+
+
+def _frame_arrays(frame: pd.DataFrame) -> Optional[Tuple]:
+    """Identity of a frame's column labels and backing arrays"""
+    try:
+        return (tuple(frame.columns), tuple(id(array) for array in frame._mgr.arrays))
+    except AttributeError:
+        return None
+
+
+def _execute_with_timeout(mode: str, code: str, df: pd.DataFrame, timeout: float) -> Any:
+    """
+    _execute on a daemon thread, giving up after `timeout` seconds (no pool).
+    A thread cannot be killed: on timeout ExecutionTimeoutError is also
+    raised inside it, which stops Python-level loops at their next bytecode;
+    a long C call (e.g. one huge sum) runs to completion in the background.
+    """
+    outcome: Dict[str, Any] = {}
+
+    def target():
+        try:
+            outcome['result'] = _execute(mode, code, df)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, name='safe-exec', daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(thread.ident), ctypes.py_object(ExecutionTimeoutError)
+        )
+        raise ExecutionTimeoutError(f"Code execution timed out after {timeout}s")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def _run(mode: str, code: str, df: pd.DataFrame, timeout: int) -> Any:
+    validator = SafeCodeValidator()
+    validator.validate(code)
+
+    logger.info(f"Executing safe {mode}: {code[:100]}...")
+
+    try:
+        pool = get_sandbox_pool()
+        if pool is not None:
+            return pool.run(mode, code, df, timeout)
+        return _execute_with_timeout(mode, code, df, timeout)
+    except Exception as e:
+        logger.error(f"Safe {mode} failed: {e}")
+        raise
 
 
 def safe_eval(code: str, df: pd.DataFrame, timeout: int = MAX_EXECUTION_TIME) -> Any:
@@ -186,48 +333,9 @@ def safe_eval(code: str, df: pd.DataFrame, timeout: int = MAX_EXECUTION_TIME) ->
     Raises:
         UnsafeCodeError: If code contains unsafe operations
         ExecutionTimeoutError: If execution times out
+        ExecutionMemoryError: If execution exceeds the memory limit
     """
-    # Validate code safety
-    validator = SafeCodeValidator()
-    validator.validate(code)
-    
-    # Create restricted namespace
-    namespace = {
-        'df': df.copy(),  # Work on a copy
-        'pd': pd,
-        '__builtins__': {
-            'True': True,
-            'False': False,
-            'None': None,
-            'len': len,
-            'str': str,
-            'int': int,
-            'float': float,
-            'list': list,
-            'dict': dict,
-            'tuple': tuple,
-            'range': range,
-            'enumerate': enumerate,
-            'zip': zip,
-            'sorted': sorted,
-            'sum': sum,
-            'min': min,
-            'max': max,
-            'abs': abs,
-            'round': round,
-        }
-    }
-    
-    logger.info(f"Executing safe eval: {code[:100]}...")
-    
-    try:
-        # Note: signal.alarm doesn't work on Windows
-        # For production, consider using multiprocessing with timeout
-        result = eval(code, namespace)
-        return result
-    except Exception as e:
-        logger.error(f"Safe eval failed: {e}")
-        raise
+    return _run('eval', code, df, timeout)
 
 
 def safe_exec(code: str, df: pd.DataFrame, timeout: int = MAX_EXECUTION_TIME) -> Dict[str, Any]:
@@ -245,51 +353,396 @@ def safe_exec(code: str, df: pd.DataFrame, timeout: int = MAX_EXECUTION_TIME) ->
     Raises:
         UnsafeCodeError: If code contains unsafe operations
         ExecutionTimeoutError: If execution times out
+        ExecutionMemoryError: If execution exceeds the memory limit
     """
-    # Validate code safety
-    validator = SafeCodeValidator()
-    validator.validate(code)
-    
-    # Create restricted namespace
-    namespace = {
-        'df': df.copy(),  # Work on a copy
-        'pd': pd,
-        'px': px,
-        '__builtins__': {
-            'True': True,
-            'False': False,
-            'None': None,
-            'len': len,
-            'str': str,
-            'int': int,
-            'float': float,
-            'list': list,
-            'dict': dict,
-            'tuple': tuple,
-            'range': range,
-            'enumerate': enumerate,
-            'zip': zip,
-            'sorted': sorted,
-            'sum': sum,
-            'min': min,
-            'max': max,
-            'abs': abs,
-            'round': round,
-        }
-    }
-    
-    logger.info(f"Executing safe exec: {code[:100]}...")
-    
+    return _run('exec', code, df, timeout)
+
+
+# =================================================================
+# Shared DataFrames
+# =================================================================
+
+@dataclass(frozen=True)
+class SharedFrameHandle:
+    """
+    Location of a published DataFrame: a protocol-5 pickle header followed
+    by its out-of-band buffers, all inside one shared memory block.
+    """
+    name: str
+    header_size: int
+    buffer_sizes: Tuple[int, ...]
+
+
+class SharedFrameStore:
+    """
+    Publishes DataFrames into shared memory, once per frame object.
+
+    Numeric column buffers are written out-of-band so workers map them
+    without unpickling copies. Entries are keyed on the frame's identity,
+    shape, column labels and backing arrays, so a repeat call costs
+    O(columns) rather than a pass over the rows. A weak reference guards
+    against a new frame at a recycled address. Published frames are treated
+    as immutable: the analyst store replaces frames on refresh, and callers
+    that write values in place must release() the frame first. Least
+    recently used entries are evicted beyond max_frames.
+    """
+
+    def __init__(self, max_frames: int = MAX_SHARED_FRAMES):
+        self.max_frames = max_frames
+        self._frames: OrderedDict = OrderedDict()  # token -> (handle, shm, frame weakref)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def token(df: pd.DataFrame) -> Tuple:
+        """Identity token of `df`: object, shape, labels and backing arrays"""
+        return (id(df), df.shape, _frame_arrays(df))
+
+    def publish(self, df: pd.DataFrame) -> SharedFrameHandle:
+        key = self.token(df)
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is not None:
+                if entry[2]() is df:
+                    self._frames.move_to_end(key)
+                    return entry[0]
+                self._discard(key)  # the old frame died and its id was reused
+
+            buffers: List[pickle.PickleBuffer] = []
+            header = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+            try:
+                raw = [buffer.raw() for buffer in buffers]
+            except BufferError:
+                # Non-contiguous buffer: keep everything in-band
+                header, raw = pickle.dumps(df, protocol=5), []
+
+            sizes = tuple(view.nbytes for view in raw)
+            shm = SharedMemory(create=True, size=max(len(header) + sum(sizes), 1))
+            shm.buf[:len(header)] = header
+            offset = len(header)
+            for view in raw:
+                shm.buf[offset:offset + view.nbytes] = view
+                offset += view.nbytes
+
+            handle = SharedFrameHandle(name=shm.name, header_size=len(header), buffer_sizes=sizes)
+            self._frames[key] = (handle, shm, weakref.ref(df))
+            while len(self._frames) > self.max_frames:
+                self._discard(next(iter(self._frames)))
+            return handle
+
+    def release(self, df: pd.DataFrame) -> None:
+        with self._lock:
+            self._discard(self.token(df))
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._frames):
+                self._discard(key)
+
+    def _discard(self, key: Tuple) -> None:
+        entry = self._frames.pop(key, None)
+        if entry is None:
+            return
+        shm = entry[1]
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach_frame(handle: SharedFrameHandle) -> Tuple[pd.DataFrame, SharedMemory]:
+    """Map a published frame (worker side); buffers stay in shared memory"""
+    # The publishing process owns the segment; keep the resource tracker
+    # from unlinking it when this worker exits
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        shm = SharedMemory(name=handle.name)
+    finally:
+        resource_tracker.register = register
+
+    header = bytes(shm.buf[:handle.header_size])
+    buffers, offset = [], handle.header_size
+    for size in handle.buffer_sizes:
+        buffers.append(shm.buf[offset:offset + size])
+        offset += size
+    return pickle.loads(header, buffers=buffers), shm
+
+
+# =================================================================
+# Worker Process
+# =================================================================
+
+def _memory_in_use() -> Optional[int]:
+    """Current address space size of this process, if it can be read"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _set_memory_limit(limit: Optional[int]) -> None:
+    if resource is None:
+        return
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if limit is None:
+        resource.setrlimit(resource.RLIMIT_AS, (hard, hard))
+        return
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _worker_main(conn, memory_limit: int) -> None:
+    """
+    Worker loop: receive (mode, code, handle), reply ('ok', result) or
+    ('error', exception). Frames stay mapped between calls (LRU).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        # Shared buffers are read-only; copy-on-write copies before writing
+        pd.set_option('mode.copy_on_write', True)
+    except (KeyError, ValueError, pd.errors.OptionError):
+        pass
+
+    frames: OrderedDict = OrderedDict()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        mode, code, handle = message
+        try:
+            entry = frames.get(handle.name)
+            if entry is None:
+                entry = frames[handle.name] = _attach_frame(handle)
+                while len(frames) > MAX_FRAMES_PER_WORKER:
+                    _name, (old_df, old_shm) = frames.popitem(last=False)
+                    del old_df
+                    try:
+                        old_shm.close()
+                    except BufferError:
+                        pass  # still referenced by a result; unmapped at exit
+            frames.move_to_end(handle.name)
+            df = entry[0]
+
+            in_use = _memory_in_use()
+            _set_memory_limit(in_use + memory_limit if in_use else None)
+            try:
+                result = _execute(mode, code, df, mark_input=True)
+            finally:
+                _set_memory_limit(None)
+            conn.send(('ok', result))
+        except MemoryError:
+            conn.send(('error', ExecutionMemoryError(
+                f"Code execution exceeded the memory limit ({memory_limit // (1024 * 1024)} MB)"
+            )))
+        except BaseException as e:
+            try:
+                conn.send(('error', e))
+            except Exception:
+                conn.send(('error', SandboxError(f"{type(e).__name__}: {e}")))
+
+
+class _InputFrame:
+    """Marker returned in place of an unchanged input DataFrame"""
+
+    def __reduce__(self):
+        return (_input_frame, ())
+
+
+def _input_frame():
+    return _INPUT_FRAME
+
+
+_INPUT_FRAME = _InputFrame()
+
+
+# =================================================================
+# Sandbox Pool
+# =================================================================
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.tasks = 0
+
+
+class SandboxPool:
+    """
+    Pre-started worker processes executing validated code.
+
+    Each call borrows an idle worker, sends the code and the frame handle,
+    and waits at most `timeout` seconds; a worker that overruns or dies is
+    killed and replaced, so runaway code cannot stall the caller.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, memory_limit: int = MAX_MEMORY,
+                 max_tasks_per_worker: int = MAX_TASKS_PER_WORKER):
+        self.size = size
+        self.memory_limit = memory_limit
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.frames = SharedFrameStore()
+        self._context = get_context('forkserver' if sys.platform != 'win32' else 'spawn')
+        if hasattr(self._context, 'set_forkserver_preload'):
+            self._context.set_forkserver_preload([__name__])
+        self._idle: queue.Queue = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.pid = os.getpid()
+        self.stats = {'tasks': 0, 'timeouts': 0, 'crashes': 0, 'recycled': 0}
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def run(self, mode: str, code: str, df: pd.DataFrame, timeout: float = MAX_EXECUTION_TIME) -> Any:
+        """Execute validated code in a worker and return its result"""
+        if self._closed:
+            raise SandboxError("Sandbox pool is shut down")
+        handle = self.frames.publish(df)
+        try:
+            # Busy workers are bounded by their own timeouts; so is the wait for one
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            self.stats['timeouts'] += 1
+            raise ExecutionTimeoutError(f"No sandbox worker became free within {timeout}s")
+        healthy = False
+        try:
+            worker.conn.send((mode, code, handle))
+            if not worker.conn.poll(timeout):
+                self.stats['timeouts'] += 1
+                raise ExecutionTimeoutError(f"Code execution timed out after {timeout}s")
+            try:
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError):
+                self.stats['crashes'] += 1
+                raise SandboxError("Sandbox worker exited unexpectedly (likely out of memory)")
+            healthy = True
+        finally:
+            worker.tasks += 1
+            self.stats['tasks'] += 1
+            if healthy and worker.tasks < self.max_tasks_per_worker:
+                self._idle.put(worker)
+            else:
+                if healthy:
+                    self.stats['recycled'] += 1
+                self._replace(worker)
+
+        if status == 'error':
+            raise payload
+        if mode == 'exec' and payload.get('df') is _INPUT_FRAME:
+            payload['df'] = df
+        return payload
+
+    def warm(self, df: pd.DataFrame, timeout: float = MAX_EXECUTION_TIME) -> None:
+        """Publish `df` and map it in every worker ahead of the first query"""
+        handle = self.frames.publish(df)
+        workers = []
+        for _ in range(self.size):
+            try:
+                workers.append(self._idle.get(timeout=timeout))
+            except queue.Empty:
+                break  # the busy ones map it on first use
+        for worker in workers:
+            worker.conn.send(('eval', 'None', handle))
+        for worker in workers:
+            if worker.conn.poll(timeout):
+                try:
+                    worker.conn.recv()
+                    self._idle.put(worker)
+                    continue
+                except (EOFError, OSError):
+                    pass
+            self._replace(worker)
+
+    def shutdown(self) -> None:
+        self._closed = True
+        if self.pid != os.getpid():
+            return  # inherited across a fork: the workers and segments belong to the parent
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            self._stop_worker(worker)
+        self.frames.clear()
+
+    def _start_worker(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.memory_limit),
+            daemon=True,
+            name='safe-exec-worker',
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker: _Worker) -> None:
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        self._stop_worker(worker)
+        if not self._closed:
+            self._idle.put(self._start_worker())
+
+    def _stop_worker(self, worker: _Worker) -> None:
+        try:
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.process.join(timeout=5)
+        finally:
+            worker.conn.close()
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def _pool_settings() -> Dict[str, Any]:
     try:
-        exec(code, namespace)
-        # Return only safe variables
+        from django.conf import settings
         return {
-            k: v for k, v in namespace.items() 
-            if not k.startswith('_') and k not in {'pd', 'px'}
+            'enabled': getattr(settings, 'SAFE_EXEC_USE_POOL', True),
+            'size': getattr(settings, 'SAFE_EXEC_POOL_SIZE', DEFAULT_POOL_SIZE),
+            'memory_limit': getattr(settings, 'SAFE_EXEC_MAX_MEMORY', MAX_MEMORY),
         }
-    except Exception as e:
-        logger.error(f"Safe exec failed: {e}")
-        raise
+    except Exception:
+        return {'enabled': True, 'size': DEFAULT_POOL_SIZE, 'memory_limit': MAX_MEMORY}
+
+
+def get_sandbox_pool() -> Optional[SandboxPool]:
+    """
+    Process-wide sandbox pool, started on first use (None when disabled).
+    A forked process (e.g. gunicorn --preload) starts its own, since the
+    parent's worker pipes must not be shared.
+    """
+    global _pool
+    if _pool is not None and _pool.pid == os.getpid():
+        return _pool
+    config = _pool_settings()
+    if not config['enabled'] or sys.platform == 'win32':
+        return None
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = SandboxPool(size=config['size'], memory_limit=config['memory_limit'])
+            atexit.register(_pool.shutdown)
+    return _pool
+
+
+def shutdown_sandbox_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
 
 
 def validate_code_safety(code: str) -> tuple[bool, Optional[str]]:
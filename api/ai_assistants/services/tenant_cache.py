@@ -71,8 +71,10 @@ class TenantCache:
         
         logger.info(f"TenantCache initialized: ttl={ttl}s, max_size={max_size_per_tenant/1024/1024:.1f}MB/tenant")
     
-    def _get_tenant_id(self, user_id: Optional[int]) -> str:
-        """Get tenant identifier from user ID"""
+    def _get_tenant_id(self, user_id: Optional[int], tenant_id: Optional[str] = None) -> str:
+        """Get cache bucket from tenant ID (if given) or user ID"""
+        if tenant_id is not None:
+            return f"tenant_{tenant_id}"
         if user_id is None:
             return "anonymous"
         return f"user_{user_id}"
@@ -82,6 +84,8 @@ class TenantCache:
         import pandas as pd
         if isinstance(data, pd.DataFrame):
             return data.memory_usage(deep=True).sum()
+        elif hasattr(data, 'memory_usage'):
+            return int(data.memory_usage())
         elif isinstance(data, dict):
             return len(str(data))
         else:
@@ -116,18 +120,19 @@ class TenantCache:
             self._total_size -= entry.size_bytes
             logger.debug(f"Expired entry removed: {tenant_id}/{key}")
     
-    def get(self, user_id: Optional[int], key: str) -> Optional[Any]:
+    def get(self, user_id: Optional[int], key: str, tenant_id: Optional[str] = None) -> Optional[Any]:
         """
         Get cached data for user.
         
         Args:
             user_id: User ID (None for anonymous)
             key: Cache key
+            tenant_id: Tenant ID; when given, the entry is shared by the tenant
         
         Returns:
             Cached data or None if not found/expired
         """
-        tenant_id = self._get_tenant_id(user_id)
+        tenant_id = self._get_tenant_id(user_id, tenant_id)
         
         with self._lock:
             if tenant_id not in self._cache:
@@ -152,7 +157,7 @@ class TenantCache:
             logger.debug(f"Cache hit: {tenant_id}/{key}")
             return entry.data
     
-    def set(self, user_id: Optional[int], key: str, data: Any) -> bool:
+    def set(self, user_id: Optional[int], key: str, data: Any, tenant_id: Optional[str] = None) -> bool:
         """
         Set cached data for user.
         
@@ -160,11 +165,12 @@ class TenantCache:
             user_id: User ID (None for anonymous)
             key: Cache key
             data: Data to cache
+            tenant_id: Tenant ID; when given, the entry is shared by the tenant
         
         Returns:
             True if cached successfully
         """
-        tenant_id = self._get_tenant_id(user_id)
+        tenant_id = self._get_tenant_id(user_id, tenant_id)
         size_bytes = self._estimate_size(data)
         
         with self._lock:
@@ -207,9 +213,9 @@ class TenantCache:
             logger.debug(f"Cache set: {tenant_id}/{key} ({size_bytes} bytes)")
             return True
     
-    def delete(self, user_id: Optional[int], key: str) -> bool:
-        """Delete cached data for user"""
-        tenant_id = self._get_tenant_id(user_id)
+    def delete(self, user_id: Optional[int], key: str, tenant_id: Optional[str] = None) -> bool:
+        """Delete cached data for user (or tenant)"""
+        tenant_id = self._get_tenant_id(user_id, tenant_id)
         
         with self._lock:
             if tenant_id not in self._cache:
@@ -224,9 +230,9 @@ class TenantCache:
             logger.debug(f"Cache deleted: {tenant_id}/{key}")
             return True
     
-    def clear_tenant(self, user_id: Optional[int]) -> None:
-        """Clear all cache for a user"""
-        tenant_id = self._get_tenant_id(user_id)
+    def clear_tenant(self, user_id: Optional[int], tenant_id: Optional[str] = None) -> None:
+        """Clear all cache for a user (or tenant)"""
+        tenant_id = self._get_tenant_id(user_id, tenant_id)
         
         with self._lock:
             if tenant_id in self._cache:
@@ -9,14 +9,180 @@ Features / 功能:
 - Suggest vendor matching / 建議供應商配對
 """
 
-import re
-from typing import Optional, List, Dict, Any, Tuple
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple, Iterable
+from django.core.cache import cache
 from django.db import transaction
 from django.db.models import Q, Count
 from django.utils import timezone
 
-from accounting.models import Contact, Account, AccountType, AccountSubType
+from accounting.models import Contact, Account, AccountType, AccountSubType, normalize_vendor_name
 from ai_assistants.models import Receipt, ReceiptStatus
+from core.tenants.managers import get_current_tenant
+
+
+def name_ngrams(normalized: str, n: int = 3) -> frozenset:
+    """Character n-grams of a normalized name, padded so short names still get grams"""
+    if not normalized:
+        return frozenset()
+    padded = f' {normalized} '
+    if len(padded) <= n:
+        return frozenset([padded])
+    return frozenset(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+def normalized_similarity(s1: str, s2: str, grams1: frozenset = None, grams2: frozenset = None) -> float:
+    """
+    Similarity of two normalized names: the better of word Jaccard and
+    character trigram Dice, so spacing/typo variants still score.
+    """
+    if not s1 or not s2:
+        return 0.0
+    if s1 == s2:
+        return 1.0
+    
+    words1 = set(s1.split())
+    words2 = set(s2.split())
+    union = words1 | words2
+    jaccard = len(words1 & words2) / len(union) if union else 0.0
+    
+    grams1 = grams1 if grams1 is not None else name_ngrams(s1)
+    grams2 = grams2 if grams2 is not None else name_ngrams(s2)
+    total = len(grams1) + len(grams2)
+    dice = 2 * len(grams1 & grams2) / total if total else 0.0
+    
+    return max(jaccard, dice)
+
+
+class VendorIndex:
+    """
+    In-memory blocking index over one tenant's contacts.
+    一個租戶聯絡人的記憶體配對索引
+    
+    Exact keys (tax number, lowercased name, normalized name) resolve in O(1);
+    fuzzy suggestions only score contacts sharing character n-grams with the
+    query instead of every contact.
+    """
+    
+    # Share of the query's n-grams a contact needs to become a candidate
+    MIN_GRAM_OVERLAP = 0.3
+    
+    def __init__(self, rows: Iterable[tuple]):
+        self.by_tax: Dict[str, Any] = {}
+        self.by_exact: Dict[str, Any] = {}
+        self.by_normalized: Dict[str, Any] = {}
+        self.names: Dict[Any, Tuple[str, frozenset]] = {}
+        self.postings: Dict[str, List[Any]] = {}
+        
+        for contact_id, company_name, contact_name, normalized_name, normalized_contact_name, tax_number in rows:
+            if tax_number:
+                self.by_tax.setdefault(tax_number, contact_id)
+            for name in (company_name, contact_name):
+                if name:
+                    self.by_exact.setdefault(name.lower(), contact_id)
+            for normalized in (normalized_name, normalized_contact_name):
+                if normalized:
+                    self.by_normalized.setdefault(normalized, contact_id)
+            
+            # Suggestions score against the display name, as before
+            primary = normalized_name or normalized_contact_name
+            grams = name_ngrams(primary)
+            self.names[contact_id] = (primary, grams)
+            for gram in grams | name_ngrams(normalized_contact_name):
+                self.postings.setdefault(gram, []).append(contact_id)
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def lookup(self, vendor_name: str = None, tax_id: str = None) -> Optional[Any]:
+        """Contact id by tax number, exact name, then normalized name"""
+        if tax_id and tax_id in self.by_tax:
+            return self.by_tax[tax_id]
+        if vendor_name:
+            contact_id = self.by_exact.get(vendor_name.lower())
+            if contact_id is not None:
+                return contact_id
+            normalized = normalize_vendor_name(vendor_name)
+            if normalized:
+                return self.by_normalized.get(normalized)
+        return None
+    
+    def candidates(self, normalized: str, limit: int = 5) -> List[Tuple[Any, float]]:
+        """Best (contact id, similarity) pairs among contacts sharing n-grams"""
+        grams = name_ngrams(normalized)
+        if not grams:
+            return []
+        
+        overlap: Dict[Any, int] = {}
+        for gram in grams:
+            for contact_id in self.postings.get(gram, ()):
+                overlap[contact_id] = overlap.get(contact_id, 0) + 1
+        
+        needed = max(1, int(len(grams) * self.MIN_GRAM_OVERLAP))
+        scored = []
+        for contact_id, shared in overlap.items():
+            if shared < needed:
+                continue
+            name, name_grams = self.names[contact_id]
+            scored.append((contact_id, normalized_similarity(normalized, name, grams, name_grams)))
+        
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+
+# Per-process index cache, least recently used tenant first; the version key
+# in the shared cache is bumped whenever a contact changes so every process
+# rebuilds on next use. The TTL covers bulk writes that bypass the Contact
+# signals; expired indexes are dropped and at most VENDOR_INDEX_MAX_TENANTS kept.
+_vendor_indexes: 'OrderedDict[str, Tuple[Any, float, VendorIndex]]' = OrderedDict()
+_vendor_indexes_lock = threading.Lock()
+
+VENDOR_INDEX_VERSION_KEY = 'vendor_index:version:{}'
+VENDOR_INDEX_TTL = 300
+VENDOR_INDEX_MAX_TENANTS = 64
+
+
+def _vendor_index_key(tenant) -> str:
+    return str(tenant.pk) if tenant is not None else 'global'
+
+
+def invalidate_vendor_index(tenant_id=None) -> None:
+    """Mark a tenant's vendor index stale (called on contact changes)"""
+    key = str(tenant_id) if tenant_id is not None else 'global'
+    cache.set(VENDOR_INDEX_VERSION_KEY.format(key), time.time_ns(), None)
+    if key != 'global':
+        # Unscoped lookups see every tenant's contacts
+        cache.set(VENDOR_INDEX_VERSION_KEY.format('global'), time.time_ns(), None)
+
+
+def get_vendor_index() -> VendorIndex:
+    """Vendor index for the current tenant, rebuilt when its version changes"""
+    key = _vendor_index_key(get_current_tenant())
+    version = cache.get(VENDOR_INDEX_VERSION_KEY.format(key))
+    with _vendor_indexes_lock:
+        cached = _vendor_indexes.get(key)
+        if cached is not None:
+            _vendor_indexes.move_to_end(key)
+    if cached is not None and cached[0] == version and time.monotonic() - cached[1] < VENDOR_INDEX_TTL:
+        return cached[2]
+    
+    index = VendorIndex(
+        Contact.objects.order_by('created_at', 'id').values_list(
+            'id', 'company_name', 'contact_name',
+            'normalized_name', 'normalized_contact_name', 'tax_number',
+        )
+    )
+    now = time.monotonic()
+    with _vendor_indexes_lock:
+        _vendor_indexes[key] = (version, now, index)
+        _vendor_indexes.move_to_end(key)
+        for stale in [k for k, (_, built, _) in _vendor_indexes.items() if now - built >= VENDOR_INDEX_TTL]:
+            del _vendor_indexes[stale]
+        while len(_vendor_indexes) > VENDOR_INDEX_MAX_TENANTS:
+            _vendor_indexes.popitem(last=False)
+    return index
 
 
 class VendorRecognitionService:
@@ -33,29 +199,7 @@ class VendorRecognitionService:
         Normalize vendor name for matching
         標準化供應商名稱用於配對
         """
-        if not name:
-            return ''
-        
-        # Convert to lowercase and strip
-        normalized = name.lower().strip()
-        
-        # Remove common suffixes
-        suffixes = [
-            '有限公司', '股份有限公司', '公司', '企業', '商行', '店',
-            'limited', 'ltd', 'inc', 'corp', 'co.', 'company',
-            '分店', '門市', '專櫃'
-        ]
-        for suffix in suffixes:
-            if normalized.endswith(suffix.lower()):
-                normalized = normalized[:-len(suffix)].strip()
-        
-        # Remove special characters
-        normalized = re.sub(r'[^\w\s]', '', normalized)
-        
-        # Remove extra whitespace
-        normalized = ' '.join(normalized.split())
-        
-        return normalized
+        return normalize_vendor_name(name)
     
     def find_matching_contact(self, vendor_name: str, tax_id: str = None) -> Optional[Contact]:
         """
@@ -65,31 +209,34 @@ class VendorRecognitionService:
         if not vendor_name and not tax_id:
             return None
         
-        # Try exact tax ID match first
-        if tax_id:
-            contact = Contact.objects.filter(tax_number=tax_id).first()
-            if contact:
-                return contact
-        
-        # Try exact name match
-        if vendor_name:
-            contact = Contact.objects.filter(
-                Q(company_name__iexact=vendor_name) |
-                Q(contact_name__iexact=vendor_name)
-            ).first()
-            if contact:
-                return contact
-        
-        # Try normalized name match
-        normalized = self.normalize_vendor_name(vendor_name)
-        if normalized:
-            contacts = Contact.objects.all()
-            for contact in contacts:
-                if (self.normalize_vendor_name(contact.company_name) == normalized or
-                    self.normalize_vendor_name(contact.contact_name) == normalized):
-                    return contact
+        contact_id = get_vendor_index().lookup(vendor_name, tax_id)
+        if contact_id is None:
+            return None
+        return Contact.objects.filter(pk=contact_id).first()
+    
+    def match_many(self, receipts: Iterable) -> List[Optional[Contact]]:
+        """
+        Match the vendors of many receipts at once
+        批次配對多張收據的供應商
         
-        return None
+        One index lookup per distinct (vendor name, tax id) and a single
+        query for the matched contacts. Returns contacts in receipt order.
+        """
+        receipts = list(receipts)
+        index = get_vendor_index()
+        
+        keys = []
+        resolved: Dict[Tuple, Any] = {}
+        for receipt in receipts:
+            key = (receipt.vendor_name or '', getattr(receipt, 'vendor_tax_id', None) or '')
+            keys.append(key)
+            if key not in resolved:
+                resolved[key] = index.lookup(*key) if any(key) else None
+        
+        contacts = Contact.objects.in_bulk(
+            {contact_id for contact_id in resolved.values() if contact_id is not None}
+        )
+        return [contacts.get(resolved[key]) for key in keys]
     
     def suggest_matching_contacts(self, vendor_name: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
@@ -99,20 +246,15 @@ class VendorRecognitionService:
         if not vendor_name:
             return []
         
-        suggestions = []
         normalized = self.normalize_vendor_name(vendor_name)
+        candidates = get_vendor_index().candidates(normalized, limit)
+        contacts = Contact.objects.in_bulk([contact_id for contact_id, _score in candidates])
         
-        # Search by partial name match
-        contacts = Contact.objects.filter(
-            Q(company_name__icontains=vendor_name) |
-            Q(contact_name__icontains=vendor_name) |
-            Q(company_name__icontains=normalized) |
-            Q(contact_name__icontains=normalized)
-        )[:limit]
-        
-        for contact in contacts:
-            # Calculate similarity score
-            similarity = self._calculate_similarity(vendor_name, contact.company_name or contact.contact_name)
+        suggestions = []
+        for contact_id, similarity in candidates:
+            contact = contacts.get(contact_id)
+            if contact is None:
+                continue
             suggestions.append({
                 'contact_id': str(contact.id),
                 'company_name': contact.company_name,
@@ -122,9 +264,6 @@ class VendorRecognitionService:
                 'contact_type': contact.contact_type
             })
         
-        # Sort by similarity
-        suggestions.sort(key=lambda x: x['similarity_score'], reverse=True)
-        
         return suggestions
     
     def _calculate_similarity(self, str1: str, str2: str) -> float:
@@ -134,24 +273,7 @@ class VendorRecognitionService:
         """
         if not str1 or not str2:
             return 0.0
-        
-        s1 = self.normalize_vendor_name(str1)
-        s2 = self.normalize_vendor_name(str2)
-        
-        if s1 == s2:
-            return 1.0
-        
-        # Simple Jaccard similarity on words
-        words1 = set(s1.split())
-        words2 = set(s2.split())
-        
-        if not words1 or not words2:
-            return 0.0
-        
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        
-        return len(intersection) / len(union) if union else 0.0
+        return normalized_similarity(self.normalize_vendor_name(str1), self.normalize_vendor_name(str2))
     
     @transaction.atomic
     def create_contact_from_receipt(self, receipt: Receipt) -> Tuple[Optional[Contact], Optional[str]]:
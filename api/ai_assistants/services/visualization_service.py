@@ -12,11 +12,7 @@ import json
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Any, Optional, Union
-from openai import OpenAI
-from django.conf import settings
-
-
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from core.libs.ai_service import cached_completion, get_llm_client
 
 
 # ============================================================================
@@ -288,7 +284,8 @@ IMPORTANT: Respond ONLY with valid JSON in this exact format:
 """
     
     try:
-        response = client.chat.completions.create(
+        response = cached_completion(
+            get_llm_client(),
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -0,0 +1,52 @@
+"""
+AI Assistants Signals
+=====================
+Keep the document retrieval index in step with AIDocument changes and the
+vendor matching index in step with Contact changes.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from accounting.models import Contact
+
+from .models import AIDocument
+
+logger = logging.getLogger('analyst.rag')
+
+
+@receiver(post_save, sender=AIDocument)
+def index_document(sender, instance, raw=False, **kwargs):
+    """(Re)index a document once the save commits; unchanged content is skipped."""
+    if raw:
+        return
+
+    def reindex():
+        from .services.document_index import DocumentIndexService
+        try:
+            DocumentIndexService().index_document(instance)
+        except Exception as e:
+            logger.error(f"Error indexing document {instance.pk}: {e}")
+
+    transaction.on_commit(reindex)
+
+
+@receiver(pre_delete, sender=AIDocument)
+def remove_document_from_index(sender, instance, **kwargs):
+    """Drop the document's chunks and adjust the partition statistics."""
+    from .services.document_index import DocumentIndexService
+    DocumentIndexService().remove_document(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Contact)
+def invalidate_vendor_index(sender, instance, **kwargs):
+    """
+    Rebuild the tenant's vendor matching index on next use. Bumped again on
+    commit so other processes cannot keep an index built before the commit.
+    """
+    from .services.vendor_recognition_service import invalidate_vendor_index
+    invalidate_vendor_index(instance.tenant_id)
+    transaction.on_commit(lambda: invalidate_vendor_index(instance.tenant_id))
@@ -6,7 +6,12 @@ Celery tasks for async processing of OCR, reports, AI analysis, etc.
 
 from .ocr_tasks import process_document_ocr, batch_ocr_process
 from .report_tasks import generate_report, generate_bulk_reports
-from .ai_tasks import run_ai_analysis, batch_ai_analysis
+from .ai_tasks import (
+    run_ai_analysis,
+    batch_ai_analysis,
+    summarize_conversation,
+    refresh_recurring_expenses,
+)
 from .cleanup_tasks import cleanup_old_task_results
 
 __all__ = [
@@ -16,5 +21,7 @@ __all__ = [
     'generate_bulk_reports',
     'run_ai_analysis',
     'batch_ai_analysis',
+    'summarize_conversation',
+    'refresh_recurring_expenses',
     'cleanup_old_task_results',
 ]
@@ -230,3 +230,69 @@ def batch_ai_analysis(self, items: list, analysis_type: str, user_id: int, optio
         except AsyncTask.DoesNotExist:
             pass
         raise
+
+
+@shared_task(bind=True, max_retries=2, default_retry_delay=60)
+def summarize_conversation(self, conversation_id: str):
+    """
+    Fold messages that left an AIConversation's context window into its
+    rolling summary.
+    
+    Args:
+        conversation_id: ID of the AIConversation
+    
+    Returns:
+        dict: Conversation id and the seq the summary now covers
+    """
+    from core.libs.ai_service import get_llm_client
+    from ai_assistants.models import AIConversation
+    from ai_assistants.services.conversation_store import ConversationStore
+    
+    conversation = AIConversation.objects.select_related('agent').filter(id=conversation_id).first()
+    if conversation is None:
+        return {'conversation_id': conversation_id, 'summary_seq': None}
+    
+    store = ConversationStore(conversation)
+    if store.needs_summary():
+        try:
+            client = get_llm_client()
+            model = conversation.agent.llm_model if conversation.agent and conversation.agent.llm_model else 'gpt-4o-mini'
+            store.summarize(client, model=model)
+        except Exception as exc:
+            logger.warning(f"Conversation summary failed for {conversation_id}: {exc}")
+            raise self.retry(exc=exc)
+    
+    return {'conversation_id': conversation_id, 'summary_seq': conversation.summary_seq}
+
+
+@shared_task(bind=True)
+def refresh_recurring_expenses(self, tenant_id: str = None, months: int = 12):
+    """
+    Recompute and cache recurring-expense patterns for every member of a
+    tenant (all active tenants when tenant_id is None), one ledger query
+    per tenant.
+    
+    Args:
+        tenant_id: ID of the Tenant, or None for all active tenants
+        months: Detection window in months
+    
+    Returns:
+        dict: Tenants refreshed and users cached
+    """
+    from core.tenants.models import Tenant
+    from ai_assistants.services.recurring_expense_service import RecurringExpenseService
+    
+    tenants = Tenant.objects.filter(is_active=True)
+    if tenant_id:
+        tenants = tenants.filter(id=tenant_id)
+    
+    service = RecurringExpenseService()
+    refreshed, users = 0, 0
+    for tenant in tenants.iterator():
+        try:
+            users += service.refresh_tenant(tenant, months)
+            refreshed += 1
+        except Exception as exc:
+            logger.warning(f"Recurring expense refresh failed for tenant {tenant.id}: {exc}")
+    
+    return {'tenants': refreshed, 'users': users}
@@ -37,7 +37,7 @@ from ai_assistants.views.brainstorm_viewset import (
 from ai_assistants.views.finance_viewset import ReceiptAnalyzerViewSet
 from ai_assistants.views.ai_service_viewset import AIServiceViewSet
 from ai_assistants.views.accounting_viewset import AccountingAssistantViewSet
-from ai_assistants.views.agent_viewset import AIAgentViewSet
+from ai_assistants.views.agent_viewset import AIAgentViewSet, agent_chat_stream
 from ai_assistants.views.visualization_viewset import (
     ChartTypesView,
     AnalyzeDataView,
@@ -155,6 +155,9 @@ urlpatterns = [
     path("accounting-assistant/receipts/<uuid:pk>/", 
          AccountingAssistantViewSet.as_view({"get": "get_receipt", "patch": "update_receipt"}), 
          name="accounting-assistant-receipt-detail"),
+    path("accounting-assistant/receipts/<uuid:pk>/image/",
+         AccountingAssistantViewSet.as_view({"get": "receipt_image"}),
+         name="accounting-assistant-receipt-image"),
     path("accounting-assistant/receipts/<uuid:pk>/approve/", 
          AccountingAssistantViewSet.as_view({"post": "approve_receipt"}), 
          name="accounting-assistant-approve"),
@@ -164,6 +167,12 @@ urlpatterns = [
     path("accounting-assistant/receipts/<uuid:pk>/ai-review/", 
          AccountingAssistantViewSet.as_view({"post": "ai_review_receipt"}), 
          name="accounting-assistant-ai-review"),
+    path("accounting-assistant/receipts/<uuid:pk>/detect-anomalies/",
+         AccountingAssistantViewSet.as_view({"get": "detect_anomalies"}),
+         name="accounting-assistant-detect-anomalies"),
+    path("accounting-assistant/receipts/batch-detect-anomalies/",
+         AccountingAssistantViewSet.as_view({"post": "batch_detect_anomalies"}),
+         name="accounting-assistant-batch-detect-anomalies"),
     path("accounting-assistant/compare/", 
          AccountingAssistantViewSet.as_view({"post": "compare_excel"}), 
          name="accounting-assistant-compare"),
@@ -207,6 +216,9 @@ urlpatterns = [
     path("agent/chat/", 
          AIAgentViewSet.as_view({"post": "chat"}), 
          name="ai-agent-chat"),
+    path("agent/chat/stream/", 
+         agent_chat_stream, 
+         name="ai-agent-chat-stream"),
     path("agent/agents/", 
          AIAgentViewSet.as_view({"get": "agents"}), 
          name="ai-agent-agents"),
@@ -7,6 +7,7 @@ API Endpoints:
 - GET /api/v1/accounting-assistant/receipts/ - List all receipts
 - GET /api/v1/accounting-assistant/receipts/{id}/ - Get receipt detail
 - PATCH /api/v1/accounting-assistant/receipts/{id}/ - Update receipt
+- GET /api/v1/accounting-assistant/receipts/{id}/image/ - Receipt image (?thumbnail=1)
 - POST /api/v1/accounting-assistant/receipts/{id}/approve/ - Approve receipt
 - POST /api/v1/accounting-assistant/receipts/{id}/create-journal/ - Create journal entry
 - POST /api/v1/accounting-assistant/compare/ - Compare Excel with database
@@ -16,12 +17,14 @@ API Endpoints:
 """
 
 import base64
+import binascii
 import uuid
 from datetime import datetime, date
 from decimal import Decimal
 from io import BytesIO
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
 from django.db import models
 from django.db.models import Sum, Q, Count
 from django.utils import timezone
@@ -52,7 +55,7 @@ from ai_assistants.services.accounting_service import (
     get_ai_suggestions,
     process_receipt_full,
     generate_expense_report_excel,
-    compare_excel_with_database,
+    compare_excel_with_queryset,
     get_comparison_ai_analysis,
 )
 from ai_assistants.services.journal_entry_service import (
@@ -60,7 +63,9 @@ from ai_assistants.services.journal_entry_service import (
     create_journal_from_receipt,
     approve_receipt_with_journal,
     batch_create_journals,
+    bulk_approve_receipts,
 )
+from ai_assistants.services.blob_store import BlobStoreError, get_blob_store
 from ai_assistants.services.anomaly_detection_service import (
     AnomalyDetectionService,
     detect_receipt_anomalies,
@@ -108,29 +113,31 @@ class AccountingAssistantViewSet(viewsets.ViewSet):
         auto_categorize = data.get('auto_categorize', True)
         auto_journal = data.get('auto_journal', False)
         
-        # Get image as base64
+        # Store the image once by content hash; base64 is only built for the model call
+        store = get_blob_store()
         if data.get('image'):
             image_file = data['image']
-            image_base64 = base64.b64encode(image_file.read()).decode('utf-8')
+            content = image_file.read()
             image_file.seek(0)  # Reset file pointer
+            blob = store.put(content, image_file.content_type or 'image/jpeg')
+            image_base64 = base64.b64encode(content).decode('utf-8')
             original_filename = image_file.name
         else:
             image_base64 = data['image_base64']
+            try:
+                blob = store.put_base64(image_base64)
+            except (binascii.Error, ValueError):
+                return Response({'error': 'Invalid base64 image data'}, status=status.HTTP_400_BAD_REQUEST)
             original_filename = 'uploaded_image.jpg'
         
         # Create receipt record
         receipt = Receipt.objects.create(
             uploaded_by=request.user,
             original_filename=original_filename,
-            image_base64=image_base64,
+            image_blob=blob,
             status=ReceiptStatus.ANALYZING,
         )
         
-        # Save image file if provided
-        if data.get('image'):
-            receipt.image = data['image']
-            receipt.save()
-        
         try:
             # Process receipt
             result = process_receipt_full(image_base64, language, auto_save=False)
@@ -259,6 +266,39 @@ class AccountingAssistantViewSet(viewsets.ViewSet):
         serializer = ReceiptSerializer(receipt)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'], url_path='image')
+    def receipt_image(self, request, pk=None):
+        """
+        Receipt image, or its thumbnail with ?thumbnail=1
+        收據圖片或縮圖
+        """
+        receipt = (
+            Receipt.objects.filter(pk=pk, uploaded_by=request.user)
+            .select_related('image_blob').only('id', 'image_blob__content_type').first()
+        )
+        if receipt is None or not receipt.image_blob_id:
+            return Response({'error': 'Receipt image not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        thumbnail = request.query_params.get('thumbnail') in ('1', 'true')
+        sha256 = receipt.image_blob_id
+        etag = f'"{sha256}-thumb"' if thumbnail else f'"{sha256}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=304)
+        else:
+            store = get_blob_store()
+            try:
+                if thumbnail:
+                    response = FileResponse(store.open_thumbnail(sha256), content_type='image/jpeg')
+                else:
+                    response = FileResponse(store.open(sha256), content_type=receipt.image_blob.content_type)
+            except (BlobStoreError, OSError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Content-addressed: the bytes behind an ETag never change
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+    
     @action(detail=True, methods=['patch'], url_path='update-receipt')
     def update_receipt(self, request, pk=None):
         """
@@ -494,48 +534,28 @@ class AccountingAssistantViewSet(viewsets.ViewSet):
             uploaded_by=request.user
         )
         
-        results = {
-            'success': [],
-            'failed': [],
-            'total': receipts.count()
-        }
-        
-        for receipt in receipts:
-            try:
-                if auto_journal:
-                    journal_entry, error = approve_receipt_with_journal(
-                        receipt=receipt,
-                        user=request.user,
-                        auto_post=auto_post
-                    )
-                    if error:
-                        results['failed'].append({
-                            'receipt_id': str(receipt.id),
-                            'error': error
-                        })
-                    else:
-                        results['success'].append({
-                            'receipt_id': str(receipt.id),
-                            'journal_entry_id': str(journal_entry.id),
-                            'entry_number': journal_entry.entry_number
-                        })
-                else:
-                    receipt.status = ReceiptStatus.APPROVED
-                    receipt.reviewed_by = request.user
-                    receipt.reviewed_at = timezone.now()
-                    receipt.save()
-                    results['success'].append({
-                        'receipt_id': str(receipt.id),
-                        'journal_entry_id': None
-                    })
-            except Exception as e:
-                results['failed'].append({
-                    'receipt_id': str(receipt.id),
-                    'error': str(e)
-                })
-        
-        results['success_count'] = len(results['success'])
-        results['failed_count'] = len(results['failed'])
+        if auto_journal:
+            # Set-based: accounts and entry numbers resolved once, entries bulk-created per chunk
+            results = bulk_approve_receipts(
+                receipts=list(receipts),
+                user=request.user,
+                auto_post=auto_post
+            )
+        else:
+            receipt_ids = [str(pk) for pk in receipts.values_list('id', flat=True)]
+            receipts.update(
+                status=ReceiptStatus.APPROVED,
+                reviewed_by=request.user,
+                reviewed_at=timezone.now(),
+                updated_at=timezone.now(),
+            )
+            results = {
+                'success': [{'receipt_id': pk, 'journal_entry_id': None} for pk in receipt_ids],
+                'failed': [],
+                'total': len(receipt_ids),
+                'success_count': len(receipt_ids),
+                'failed_count': 0,
+            }
         
         return Response({
             'status': 'completed',
@@ -646,7 +666,38 @@ class AccountingAssistantViewSet(viewsets.ViewSet):
             'anomalies': anomalies,
             'ai_analysis': ai_analysis
         })
-    
+
+    @action(detail=False, methods=['post'], url_path='batch-detect-anomalies')
+    def batch_detect_anomalies(self, request):
+        """
+        Detect anomalies in multiple receipts (e.g. after a bulk upload)
+        批量檢測收據異常
+        """
+        receipt_ids = request.data.get('receipt_ids', [])
+
+        if not receipt_ids:
+            return Response({
+                'status': 'error',
+                'error': 'No receipt IDs provided'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        receipts = Receipt.objects.filter(id__in=receipt_ids, uploaded_by=request.user)
+        results = AnomalyDetectionService(user=request.user).detect_many(receipts)
+
+        return Response({
+            'status': 'completed',
+            'total': len(results),
+            'flagged': sum(1 for anomalies in results.values() if anomalies),
+            'results': [
+                {
+                    'receipt_id': str(receipt_id),
+                    'anomalies_count': len(anomalies),
+                    'anomalies': anomalies,
+                }
+                for receipt_id, anomalies in results.items()
+            ]
+        })
+
     @action(detail=False, methods=['get'], url_path='anomaly-summary')
     def get_anomaly_summary(self, request):
         """
@@ -815,24 +866,20 @@ class AccountingAssistantViewSet(viewsets.ViewSet):
         date_from = serializer.validated_data.get('date_from')
         date_to = serializer.validated_data.get('date_to')
         
-        # Get database records
+        # Database side is looked up per chunk of Excel receipt numbers
         queryset = Receipt.objects.filter(uploaded_by=request.user)
         if date_from:
             queryset = queryset.filter(receipt_date__gte=date_from)
         if date_to:
             queryset = queryset.filter(receipt_date__lte=date_to)
         
-        db_records = list(queryset.values(
-            'receipt_number', 'vendor_name', 'receipt_date',
-            'total_amount', 'tax_amount', 'category'
-        ))
-        
-        # Read Excel file
-        excel_content = excel_file.read()
-        
-        # Compare
+        # Compare (the sheet is streamed, not loaded)
         try:
-            comparison_result = compare_excel_with_database(excel_content, db_records)
+            comparison_result = compare_excel_with_queryset(
+                excel_file, queryset,
+                chunk_size=settings.EXCEL_COMPARE_CHUNK_SIZE,
+                max_details=settings.EXCEL_COMPARE_MAX_DETAILS,
+            )
             ai_analysis = get_comparison_ai_analysis(comparison_result)
         except Exception as e:
             return Response({
@@ -854,7 +901,8 @@ class AccountingAssistantViewSet(viewsets.ViewSet):
             health_score=ai_analysis.get('overall_health_score', 0),
             status='COMPLETED',
         )
-        comparison.excel_file.save(excel_file.name, ContentFile(excel_content))
+        excel_file.seek(0)
+        comparison.excel_file.save(excel_file.name, excel_file)
         
         return Response({
             'comparison_id': str(comparison.id),
@@ -1062,10 +1110,9 @@ Receipt Information:
             )
             context += f"\nRecent Activity: {totals['count']} receipts, Total: {totals['total']}"
         
-        from openai import OpenAI
-        from django.conf import settings
+        from core.libs.ai_service import get_llm_client
         
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        client = get_llm_client()
         
         prompt = f"""You are an expert accounting assistant. Help the user with their question.
 Provide answers in both English and Traditional Chinese (繁體中文).
@@ -2,21 +2,30 @@
 AI Agent ViewSet
 ================
 REST API for AI Agent operations with autonomous CRUD and logging
+
+agent_chat_stream is the streaming variant of chat: an async view sending
+the answer as server-sent events while the model generates it. It needs
+an ASGI server (core.asgi); under WSGI Django buffers the whole stream.
 """
 
+import base64
 import json
 import uuid
 from datetime import datetime
 from typing import Optional
 
-from django.utils import timezone
+from asgiref.sync import sync_to_async
 from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import IsAuthenticated
-from openai import OpenAI
-from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from ai_assistants.models import (
     AIAgent,
@@ -29,6 +38,15 @@ from ai_assistants.agents.ai_tools import (
     AIToolRegistry,
     BusinessToolExecutor,
 )
+from ai_assistants.services.agent_chat import (
+    BUSINESS_AGENT_PROMPT,
+    AgentChatService,
+    astream_completion,
+    get_async_openai_client,
+    get_openai_client,
+    tool_call_dicts,
+)
+from ai_assistants.services.conversation_store import ConversationStore
 from core.schema_serializers import AIAgentChatRequestSerializer
 
 
@@ -56,7 +74,7 @@ class AIAgentViewSet(viewsets.ViewSet):
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.openai_client = OpenAI(api_key=getattr(settings, 'OPENAI_API_KEY', ''))
+        self.openai_client = get_openai_client()
     
     @action(detail=False, methods=['get'])
     def agents(self, request):
@@ -117,8 +135,6 @@ class AIAgentViewSet(viewsets.ViewSet):
         }
         """
         message = request.data.get('message', '')
-        session_id = request.data.get('session_id') or str(uuid.uuid4())
-        agent_id = request.data.get('agent_id')
         auto_execute = request.data.get('auto_execute', True)
         
         if not message:
@@ -127,70 +143,17 @@ class AIAgentViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get or create agent
-        agent = None
-        if agent_id:
-            try:
-                agent = AIAgent.objects.get(pk=agent_id)
-            except AIAgent.DoesNotExist:
-                pass
-        
-        if not agent:
-            # Use or create default business agent
-            agent, _ = AIAgent.objects.get_or_create(
-                name='business_agent',
-                defaults={
-                    'display_name': 'Business CRUD Agent',
-                    'description': 'Autonomous agent for managing business data (audits, tax returns, billing, revenue)',
-                    'agent_type': 'BUSINESS',
-                    'auto_execute': True,
-                    'llm_model': 'gpt-4o-mini',
-                    'system_prompt': self._get_business_agent_prompt(),
-                }
-            )
-        
-        # Get or create conversation
-        conversation, created = AIConversation.objects.get_or_create(
-            session_id=session_id,
-            defaults={
-                'user': request.user,
-                'agent': agent,
-                'title': message[:100],
-            }
+        chat = AgentChatService(
+            request.user,
+            message,
+            session_id=request.data.get('session_id'),
+            agent_id=request.data.get('agent_id'),
         )
-        
-        # Add user message to history
-        messages = conversation.messages or []
-        messages.append({
-            "role": "user",
-            "content": message,
-            "timestamp": timezone.now().isoformat()
-        })
-        
-        # Get available tools
-        tools = AIToolRegistry.to_openai_tools(agent.allowed_tools if agent.allowed_tools else None)
-        
-        # Build conversation for OpenAI
-        openai_messages = [
-            {"role": "system", "content": agent.system_prompt or self._get_business_agent_prompt()}
-        ]
-        
-        # Add history (last 10 messages)
-        for msg in messages[-10:]:
-            openai_messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
+        openai_messages = chat.build_messages()
         
         # Call OpenAI with function calling
         try:
-            response = self.openai_client.chat.completions.create(
-                model=agent.llm_model or 'gpt-4o-mini',
-                messages=openai_messages,
-                tools=tools,
-                tool_choice="auto",
-                temperature=agent.temperature or 0.7,
-            )
+            response = self.openai_client.chat.completions.create(**chat.completion_kwargs(openai_messages))
         except Exception as e:
             return Response(
                 {"error": f"AI service error: {str(e)}"},
@@ -198,61 +161,16 @@ class AIAgentViewSet(viewsets.ViewSet):
             )
         
         assistant_message = response.choices[0].message
-        tool_calls = assistant_message.tool_calls
+        tool_calls = tool_call_dicts(assistant_message.tool_calls)
         
-        # Process tool calls if any
-        actions_taken = []
+        # Process tool calls if any (read-only tools run concurrently)
         if tool_calls and auto_execute:
-            executor = BusinessToolExecutor(
-                user=request.user,
-                session_id=session_id,
-                agent=agent
-            )
-            
-            for tool_call in tool_calls:
-                tool_name = tool_call.function.name
-                tool_args = json.loads(tool_call.function.arguments)
-                
-                # Execute the tool
-                handler = AIToolRegistry.get_handler(tool_name)
-                if handler:
-                    result = handler(executor, **tool_args)
-                    actions_taken.append({
-                        "tool": tool_name,
-                        "arguments": tool_args,
-                        "result": result
-                    })
-            
-            # Get follow-up response after tool execution
-            openai_messages.append({
-                "role": "assistant",
-                "content": None,
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments
-                        }
-                    }
-                    for tc in tool_calls
-                ]
-            })
-            
-            for i, action in enumerate(actions_taken):
-                openai_messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_calls[i].id,
-                    "content": json.dumps(action["result"])
-                })
+            chat.run_tools(openai_messages, tool_calls)
             
             # Get final response
             try:
                 final_response = self.openai_client.chat.completions.create(
-                    model=agent.llm_model or 'gpt-4o-mini',
-                    messages=openai_messages,
-                    temperature=agent.temperature or 0.7,
+                    **chat.completion_kwargs(openai_messages, with_tools=False)
                 )
                 assistant_content = final_response.choices[0].message.content
             except Exception as e:
@@ -261,39 +179,16 @@ class AIAgentViewSet(viewsets.ViewSet):
             assistant_content = assistant_message.content or "I understand. How can I help?"
             
             # If there are tool calls but auto_execute is false, explain what would be done
-            if tool_calls and not auto_execute:
-                pending_actions = []
-                for tc in tool_calls:
-                    pending_actions.append({
-                        "tool": tc.function.name,
-                        "arguments": json.loads(tc.function.arguments)
-                    })
-                assistant_content += f"\n\nI would like to execute the following actions (pending approval):\n{json.dumps(pending_actions, indent=2)}"
+            if tool_calls:
+                assistant_content += chat.pending_actions_note(tool_calls)
         
-        # Add assistant message to history
-        messages.append({
-            "role": "assistant",
-            "content": assistant_content,
-            "timestamp": timezone.now().isoformat(),
-            "actions": actions_taken if actions_taken else None
-        })
-        
-        # Update conversation
-        conversation.messages = messages
-        conversation.total_actions += len(actions_taken)
-        conversation.successful_actions += sum(1 for a in actions_taken if a["result"].get("success"))
-        conversation.failed_actions += sum(1 for a in actions_taken if not a["result"].get("success"))
-        conversation.save()
+        conversation_stats = chat.finish(assistant_content)
         
         return Response({
-            "session_id": session_id,
+            "session_id": chat.session_id,
             "message": assistant_content,
-            "actions_taken": actions_taken,
-            "conversation_stats": {
-                "total_actions": conversation.total_actions,
-                "successful_actions": conversation.successful_actions,
-                "failed_actions": conversation.failed_actions,
-            }
+            "actions_taken": chat.actions_taken,
+            "conversation_stats": conversation_stats,
         })
     
     @action(detail=False, methods=['get'])
@@ -355,20 +250,41 @@ class AIAgentViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def sessions(self, request):
-        """List conversation sessions"""
-        limit = int(request.query_params.get('limit', 20))
+        """List conversation sessions, newest first (?cursor= for the next page)"""
+        limit = min(int(request.query_params.get('limit', 20)), 100)
+        cursor = request.query_params.get('cursor')
         
         sessions = AIConversation.objects.filter(
             user=request.user
-        ).order_by('-updated_at')[:limit]
+        ).select_related('agent').order_by('-updated_at', '-id')
+        
+        if cursor:
+            # Keyset cursor: "<updated_at>|<id>" of the last session on the previous page
+            try:
+                updated_at, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+                updated_at = datetime.fromisoformat(updated_at)
+                last_id = uuid.UUID(last_id)
+            except (ValueError, UnicodeDecodeError):
+                return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+            sessions = sessions.filter(
+                Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=last_id)
+            )
+        
+        sessions = list(sessions[:limit + 1])
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            last = sessions[-1]
+            next_cursor = base64.urlsafe_b64encode(f"{last.updated_at.isoformat()}|{last.id}".encode()).decode()
         
         return Response({
+            "next_cursor": next_cursor,
             "sessions": [
                 {
                     "session_id": s.session_id,
                     "title": s.title,
                     "agent": s.agent.display_name if s.agent else None,
-                    "message_count": len(s.messages) if s.messages else 0,
+                    "message_count": s.message_count,
                     "total_actions": s.total_actions,
                     "successful_actions": s.successful_actions,
                     "created_at": s.created_at.isoformat(),
@@ -380,9 +296,12 @@ class AIAgentViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'], url_path='sessions/(?P<session_id>[^/.]+)')
     def get_session(self, request, session_id=None):
-        """Get a specific session with full history"""
+        """
+        Get a specific session with a page of its history.
+        Messages are newest page first; pass ?before=<next_cursor> for older ones.
+        """
         try:
-            session = AIConversation.objects.get(
+            session = AIConversation.objects.select_related('agent').get(
                 session_id=session_id,
                 user=request.user
             )
@@ -392,6 +311,14 @@ class AIAgentViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
+        try:
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+            limit = int(request.query_params.get('limit', ConversationStore.PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "Invalid pagination parameters"}, status=status.HTTP_400_BAD_REQUEST)
+        messages, next_cursor = ConversationStore(session).page(before=before, limit=limit)
+        
         # Get actions for this session
         actions = AIActionLog.objects.filter(
             session_id=session_id
@@ -404,7 +331,10 @@ class AIAgentViewSet(viewsets.ViewSet):
                 "id": str(session.agent.id),
                 "name": session.agent.display_name,
             } if session.agent else None,
-            "messages": session.messages,
+            "summary": session.summary,
+            "message_count": session.message_count,
+            "messages": [m.to_dict() for m in messages],
+            "next_cursor": next_cursor,
             "actions": [
                 {
                     "id": str(a.id),
@@ -428,30 +358,114 @@ class AIAgentViewSet(viewsets.ViewSet):
     
     def _get_business_agent_prompt(self) -> str:
         """Get the system prompt for business agent"""
-        return """You are an AI assistant for an ERP system that manages business operations including audit projects, tax returns, billable hours, and revenue.
+        return BUSINESS_AGENT_PROMPT
 
-You have access to tools to create, read, update, and delete records in the database. When a user asks you to perform an action, use the appropriate tool.
 
-IMPORTANT RULES:
-1. Always confirm what action you're taking before executing
-2. For CREATE operations, extract all required information from the user's request
-3. For UPDATE operations, identify the record first then apply changes
-4. For DELETE operations, confirm the target before proceeding
-5. If information is missing, ask the user for it
-6. After executing an action, summarize what was done
-7. All actions are logged and can be rolled back if needed
+# =================================================================
+# Streaming Chat
+# =================================================================
 
-Available models and their purposes:
-- AuditProject: Audit engagements for clients (financial, internal, tax audits)
-- TaxReturnCase: Tax filing cases (profits tax, salaries tax, property tax)
-- BillableHour: Time tracking for employees working on projects
-- Revenue: Income records from clients
-- Company: Client companies
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
 
-When creating records:
-- client_id is a UUID reference to a Company
-- project_id is a UUID reference to an AuditProject (optional for some models)
-- Dates should be in YYYY-MM-DD format
-- Amounts/rates are decimal numbers
 
-Be helpful, accurate, and always explain what you're doing."""
+@csrf_exempt
+@require_POST
+async def agent_chat_stream(request):
+    """
+    Chat with AI agent, streamed as server-sent events.
+    
+    Same request body as chat. Events:
+    - delta: {"content": "..."} answer text as it is generated
+    - actions: {"actions_taken": [...]} after the tools have run
+    - done: {"session_id", "message", "conversation_stats"}
+    - error: {"error": "..."}
+    """
+    try:
+        authenticated = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"error": str(e.detail)}, status=401)
+    if authenticated is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+    user = authenticated[0]
+    
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    message = data.get('message', '')
+    auto_execute = data.get('auto_execute', True)
+    if not message:
+        return JsonResponse({"error": "Message is required"}, status=400)
+    
+    chat = await sync_to_async(AgentChatService)(
+        user,
+        message,
+        session_id=data.get('session_id'),
+        agent_id=data.get('agent_id'),
+    )
+    openai_messages = await sync_to_async(chat.build_messages)()
+    
+    async def events():
+        # Taken on the loop that consumes the stream, which under WSGI is not the view's
+        client = get_async_openai_client()
+        parts = []
+        tool_calls = []
+        try:
+            # Text the model writes alongside tool calls goes out as well
+            async for kind, value in astream_completion(client, **chat.completion_kwargs(openai_messages)):
+                if kind == "delta":
+                    parts.append(value)
+                    yield _sse("delta", {"content": value})
+                else:
+                    tool_calls = value
+        except Exception as e:
+            yield _sse("error", {"error": f"AI service error: {str(e)}"})
+            return
+        
+        if tool_calls and auto_execute:
+            try:
+                actions = await sync_to_async(chat.run_tools)(openai_messages, tool_calls)
+            except Exception as e:
+                error = f"Error executing actions: {str(e)}"
+                # Keep the turn (and any actions that did run) in the history
+                try:
+                    await sync_to_async(chat.finish)(error)
+                except Exception:
+                    pass
+                yield _sse("error", {"error": error})
+                return
+            yield _sse("actions", {"actions_taken": actions})
+            parts = []
+            try:
+                async for kind, value in astream_completion(
+                    client, **chat.completion_kwargs(openai_messages, with_tools=False)
+                ):
+                    if kind == "delta":
+                        parts.append(value)
+                        yield _sse("delta", {"content": value})
+                assistant_content = "".join(parts)
+            except Exception as e:
+                assistant_content = "".join(parts) or f"Actions completed. Error getting summary: {str(e)}"
+        else:
+            assistant_content = "".join(parts) or "I understand. How can I help?"
+            if tool_calls:
+                note = chat.pending_actions_note(tool_calls)
+                assistant_content += note
+                yield _sse("delta", {"content": note})
+        
+        try:
+            conversation_stats = await sync_to_async(chat.finish)(assistant_content)
+        except Exception as e:
+            yield _sse("error", {"error": f"Error saving conversation: {str(e)}"})
+            return
+        yield _sse("done", {
+            "session_id": chat.session_id,
+            "message": assistant_content,
+            "conversation_stats": conversation_stats,
+        })
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: do not buffer the stream
+    return response
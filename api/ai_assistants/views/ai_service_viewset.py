@@ -12,6 +12,7 @@ from django.conf import settings
 import base64
 
 from core.libs.ai_service import AIService, AIProvider, get_ai_service
+from core.libs.llm_gateway import QuotaExceeded
 from core.schema_serializers import AIChatRequestSerializer
 
 
@@ -91,7 +92,8 @@ class AIServiceViewSet(viewsets.ViewSet):
                 message=message,
                 system_prompt=system_prompt,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                user_id=str(request.user.id)
             )
             
             return Response({
@@ -101,6 +103,11 @@ class AIServiceViewSet(viewsets.ViewSet):
                 "usage": response.usage
             })
             
+        except QuotaExceeded as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
         except Exception as e:
             return Response(
                 {"error": str(e)},
@@ -145,7 +152,8 @@ class AIServiceViewSet(viewsets.ViewSet):
                 messages=messages,
                 system_prompt=system_prompt,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                user_id=str(request.user.id)
             )
             
             return Response({
@@ -155,6 +163,11 @@ class AIServiceViewSet(viewsets.ViewSet):
                 "usage": response.usage
             })
             
+        except QuotaExceeded as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
         except Exception as e:
             return Response(
                 {"error": str(e)},
@@ -347,7 +360,8 @@ class AIServiceViewSet(viewsets.ViewSet):
             ai = get_ai_service(provider=provider)
             response = ai.chat(
                 message="Hello, please respond with 'Connection successful'",
-                max_tokens=50
+                max_tokens=50,
+                user_id=str(request.user.id)
             )
             
             return Response({
@@ -445,7 +459,8 @@ Format your response clearly with sections and bullet points."""
                 message=full_message,
                 system_prompt=system_prompt,
                 temperature=0.7,
-                max_tokens=2000
+                max_tokens=2000,
+                user_id=str(request.user.id)
             )
             
             return Response({
@@ -4,7 +4,7 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 from ai_assistants.serializers.analyst_serializer import AnalystQuerySerializer
-from ai_assistants.services.analyst_service import handle_query_logic, dataframe_cache
+from ai_assistants.services.analyst_service import handle_query_logic, get_dataframes
 from ai_assistants.services.analyst_service import load_all_datasets
 from django.apps import apps
 from django.db import connection
@@ -74,7 +74,7 @@ class AnalystDataView(APIView):
     serializer_class = AnalystDataResponseSerializer
     
     def get(self, request):
-        df = dataframe_cache.get("analysis_data")
+        df = get_dataframes().get("analysis_data")
         if df is not None:
             # Limit rows for anonymous users
             if not request.user.is_authenticated:
@@ -203,21 +203,22 @@ class AnalystSchemaView(APIView):
                     continue
             
             # Also add schema from loaded DataFrames (for CSV fallback data)
-            for name, df in dataframe_cache.items():
+            loaded_frames = get_dataframes(load=False)
+            for name, df in loaded_frames.items():
                 if df is not None and not df.empty:
                     # Check if this is already in schema_tables
                     existing = next((t for t in schema_tables if t['name'] == name), None)
                     if not existing:
                         columns = []
                         for col in df.columns:
-                            col_type = str(df[col].dtype)
+                            col_type = str(df[col].dtype).lower()
                             if 'int' in col_type:
                                 sql_type = 'INTEGER'
                             elif 'float' in col_type:
                                 sql_type = 'DECIMAL'
                             elif 'datetime' in col_type:
                                 sql_type = 'TIMESTAMP'
-                            elif 'object' in col_type:
+                            elif col_type in ('object', 'category', 'str', 'string'):
                                 sql_type = 'VARCHAR'
                             elif 'bool' in col_type:
                                 sql_type = 'BOOLEAN'
@@ -243,9 +244,9 @@ class AnalystSchemaView(APIView):
                         })
             
             # Determine data source status
-            if not has_db_data and dataframe_cache:
+            if not has_db_data and loaded_frames:
                 data_source = 'csv_fallback'
-            elif not has_db_data and not dataframe_cache:
+            elif not has_db_data and not loaded_frames:
                 data_source = 'no_data'
             
             return Response({
@@ -297,7 +298,7 @@ class AnalystDataStatusView(APIView):
             
             # Check cache
             cache_stats = {}
-            for name, df in dataframe_cache.items():
+            for name, df in get_dataframes(load=False).items():
                 if df is not None and not df.empty:
                     cache_stats[name] = {
                         'rows': len(df),
@@ -13,6 +13,7 @@ from django.utils import timezone
 from django.http import FileResponse, Http404
 import logging
 
+from core.libs.llm_gateway import QuotaExceeded
 from ai_assistants.models import Email, EmailAccount, EmailAttachment, EmailTemplate
 from ai_assistants.serializers.email_serializer import (
     EmailSerializer, EmailListSerializer, EmailComposeSerializer,
@@ -203,11 +204,14 @@ class EmailViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
 
         try:
-            analysis = summarize_email(email)
+            user_id = str(request.user.id) if request.user.is_authenticated else None
+            analysis = summarize_email(email, user_id=user_id)
             email.ai_summary = analysis.get('summary')
             email.ai_action_items = analysis.get('action_items', [])
             email.ai_sentiment = analysis.get('sentiment')
             email.save(update_fields=['ai_summary', 'ai_action_items', 'ai_sentiment'])
+        except QuotaExceeded as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
         except Exception as exc:
             logger.error("Email analyze failed: %s", exc, exc_info=True)
             return Response(
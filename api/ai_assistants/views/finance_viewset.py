@@ -106,7 +106,8 @@ class ReceiptAnalyzerViewSet(viewsets.ViewSet):
                 message=prompt,
                 system_prompt="You are an expert financial analyst. Provide detailed, actionable insights from financial reports. Use bullet points and clear formatting.",
                 temperature=0.3,
-                max_tokens=2000
+                max_tokens=2000,
+                user_id=str(request.user.id)
             )
             
             return Response({
@@ -172,7 +173,8 @@ Please provide:
                 message=prompt,
                 system_prompt="You are an expert financial analyst specializing in period-over-period analysis. Provide detailed comparisons with specific numbers and percentages.",
                 temperature=0.3,
-                max_tokens=2500
+                max_tokens=2500,
+                user_id=str(request.user.id)
             )
             
             return Response({
@@ -232,7 +234,8 @@ Please provide:
                 message=prompt,
                 system_prompt="You are an expert financial forecaster. Provide realistic forecasts with clear reasoning and confidence intervals.",
                 temperature=0.4,
-                max_tokens=2000
+                max_tokens=2000,
+                user_id=str(request.user.id)
             )
             
             return Response({
@@ -44,6 +44,7 @@ from ai_assistants.serializers.accounting_serializer import (
     BulkStatusUpdateSerializer,
     BulkReceiptUploadSerializer,
 )
+from ai_assistants.services.blob_store import get_blob_store
 
 logger = logging.getLogger(__name__)
 
@@ -187,13 +188,14 @@ class AccountingProjectViewSet(viewsets.ModelViewSet):
         results = []
         errors = []
         
+        store = get_blob_store()
         for file in files:
             try:
                 receipt = Receipt.objects.create(
                     project=project,
                     uploaded_by=request.user,
                     original_filename=file.name,
-                    image=file,
+                    image_blob=store.put_file(file),
                     status=ReceiptStatus.UPLOADED
                 )
                 results.append({
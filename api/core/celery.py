@@ -56,6 +56,10 @@ app.conf.update(
             'task': 'ai_assistants.tasks.cleanup_tasks.cleanup_old_task_results',
             'schedule': 3600.0,  # Every hour
         },
+        'refresh-recurring-expenses': {
+            'task': 'ai_assistants.tasks.ai_tasks.refresh_recurring_expenses',
+            'schedule': 86400.0,  # Daily
+        },
     },
 )
 
@@ -1,5 +1,8 @@
 # Core library modules
-from core.libs.ai_service import AIService, AIProvider, AIResponse, get_ai_service, quick_chat
+from core.libs.ai_service import (
+    AIService, AIProvider, AIResponse, get_ai_service, quick_chat, get_llm_client, cached_completion,
+)
+from core.libs.llm_gateway import LLMGateway, LLMRequest, get_llm_gateway
 
 __all__ = [
     'AIService',
@@ -7,4 +10,9 @@ __all__ = [
     'AIResponse',
     'get_ai_service',
     'quick_chat',
+    'get_llm_client',
+    'cached_completion',
+    'LLMGateway',
+    'LLMRequest',
+    'get_llm_gateway',
 ]
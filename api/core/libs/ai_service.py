@@ -1,10 +1,23 @@
 """
 Unified AI Service for Wisematic ERP
 Supports: OpenAI (GPT), Google Gemini, DeepSeek
+
+Clients come from a process-wide registry (get_llm_client), one per
+(provider, base URL, API key), so every caller shares the client's
+keep-alive HTTP pool; get_async_llm_client does the same per event loop. Deterministic completions (temperature 0) can be
+served from ResponseCache, an in-process LRU/TTL cache with one bucket
+per tenant. chat and chat_with_history go through the async LLM gateway
+(core.libs.llm_gateway) when LLM_GATEWAY_ENABLED is on.
 """
+import hashlib
+import json
 import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from enum import Enum
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from django.conf import settings
 from dataclasses import dataclass
 
@@ -26,6 +39,240 @@ class AIResponse:
     raw_response: Optional[Any] = None
 
 
+def provider_api_key(provider: AIProvider) -> str:
+    """Get API key for a provider from settings or environment"""
+    key_mapping = {
+        AIProvider.OPENAI: ('OPENAI_API_KEY', 'OPENAI_API_KEY'),
+        AIProvider.GEMINI: ('GEMINI_API_KEY', 'GOOGLE_API_KEY'),
+        AIProvider.DEEPSEEK: ('DEEPSEEK_API_KEY', 'DEEPSEEK_API_KEY'),
+    }
+    
+    settings_key, env_key = key_mapping.get(provider, ('', ''))
+    
+    # Try settings first, then environment
+    return getattr(settings, settings_key, '') or os.getenv(env_key, '')
+
+
+# =================================================================
+# Client Registry
+# =================================================================
+
+_clients: Dict[Tuple[str, str, str], Any] = {}
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+_gemini_config: Optional[Tuple[int, str]] = None
+
+
+def get_llm_client(
+    provider: AIProvider = AIProvider.OPENAI,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+):
+    """
+    Shared OpenAI-compatible client (OpenAI, DeepSeek) for this process.
+    
+    Clients are keyed by (provider, base URL, API key digest) and never
+    closed, so connections stay open between calls. A forked worker starts
+    with an empty registry instead of reusing its parent's sockets.
+    """
+    global _clients_pid
+    provider = AIProvider(provider) if isinstance(provider, str) else provider
+    if provider == AIProvider.GEMINI:
+        raise ValueError("Gemini has no OpenAI-compatible client; use configure_gemini")
+    
+    if api_key is None:
+        api_key = provider_api_key(provider)
+    if base_url is None:
+        if provider == AIProvider.DEEPSEEK:
+            base_url = getattr(settings, 'DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+        else:
+            base_url = getattr(settings, 'OPENAI_BASE_URL', None)
+    
+    key = (provider.value, base_url or '', hashlib.sha256(api_key.encode()).hexdigest())
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(key)
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=api_key, base_url=base_url or None)
+            _clients[key] = client
+    return client
+
+
+_async_clients: "weakref.WeakKeyDictionary[Any, Dict[Tuple[str, str, str], Any]]" = weakref.WeakKeyDictionary()
+
+
+def get_async_llm_client(
+    provider: AIProvider = AIProvider.OPENAI,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+):
+    """
+    Shared AsyncOpenAI-compatible client for the running event loop.
+    
+    Keyed like get_llm_client. An async client's connection pool belongs to
+    the loop it was first used on, so each loop gets its own; under ASGI
+    that is one per worker, and a loop's clients go away with it.
+    Must be called from a coroutine.
+    """
+    import asyncio
+    provider = AIProvider(provider) if isinstance(provider, str) else provider
+    if provider == AIProvider.GEMINI:
+        raise ValueError("Gemini has no OpenAI-compatible client; use configure_gemini")
+    
+    if api_key is None:
+        api_key = provider_api_key(provider)
+    if base_url is None:
+        if provider == AIProvider.DEEPSEEK:
+            base_url = getattr(settings, 'DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+        else:
+            base_url = getattr(settings, 'OPENAI_BASE_URL', None)
+    
+    loop = asyncio.get_running_loop()
+    key = (provider.value, base_url or '', hashlib.sha256(api_key.encode()).hexdigest())
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url or None)
+            clients[key] = client
+    return client
+
+
+def configure_gemini(api_key: str):
+    """
+    google.generativeai configured for api_key.
+    The SDK keeps one global configuration; it is only reset when the key
+    (or the process) changes.
+    """
+    global _gemini_config
+    import google.generativeai as genai
+    
+    with _clients_lock:
+        if _gemini_config != (os.getpid(), api_key):
+            genai.configure(api_key=api_key)
+            _gemini_config = (os.getpid(), api_key)
+    return genai
+
+
+# =================================================================
+# Response Cache
+# =================================================================
+
+class ResponseCache:
+    """
+    Thread-safe LRU/TTL cache of deterministic completions.
+    
+    Entries are keyed by a SHA-256 of the endpoint and the full request
+    (model, messages, parameters) and kept in one bucket per scope, normally
+    the current tenant, so tenants never read each other's results and one
+    busy tenant only evicts its own entries.
+    """
+    
+    MAX_SCOPES = 256
+    
+    def __init__(self, ttl: float = 3600, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._scopes: OrderedDict = OrderedDict()  # scope -> OrderedDict(key -> (expires, value))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(endpoint: str, request: Dict[str, Any]) -> str:
+        payload = json.dumps([endpoint, request], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def get(self, scope: str, key: str):
+        with self._lock:
+            entries = self._scopes.get(scope)
+            entry = entries.get(key) if entries is not None else None
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del entries[key]
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self._scopes.move_to_end(scope)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, scope: str, key: str, value) -> None:
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries is None:
+                entries = self._scopes[scope] = OrderedDict()
+                if len(self._scopes) > self.MAX_SCOPES:
+                    self._scopes.popitem(last=False)
+            self._scopes.move_to_end(scope)
+            entries[key] = (time.monotonic() + self.ttl, value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+    
+    def clear(self, scope: Optional[str] = None) -> None:
+        with self._lock:
+            if scope is None:
+                self._scopes.clear()
+            else:
+                self._scopes.pop(scope, None)
+    
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'scopes': len(self._scopes),
+                'entries': sum(len(entries) for entries in self._scopes.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide response cache, or None when LLM_RESPONSE_CACHE_ENABLED is off"""
+    global _response_cache
+    if not settings.LLM_RESPONSE_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            ttl=settings.LLM_RESPONSE_CACHE_TTL,
+            max_entries=settings.LLM_RESPONSE_CACHE_MAX_ENTRIES,
+        )
+    return _response_cache
+
+
+def _cache_scope() -> str:
+    from core.tenants.managers import get_current_tenant
+    
+    tenant = get_current_tenant()
+    return f"tenant_{tenant.pk}" if tenant is not None else "global"
+
+
+def cached_completion(client, scope: Optional[str] = None, **kwargs):
+    """
+    client.chat.completions.create(**kwargs), answered from the response
+    cache when the request is deterministic (temperature 0, not streamed).
+    scope defaults to the current tenant.
+    """
+    cache = get_response_cache()
+    if cache is None or kwargs.get('temperature') != 0 or kwargs.get('stream'):
+        return client.chat.completions.create(**kwargs)
+    
+    scope = scope or _cache_scope()
+    key = cache.make_key(str(client.base_url), kwargs)
+    response = cache.get(scope, key)
+    if response is None:
+        response = client.chat.completions.create(**kwargs)
+        cache.set(scope, key, response)
+    return response
+
+
 class AIService:
     """
     Unified AI service that can switch between different AI providers.
@@ -55,48 +302,68 @@ class AIService:
         self.provider = provider
         self.model = model or self.DEFAULT_MODELS.get(provider)
         self._api_key = api_key
-        self._client = None
         
     @property
     def api_key(self) -> str:
         """Get API key from parameter, settings, or environment"""
         if self._api_key:
             return self._api_key
-            
-        key_mapping = {
-            AIProvider.OPENAI: ('OPENAI_API_KEY', 'OPENAI_API_KEY'),
-            AIProvider.GEMINI: ('GEMINI_API_KEY', 'GOOGLE_API_KEY'),
-            AIProvider.DEEPSEEK: ('DEEPSEEK_API_KEY', 'DEEPSEEK_API_KEY'),
-        }
-        
-        settings_key, env_key = key_mapping.get(self.provider, ('', ''))
-        
-        # Try settings first, then environment
-        return getattr(settings, settings_key, '') or os.getenv(env_key, '')
+        return provider_api_key(self.provider)
     
     def _get_openai_client(self):
-        """Initialize OpenAI client"""
-        from openai import OpenAI
-        return OpenAI(api_key=self.api_key)
+        """Shared OpenAI client"""
+        return get_llm_client(AIProvider.OPENAI, self.api_key)
     
     def _get_deepseek_client(self):
-        """Initialize DeepSeek client (OpenAI compatible)"""
-        from openai import OpenAI
-        base_url = getattr(settings, 'DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
-        return OpenAI(api_key=self.api_key, base_url=base_url)
+        """Shared DeepSeek client (OpenAI compatible)"""
+        return get_llm_client(AIProvider.DEEPSEEK, self.api_key)
     
     def _get_gemini_client(self):
         """Initialize Gemini client"""
-        import google.generativeai as genai
-        genai.configure(api_key=self.api_key)
+        genai = configure_gemini(self.api_key)
         return genai.GenerativeModel(self.model)
     
+    def _use_gateway(self, kwargs: Dict[str, Any]) -> bool:
+        """Settings-keyed, non-streaming requests go through the LLM gateway"""
+        return bool(settings.LLM_GATEWAY_ENABLED and not self._api_key and not kwargs.get('stream'))
+    
+    def _chat_gateway(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        user_id: Optional[str] = None,
+        action: str = 'chat',
+        **kwargs
+    ) -> AIResponse:
+        """
+        Chat through the shared LLM gateway: this service's provider and
+        model first, then the gateway's other providers as failover.
+        Requests with a user_id count against that user's daily quota.
+        """
+        from core.libs.llm_gateway import LLMRequest, get_llm_gateway
+        
+        gateway = get_llm_gateway()
+        providers = [self.provider.value] + [name for name in gateway.order if name != self.provider.value]
+        return gateway.complete_sync(LLMRequest(
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            providers=providers,
+            models={self.provider.value: self.model},
+            extra=kwargs,
+            user_id=user_id,
+            action=action,
+        ))
+    
     def chat(
         self, 
         message: str,
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: int = 2000,
+        user_id: Optional[str] = None,
+        action: str = 'chat',
         **kwargs
     ) -> AIResponse:
         """
@@ -107,10 +374,16 @@ class AIService:
             system_prompt: Optional system prompt
             temperature: Creativity level (0-1)
             max_tokens: Maximum response tokens
+            user_id: Requesting user, checked against AI quotas by the gateway
+            action: Label the gateway records the request under
             
         Returns:
             AIResponse object with content and metadata
         """
+        if self._use_gateway(kwargs):
+            messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+            messages.append({"role": "user", "content": message})
+            return self._chat_gateway(messages, temperature, max_tokens, user_id, action, **kwargs)
         if self.provider == AIProvider.GEMINI:
             return self._chat_gemini(message, system_prompt, temperature, max_tokens, **kwargs)
         else:
@@ -135,7 +408,8 @@ class AIService:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": message})
         
-        response = client.chat.completions.create(
+        response = cached_completion(
+            client,
             model=self.model,
             messages=messages,
             temperature=temperature,
@@ -164,9 +438,7 @@ class AIService:
         **kwargs
     ) -> AIResponse:
         """Chat using Google Gemini API"""
-        import google.generativeai as genai
-        
-        genai.configure(api_key=self.api_key)
+        genai = configure_gemini(self.api_key)
         
         generation_config = genai.GenerationConfig(
             temperature=temperature,
@@ -199,6 +471,8 @@ class AIService:
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: int = 2000,
+        user_id: Optional[str] = None,
+        action: str = 'chat',
         **kwargs
     ) -> AIResponse:
         """
@@ -209,10 +483,16 @@ class AIService:
             system_prompt: Optional system prompt
             temperature: Creativity level (0-1)
             max_tokens: Maximum response tokens
+            user_id: Requesting user, checked against AI quotas by the gateway
+            action: Label the gateway records the request under
             
         Returns:
             AIResponse object
         """
+        if self._use_gateway(kwargs):
+            api_messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+            api_messages.extend(messages)
+            return self._chat_gateway(api_messages, temperature, max_tokens, user_id, action, **kwargs)
         if self.provider == AIProvider.GEMINI:
             return self._chat_with_history_gemini(messages, system_prompt, temperature, max_tokens, **kwargs)
         else:
@@ -237,7 +517,8 @@ class AIService:
             api_messages.append({"role": "system", "content": system_prompt})
         api_messages.extend(messages)
         
-        response = client.chat.completions.create(
+        response = cached_completion(
+            client,
             model=self.model,
             messages=api_messages,
             temperature=temperature,
@@ -266,9 +547,7 @@ class AIService:
         **kwargs
     ) -> AIResponse:
         """Chat with history using Gemini API"""
-        import google.generativeai as genai
-        
-        genai.configure(api_key=self.api_key)
+        genai = configure_gemini(self.api_key)
         
         generation_config = genai.GenerationConfig(
             temperature=temperature,
@@ -340,9 +619,7 @@ class AIService:
         mime_type: str
     ) -> AIResponse:
         """Analyze image using Gemini"""
-        import google.generativeai as genai
-        
-        genai.configure(api_key=self.api_key)
+        genai = configure_gemini(self.api_key)
         model = genai.GenerativeModel("gemini-1.5-pro")
         
         response = model.generate_content([
@@ -403,9 +680,12 @@ class AIService:
 
 
 # Convenience functions
+_services: Dict[Tuple[AIProvider, Optional[str]], AIService] = {}
+
+
 def get_ai_service(provider: str = "openai", model: Optional[str] = None) -> AIService:
     """
-    Get an AI service instance.
+    Get the shared AI service instance for a provider and model.
     
     Args:
         provider: "openai", "gemini", or "deepseek"
@@ -415,7 +695,11 @@ def get_ai_service(provider: str = "openai", model: Optional[str] = None) -> AIS
         AIService instance
     """
     provider_enum = AIProvider(provider.lower())
-    return AIService(provider=provider_enum, model=model)
+    key = (provider_enum, model)
+    service = _services.get(key)
+    if service is None:
+        service = _services.setdefault(key, AIService(provider=provider_enum, model=model))
+    return service
 
 
 def quick_chat(message: str, provider: str = "openai") -> str:
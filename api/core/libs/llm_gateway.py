@@ -0,0 +1,502 @@
+"""
+Async LLM Gateway for Wisematic ERP
+
+One asyncio event loop per process, running in a background thread,
+multiplexes every completion over AsyncOpenAI (OpenAI, DeepSeek) and async
+Gemini clients, so a burst of requests shares a few keep-alive connection
+pools instead of holding one blocked worker thread per provider call.
+
+Per provider:
+- a token bucket for requests per minute and one for tokens per minute
+  (LLM_GATEWAY_PROVIDER_LIMITS), plus a cap on in-flight requests
+- failover: a rate-limited (429), overloaded (5xx), timed-out or
+  unreachable provider hands the request to the next one in order
+- hedging: when the current attempt has not answered after
+  LLM_GATEWAY_HEDGE_AFTER seconds, the next provider is tried as well and
+  the first answer wins
+
+Requests carrying a user_id are checked against and recorded in the
+LLM_GATEWAY_QUOTA_CONTROLLER (AIRequestController) daily quotas.
+
+Usage:
+    gateway = get_llm_gateway()
+    response = gateway.complete_sync(LLMRequest(messages=[...]))
+    responses = gateway.complete_many_sync([LLMRequest(...), ...])
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from core.libs.ai_service import (
+    AIProvider, AIResponse, _cache_scope, configure_gemini, get_response_cache, provider_api_key,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """Raised when no provider could answer a request"""
+
+    def __init__(self, message: str, errors: Optional[List[Exception]] = None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+class QuotaExceeded(GatewayError):
+    """Raised when the user's daily AI quota does not cover the request"""
+    pass
+
+
+@dataclass
+class ProviderConfig:
+    """One upstream the gateway can send requests to"""
+    name: str
+    kind: AIProvider
+    model: str
+    api_key: str
+    base_url: Optional[str] = None
+    rpm: int = 500
+    tpm: int = 200000
+    concurrency: int = 64
+
+
+@dataclass
+class LLMRequest:
+    """
+    A chat completion request.
+
+    providers: failover order (gateway order when empty)
+    models: model per provider name, overriding the provider default
+    extra: further chat.completions parameters (response_format, tools...);
+           Gemini only understands a JSON response_format and is skipped
+           for anything else
+    """
+    messages: List[Dict[str, Any]]
+    temperature: float = 0.7
+    max_tokens: int = 2000
+    providers: Sequence[str] = ()
+    models: Dict[str, str] = field(default_factory=dict)
+    extra: Dict[str, Any] = field(default_factory=dict)
+    user_id: Optional[str] = None
+    action: str = 'chat'
+    cache_scope: Optional[str] = None
+
+
+def estimate_request_tokens(request: LLMRequest) -> int:
+    """Prompt tokens (~4 characters each) plus the completion allowance"""
+    chars = sum(len(str(message.get('content') or '')) for message in request.messages)
+    return chars // 4 + request.max_tokens
+
+
+def is_retriable(exc: BaseException) -> bool:
+    """Errors another provider (or a later attempt) may not have"""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+        if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+    except ImportError:
+        pass
+    # openai.APIStatusError.status_code, google.api_core GoogleAPICallError.code
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'code', None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return False
+
+
+# =================================================================
+# Rate Limiting
+# =================================================================
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at rate_per_minute.
+    Waiters are served in arrival order; a request larger than the
+    bucket only has to wait for a full bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Take amount tokens, returning the seconds spent waiting"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class ProviderLimiter:
+    """Requests/minute, tokens/minute and in-flight limits of one provider"""
+
+    def __init__(self, config: ProviderConfig):
+        self.requests = TokenBucket(config.rpm)
+        self.tokens = TokenBucket(config.tpm)
+        self.in_flight = asyncio.Semaphore(config.concurrency)
+
+
+# =================================================================
+# Gateway
+# =================================================================
+
+class LLMGateway:
+    """
+    Concurrent completions with per-provider limits, failover and hedging.
+
+    Coroutines run on the gateway's own event loop (clients, buckets and
+    semaphores are bound to it); sync code uses complete_sync and async
+    code on another loop awaits acomplete.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[ProviderConfig],
+        hedge_after: Optional[float] = None,
+        timeout: float = 60,
+        controller=None,
+    ):
+        self.providers = {config.name: config for config in providers}
+        self.order = [config.name for config in providers]
+        self.hedge_after = hedge_after
+        self.timeout = timeout
+        self.controller = controller
+        self.stats: Dict[str, Counter] = defaultdict(Counter)
+        self._limiters: Dict[str, ProviderLimiter] = {}
+        self._clients: Dict[str, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> 'LLMGateway':
+        """Gateway over LLM_GATEWAY_PROVIDERS that have an API key"""
+        from core.libs.ai_service import AIService
+
+        limits = settings.LLM_GATEWAY_PROVIDER_LIMITS
+        providers = []
+        for name in settings.LLM_GATEWAY_PROVIDERS:
+            kind = AIProvider(name)
+            api_key = provider_api_key(kind)
+            if not api_key:
+                continue
+            if kind == AIProvider.DEEPSEEK:
+                base_url = settings.DEEPSEEK_BASE_URL
+            elif kind == AIProvider.OPENAI:
+                base_url = settings.OPENAI_BASE_URL
+            else:
+                base_url = None
+            providers.append(ProviderConfig(
+                name=name, kind=kind, model=AIService.DEFAULT_MODELS[kind],
+                api_key=api_key, base_url=base_url, **limits.get(name, {}),
+            ))
+
+        controller = settings.LLM_GATEWAY_QUOTA_CONTROLLER
+        return cls(
+            providers,
+            hedge_after=settings.LLM_GATEWAY_HEDGE_AFTER or None,
+            timeout=settings.LLM_GATEWAY_TIMEOUT,
+            controller=import_string(controller) if controller else None,
+        )
+
+    # =================================================================
+    # Sync / cross-loop facade
+    # =================================================================
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=loop.run_forever, name='llm-gateway', daemon=True,
+                )
+                self._thread.start()
+                self._loop = loop
+        return self._loop
+
+    def submit(self, coro):
+        """Schedule coro on the gateway loop, returning a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def complete_sync(self, request: LLMRequest) -> AIResponse:
+        """
+        Blocking complete() for sync callers. Deterministic requests
+        (temperature 0, no user quota) are answered from the response
+        cache, scoped to the caller's tenant.
+        """
+        cache = get_response_cache()
+        cacheable = cache is not None and request.temperature == 0 and not request.user_id
+        if cacheable:
+            scope = request.cache_scope or _cache_scope()
+            key = cache.make_key('llm_gateway', {
+                'messages': request.messages, 'temperature': request.temperature,
+                'max_tokens': request.max_tokens, 'providers': list(request.providers or self.order),
+                'models': request.models, 'extra': request.extra,
+            })
+            response = cache.get(scope, key)
+            if response is not None:
+                return response
+
+        response = self.submit(self.complete(request)).result()
+        if cacheable:
+            cache.set(scope, key, response)
+        return response
+
+    def complete_many_sync(self, requests: Sequence[LLMRequest]) -> List[Any]:
+        """Run requests concurrently; failed ones come back as exceptions"""
+        return self.submit(self.complete_many(requests)).result()
+
+    async def acomplete(self, request: LLMRequest) -> AIResponse:
+        """complete() awaited from another event loop (ASGI views)"""
+        return await asyncio.wrap_future(self.submit(self.complete(request)))
+
+    def close(self) -> None:
+        """Close the clients and stop the loop thread"""
+        if self._loop is None:
+            return
+        self.submit(self._close_clients()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    async def _close_clients(self) -> None:
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+    # =================================================================
+    # Async API (gateway loop)
+    # =================================================================
+
+    async def complete_many(self, requests: Sequence[LLMRequest]) -> List[Any]:
+        return await asyncio.gather(*(self.complete(request) for request in requests), return_exceptions=True)
+
+    async def complete(self, request: LLMRequest) -> AIResponse:
+        """Answer request from the first provider that succeeds"""
+        if request.user_id and self.controller is not None:
+            check = self.controller.check_request(request.user_id, estimate_request_tokens(request))
+            if not check['allowed']:
+                raise QuotaExceeded(check.get('reason', 'AI quota exceeded'))
+
+        started = time.perf_counter()
+        response, error = None, None
+        try:
+            response = await self._failover(request)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if request.user_id and self.controller is not None:
+                usage = (response.usage if response else None) or {}
+                self.controller.record_request(
+                    user_id=request.user_id,
+                    action=request.action,
+                    model=response.model if response else '',
+                    input_tokens=usage.get('prompt_tokens', 0),
+                    output_tokens=usage.get('completion_tokens', 0),
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens,
+                    duration_ms=(time.perf_counter() - started) * 1000,
+                    success=error is None,
+                    error_message=str(error) if error else None,
+                )
+
+    def _candidates(self, request: LLMRequest) -> List[str]:
+        names = [name for name in (request.providers or self.order) if name in self.providers]
+        if set(request.extra) - {'response_format'}:
+            names = [name for name in names if self.providers[name].kind != AIProvider.GEMINI]
+        return names
+
+    async def _failover(self, request: LLMRequest) -> AIResponse:
+        """
+        Try providers in order. The next one starts when the current attempt
+        fails with a retriable error, or runs longer than hedge_after.
+        """
+        candidates = self._candidates(request)
+        if not candidates:
+            raise GatewayError("No configured AI provider can serve this request")
+
+        errors: List[Exception] = []
+        pending = set()
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            name = candidates[next_index]
+            next_index += 1
+            task = asyncio.ensure_future(self._attempt(name, request))
+            task.provider = name
+            pending.add(task)
+
+        launch()
+        try:
+            while pending:
+                can_hedge = self.hedge_after and next_index < len(candidates)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    self.stats[candidates[next_index]]['hedged'] += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    pending.discard(task)
+                    exc = task.exception()
+                    if exc is None:
+                        return task.result()
+                    errors.append(exc)
+                    if not is_retriable(exc):
+                        raise exc
+                    logger.warning("LLM provider %s failed, failing over: %s", task.provider, exc)
+
+                if not pending and next_index < len(candidates):
+                    launch()
+        finally:
+            # Losing hedges and attempts still queued on a limiter
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        raise GatewayError(f"All AI providers failed: {errors[-1]}", errors)
+
+    async def _attempt(self, name: str, request: LLMRequest) -> AIResponse:
+        config = self.providers[name]
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            limiter = self._limiters[name] = ProviderLimiter(config)
+
+        stats = self.stats[name]
+        stats['requests'] += 1
+        waited = await limiter.requests.acquire()
+        waited += await limiter.tokens.acquire(estimate_request_tokens(request))
+        if waited:
+            stats['throttled'] += 1
+
+        try:
+            async with limiter.in_flight:
+                model = request.models.get(name, config.model)
+                if config.kind == AIProvider.GEMINI:
+                    call = self._gemini(config, model, request)
+                else:
+                    call = self._openai_compatible(config, model, request)
+                response = await asyncio.wait_for(call, self.timeout)
+        except asyncio.CancelledError:
+            stats['cancelled'] += 1
+            raise
+        except Exception:
+            stats['failed'] += 1
+            raise
+        stats['succeeded'] += 1
+        return response
+
+    def _client(self, config: ProviderConfig):
+        """AsyncOpenAI client per (provider, base URL, API key) on the gateway loop"""
+        key = f"{config.kind.value}|{config.base_url or ''}|{hashlib.sha256(config.api_key.encode()).hexdigest()}"
+        client = self._clients.get(key)
+        if client is None:
+            from openai import AsyncOpenAI
+            # Failover replaces the SDK's own retries
+            client = AsyncOpenAI(api_key=config.api_key, base_url=config.base_url or None, max_retries=0)
+            self._clients[key] = client
+        return client
+
+    async def _openai_compatible(self, config: ProviderConfig, model: str, request: LLMRequest) -> AIResponse:
+        response = await self._client(config).chat.completions.create(
+            model=model,
+            messages=request.messages,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+            **request.extra
+        )
+        return AIResponse(
+            content=response.choices[0].message.content,
+            provider=config.kind.value,
+            model=model,
+            usage={
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens,
+            } if response.usage else None,
+            raw_response=response
+        )
+
+    async def _gemini(self, config: ProviderConfig, model_name: str, request: LLMRequest) -> AIResponse:
+        genai = configure_gemini(config.api_key)
+
+        system_prompt = "\n\n".join(
+            message['content'] for message in request.messages if message['role'] == 'system'
+        )
+        contents = [
+            {"role": "user" if message['role'] == 'user' else "model", "parts": [message['content']]}
+            for message in request.messages if message['role'] != 'system'
+        ]
+        response_format = request.extra.get('response_format') or {}
+        generation_config = genai.GenerationConfig(
+            temperature=request.temperature,
+            max_output_tokens=request.max_tokens,
+            response_mime_type='application/json' if response_format.get('type') == 'json_object' else None,
+        )
+        model = genai.GenerativeModel(
+            model_name,
+            generation_config=generation_config,
+            system_instruction=system_prompt or None,
+        )
+
+        response = await model.generate_content_async(contents)
+
+        return AIResponse(
+            content=response.text,
+            provider=config.kind.value,
+            model=model_name,
+            usage={
+                "prompt_tokens": response.usage_metadata.prompt_token_count,
+                "completion_tokens": response.usage_metadata.candidates_token_count,
+                "total_tokens": response.usage_metadata.total_token_count,
+            } if hasattr(response, 'usage_metadata') else None,
+            raw_response=response
+        )
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_pid: Optional[int] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """
+    Process-wide gateway built from settings. A forked worker builds its
+    own, since the parent's loop thread does not survive the fork.
+    """
+    global _gateway, _gateway_pid
+    with _gateway_lock:
+        if _gateway is None or _gateway_pid != os.getpid():
+            _gateway = LLMGateway.from_settings()
+            _gateway_pid = os.getpid()
+    return _gateway
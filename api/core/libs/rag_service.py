@@ -2,10 +2,18 @@
 RAG (Retrieval Augmented Generation) Knowledge Base Service.
 Stores and retrieves help documentation for the AI assistant.
 Supports bilingual (EN/ZH) content.
+
+Search runs against a BM25 inverted index built once at load time and
+extended incrementally by add_item. Query scoring, category/language masks
+and top-k selection are vectorized with numpy; when items carry embeddings
+a dense (faiss ANN or numpy) similarity is blended in.
 """
 import os
+import re
 import json
-from typing import List, Dict, Optional
+import math
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 import numpy as np
 
@@ -37,6 +45,149 @@ class KnowledgeItem:
     embedding: Optional[np.ndarray] = None
 
 
+# Latin words/numbers, and runs of CJK ideographs (indexed as unigrams + bigrams)
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens plus CJK unigrams and bigrams"""
+    return [token for token, _offset in iter_tokens(text)]
+
+
+def iter_tokens(text: str):
+    """Yield (token, character offset) pairs in the same scheme as tokenize()"""
+    if not text:
+        return
+    text = text.lower()
+    for match in _WORD_RE.finditer(text):
+        yield match.group(), match.start()
+    for match in _CJK_RE.finditer(text):
+        run, start = match.group(), match.start()
+        for i, char in enumerate(run):
+            yield char, start + i
+        for i in range(len(run) - 1):
+            yield run[i:i + 2], start + i
+
+
+class KeywordIndex:
+    """
+    Incremental BM25 inverted index over knowledge items.
+
+    Each item gets a slot; postings keep (slot, term frequency) per token and
+    are frozen into numpy arrays on first use. Title terms are weighted
+    TITLE_WEIGHT times content terms. Replacing an item retires its old slot.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    TITLE_WEIGHT = 3.0
+    LANGUAGES = ('en', 'zh')
+
+    def __init__(self):
+        self.slot_ids: List[str] = []
+        self.id_to_slot: Dict[str, int] = {}
+        self._postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        self._frozen: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lengths: List[float] = []
+        self._alive: List[bool] = []
+        self._categories: List[str] = []
+        self._languages: Dict[str, List[bool]] = {language: [] for language in self.LANGUAGES}
+        self._arrays = None
+        self._masks: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def __len__(self):
+        return len(self.id_to_slot)
+
+    def add(self, item: 'KnowledgeItem') -> int:
+        """Index an item (replacing any previous version). Returns its slot."""
+        previous = self.id_to_slot.get(item.id)
+        if previous is not None:
+            self._alive[previous] = False
+
+        slot = len(self.slot_ids)
+        self.slot_ids.append(item.id)
+        self.id_to_slot[item.id] = slot
+
+        title_terms = Counter(tokenize(item.title_en or item.title) + tokenize(item.title_zh))
+        content_terms = Counter(tokenize(item.content_en or item.content) + tokenize(item.content_zh))
+        length = 0.0
+        for token in title_terms.keys() | content_terms.keys():
+            tf = title_terms[token] * self.TITLE_WEIGHT + content_terms[token]
+            length += tf
+            slots, tfs = self._postings.setdefault(token, ([], []))
+            slots.append(slot)
+            tfs.append(tf)
+            self._frozen.pop(token, None)
+
+        self._lengths.append(length)
+        self._alive.append(True)
+        self._categories.append(item.category)
+        self._languages['en'].append(bool(item.title_en or item.content_en or item.title or item.content))
+        self._languages['zh'].append(bool(item.title_zh or item.content_zh))
+
+        self._arrays = None
+        self._masks.clear()
+        return slot
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every slot for the query (retired slots score 0)"""
+        lengths, alive = self._materialize()
+        scores = np.zeros(len(lengths), dtype=np.float64)
+        live = int(alive.sum())
+        if not live:
+            return scores
+
+        norm = self.K1 * (1 - self.B + self.B * lengths / max(lengths[alive].mean(), 1e-9))
+        for token, query_tf in Counter(tokenize(query)).items():
+            postings = self._posting_arrays(token)
+            if postings is None:
+                continue
+            slots, tfs = postings
+            df = int(alive[slots].sum())
+            if not df:
+                continue
+            idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+            scores[slots] += query_tf * idf * tfs * (self.K1 + 1) / (tfs + norm[slots])
+
+        scores[~alive] = 0.0
+        return scores
+
+    def mask(self, category: Optional[str] = None, language: Optional[str] = None) -> np.ndarray:
+        """Cached boolean mask of live slots matching category / language"""
+        key = (category or '', language or '')
+        cached = self._masks.get(key)
+        if cached is not None:
+            return cached
+
+        _lengths, alive = self._materialize()
+        mask = alive.copy()
+        if category:
+            mask &= np.asarray(self._categories, dtype=object) == category
+        if language:
+            mask &= np.asarray(self._languages.get(language, [False] * len(mask)), dtype=bool)
+        self._masks[key] = mask
+        return mask
+
+    def _materialize(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = (
+                np.asarray(self._lengths, dtype=np.float64),
+                np.asarray(self._alive, dtype=bool),
+            )
+        return self._arrays
+
+    def _posting_arrays(self, token: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        frozen = self._frozen.get(token)
+        if frozen is None:
+            postings = self._postings.get(token)
+            if postings is None:
+                return None
+            frozen = (np.asarray(postings[0], dtype=np.int64), np.asarray(postings[1], dtype=np.float64))
+            self._frozen[token] = frozen
+        return frozen
+
+
 class RAGKnowledgeBase:
     """
     RAG Knowledge Base for ERP help documentation.
@@ -44,15 +195,28 @@ class RAGKnowledgeBase:
     Supports bilingual (EN/ZH) content.
     """
     
-    def __init__(self):
+    # Weight of dense similarity relative to the normalised BM25 score
+    EMBEDDING_WEIGHT = 1.0
+    
+    # Use a faiss HNSW index (approximate) above this many embedded items
+    FAISS_MIN_ITEMS = 5000
+    
+    def __init__(self, load: bool = True):
         self.items: Dict[str, KnowledgeItem] = {}
-        self.index = None
-        self.id_to_index: Dict[str, int] = {}
-        self.index_to_id: Dict[int, str] = {}
-        self._initialized = False
+        self.index = KeywordIndex()
+        self._embeddings = None
         
         # Load knowledge base from JSON file
-        self._load_knowledge_from_json()
+        if load:
+            self._load_knowledge_from_json()
+        self._build_index()
+    
+    def _build_index(self):
+        """Index every loaded item"""
+        self.index = KeywordIndex()
+        for item in self.items.values():
+            self.index.add(item)
+        self._embeddings = None
     
     def _load_knowledge_from_json(self):
         """Load knowledge base from JSON file"""
@@ -119,63 +283,96 @@ class RAGKnowledgeBase:
     def add_item(self, item: KnowledgeItem):
         """Add an item to the knowledge base"""
         self.items[item.id] = item
-        self._initialized = False  # Need to rebuild index
+        self.index.add(item)
+        if item.embedding is not None or self._embeddings is not None:
+            self._embeddings = None  # Rebuilt on next embedding query
     
-    def search(self, query: str, top_k: int = 3, category: Optional[str] = None, language: str = 'en') -> List[KnowledgeItem]:
+    def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        category: Optional[str] = None,
+        language: str = 'en',
+        language_only: bool = False,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> List[KnowledgeItem]:
         """
         Search the knowledge base for relevant items.
-        Falls back to keyword search if embeddings not available.
+        BM25 keyword scoring, blended with embedding similarity when a
+        query embedding is given and items have embeddings.
         
         Args:
             query: Search query
             top_k: Number of results to return
             category: Optional category filter
             language: 'en' or 'zh' for language preference
+            language_only: Only return items that have content in `language`
+            query_embedding: Optional embedding of the query
         """
-        results = []
+        if top_k <= 0 or not self.items:
+            return []
         
-        # Simple keyword search (fallback)
-        query_lower = query.lower()
+        scores = self.index.scores(query)
+        top = scores.max() if len(scores) else 0.0
+        if top > 0:
+            scores = scores / top
         
-        for item in self.items.values():
-            if category and item.category != category:
-                continue
-            
-            # Score based on keyword matching in both languages
-            score = 0
-            
-            # Search in title (both languages)
-            title_en = item.title_en.lower() if item.title_en else item.title.lower()
-            title_zh = item.title_zh if item.title_zh else ''
-            
-            if query_lower in title_en:
-                score += 3
-            if query_lower in title_zh:
-                score += 3
-            
-            # Search in content (both languages)
-            content_en = item.content_en.lower() if item.content_en else item.content.lower()
-            content_zh = item.content_zh if item.content_zh else ''
-            
-            if query_lower in content_en:
-                score += 1
-            if query_lower in content_zh:
-                score += 1
-            
-            # Check for word overlap
-            query_words = set(query_lower.split())
-            title_words = set(title_en.split()) | set(title_zh.split() if title_zh else [])
-            content_words = set(content_en.split()) | set(content_zh.split() if content_zh else [])
-            
-            score += len(query_words & title_words) * 2
-            score += len(query_words & content_words) * 0.5
-            
-            if score > 0:
-                results.append((score, item))
+        if query_embedding is not None:
+            slots, similarities = self._dense_scores(query_embedding, top_k)
+            scores[slots] += self.EMBEDDING_WEIGHT * np.maximum(similarities, 0)
+        
+        mask = self.index.mask(category, language if language_only else None)
+        scores = np.where(mask & (scores > 0), scores, 0.0)
+        
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [self.items[self.index.slot_ids[slot]] for slot in candidates]
+    
+    def _dense_scores(self, query_embedding: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine similarity of the query against embedded items.
+        Uses a faiss HNSW index for large collections, otherwise one matrix product.
+        """
+        if self._embeddings is None:
+            self._embeddings = self._build_embeddings()
+        slots, matrix, ann = self._embeddings
+        if not len(slots):
+            return slots, np.zeros(0, dtype=np.float32)
+        
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        
+        if ann is not None:
+            # Over-fetch so masks applied afterwards still leave top_k results
+            found_scores, found = ann.search(query, min(len(slots), max(top_k * 20, 100)))
+            keep = found[0] >= 0
+            return slots[found[0][keep]], found_scores[0][keep]
+        
+        return slots, matrix @ query[0]
+    
+    def _build_embeddings(self):
+        """(slots, normalised matrix, optional faiss index) for items with embeddings"""
+        slots, vectors = [], []
+        for item_id, slot in self.index.id_to_slot.items():
+            embedding = self.items[item_id].embedding
+            if embedding is not None:
+                slots.append(slot)
+                vectors.append(np.asarray(embedding, dtype=np.float32))
+        
+        if not vectors:
+            return np.zeros(0, dtype=np.int64), None, None
+        
+        matrix = np.vstack(vectors)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        
+        ann = None
+        if HAS_FAISS and len(vectors) >= self.FAISS_MIN_ITEMS:
+            ann = faiss.IndexHNSWFlat(matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            ann.add(matrix)
         
-        # Sort by score and return top_k
-        results.sort(key=lambda x: x[0], reverse=True)
-        return [item for _, item in results[:top_k]]
+        return np.asarray(slots, dtype=np.int64), matrix, ann
     
     def get_context_for_query(self, query: str, category: Optional[str] = None, language: str = 'en') -> str:
         """
@@ -0,0 +1,154 @@
+"""
+Benchmark the async LLM gateway against local fake providers
+Usage: python manage.py benchmark_llm_gateway --requests 500 --latency 200 --fail-rate 0.1
+
+Starts two OpenAI-compatible stub servers ("primary" and "fallback") that
+answer /v1/chat/completions after --latency ms. The primary rejects
+--fail-rate of requests with 429 and answers --tail-rate of them only
+after --tail-latency ms, so failover and hedging have work to do.
+
+Reports throughput and latency of:
+- blocking: one sync client call after another (the pre-gateway path),
+  timed on --baseline requests
+- gateway: --requests concurrent requests through LLMGateway
+No database access.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from openai import OpenAI
+
+from core.libs.ai_service import AIProvider
+from core.libs.llm_gateway import LLMGateway, LLMRequest, ProviderConfig
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal chat.completions endpoint; behaviour comes from server.config"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        config = self.server.config
+
+        if random.random() < config['fail_rate']:
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}})
+            return
+
+        tail = random.random() < config['tail_rate']
+        time.sleep(config['tail_latency'] if tail else config['latency'])
+        self._send(200, {
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body['model'],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 20, "completion_tokens": 1, "total_tokens": 21},
+        })
+
+    def _send(self, status, payload):
+        payload = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class Command(BaseCommand):
+    help = 'Measure LLM gateway throughput under a burst of concurrent requests against stub providers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--baseline', type=int, default=20, help='requests timed on the blocking path')
+        parser.add_argument('--latency', type=float, default=200, help='ms per stub answer')
+        parser.add_argument('--fail-rate', type=float, default=0.1, help='share of 429s from the primary')
+        parser.add_argument('--tail-rate', type=float, default=0.02, help='share of slow primary answers')
+        parser.add_argument('--tail-latency', type=float, default=3000, help='ms for a slow answer')
+        parser.add_argument('--hedge-after', type=float, default=1000, help='ms, 0 disables hedging')
+        parser.add_argument('--rpm', type=int, default=60000, help='per-provider requests per minute')
+        parser.add_argument('--concurrency', type=int, default=256, help='per-provider in-flight requests')
+
+    def handle(self, *args, **options):
+        primary = self._server(options, fail_rate=options['fail_rate'], tail_rate=options['tail_rate'])
+        fallback = self._server(options, fail_rate=0, tail_rate=0)
+        try:
+            self._blocking(primary, options)
+            self._gateway(primary, fallback, options)
+        finally:
+            primary.shutdown()
+            fallback.shutdown()
+
+    def _server(self, options, fail_rate, tail_rate):
+        server = StubServer(('127.0.0.1', 0), StubHandler)
+        server.config = {
+            'latency': options['latency'] / 1000,
+            'fail_rate': fail_rate,
+            'tail_rate': tail_rate,
+            'tail_latency': options['tail_latency'] / 1000,
+        }
+        server.base_url = f'http://127.0.0.1:{server.server_address[1]}/v1'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def _request(self):
+        return LLMRequest(messages=[{"role": "user", "content": "Summarise this receipt"}], max_tokens=50)
+
+    def _blocking(self, primary, options):
+        # SDK retries stand in for failover on this path
+        client = OpenAI(api_key='stub', base_url=primary.base_url, max_retries=5)
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(options['baseline']):
+            request_started = time.perf_counter()
+            client.chat.completions.create(model='stub', messages=self._request().messages, max_tokens=50)
+            latencies.append(time.perf_counter() - request_started)
+        self._report('blocking', latencies, time.perf_counter() - started)
+
+    def _gateway(self, primary, fallback, options):
+        limits = {'rpm': options['rpm'], 'tpm': options['rpm'] * 1000, 'concurrency': options['concurrency']}
+        gateway = LLMGateway(
+            [
+                ProviderConfig('primary', AIProvider.OPENAI, 'stub', 'stub', primary.base_url, **limits),
+                ProviderConfig('fallback', AIProvider.DEEPSEEK, 'stub', 'stub', fallback.base_url, **limits),
+            ],
+            hedge_after=options['hedge_after'] / 1000 or None,
+        )
+
+        async def timed(request):
+            request_started = time.perf_counter()
+            await gateway.complete(request)
+            return time.perf_counter() - request_started
+
+        async def burst():
+            return await asyncio.gather(
+                *(timed(self._request()) for _ in range(options['requests'])), return_exceptions=True
+            )
+
+        try:
+            started = time.perf_counter()
+            results = gateway.submit(burst()).result()
+            elapsed = time.perf_counter() - started
+        finally:
+            gateway.close()
+
+        latencies = [result for result in results if isinstance(result, float)]
+        self._report('gateway', latencies, elapsed, failed=len(results) - len(latencies))
+        for name, counts in gateway.stats.items():
+            self.stdout.write(f"  {name}: " + ', '.join(f"{key} {value}" for key, value in sorted(counts.items())))
+
+    def _report(self, label, latencies, elapsed, failed=0):
+        ms = np.array(latencies) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {len(latencies)} requests in {elapsed:.2f}s ({len(latencies) / elapsed:,.1f} req/s), "
+            f"p50 {np.percentile(ms, 50):.0f} ms, p99 {np.percentile(ms, 99):.0f} ms, {failed} failed"
+        ))
@@ -105,10 +105,12 @@ class Notification(BaseModel):
     def mark_as_read(self):
         """Mark notification as read"""
         from django.utils import timezone
+        from core.services.notification_service import NotificationService
         if not self.is_read:
             self.is_read = True
             self.read_at = timezone.now()
             self.save(update_fields=['is_read', 'read_at'])
+            NotificationService.invalidate_counts([self.user_id])
 
 
 class NotificationPreference(BaseModel):
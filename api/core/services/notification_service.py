@@ -6,7 +6,10 @@ Service layer for creating and sending notifications.
 from typing import List, Optional, Dict, Any
 from django.conf import settings
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Count
 from django.template.loader import render_to_string
 from django.contrib.auth import get_user_model
 
@@ -18,6 +21,9 @@ from core.models_notifications import (
 User = get_user_model()
 
 
+COUNTS_KEY = 'notifications:counts:{}'
+
+
 class NotificationService:
     """
     Service for creating and managing notifications
@@ -29,57 +35,12 @@ class NotificationService:
         user,
         title: str,
         message: str,
-        notification_type: str = NotificationType.INFO,
-        category: str = NotificationCategory.SYSTEM,
-        priority: str = NotificationPriority.NORMAL,
-        action_url: Optional[str] = None,
-        action_label: Optional[str] = None,
-        related_object_type: Optional[str] = None,
-        related_object_id: Optional[str] = None,
-        metadata: Optional[Dict[str, Any]] = None,
-        expires_at=None,
-        send_email: bool = False,
-        send_push: bool = False,
+        **kwargs
     ) -> Notification:
         """
         Create a new notification for a user
         """
-        notification = Notification.objects.create(
-            user=user,
-            title=title,
-            message=message,
-            notification_type=notification_type,
-            category=category,
-            priority=priority,
-            action_url=action_url,
-            action_label=action_label,
-            related_object_type=related_object_type,
-            related_object_id=related_object_id,
-            metadata=metadata or {},
-            expires_at=expires_at,
-        )
-        
-        # Log in-app notification
-        NotificationLog.objects.create(
-            notification=notification,
-            user=user,
-            channel='IN_APP',
-            status='DELIVERED',
-            recipient=str(user.id),
-            content=message,
-            delivered_at=timezone.now()
-        )
-        
-        # Check user preferences and send via additional channels
-        preferences = cls.get_user_preferences(user)
-        
-        if send_email and preferences.email_enabled:
-            cls.send_email_notification(notification, user)
-        
-        if send_push and preferences.push_enabled:
-            cls.send_push_notification(notification, user)
-        
-        return notification
+        return cls.create_bulk_notification([user], title, message, **kwargs)[0]
     
     @classmethod
     def create_bulk_notification(
@@ -87,20 +48,97 @@ class NotificationService:
         users: List,
         title: str,
         message: str,
-        **kwargs
+        notification_type: str = NotificationType.INFO,
+        category: str = NotificationCategory.SYSTEM,
+        priority: str = NotificationPriority.NORMAL,
+        action_url: Optional[str] = None,
+        action_label: Optional[str] = None,
+        related_object_type: Optional[str] = None,
+        related_object_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        expires_at=None,
+        send_email: bool = False,
+        send_push: bool = False,
     ) -> List[Notification]:
         """
         Create notifications for multiple users
+        
+        Preferences are read in one query, notifications and their delivery
+        logs are inserted with bulk_create, and email/push delivery is queued
+        to deliver_notifications once the transaction commits.
         """
-        notifications = []
-        for user in users:
-            notification = cls.create_notification(
+        users = list(users)
+        if not users:
+            return []
+        
+        notifications = [
+            Notification(
                 user=user,
                 title=title,
                 message=message,
-                **kwargs
+                notification_type=notification_type,
+                category=category,
+                priority=priority,
+                action_url=action_url,
+                action_label=action_label,
+                related_object_type=related_object_type,
+                related_object_id=related_object_id,
+                metadata=metadata or {},
+                expires_at=expires_at,
             )
-            notifications.append(notification)
+            for user in users
+        ]
+        
+        preferences = cls.get_bulk_preferences(users) if send_email or send_push else {}
+        now = timezone.now()
+        logs = []
+        pending = []
+        for notification, user in zip(notifications, users):
+            # Log in-app notification
+            logs.append(NotificationLog(
+                notification=notification,
+                user=user,
+                channel='IN_APP',
+                status='DELIVERED',
+                recipient=str(user.id),
+                content=message,
+                delivered_at=now,
+            ))
+            
+            # Queue additional channels the user has enabled
+            user_preferences = preferences.get(user.pk)
+            if send_email and user_preferences.email_enabled and user.email:
+                subject, plain_message, _ = cls.render_email(notification)
+                pending.append(NotificationLog(
+                    notification=notification,
+                    user=user,
+                    channel='EMAIL',
+                    status='PENDING',
+                    recipient=user.email,
+                    subject=subject,
+                    content=plain_message,
+                ))
+            if send_push and user_preferences.push_enabled:
+                pending.append(NotificationLog(
+                    notification=notification,
+                    user=user,
+                    channel='PUSH',
+                    status='PENDING',
+                    recipient=str(user.id),
+                    subject=title,
+                    content=message,
+                ))
+        
+        batch_size = settings.NOTIFICATION_BATCH_SIZE
+        with transaction.atomic():
+            Notification.objects.bulk_create(notifications, batch_size=batch_size)
+            NotificationLog.objects.bulk_create(logs + pending, batch_size=batch_size)
+            user_ids = [user.pk for user in users]
+            cls.invalidate_counts(user_ids)
+            transaction.on_commit(lambda: cls.invalidate_counts(user_ids))
+            if pending:
+                transaction.on_commit(lambda: cls.queue_delivery([log.id for log in pending]), robust=True)
+        
         return notifications
     
     @classmethod
@@ -112,83 +150,146 @@ class NotificationService:
         return preferences
     
     @classmethod
-    def send_email_notification(cls, notification: Notification, user) -> bool:
+    def get_bulk_preferences(cls, users: List) -> Dict[Any, NotificationPreference]:
         """
-        Send notification via email
+        Notification preferences keyed by user id, creating defaults for
+        users that have none yet
         """
-        try:
-            subject = f"[{notification.category}] {notification.title}"
-            
-            # Simple HTML email
-            html_message = f"""
-            <html>
-            <body>
-                <h2>{notification.title}</h2>
-                <p>{notification.message}</p>
-                {f'<p><a href="{notification.action_url}">{notification.action_label or "View Details"}</a></p>' if notification.action_url else ''}
-                <hr>
-                <p style="color: #666; font-size: 12px;">
-                    This is an automated notification from AutoBooks.
-                </p>
-            </body>
-            </html>
-            """
-            
-            plain_message = f"{notification.title}\n\n{notification.message}"
-            if notification.action_url:
-                plain_message += f"\n\nView: {notification.action_url}"
-            
-            # Create log entry
-            log = NotificationLog.objects.create(
-                notification=notification,
-                user=user,
-                channel='EMAIL',
-                status='PENDING',
-                recipient=user.email,
-                subject=subject,
-                content=plain_message,
-            )
-            
-            # Send email
-            sent = send_mail(
-                subject=subject,
-                message=plain_message,
-                html_message=html_message,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@autobooks.com'),
-                recipient_list=[user.email],
-                fail_silently=True,
+        preferences = {
+            preference.user_id: preference
+            for preference in NotificationPreference.objects.filter(user__in=users)
+        }
+        missing = [NotificationPreference(user=user) for user in users if user.pk not in preferences]
+        if missing:
+            NotificationPreference.objects.bulk_create(
+                missing, batch_size=settings.NOTIFICATION_BATCH_SIZE, ignore_conflicts=True
             )
-            
-            # Update log
-            if sent:
+            preferences.update((preference.user_id, preference) for preference in missing)
+        return preferences
+    
+    # Delivery through the deliver_notifications task
+    
+    @classmethod
+    def queue_delivery(cls, log_ids: List) -> None:
+        """
+        Send pending email/push logs through the deliver_notifications task,
+        one task per NOTIFICATION_BATCH_SIZE logs
+        """
+        from core.tasks import deliver_notifications
+        
+        batch_size = settings.NOTIFICATION_BATCH_SIZE
+        for start in range(0, len(log_ids), batch_size):
+            deliver_notifications.delay([str(log_id) for log_id in log_ids[start:start + batch_size]])
+    
+    @classmethod
+    def render_email(cls, notification: Notification):
+        """
+        Subject, plain text and HTML body of a notification email
+        """
+        subject = f"[{notification.category}] {notification.title}"
+        
+        # Simple HTML email
+        html_message = f"""
+        <html>
+        <body>
+            <h2>{notification.title}</h2>
+            <p>{notification.message}</p>
+            {f'<p><a href="{notification.action_url}">{notification.action_label or "View Details"}</a></p>' if notification.action_url else ''}
+            <hr>
+            <p style="color: #666; font-size: 12px;">
+                This is an automated notification from AutoBooks.
+            </p>
+        </body>
+        </html>
+        """
+        
+        plain_message = f"{notification.title}\n\n{notification.message}"
+        if notification.action_url:
+            plain_message += f"\n\nView: {notification.action_url}"
+        
+        return subject, plain_message, html_message
+    
+    @classmethod
+    def deliver(cls, log_ids: List) -> Dict[str, int]:
+        """
+        Send pending EMAIL and PUSH logs.
+        Emails share one SMTP connection; log statuses are saved with
+        bulk_update. Returns counts of sent and failed logs.
+        """
+        logs = list(
+            NotificationLog.objects.filter(id__in=log_ids, status='PENDING')
+            .select_related('notification')
+        )
+        emails = [log for log in logs if log.channel == 'EMAIL']
+        
+        now = timezone.now()
+        for log in logs:
+            if log.channel == 'PUSH':
+                # TODO: Implement actual push notification via Firebase/OneSignal/etc.
+                # For now, just log it as sent
                 log.status = 'SENT'
-                log.sent_at = timezone.now()
-            else:
-                log.status = 'FAILED'
-                log.error_message = 'Email sending failed'
-            log.save()
-            
-            return bool(sent)
-            
-        except Exception as e:
-            # Log the error
-            NotificationLog.objects.create(
-                notification=notification,
-                user=user,
-                channel='EMAIL',
-                status='FAILED',
-                recipient=user.email,
-                content=notification.message,
-                error_message=str(e)
-            )
-            return False
+                log.sent_at = now
+        
+        if emails:
+            from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@autobooks.com')
+            try:
+                with get_connection() as connection:
+                    for log in emails:
+                        subject, plain_message, html_message = cls.render_email(log.notification)
+                        email = EmailMultiAlternatives(
+                            subject=subject,
+                            body=plain_message,
+                            from_email=from_email,
+                            to=[log.recipient],
+                            connection=connection,
+                        )
+                        email.attach_alternative(html_message, 'text/html')
+                        try:
+                            sent = connection.send_messages([email])
+                        except Exception as e:
+                            sent = 0
+                            log.error_message = str(e)
+                        if sent:
+                            log.status = 'SENT'
+                            log.sent_at = timezone.now()
+                        else:
+                            log.status = 'FAILED'
+                            log.error_message = log.error_message or 'Email sending failed'
+            except Exception as e:
+                # Could not open the connection
+                for log in emails:
+                    if log.status == 'PENDING':
+                        log.status = 'FAILED'
+                        log.error_message = str(e)
+        
+        NotificationLog.objects.bulk_update(
+            logs, ['status', 'sent_at', 'error_message'], batch_size=settings.NOTIFICATION_BATCH_SIZE
+        )
+        sent = sum(1 for log in logs if log.status == 'SENT')
+        return {'sent': sent, 'failed': len(logs) - sent}
+    
+    @classmethod
+    def send_email_notification(cls, notification: Notification, user) -> bool:
+        """
+        Send notification via email
+        """
+        subject, plain_message, _ = cls.render_email(notification)
+        log = NotificationLog.objects.create(
+            notification=notification,
+            user=user,
+            channel='EMAIL',
+            status='PENDING',
+            recipient=user.email,
+            subject=subject,
+            content=plain_message,
+        )
+        return cls.deliver([log.id])['sent'] == 1
     
     @classmethod
     def send_push_notification(cls, notification: Notification, user) -> bool:
         """
         Send push notification (placeholder for future implementation)
         """
-        # Create log entry
         log = NotificationLog.objects.create(
             notification=notification,
             user=user,
@@ -198,14 +299,9 @@ class NotificationService:
             subject=notification.title,
             content=notification.message,
         )
-        
-        # TODO: Implement actual push notification via Firebase/OneSignal/etc.
-        # For now, just log it as sent
-        log.status = 'SENT'
-        log.sent_at = timezone.now()
-        log.save()
-        
-        return True
+        return cls.deliver([log.id])['sent'] == 1
+    
+    # Read state and cached counts
     
     @classmethod
     def mark_as_read(cls, notification_ids: List[str], user) -> int:
@@ -213,7 +309,7 @@ class NotificationService:
         Mark notifications as read
         Returns count of updated notifications
         """
-        return Notification.objects.filter(
+        count = Notification.objects.filter(
             id__in=notification_ids,
             user=user,
             is_read=False
@@ -221,56 +317,71 @@ class NotificationService:
             is_read=True,
             read_at=timezone.now()
         )
+        if count:
+            cls.invalidate_counts([user.pk])
+        return count
     
     @classmethod
     def mark_all_as_read(cls, user) -> int:
         """
         Mark all notifications as read for a user
         """
-        return Notification.objects.filter(
+        count = Notification.objects.filter(
             user=user,
             is_read=False
         ).update(
             is_read=True,
             read_at=timezone.now()
         )
+        if count:
+            cls.invalidate_counts([user.pk])
+        return count
     
     @classmethod
     def get_unread_count(cls, user) -> int:
         """
         Get count of unread notifications
         """
-        return Notification.objects.filter(
-            user=user,
-            is_read=False
-        ).count()
+        return cls.get_notification_counts(user)['unread']
     
     @classmethod
     def get_notification_counts(cls, user) -> Dict[str, Any]:
         """
         Get notification counts by category and type
-        """
-        from django.db.models import Count
-        
-        notifications = Notification.objects.filter(user=user)
         
-        total = notifications.count()
-        unread = notifications.filter(is_read=False).count()
-        
-        by_category = dict(
-            notifications.values('category').annotate(count=Count('id')).values_list('category', 'count')
-        )
-        
-        by_type = dict(
-            notifications.values('notification_type').annotate(count=Count('id')).values_list('notification_type', 'count')
+        Served from a per-user cache, filled by one grouped query and dropped
+        by invalidate_counts whenever the user's notifications change.
+        """
+        key = COUNTS_KEY.format(user.pk)
+        counts = cache.get(key)
+        if counts is None:
+            counts = cls._count_notifications(user)
+            cache.set(key, counts, settings.NOTIFICATION_COUNTS_CACHE_TTL)
+        return counts
+    
+    @classmethod
+    def _count_notifications(cls, user) -> Dict[str, Any]:
+        rows = (
+            Notification.objects.filter(user=user)
+            .values_list('category', 'notification_type', 'is_read')
+            .annotate(count=Count('id'))
+            .order_by()
         )
-        
-        return {
-            'total': total,
-            'unread': unread,
-            'by_category': by_category,
-            'by_type': by_type,
-        }
+        counts = {'total': 0, 'unread': 0, 'by_category': {}, 'by_type': {}}
+        for category, notification_type, is_read, count in rows:
+            counts['total'] += count
+            if not is_read:
+                counts['unread'] += count
+            counts['by_category'][category] = counts['by_category'].get(category, 0) + count
+            counts['by_type'][notification_type] = counts['by_type'].get(notification_type, 0) + count
+        return counts
+    
+    @classmethod
+    def invalidate_counts(cls, user_ids: List) -> None:
+        """
+        Drop cached counts for users whose notifications changed
+        """
+        cache.delete_many([COUNTS_KEY.format(user_id) for user_id in user_ids])
     
     @classmethod
     def delete_old_notifications(cls, days: int = 30) -> int:
@@ -278,10 +389,10 @@ class NotificationService:
         Delete notifications older than specified days
         """
         cutoff = timezone.now() - timezone.timedelta(days=days)
-        count, _ = Notification.objects.filter(
-            created_at__lt=cutoff,
-            is_read=True
-        ).delete()
+        old = Notification.objects.filter(created_at__lt=cutoff, is_read=True)
+        user_ids = list(old.values_list('user_id', flat=True).distinct())
+        count, _ = old.delete()
+        cls.invalidate_counts(user_ids)
         return count
     
     # Convenience methods for common notification types
@@ -331,6 +331,35 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Content-addressed receipt images (ai_assistants.services.blob_store):
+# local disk by default, S3-compatible bucket with RECEIPT_BLOB_STORAGE=s3
+RECEIPT_BLOB_STORAGE = os.getenv('RECEIPT_BLOB_STORAGE', 'local').lower()
+if RECEIPT_BLOB_STORAGE == 's3':
+    RECEIPT_BLOB_BACKEND = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.getenv('RECEIPT_BLOB_BUCKET', os.getenv('AWS_S3_BUCKET_NAME', '')),
+            'region_name': os.getenv('AWS_REGION', 'us-east-1'),
+            'access_key': os.getenv('AWS_ACCESS_KEY_ID', ''),
+            'secret_key': os.getenv('AWS_SECRET_ACCESS_KEY', ''),
+            'endpoint_url': os.getenv('RECEIPT_BLOB_ENDPOINT_URL') or None,
+            'location': 'receipt-blobs',
+            'file_overwrite': True,
+            'default_acl': 'private',
+        },
+    }
+else:
+    RECEIPT_BLOB_BACKEND = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.getenv('RECEIPT_BLOB_DIR', str(BASE_DIR / 'var' / 'receipt_blobs'))},
+    }
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'receipt_blobs': RECEIPT_BLOB_BACKEND,
+}
+
 # =================================================================
 # AI API Keys (from environment)
 # =================================================================
@@ -339,6 +368,8 @@ GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY', '')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', '')
 DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+# Optional OpenAI-compatible endpoint (proxy, local stub server)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', '') or None
 
 # Google Application Credentials
 GOOGLE_APPLICATION_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS', '')
@@ -382,6 +413,58 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 # =================================================================
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 
+# Run Celery tasks in-process (local development without a worker)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False').lower() == 'true'
+
+# Sandbox worker pool for LLM-generated pandas code (ai_assistants.services.safe_exec)
+SAFE_EXEC_USE_POOL = os.getenv('SAFE_EXEC_USE_POOL', 'True').lower() == 'true'
+SAFE_EXEC_POOL_SIZE = int(os.getenv('SAFE_EXEC_POOL_SIZE', '2'))
+SAFE_EXEC_MAX_MEMORY = int(os.getenv('SAFE_EXEC_MAX_MEMORY_MB', '256')) * 1024 * 1024
+
+# Cached tenant/membership/plan context per (user, tenant header) (core.tenants.context)
+TENANT_CONTEXT_CACHE_TTL = int(os.getenv('TENANT_CONTEXT_CACHE_TTL', '60'))
+
+# Memory-mapped analyst/planner DataFrame snapshots (ai_assistants.services.frame_snapshots)
+ANALYST_SNAPSHOTS_ENABLED = os.getenv('ANALYST_SNAPSHOTS_ENABLED', 'True').lower() == 'true'
+ANALYST_SNAPSHOT_DIR = os.getenv('ANALYST_SNAPSHOT_DIR', str(BASE_DIR / 'var' / 'snapshots'))
+# In-process analyst dataset cache (ai_assistants.services.analyst_store); whole ledgers exceed TenantCache's 100MB default
+ANALYST_CACHE_MAX_SIZE = int(os.getenv('ANALYST_CACHE_MAX_SIZE_MB', '1024')) * 1024 * 1024
+ANALYST_CACHE_GLOBAL_MAX_SIZE = int(os.getenv('ANALYST_CACHE_GLOBAL_MAX_SIZE_MB', '4096')) * 1024 * 1024
+
+# Threads for concurrent read-only agent tool calls (ai_assistants.agents.ai_tools)
+AI_AGENT_TOOL_WORKERS = int(os.getenv('AI_AGENT_TOOL_WORKERS', '4'))
+
+# Cached recurring-expense patterns per user (ai_assistants.services.recurring_expense_service)
+RECURRING_EXPENSE_CACHE_TTL = int(os.getenv('RECURRING_EXPENSE_CACHE_TTL', str(2 * 24 * 3600)))
+
+# Notification fan-out batches and cached per-user counts (core.services.notification_service)
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', '500'))
+NOTIFICATION_COUNTS_CACHE_TTL = int(os.getenv('NOTIFICATION_COUNTS_CACHE_TTL', '300'))
+
+# In-process cache of temperature-0 LLM completions, per tenant (core.libs.ai_service)
+LLM_RESPONSE_CACHE_ENABLED = os.getenv('LLM_RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+LLM_RESPONSE_CACHE_TTL = int(os.getenv('LLM_RESPONSE_CACHE_TTL', '3600'))
+LLM_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('LLM_RESPONSE_CACHE_MAX_ENTRIES', '512'))
+
+# Async LLM gateway: failover order, per-provider limits, hedging and quotas (core.libs.llm_gateway)
+LLM_GATEWAY_ENABLED = os.getenv('LLM_GATEWAY_ENABLED', 'True').lower() == 'true'
+LLM_GATEWAY_PROVIDERS = os.getenv('LLM_GATEWAY_PROVIDERS', 'openai,deepseek,gemini').split(',')
+LLM_GATEWAY_PROVIDER_LIMITS = {
+    'openai': {'rpm': int(os.getenv('OPENAI_RPM', '500')), 'tpm': int(os.getenv('OPENAI_TPM', '200000'))},
+    'deepseek': {'rpm': int(os.getenv('DEEPSEEK_RPM', '300')), 'tpm': int(os.getenv('DEEPSEEK_TPM', '200000'))},
+    'gemini': {'rpm': int(os.getenv('GEMINI_RPM', '300')), 'tpm': int(os.getenv('GEMINI_TPM', '200000'))},
+}
+LLM_GATEWAY_HEDGE_AFTER = float(os.getenv('LLM_GATEWAY_HEDGE_AFTER', '15'))  # seconds, 0 disables hedging
+LLM_GATEWAY_TIMEOUT = float(os.getenv('LLM_GATEWAY_TIMEOUT', '60'))
+LLM_GATEWAY_QUOTA_CONTROLLER = 'ai_assistants.services.ai_request_controls.ai_request_controller'
+
+# Receipts per transaction when bulk-approving with journal entries (ai_assistants.services.journal_entry_service)
+JOURNAL_BULK_CHUNK_SIZE = int(os.getenv('JOURNAL_BULK_CHUNK_SIZE', '500'))
+
+# Excel rows per receipt lookup, and items kept per differences list (ai_assistants.services.accounting_service)
+EXCEL_COMPARE_CHUNK_SIZE = int(os.getenv('EXCEL_COMPARE_CHUNK_SIZE', '1000'))
+EXCEL_COMPARE_MAX_DETAILS = int(os.getenv('EXCEL_COMPARE_MAX_DETAILS', '1000'))
+
 # Optional: Configure cache with Redis
 if REDIS_URL and not DEBUG:
     CACHES = {
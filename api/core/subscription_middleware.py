@@ -9,6 +9,7 @@ from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
 from django.utils.translation import gettext_lazy as _
 
+from core.tenants.context import get_request_context
 from users.models import SubscriptionPlan, UserSubscription
 
 
@@ -71,14 +72,14 @@ class SubscriptionMiddleware(MiddlewareMixin):
         if not hasattr(request, 'user') or not request.user.is_authenticated:
             return None
         
-        # Get user's subscription
-        subscription = self._get_user_subscription(request.user)
-        plan = self._get_subscription_plan(subscription)
+        # Subscription and plan come from the (cached) tenant request context
+        context = get_request_context(request)
+        plan = context.plan
         
         # Add to request
-        request.subscription = subscription
+        request.subscription = context.subscription
         request.subscription_plan = plan
-        request.subscription_features = self._get_features_dict(plan)
+        request.subscription_features = context.features
         
         # Check feature restrictions
         restriction_error = self._check_feature_restriction(request.path, plan)
@@ -91,74 +92,6 @@ class SubscriptionMiddleware(MiddlewareMixin):
         """Check if path is exempt from subscription checks"""
         return any(path.startswith(exempt) for exempt in self.EXEMPT_PATHS)
     
-    def _get_user_subscription(self, user):
-        """Get user's subscription"""
-        try:
-            return UserSubscription.objects.select_related('plan').get(
-                user=user,
-                status__in=['active', 'trial']
-            )
-        except UserSubscription.DoesNotExist:
-            return None
-    
-    def _get_subscription_plan(self, subscription):
-        """Get subscription plan (default to free if no subscription)"""
-        if subscription:
-            return subscription.plan
-        
-        # Return free plan as default
-        try:
-            return SubscriptionPlan.objects.get(plan_type='free', is_active=True)
-        except SubscriptionPlan.DoesNotExist:
-            return None
-    
-    def _get_features_dict(self, plan):
-        """Convert plan features to dictionary for easy access"""
-        if not plan:
-            return {
-                'has_ai_assistant': False,
-                'has_advanced_analytics': False,
-                'has_custom_reports': False,
-                'has_api_access': False,
-                'has_priority_support': False,
-                'has_sso': False,
-                'has_audit_logs': False,
-                'has_data_export': False,
-                'has_multi_currency': False,
-                'has_custom_branding': False,
-                'max_users': 1,
-                'max_companies': 1,
-                'max_storage_gb': 1,
-                'max_documents': 50,
-                'max_invoices_monthly': 10,
-                'max_employees': 5,
-                'max_projects': 2,
-                'ai_queries_monthly': 0,
-                'rag_documents': 0,
-            }
-        
-        return {
-            'has_ai_assistant': plan.has_ai_assistant,
-            'has_advanced_analytics': plan.has_advanced_analytics,
-            'has_custom_reports': plan.has_custom_reports,
-            'has_api_access': plan.has_api_access,
-            'has_priority_support': plan.has_priority_support,
-            'has_sso': plan.has_sso,
-            'has_audit_logs': plan.has_audit_logs,
-            'has_data_export': plan.has_data_export,
-            'has_multi_currency': plan.has_multi_currency,
-            'has_custom_branding': plan.has_custom_branding,
-            'max_users': plan.max_users,
-            'max_companies': plan.max_companies,
-            'max_storage_gb': plan.max_storage_gb,
-            'max_documents': plan.max_documents,
-            'max_invoices_monthly': plan.max_invoices_monthly,
-            'max_employees': plan.max_employees,
-            'max_projects': plan.max_projects,
-            'ai_queries_monthly': plan.ai_queries_monthly,
-            'rag_documents': plan.rag_documents,
-        }
-    
     def _check_feature_restriction(self, path, plan):
         """Check if path requires a feature the user doesn't have"""
         if not plan:
@@ -179,6 +112,54 @@ class SubscriptionMiddleware(MiddlewareMixin):
         return None
 
 
+def get_plan_features(plan):
+    """Convert plan features to dictionary for easy access"""
+    if not plan:
+        return {
+            'has_ai_assistant': False,
+            'has_advanced_analytics': False,
+            'has_custom_reports': False,
+            'has_api_access': False,
+            'has_priority_support': False,
+            'has_sso': False,
+            'has_audit_logs': False,
+            'has_data_export': False,
+            'has_multi_currency': False,
+            'has_custom_branding': False,
+            'max_users': 1,
+            'max_companies': 1,
+            'max_storage_gb': 1,
+            'max_documents': 50,
+            'max_invoices_monthly': 10,
+            'max_employees': 5,
+            'max_projects': 2,
+            'ai_queries_monthly': 0,
+            'rag_documents': 0,
+        }
+    
+    return {
+        'has_ai_assistant': plan.has_ai_assistant,
+        'has_advanced_analytics': plan.has_advanced_analytics,
+        'has_custom_reports': plan.has_custom_reports,
+        'has_api_access': plan.has_api_access,
+        'has_priority_support': plan.has_priority_support,
+        'has_sso': plan.has_sso,
+        'has_audit_logs': plan.has_audit_logs,
+        'has_data_export': plan.has_data_export,
+        'has_multi_currency': plan.has_multi_currency,
+        'has_custom_branding': plan.has_custom_branding,
+        'max_users': plan.max_users,
+        'max_companies': plan.max_companies,
+        'max_storage_gb': plan.max_storage_gb,
+        'max_documents': plan.max_documents,
+        'max_invoices_monthly': plan.max_invoices_monthly,
+        'max_employees': plan.max_employees,
+        'max_projects': plan.max_projects,
+        'ai_queries_monthly': plan.ai_queries_monthly,
+        'rag_documents': plan.rag_documents,
+    }
+
+
 def check_subscription_limit(user, limit_type, current_count=None):
     """
     Utility function to check if user has reached a subscription limit.
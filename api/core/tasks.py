@@ -0,0 +1,33 @@
+"""
+Core Tasks
+==========
+Async tasks for core services (notification delivery).
+"""
+
+import logging
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def deliver_notifications(self, log_ids: list):
+    """
+    Send pending EMAIL and PUSH notification logs queued by
+    NotificationService.create_bulk_notification, emails over one SMTP
+    connection.
+    
+    Args:
+        log_ids: IDs of PENDING NotificationLog rows
+    
+    Returns:
+        dict: Counts of sent and failed logs
+    """
+    from core.services.notification_service import NotificationService
+    
+    try:
+        return NotificationService.deliver(log_ids)
+    except Exception as exc:
+        # Logs stay PENDING, so a retry only picks up what was not saved
+        logger.warning(f"Notification delivery failed for {len(log_ids)} logs: {exc}")
+        raise self.retry(exc=exc)
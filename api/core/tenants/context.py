@@ -0,0 +1,191 @@
+"""
+Request Context Resolver
+========================
+Resolves the tenant, membership, role and subscription plan for a
+(user, tenant header) pair and caches the result, so TenantMiddleware,
+SubscriptionMiddleware and TenantContextMixin share one lookup per request
+and warm requests do not touch the database.
+
+On a miss the user's active memberships are read in a single query joined
+to their tenant and the user's subscription/plan. The Tenant table is only
+queried when a header names a tenant the user is not a member of, and the
+free plan only when the user has no active subscription.
+
+Cached contexts are keyed by user, header and two version stamps: one per
+user (bumped on membership / subscription changes) and one global (bumped
+on tenant / plan changes). See core.tenants.signals.
+"""
+
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+CONTEXT_KEY = 'tenant_ctx:{user}:{kind}:{value}:{global_version}:{user_version}'
+USER_VERSION_KEY = 'tenant_ctx:ver:user:{}'
+GLOBAL_VERSION_KEY = 'tenant_ctx:ver:global'
+
+ACTIVE_SUBSCRIPTION_STATUSES = ('active', 'trial')
+
+
+@dataclass
+class RequestContext:
+    """Tenant and subscription context resolved for one user and tenant header"""
+    tenant: Any = None                  # Tenant named by the header (even without membership)
+    membership: Any = None              # active membership for that tenant
+    default_membership: Any = None      # user's first active membership (no/unusable header)
+    invalid_header: bool = False
+    subscription: Any = None
+    plan: Any = None
+    features: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def role(self) -> Optional[str]:
+        membership = self.membership or self.default_membership
+        return membership.role if membership else None
+
+
+def get_tenant_headers(request):
+    """Return (tenant_id, tenant_slug) from X-Tenant-ID / X-Tenant-Slug"""
+    def _get_header(name):
+        # Django test client sends HTTP_X_TENANT_ID in META
+        meta_key = 'HTTP_' + name.upper().replace('-', '_')
+        return request.META.get(meta_key) or request.headers.get(name)
+
+    return _get_header('X-Tenant-ID'), _get_header('X-Tenant-Slug')
+
+
+def get_request_context(request, user=None) -> RequestContext:
+    """
+    Context for request, resolved once per request and user.
+    Pass user for DRF views, where authentication happens after middleware.
+    """
+    user = user if user is not None else request.user
+    cached = getattr(request, '_tenant_context', None)
+    if cached is not None and cached[0] == user.pk:
+        return cached[1]
+
+    tenant_id, tenant_slug = get_tenant_headers(request)
+    context = resolve_request_context(user, tenant_id=tenant_id, tenant_slug=tenant_slug)
+    request._tenant_context = (user.pk, context)
+    return context
+
+
+def resolve_request_context(user, tenant_id=None, tenant_slug=None) -> RequestContext:
+    """Cached RequestContext for an authenticated user and tenant header"""
+    if tenant_id:
+        kind, value = 'id', str(tenant_id)
+    elif tenant_slug:
+        kind, value = 'slug', str(tenant_slug)
+    else:
+        kind, value = 'default', ''
+
+    user_version_key = USER_VERSION_KEY.format(user.pk)
+    versions = cache.get_many([GLOBAL_VERSION_KEY, user_version_key])
+    key = CONTEXT_KEY.format(
+        user=user.pk,
+        kind=kind,
+        value=value,
+        global_version=versions.get(GLOBAL_VERSION_KEY, 0),
+        user_version=versions.get(user_version_key, 0),
+    )
+
+    context = cache.get(key)
+    if context is None:
+        context = _load_context(user, kind, value)
+        _detach_user(context)
+        cache.set(key, context, settings.TENANT_CONTEXT_CACHE_TTL)
+
+    _attach_user(context, user)
+    return context
+
+
+def invalidate_user_context(user_id) -> None:
+    """Drop cached contexts for one user (membership / subscription changes)"""
+    cache.set(USER_VERSION_KEY.format(user_id), time.time_ns(), None)
+
+
+def invalidate_all_contexts() -> None:
+    """Drop every cached context (tenant / plan changes)"""
+    cache.set(GLOBAL_VERSION_KEY, time.time_ns(), None)
+
+
+# =================================================================
+# Loading
+# =================================================================
+
+def _load_context(user, kind, value) -> RequestContext:
+    from .models import Tenant, TenantMembership
+    from core.subscription_middleware import get_plan_features
+
+    context = RequestContext()
+
+    tenant_uuid = None
+    if kind == 'id':
+        try:
+            tenant_uuid = uuid.UUID(value)
+        except ValueError:
+            context.invalid_header = True
+
+    # One query: every active membership with its tenant and the user's plan
+    memberships = list(
+        TenantMembership.objects.filter(
+            user=user, is_active=True, tenant__is_active=True
+        ).select_related('tenant', 'user__subscription__plan')
+    )
+    if memberships:
+        context.default_membership = memberships[0]
+
+    if kind != 'default' and not context.invalid_header:
+        for membership in memberships:
+            if (membership.tenant_id == tenant_uuid if kind == 'id' else membership.tenant.slug == value):
+                context.tenant = membership.tenant
+                context.membership = membership
+                break
+        else:
+            lookup = {'id': tenant_uuid} if kind == 'id' else {'slug': value}
+            context.tenant = Tenant.objects.filter(is_active=True, **lookup).first()
+            context.invalid_header = context.tenant is None
+
+    if memberships:
+        subscription = getattr(memberships[0].user, 'subscription', None)
+    else:
+        from users.models import UserSubscription
+        subscription = UserSubscription.objects.select_related('plan').filter(user=user).first()
+    if subscription is not None and subscription.status in ACTIVE_SUBSCRIPTION_STATUSES:
+        context.subscription = subscription
+        context.plan = subscription.plan
+    else:
+        from users.models import SubscriptionPlan
+        # Default to the free plan
+        context.plan = SubscriptionPlan.objects.filter(plan_type='free', is_active=True).first()
+
+    context.features = get_plan_features(context.plan)
+    return context
+
+
+def _detach_user(context: RequestContext) -> None:
+    """Keep the user row (password hash etc.) out of the shared cache"""
+    from .models import TenantMembership
+    from users.models import UserSubscription
+
+    # membership and default_membership are often the same object
+    cached = {id(obj): (obj, user_field) for obj, user_field in (
+        (context.membership, TenantMembership._meta.get_field('user')),
+        (context.default_membership, TenantMembership._meta.get_field('user')),
+        (context.subscription, UserSubscription._meta.get_field('user')),
+    ) if obj is not None}
+    for obj, user_field in cached.values():
+        if user_field.is_cached(obj):
+            user_field.delete_cached_value(obj)
+
+
+def _attach_user(context: RequestContext, user) -> None:
+    for membership in (context.membership, context.default_membership):
+        if membership is not None:
+            membership.user = user
+    if context.subscription is not None:
+        context.subscription.user = user
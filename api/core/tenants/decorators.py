@@ -200,7 +200,7 @@ class TenantAccessPermission:
     """
     
     def has_permission(self, request, view):
-        from .models import Tenant, TenantMembership, TenantRole
+        from .context import get_request_context
         from .managers import set_current_tenant
         
         # Already set by middleware?
@@ -208,30 +208,23 @@ class TenantAccessPermission:
             # Still check viewer write restriction
             return self._check_write_access(request)
         
-        # Resolve tenant from headers
-        tenant = self._resolve_tenant(request)
-        if tenant is None:
-            # Check if header was provided but invalid
-            tenant_header = request.META.get('HTTP_X_TENANT_ID') or request.META.get('HTTP_X_TENANT_SLUG')
-            if tenant_header:
-                # Invalid tenant header
-                return False
-            # No header - try default tenant
-            tenant = self._get_default_tenant(request.user)
-        
-        if tenant is None:
-            # No tenant context available
-            return False
+        # Resolve tenant from headers (cached per user and header)
+        context = get_request_context(request, user=request.user)
+        if context.tenant is not None or context.invalid_header:
+            # Header given: the user must be a member of that tenant
+            membership = context.membership
+        else:
+            # No header - use default tenant
+            membership = context.default_membership
         
-        # Get membership
-        membership = self._get_membership(request.user, tenant)
         if membership is None:
+            # No tenant context available
             return False
         
         # Set on request
-        request.tenant = tenant
+        request.tenant = membership.tenant
         request.tenant_membership = membership
-        set_current_tenant(tenant)
+        set_current_tenant(membership.tenant)
         
         return self._check_write_access(request)
     
@@ -243,36 +236,3 @@ class TenantAccessPermission:
             if membership.role == TenantRole.VIEWER.value:
                 return False
         return True
-    
-    def _resolve_tenant(self, request):
-        from .models import Tenant
-        
-        tenant_id = request.META.get('HTTP_X_TENANT_ID') or request.headers.get('X-Tenant-ID')
-        if tenant_id:
-            try:
-                return Tenant.objects.get(id=tenant_id, is_active=True)
-            except Exception:
-                return None
-        
-        tenant_slug = request.META.get('HTTP_X_TENANT_SLUG') or request.headers.get('X-Tenant-Slug')
-        if tenant_slug:
-            try:
-                return Tenant.objects.get(slug=tenant_slug, is_active=True)
-            except Tenant.DoesNotExist:
-                return None
-        
-        return None
-    
-    def _get_membership(self, user, tenant):
-        from .models import TenantMembership
-        try:
-            return TenantMembership.objects.get(user=user, tenant=tenant, is_active=True)
-        except TenantMembership.DoesNotExist:
-            return None
-    
-    def _get_default_tenant(self, user):
-        from .models import TenantMembership
-        membership = TenantMembership.objects.filter(
-            user=user, is_active=True, tenant__is_active=True
-        ).select_related('tenant').first()
-        return membership.tenant if membership else None
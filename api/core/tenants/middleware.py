@@ -8,6 +8,7 @@ from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
 from django.utils.translation import gettext_lazy as _
 
+from .context import get_request_context
 from .managers import set_current_tenant, clear_current_tenant, get_current_tenant
 
 
@@ -60,17 +61,20 @@ class TenantMiddleware(MiddlewareMixin):
         if not hasattr(request, 'user') or not request.user.is_authenticated:
             return None
         
-        tenant, invalid_header = self._resolve_tenant(request)
+        # Tenant, membership and plan in one cached lookup (shared with
+        # SubscriptionMiddleware through the request)
+        context = get_request_context(request)
 
-        if invalid_header:
+        if context.invalid_header:
             return JsonResponse({
                 'error': 'invalid_tenant_header',
                 'message': _('Invalid tenant identifier provided.')
             }, status=400)
 
+        tenant = context.tenant
         if tenant:
             # Verify user has access to this tenant
-            membership = self._get_membership(request.user, tenant)
+            membership = context.membership
             if membership and membership.is_active:
                 set_current_tenant(tenant)
                 request.tenant = tenant
@@ -94,14 +98,12 @@ class TenantMiddleware(MiddlewareMixin):
                     'error': 'tenant_access_denied',
                     'message': _('You do not have access to this organization.')
                 }, status=403)
-        else:
-            # Try to get user's default tenant
-            default_tenant = self._get_default_tenant(request.user)
-            if default_tenant:
-                membership = self._get_membership(request.user, default_tenant)
-                set_current_tenant(default_tenant)
-                request.tenant = default_tenant
-                request.tenant_membership = membership
+        elif context.default_membership:
+            # Fall back to user's default tenant
+            membership = context.default_membership
+            set_current_tenant(membership.tenant)
+            request.tenant = membership.tenant
+            request.tenant_membership = membership
         
         return None
     
@@ -114,60 +116,8 @@ class TenantMiddleware(MiddlewareMixin):
         """Check if path is exempt from tenant requirement"""
         return any(path.startswith(exempt) for exempt in self.EXEMPT_PATHS)
     
-    def _resolve_tenant(self, request):
-        """Resolve tenant from request headers"""
-        Tenant = get_tenant_model()
-        
-        def _get_header(name):
-            # Django test client sends HTTP_X_TENANT_ID in META
-            meta_key = 'HTTP_' + name.upper().replace('-', '_')
-            return request.META.get(meta_key) or request.headers.get(name)
-
-        # Try X-Tenant-ID header first
-        tenant_id = _get_header('X-Tenant-ID')
-        if tenant_id:
-            try:
-                return Tenant.objects.get(id=tenant_id, is_active=True), False
-            except Exception:
-                # Invalid UUID or tenant not found
-                return None, True
-        
-        # Try X-Tenant-Slug header
-        tenant_slug = _get_header('X-Tenant-Slug')
-        if tenant_slug:
-            try:
-                return Tenant.objects.get(slug=tenant_slug, is_active=True), False
-            except Tenant.DoesNotExist:
-                return None, True
-        
-        # No tenant header provided
-        return None, False
-
     def _is_invitation_accept_path(self, path: str) -> bool:
         return 'tenant-invitations' in path and path.rstrip('/').endswith('accept')
-    
-    def _get_membership(self, user, tenant):
-        """Get user's membership for a tenant"""
-        TenantMembership = get_membership_model()
-        try:
-            return TenantMembership.objects.select_related('tenant').get(
-                user=user,
-                tenant=tenant,
-                is_active=True
-            )
-        except TenantMembership.DoesNotExist:
-            return None
-    
-    def _get_default_tenant(self, user):
-        """Get user's default/first tenant"""
-        TenantMembership = get_membership_model()
-        membership = TenantMembership.objects.filter(
-            user=user,
-            is_active=True,
-            tenant__is_active=True
-        ).select_related('tenant').first()
-        
-        return membership.tenant if membership else None
 
 
 def get_current_tenant():
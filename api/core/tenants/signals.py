@@ -0,0 +1,32 @@
+"""
+Tenant Signals
+==============
+Invalidate cached request contexts (core.tenants.context) when memberships,
+tenants, subscriptions or plans change. Each bump is repeated on commit so
+other processes cannot cache a context read before the write committed.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import SubscriptionPlan, UserSubscription
+
+from .context import invalidate_all_contexts, invalidate_user_context
+from .models import Tenant, TenantMembership
+
+
+@receiver([post_save, post_delete], sender=TenantMembership)
+@receiver([post_save, post_delete], sender=UserSubscription)
+def invalidate_user_request_context(sender, instance, **kwargs):
+    """A user's role, tenant access or plan changed"""
+    invalidate_user_context(instance.user_id)
+    transaction.on_commit(lambda: invalidate_user_context(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=Tenant)
+@receiver([post_save, post_delete], sender=SubscriptionPlan)
+def invalidate_request_contexts(sender, instance, **kwargs):
+    """Tenant activation or plan features changed for every member"""
+    invalidate_all_contexts()
+    transaction.on_commit(invalidate_all_contexts)
@@ -592,3 +592,66 @@ class MultiTenantUserTests(APITestCase):
             if codes1:
                 self.assertIn('TWD', codes1)
                 self.assertNotIn('USD', codes1)
+
+
+class RequestContextCacheTests(TestCase):
+    """Cached tenant/membership/plan context for middleware and views"""
+    
+    def setUp(self):
+        from core.tenants.models import Tenant, TenantMembership, TenantRole
+        
+        self.tenant = Tenant.objects.create(name='Context Tenant', slug='context-tenant')
+        self.other_tenant = Tenant.objects.create(name='Other Tenant', slug='other-context')
+        self.user = User.objects.create_user(
+            email='context@example.com',
+            password='testpass123'
+        )
+        self.membership = TenantMembership.objects.create(
+            tenant=self.tenant,
+            user=self.user,
+            role=TenantRole.ACCOUNTANT.value
+        )
+    
+    def test_warm_context_needs_no_queries(self):
+        from core.tenants.context import resolve_request_context
+        
+        context = resolve_request_context(self.user, tenant_id=str(self.tenant.id))
+        self.assertEqual(context.tenant, self.tenant)
+        self.assertEqual(context.role, 'ACCOUNTANT')
+        
+        with self.assertNumQueries(0):
+            context = resolve_request_context(self.user, tenant_id=str(self.tenant.id))
+            self.assertEqual(context.membership.tenant.slug, 'context-tenant')
+            self.assertEqual(context.membership.user, self.user)
+            self.assertIn('has_ai_assistant', context.features)
+    
+    def test_membership_change_invalidates_context(self):
+        from core.tenants.context import resolve_request_context
+        from core.tenants.models import TenantRole
+        
+        resolve_request_context(self.user, tenant_slug='context-tenant')
+        self.membership.role = TenantRole.VIEWER.value
+        self.membership.save()
+        
+        context = resolve_request_context(self.user, tenant_slug='context-tenant')
+        self.assertEqual(context.role, 'VIEWER')
+        
+        self.membership.delete()
+        context = resolve_request_context(self.user, tenant_slug='context-tenant')
+        self.assertEqual(context.tenant, self.tenant)
+        self.assertIsNone(context.membership)
+    
+    def test_header_resolution(self):
+        from core.tenants.context import resolve_request_context
+        
+        context = resolve_request_context(self.user, tenant_id=str(self.other_tenant.id))
+        self.assertEqual(context.tenant, self.other_tenant)
+        self.assertIsNone(context.membership)
+        self.assertEqual(context.default_membership, self.membership)
+        
+        self.assertTrue(resolve_request_context(self.user, tenant_id='99999').invalid_header)
+        self.assertTrue(resolve_request_context(self.user, tenant_id=str(uuid.uuid4())).invalid_header)
+        
+        context = resolve_request_context(self.user)
+        self.assertIsNone(context.tenant)
+        self.assertEqual(context.default_membership.tenant, self.tenant)
@@ -0,0 +1,364 @@
+"""
+Tests for core libraries
+
+Tests cover:
+1. RAG knowledge base - BM25 index, filters and incremental updates
+2. Notification fan-out - batched inserts, queued delivery, cached counts
+3. LLM clients - shared client registry and deterministic response cache
+4. LLM gateway - failover, hedging, quotas and token buckets
+"""
+import asyncio
+import time
+import uuid
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+class RAGKnowledgeBaseIndexTests(SimpleTestCase):
+    """Test indexed knowledge base search"""
+
+    def setUp(self):
+        from core.libs.rag_service import RAGKnowledgeBase
+
+        self.kb = RAGKnowledgeBase(load=False)
+        self.kb.add_item(self.make_item('inv', 'Create an invoice', 'Open sales and click new invoice.',
+                                        'accounting', title_zh='建立發票'))
+        self.kb.add_item(self.make_item('je', 'Post a journal entry', 'Journal entries update the ledger.',
+                                        'accounting'))
+        self.kb.add_item(self.make_item('leave', 'Apply for leave', 'Leave requests need approval.',
+                                        'hrms', title_zh='申請休假'))
+
+    def make_item(self, item_id, title, content, category, title_zh=''):
+        from core.libs.rag_service import KnowledgeItem
+
+        return KnowledgeItem(
+            id=item_id, title=title, title_en=title, title_zh=title_zh,
+            content=content, content_en=content, content_zh='',
+            category=category,
+        )
+
+    def ids(self, items):
+        return [item.id for item in items]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.ids(self.kb.search('invoice', top_k=3)), ['inv'])
+        self.assertEqual(self.ids(self.kb.search('journal ledger', top_k=1)), ['je'])
+
+    def test_chinese_queries_match_without_spaces(self):
+        self.assertEqual(self.ids(self.kb.search('如何申請休假', top_k=1)), ['leave'])
+
+    def test_category_and_language_masks(self):
+        self.assertEqual(self.ids(self.kb.search('approval leave invoice', top_k=5, category='hrms')), ['leave'])
+        self.assertEqual(
+            self.ids(self.kb.search('journal invoice', top_k=5, language='zh', language_only=True)),
+            ['inv']
+        )
+
+    def test_add_item_updates_index_incrementally(self):
+        self.kb.add_item(self.make_item('inv', 'Credit notes', 'Refund a customer.', 'accounting'))
+
+        self.assertEqual(self.ids(self.kb.search('invoice', top_k=3)), [])
+        self.assertEqual(self.ids(self.kb.search('refund', top_k=3)), ['inv'])
+        self.assertEqual(len(self.kb.index), 3)
+
+    def test_embeddings_are_blended_in(self):
+        for item_id, vector in (('inv', [1, 0]), ('je', [0, 1]), ('leave', [0, 1])):
+            self.kb.items[item_id].embedding = np.array(vector, dtype=np.float32)
+        self.kb.add_item(self.kb.items['inv'])
+
+        results = self.kb.search('nothing matches this', top_k=1, query_embedding=np.array([1, 0.1]))
+        self.assertEqual(self.ids(results), ['inv'])
+
+
+class NotificationFanOutTests(TestCase):
+    """NotificationService.create_bulk_notification and counts"""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(email=f'notify{i}@example.com', password=uuid.uuid4().hex)
+            for i in range(20)
+        ]
+
+    def fan_out(self, users, **kwargs):
+        from core.services.notification_service import NotificationService
+
+        with mock.patch('core.tasks.deliver_notifications.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                notifications = NotificationService.create_bulk_notification(users, 'Closing', 'Month end', **kwargs)
+        return notifications, [log_id for call in delay.call_args_list for log_id in call.args[0]]
+
+    def test_queries_do_not_grow_with_recipients(self):
+        with CaptureQueriesContext(connection) as few:
+            self.fan_out(self.users[:3], send_email=True, send_push=True)
+        with CaptureQueriesContext(connection) as many:
+            self.fan_out(self.users[3:], send_email=True, send_push=True)
+        self.assertEqual(len(few), len(many))
+
+    def test_delivery_is_queued_for_enabled_channels(self):
+        from core.models_notifications import NotificationLog, NotificationPreference
+        from core.services.notification_service import NotificationService
+
+        NotificationPreference.objects.create(user=self.users[0], email_enabled=False)
+        notifications, log_ids = self.fan_out(self.users[:3], send_email=True)
+
+        self.assertEqual(len(notifications), 3)
+        self.assertEqual(NotificationPreference.objects.filter(user__in=self.users[:3]).count(), 3)
+        self.assertEqual(NotificationLog.objects.filter(channel='IN_APP', status='DELIVERED').count(), 3)
+        self.assertEqual(len(log_ids), 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+        result = NotificationService.deliver(log_ids)
+        self.assertEqual(result, {'sent': 2, 'failed': 0})
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['notify1@example.com', 'notify2@example.com'])
+        self.assertFalse(NotificationLog.objects.filter(channel='EMAIL').exclude(status='SENT').exists())
+
+    def test_counts_are_cached_until_notifications_change(self):
+        from core.services.notification_service import NotificationService
+
+        user = self.users[0]
+        notifications, _ = self.fan_out([user])
+        self.fan_out([user], category='INVOICES', notification_type='REMINDER')
+
+        counts = NotificationService.get_notification_counts(user)
+        self.assertEqual(counts, {
+            'total': 2, 'unread': 2,
+            'by_category': {'SYSTEM': 1, 'INVOICES': 1},
+            'by_type': {'INFO': 1, 'REMINDER': 1},
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(NotificationService.get_unread_count(user), 2)
+
+        NotificationService.mark_as_read([notifications[0].id], user)
+        self.assertEqual(NotificationService.get_unread_count(user), 1)
+        self.fan_out([user])
+        self.assertEqual(NotificationService.get_notification_counts(user)['total'], 3)
+
+    def test_updates_invalidate_counts(self):
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from core.services.notification_service import NotificationService
+
+        user = self.users[0]
+        notifications, _ = self.fan_out([user])
+        self.fan_out([user])
+        self.assertEqual(NotificationService.get_unread_count(user), 2)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.patch(
+            reverse('notification-detail', args=[notifications[0].id]),
+            {'is_read': True, 'category': 'INVOICES'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        counts = NotificationService.get_notification_counts(user)
+        self.assertEqual((counts['unread'], counts['by_category'].get('INVOICES')), (1, 1))
+
+        other = user.notifications.exclude(pk=notifications[0].pk).get()
+        other.mark_as_read()
+        self.assertEqual(NotificationService.get_unread_count(user), 0)
+
+
+class LLMClientRegistryTests(SimpleTestCase):
+    """get_llm_client reuse, ResponseCache eviction and cached_completion"""
+
+    def setUp(self):
+        from core.libs import ai_service
+
+        ai_service._response_cache = None
+        self.addCleanup(setattr, ai_service, '_response_cache', None)
+
+    def fake_client(self):
+        from types import SimpleNamespace
+
+        create = mock.Mock(side_effect=lambda **kwargs: object())
+        return SimpleNamespace(base_url='https://llm.test/v1/', chat=SimpleNamespace(
+            completions=SimpleNamespace(create=create)))
+
+    def test_clients_are_shared_per_provider_and_key(self):
+        from core.libs.ai_service import AIProvider, AIService, get_llm_client
+
+        client = get_llm_client(AIProvider.OPENAI, api_key='sk-one')
+        self.assertIs(get_llm_client('openai', api_key='sk-one'), client)
+        self.assertIsNot(get_llm_client(AIProvider.OPENAI, api_key='sk-two'), client)
+        self.assertIsNot(get_llm_client(AIProvider.DEEPSEEK, api_key='sk-one'), client)
+        self.assertIs(AIService(api_key='sk-one')._get_openai_client(), client)
+
+    def test_async_clients_are_shared_per_event_loop(self):
+        import asyncio
+        from core.libs.ai_service import get_async_llm_client
+
+        async def clients():
+            return get_async_llm_client(api_key='sk-one'), get_async_llm_client(api_key='sk-one')
+
+        first, again = asyncio.run(clients())
+        self.assertIs(first, again)
+        other_loop, _ = asyncio.run(clients())
+        self.assertIsNot(other_loop, first)
+
+    def test_cache_evicts_least_recently_used_and_expired(self):
+        from core.libs.ai_service import ResponseCache
+
+        cache = ResponseCache(ttl=60, max_entries=2)
+        cache.set('tenant_a', 'k1', 1)
+        cache.set('tenant_a', 'k2', 2)
+        cache.get('tenant_a', 'k1')
+        cache.set('tenant_a', 'k3', 3)
+        self.assertEqual(cache.get('tenant_a', 'k1'), 1)
+        self.assertIsNone(cache.get('tenant_a', 'k2'))
+        self.assertIsNone(cache.get('tenant_b', 'k1'))
+
+        with mock.patch('core.libs.ai_service.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('tenant_a', 'k1'))
+
+    @override_settings(LLM_RESPONSE_CACHE_ENABLED=True)
+    def test_only_deterministic_calls_are_cached_per_scope(self):
+        from core.libs.ai_service import cached_completion
+
+        client = self.fake_client()
+        request = {'model': 'gpt-4o-mini', 'messages': [{'role': 'user', 'content': 'Sales by region'}]}
+
+        first = cached_completion(client, scope='tenant_a', temperature=0, **request)
+        self.assertIs(cached_completion(client, scope='tenant_a', temperature=0, **request), first)
+        self.assertIsNot(cached_completion(client, scope='tenant_b', temperature=0, **request), first)
+        cached_completion(client, scope='tenant_a', temperature=0.7, **request)
+        cached_completion(client, scope='tenant_a', temperature=0, stream=True, **request)
+        self.assertEqual(client.chat.completions.create.call_count, 4)
+
+    @override_settings(LLM_RESPONSE_CACHE_ENABLED=False)
+    def test_cache_can_be_disabled(self):
+        from core.libs.ai_service import cached_completion
+
+        client = self.fake_client()
+        cached_completion(client, model='m', messages=[], temperature=0)
+        cached_completion(client, model='m', messages=[], temperature=0)
+        self.assertEqual(client.chat.completions.create.call_count, 2)
+
+
+class LLMGatewayTests(SimpleTestCase):
+    """Failover, hedging, quotas and rate limiting in LLMGateway"""
+
+    def gateway(self, primary, fallback, **kwargs):
+        from core.libs.ai_service import AIProvider, AIResponse
+        from core.libs.llm_gateway import LLMGateway, ProviderConfig
+
+        gateway = LLMGateway([
+            ProviderConfig('primary', AIProvider.OPENAI, 'gpt-4o-mini', 'sk-primary'),
+            ProviderConfig('fallback', AIProvider.DEEPSEEK, 'deepseek-chat', 'sk-fallback'),
+        ], **kwargs)
+        behaviours = {'primary': primary, 'fallback': fallback}
+
+        async def fake_call(config, model, request):
+            await behaviours[config.name]()
+            return AIResponse(content=config.name, provider=config.kind.value, model=model,
+                              usage={'prompt_tokens': 3, 'completion_tokens': 2, 'total_tokens': 5})
+
+        gateway._openai_compatible = fake_call
+        self.addCleanup(gateway.close)
+        return gateway
+
+    def request(self, **kwargs):
+        from core.libs.llm_gateway import LLMRequest
+
+        return LLMRequest(messages=[{'role': 'user', 'content': 'Summarise'}], **kwargs)
+
+    @staticmethod
+    def answer(delay=0):
+        async def call():
+            await asyncio.sleep(delay)
+        return call
+
+    @staticmethod
+    def fail(status_code):
+        async def call():
+            error = Exception(f'HTTP {status_code}')
+            error.status_code = status_code
+            raise error
+        return call
+
+    def test_rate_limited_provider_fails_over(self):
+        gateway = self.gateway(self.fail(429), self.answer())
+
+        self.assertEqual(gateway.complete_sync(self.request()).content, 'fallback')
+        self.assertEqual(gateway.stats['primary']['failed'], 1)
+        self.assertEqual(gateway.stats['fallback']['succeeded'], 1)
+
+    def test_client_errors_do_not_fail_over(self):
+        gateway = self.gateway(self.fail(400), self.answer())
+
+        with self.assertRaisesMessage(Exception, 'HTTP 400'):
+            gateway.complete_sync(self.request())
+        self.assertEqual(gateway.stats['fallback']['requests'], 0)
+
+    def test_all_providers_failing_raises_gateway_error(self):
+        from core.libs.llm_gateway import GatewayError
+
+        gateway = self.gateway(self.fail(503), self.fail(429))
+
+        with self.assertRaises(GatewayError) as raised:
+            gateway.complete_sync(self.request())
+        self.assertEqual(len(raised.exception.errors), 2)
+
+    def test_slow_provider_is_hedged(self):
+        gateway = self.gateway(self.answer(delay=5), self.answer(), hedge_after=0.05)
+
+        self.assertEqual(gateway.complete_sync(self.request()).content, 'fallback')
+        self.assertEqual(gateway.stats['fallback']['hedged'], 1)
+        self.assertEqual(gateway.stats['primary']['cancelled'], 1)
+
+    def test_burst_is_multiplexed_on_one_loop(self):
+        gateway = self.gateway(self.answer(delay=0.2), self.answer())
+
+        started = time.perf_counter()
+        responses = gateway.complete_many_sync([self.request(max_tokens=50) for _ in range(200)])
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual({response.content for response in responses}, {'primary'})
+
+    def test_user_quota_is_checked_and_recorded(self):
+        from core.libs.llm_gateway import QuotaExceeded
+
+        controller = mock.Mock()
+        controller.check_request.return_value = {'allowed': True}
+        gateway = self.gateway(self.answer(), self.answer(), controller=controller)
+
+        gateway.complete_sync(self.request(user_id='user-1', action='email_summary'))
+        record = controller.record_request.call_args.kwargs
+        self.assertEqual((record['action'], record['input_tokens'], record['output_tokens']), ('email_summary', 3, 2))
+        self.assertTrue(record['success'])
+
+        controller.check_request.return_value = {'allowed': False, 'reason': 'Daily request limit reached'}
+        with self.assertRaisesMessage(QuotaExceeded, 'Daily request limit reached'):
+            gateway.complete_sync(self.request(user_id='user-1'))
+        self.assertEqual(gateway.stats['primary']['requests'], 1)
+
+    @override_settings(LLM_GATEWAY_ENABLED=True)
+    def test_ai_service_passes_requesting_user(self):
+        from core.libs.ai_service import AIProvider, AIService
+
+        gateway = mock.Mock(order=['openai', 'deepseek'])
+        with mock.patch('core.libs.llm_gateway.get_llm_gateway', return_value=gateway):
+            AIService(provider=AIProvider.OPENAI).chat('Hello', user_id='user-1')
+            AIService(provider=AIProvider.OPENAI).chat_with_history(
+                [{'role': 'user', 'content': 'Hello'}], user_id='user-2', action='finance_analysis'
+            )
+        requests = [call.args[0] for call in gateway.complete_sync.call_args_list]
+        self.assertEqual([(r.user_id, r.action) for r in requests], [('user-1', 'chat'), ('user-2', 'finance_analysis')])
+
+    def test_token_bucket_waits_for_refill(self):
+        from core.libs.llm_gateway import TokenBucket
+
+        async def acquire_twice():
+            bucket = TokenBucket(rate_per_minute=600, capacity=1)
+            return await bucket.acquire(), await bucket.acquire()
+
+        first, second = asyncio.run(acquire_twice())
+        self.assertEqual(first, 0)
+        self.assertAlmostEqual(second, 0.1, places=2)
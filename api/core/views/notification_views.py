@@ -81,6 +81,18 @@ class NotificationViewSet(viewsets.ModelViewSet):
         
         return Notification.objects.filter(user=user)
     
+    def perform_create(self, serializer):
+        notification = serializer.save()
+        NotificationService.invalidate_counts([notification.user_id])
+    
+    def perform_update(self, serializer):
+        notification = serializer.save()
+        NotificationService.invalidate_counts([notification.user_id])
+    
+    def perform_destroy(self, instance):
+        instance.delete()
+        NotificationService.invalidate_counts([instance.user_id])
+    
     @extend_schema(
         tags=['Notifications'],
         summary='Get Unread Notifications',
@@ -142,7 +154,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def read(self, request, pk=None):
         """Mark a single notification as read"""
         notification = self.get_object()
-        notification.mark_as_read()
+        NotificationService.mark_as_read([notification.id], request.user)
         return Response({'status': 'marked as read'})
     
     @extend_schema(
@@ -154,6 +166,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def clear_read(self, request):
         """Delete all read notifications"""
         count, _ = self.get_queryset().filter(is_read=True).delete()
+        NotificationService.invalidate_counts([request.user.pk])
         return Response({'deleted_count': count})
 
 
@@ -245,20 +258,17 @@ class SendNotificationView(APIView):
         User = get_user_model()
         users = User.objects.filter(id__in=user_ids)
         
-        sent_count = 0
-        for user in users:
-            NotificationService.create_notification(
-                user=user,
-                title=data['title'],
-                message=data['message'],
-                notification_type=data.get('notification_type', 'INFO'),
-                category=data.get('category', 'SYSTEM'),
-                priority=data.get('priority', 'NORMAL'),
-                action_url=data.get('action_url'),
-                action_label=data.get('action_label'),
-                send_email='EMAIL' in channels,
-                send_push='PUSH' in channels,
-            )
-            sent_count += 1
+        notifications = NotificationService.create_bulk_notification(
+            users=users,
+            title=data['title'],
+            message=data['message'],
+            notification_type=data.get('notification_type', 'INFO'),
+            category=data.get('category', 'SYSTEM'),
+            priority=data.get('priority', 'NORMAL'),
+            action_url=data.get('action_url'),
+            action_label=data.get('action_label'),
+            send_email='EMAIL' in channels,
+            send_push='PUSH' in channels,
+        )
         
-        return Response({'sent_count': sent_count})
+        return Response({'sent_count': len(notifications)})
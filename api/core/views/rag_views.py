@@ -110,7 +110,8 @@ class RAGChatView(APIView):
             ai_service = AIService(provider=provider_enum)
             response = ai_service.chat(
                 message=query,
-                system_prompt=system_prompt
+                system_prompt=system_prompt,
+                user_id=str(request.user.id)
             )
             
             return Response({